@@ -9,6 +9,12 @@ import streamlit as st
 import hashlib
 from datetime import datetime
 from lib.utils.helpers import initialize_session_state, check_authentication
+from lib.utils.kpi_engine import get_dashboard_metrics
+from lib.utils.prefetch import warm_cache, prefetch_for_role
+from lib.utils.metrics_exporter import start_metrics_server
+from lib.utils.page_instrumentation import install_page_instrumentation
+from lib.utils.wal_archive import start_wal_archiver
+from lib.utils.notification_queue import start_notification_workers
 
 # Configure page
 st.set_page_config(
@@ -124,6 +130,8 @@ def render_login_page():
             
             if login_button:
                 if authenticate_user_app(username, password):
+                    # Load the modules this role usually opens while the app reruns
+                    prefetch_for_role(st.session_state.user_role)
                     st.success("Login successful!")
                     st.rerun()
                 else:
@@ -144,6 +152,14 @@ def main():
     # Initialize session state
     initialize_session_state()
     
+    # Warm the shared cache, start the metrics endpoint, hook page run timing, start WAL archiving
+    # and the notification workers once per process
+    warm_cache()
+    start_metrics_server()
+    install_page_instrumentation()
+    start_wal_archiver()
+    start_notification_workers()
+    
     # Check authentication
     if not check_authentication():
         render_login_page()
@@ -167,20 +183,14 @@ def main():
     # Main content area
     st.markdown("### Select a module from the sidebar to get started")
     
-    # Quick stats
-    col1, col2, col3, col4 = st.columns(4)
-    
-    with col1:
-        st.metric("Project Progress", "78.5%", "2.3%")
-    
-    with col2:
-        st.metric("Active RFIs", "12", "-3")
-    
-    with col3:
-        st.metric("Budget Status", "$35.2M", "Under")
+    # Quick stats served from the latest KPI snapshot
+    metrics = get_dashboard_metrics()
+    stat_columns = st.columns(4)
     
-    with col4:
-        st.metric("Schedule", "On Track", "1 day ahead")
+    for column, label in zip(stat_columns, ["Project Progress", "Active RFIs", "Budget Status", "Schedule"]):
+        value, delta = metrics.get(label, ("N/A", None))
+        with column:
+            st.metric(label, value, delta, delta_color="inverse" if label == "Active RFIs" else "normal")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -1,112 +1,97 @@
 """
 Pure Python Caching Layer for Highland Tower Development
-In-memory and Redis caching system independent of Streamlit
+In-memory caching system independent of Streamlit, backed by the shared cache engine.
+When CACHE_BACKEND_URL or REDIS_URL is set, global entries are also shared
+between replicas through Redis (see lib/utils/cache_backends.py)
 
 This eliminates framework-specific caching and provides sustainable performance optimization
 """
 
-import time
 import json
 import hashlib
-from typing import Any, Optional, Dict, Callable
+from typing import Any, Optional, Dict, Callable, List
 from functools import wraps
 from datetime import datetime, timedelta
-import threading
+
+from lib.utils.cache_engine import CacheEngine, get_cache_engine, make_key, _MISSING
 
 
 class InMemoryCache:
-    """Pure Python in-memory cache with TTL support"""
+    """Pure Python in-memory cache with TTL support, stored in the shared cache engine"""
     
-    def __init__(self, default_ttl: int = 3600):
-        self.cache: Dict[str, Dict[str, Any]] = {}
+    def __init__(self, namespace: str, default_ttl: int = 3600, engine: Optional[CacheEngine] = None):
+        # Explicit so every pod uses the same name and invalidations reach all of them
         self.default_ttl = default_ttl
-        self._lock = threading.Lock()
+        self.namespace = namespace
+        self.engine = engine or get_cache_engine()
     
     def _generate_key(self, key: str) -> str:
         """Generate consistent cache key"""
         return hashlib.md5(key.encode()).hexdigest()
     
-    def get(self, key: str) -> Optional[Any]:
+    def get(self, key: str, default: Any = None) -> Optional[Any]:
         """Get value from cache"""
-        with self._lock:
-            cache_key = self._generate_key(key)
-            
-            if cache_key not in self.cache:
-                return None
-            
-            entry = self.cache[cache_key]
-            
-            # Check if expired
-            if time.time() > entry['expires']:
-                del self.cache[cache_key]
-                return None
-            
-            entry['hits'] = entry.get('hits', 0) + 1
-            entry['last_accessed'] = time.time()
-            return entry['value']
+        value = self.engine.get(self.namespace, self._generate_key(key), _MISSING, scope_id="")
+        if value is _MISSING:
+            return default
+        return value
     
     def set(self, key: str, value: Any, ttl: Optional[int] = None) -> None:
         """Set value in cache with TTL"""
-        with self._lock:
-            cache_key = self._generate_key(key)
-            ttl = ttl or self.default_ttl
-            
-            self.cache[cache_key] = {
-                'value': value,
-                'expires': time.time() + ttl,
-                'created': time.time(),
-                'hits': 0,
-                'last_accessed': time.time()
-            }
+        ttl = ttl or self.default_ttl
+        self.engine.set(self.namespace, self._generate_key(key), value, ttl=ttl, scope_id="")
+    
+    def get_many(self, keys: List[str]) -> Dict[str, Any]:
+        """Get several values, fetching those missing from memory from the shared tier at once"""
+        hashed = {self._generate_key(key): key for key in keys}
+        found = self.engine.get_many(self.namespace, list(hashed), scope_id="", ttl=self.default_ttl)
+        return {hashed[hashed_key]: value for hashed_key, value in found.items()}
+    
+    def get_or_compute(self, key: str, compute: Callable[[], Any], ttl: Optional[int] = None,
+                       stale_ttl: int = 0, persist: bool = False) -> Any:
+        """Get value from cache, computing it once for all concurrent callers on a miss"""
+        return self.engine.get_or_compute(
+            self.namespace, self._generate_key(key), compute,
+            ttl=ttl or self.default_ttl, scope_id="", stale_ttl=stale_ttl, persist=persist
+        )
     
     def delete(self, key: str) -> bool:
         """Delete key from cache"""
-        with self._lock:
-            cache_key = self._generate_key(key)
-            if cache_key in self.cache:
-                del self.cache[cache_key]
-                return True
-            return False
+        return self.engine.delete(self.namespace, self._generate_key(key), scope_id="")
     
     def clear(self) -> None:
         """Clear all cache entries"""
-        with self._lock:
-            self.cache.clear()
+        self.engine.invalidate(namespace=self.namespace)
     
     def get_stats(self) -> Dict[str, Any]:
         """Get cache statistics"""
-        with self._lock:
-            total_entries = len(self.cache)
-            total_hits = sum(entry.get('hits', 0) for entry in self.cache.values())
-            memory_usage = sum(len(str(entry['value'])) for entry in self.cache.values())
-            
-            return {
-                'total_entries': total_entries,
-                'total_hits': total_hits,
-                'memory_usage_bytes': memory_usage,
-                'cache_keys': list(self.cache.keys())
-            }
+        namespace_stats = self.engine.get_stats()["namespaces"].get(self.namespace, {})
+        
+        return {
+            'total_entries': namespace_stats.get('entries', 0),
+            'total_hits': namespace_stats.get('hits', 0),
+            'total_misses': namespace_stats.get('misses', 0),
+            'hit_ratio': namespace_stats.get('hit_ratio', 0),
+            'compute_time_saved_seconds': namespace_stats.get('saved_seconds', 0.0),
+            'evictions': {
+                'ttl': namespace_stats.get('evictions_ttl', 0),
+                'size': namespace_stats.get('evictions_size', 0),
+                'invalidation': namespace_stats.get('evictions_invalidation', 0)
+            },
+            'memory_usage_bytes': namespace_stats.get('bytes', 0),
+            'cache_keys': self.engine.keys(self.namespace)
+        }
     
     def cleanup_expired(self) -> int:
         """Remove expired entries and return count removed"""
-        with self._lock:
-            current_time = time.time()
-            expired_keys = [
-                key for key, entry in self.cache.items()
-                if current_time > entry['expires']
-            ]
-            
-            for key in expired_keys:
-                del self.cache[key]
-            
-            return len(expired_keys)
+        return self.engine.cleanup_expired(namespace=self.namespace)
 
 
 class HighlandTowerCache:
     """Highland Tower Development specific caching layer"""
     
     def __init__(self):
-        self.cache = InMemoryCache(default_ttl=1800)  # 30 minutes default
+        self.cache = InMemoryCache("highland_tower", default_ttl=1800)  # 30 minutes default
         
         # Cache TTLs for different data types
         self.ttl_config = {
@@ -168,6 +153,10 @@ class HighlandTowerCache:
             'highland_tower_cache_status': 'active',
             'total_cached_items': stats['total_entries'],
             'cache_hits': stats['total_hits'],
+            'cache_misses': stats['total_misses'],
+            'hit_ratio': f"{stats['hit_ratio']:.1%}",
+            'compute_time_saved': f"{stats['compute_time_saved_seconds']:.2f} s",
+            'evictions': stats['evictions'],
             'memory_usage': f"{stats['memory_usage_bytes']} bytes",
             'cached_data_types': [
                 'RFI Data', 'Project Health', 'Analytics', 
@@ -176,24 +165,20 @@ class HighlandTowerCache:
         }
 
 
-def cache_result(cache_instance: InMemoryCache, key_prefix: str, ttl: int = 3600):
-    """Decorator for caching function results"""
+def cache_result(cache_instance: InMemoryCache, key_prefix: str, ttl: int = 3600, stale_ttl: int = 0,
+                 persist: bool = False):
+    """Decorator for caching function results with single-flight misses, optional stale-while-revalidate
+    and an optional persistent disk tier"""
     def decorator(func: Callable) -> Callable:
         @wraps(func)
         def wrapper(*args, **kwargs):
             # Generate cache key from function name and arguments
-            cache_key = f"{key_prefix}_{func.__name__}_{hash((args, tuple(sorted(kwargs.items()))))}"
-            
-            # Try to get from cache first
-            cached_result = cache_instance.get(cache_key)
-            if cached_result is not None:
-                return cached_result
-            
-            # Execute function and cache result
-            result = func(*args, **kwargs)
-            cache_instance.set(cache_key, result, ttl)
+            cache_key = f"{key_prefix}_{func.__name__}_{make_key(args, kwargs)}"
             
-            return result
+            # Concurrent misses share one execution of the function
+            return cache_instance.get_or_compute(
+                cache_key, lambda: func(*args, **kwargs), ttl, stale_ttl, persist
+            )
         return wrapper
     return decorator
 
@@ -213,6 +198,6 @@ def cache_analytics_operation(ttl: int = 1800):
     return cache_result(highland_cache.cache, "highland_analytics", ttl)
 
 
-def cache_dashboard_data(ttl: int = 600):
-    """Cache dashboard data for 10 minutes"""
-    return cache_result(highland_cache.cache, "highland_dashboard", ttl)
\ No newline at end of file
+def cache_dashboard_data(ttl: int = 600, stale_ttl: int = 120):
+    """Cache dashboard data for 10 minutes, serving it up to 2 minutes stale while refreshing"""
+    return cache_result(highland_cache.cache, "highland_dashboard", ttl, stale_ttl)
\ No newline at end of file
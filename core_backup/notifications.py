@@ -7,7 +7,6 @@ with professional templates and delivery tracking.
 
 import os
 import logging
-import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from email.mime.base import MIMEBase
@@ -16,6 +15,8 @@ from datetime import datetime
 from typing import Dict, List, Optional
 import streamlit as st
 from core.database import get_database
+from lib.utils.smtp_pool import get_smtp_transport
+from lib.utils.template_engine import FORMAT, compile_template
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
@@ -24,6 +25,9 @@ logger = logging.getLogger(__name__)
 class NotificationManager:
     """Enterprise email notification system with professional templates."""
     
+    # Email templates with their compiled subject and body, shared by all instances
+    _email_templates: Optional[Dict] = None
+    
     def __init__(self):
         """Initialize notification system."""
         self.db = get_database()
@@ -39,11 +43,25 @@ class NotificationManager:
         # Notification settings
         self.max_retries = 3
         self.batch_size = 10
+        # Larger recipient lists get one message, addressed to the team, in BCC batches
+        self.bcc_threshold = int(os.environ.get('EMAIL_BCC_THRESHOLD', '25'))
         
         # Email templates
-        self.templates = self._load_email_templates()
+        self.templates = self._get_email_templates()
+    
+    @classmethod
+    def _get_email_templates(cls) -> Dict:
+        """Email templates, built and compiled once per process."""
+        if cls._email_templates is None:
+            templates = cls._load_email_templates()
+            for template in templates.values():
+                template['compiled_subject'] = compile_template(template['subject'], FORMAT)
+                template['compiled_template'] = compile_template(template['template'], FORMAT)
+            cls._email_templates = templates
+        return cls._email_templates
     
-    def _load_email_templates(self) -> Dict:
+    @staticmethod
+    def _load_email_templates() -> Dict:
         """Load professional email templates for construction notifications."""
         return {
             'daily_report_submitted': {
@@ -319,7 +337,13 @@ class NotificationManager:
     
     def _send_templated_email(self, template_name: str, recipients: List[str], 
                             template_data: Dict, priority: str = 'normal') -> Dict:
-        """Send email using template with data substitution."""
+        """
+        Send email using template with data substitution.
+        
+        Up to bcc_threshold recipients get a message addressed to them by
+        name, sent concurrently over pooled SMTP sessions; a larger list gets
+        one message greeting the team, sent to BCC batches.
+        """
         try:
             if not self.smtp_username or not self.smtp_password:
                 return {
@@ -332,35 +356,36 @@ class NotificationManager:
                 return {'success': False, 'message': f'Template {template_name} not found'}
             
             # Prepare email content
-            subject = template['subject'].format(**template_data)
+            subject = template['compiled_subject'].render(template_data)
+            transport = self._get_transport()
+            
+            failures = {}
+            if len(recipients) > self.bcc_threshold:
+                html_content = template['compiled_template'].render(dict(template_data, recipient_name='Team'))
+                message = self._build_message(None, subject, html_content, priority)
+                failures = transport.send_bcc(message, recipients)
+            else:
+                messages = []
+                for recipient in recipients:
+                    html_content = template['compiled_template'].render(
+                        dict(template_data, recipient_name=self._get_recipient_name(recipient))
+                    )
+                    messages.append((self._build_message(recipient, subject, html_content, priority), None))
+                
+                for recipient, result in zip(recipients, transport.send_many(messages)):
+                    if isinstance(result, Exception):
+                        failures[recipient] = result
             
-            # Add recipient name to template data for each recipient
             successful_sends = 0
             failed_sends = 0
-            
             for recipient in recipients:
-                try:
-                    # Get recipient name
-                    recipient_name = self._get_recipient_name(recipient)
-                    template_data['recipient_name'] = recipient_name
-                    
-                    html_content = template['template'].format(**template_data)
-                    
-                    # Send email
-                    result = self._send_email(recipient, subject, html_content, priority)
-                    
-                    if result['success']:
-                        successful_sends += 1
-                        
-                        # Log notification
-                        self._log_notification(template_name, recipient, subject, 'sent')
-                    else:
-                        failed_sends += 1
-                        self._log_notification(template_name, recipient, subject, 'failed')
-                        
-                except Exception as e:
-                    logger.error(f"Error sending email to {recipient}: {str(e)}")
+                if recipient in failures:
+                    logger.error(f"Error sending email to {recipient}: {failures[recipient]}")
                     failed_sends += 1
+                    self._log_notification(template_name, recipient, subject, 'failed')
+                else:
+                    successful_sends += 1
+                    self._log_notification(template_name, recipient, subject, 'sent')
             
             return {
                 'success': successful_sends > 0,
@@ -373,30 +398,33 @@ class NotificationManager:
             logger.error(f"Error in templated email send: {str(e)}")
             return {'success': False, 'message': str(e)}
     
+    def _get_transport(self):
+        """Pooled SMTP transport shared by every send to this server and account."""
+        return get_smtp_transport(self.smtp_server, self.smtp_port, self.smtp_username, self.smtp_password)
+    
+    def _build_message(self, to_email: Optional[str], subject: str, html_content: str,
+                       priority: str = 'normal') -> MIMEMultipart:
+        """Build an HTML email (addressed to the sender when to_email is None, for BCC sends)."""
+        msg = MIMEMultipart('alternative')
+        msg['From'] = f"{self.from_name} <{self.from_email}>"
+        msg['To'] = to_email or msg['From']
+        msg['Subject'] = subject
+        
+        # Set priority headers
+        if priority == 'high':
+            msg['X-Priority'] = '1'
+            msg['X-MSMail-Priority'] = 'High'
+            msg['Importance'] = 'High'
+        
+        # Attach HTML content
+        html_part = MIMEText(html_content, 'html')
+        msg.attach(html_part)
+        return msg
+    
     def _send_email(self, to_email: str, subject: str, html_content: str, priority: str = 'normal') -> Dict:
-        """Send individual email via SMTP."""
+        """Send individual email via a pooled SMTP session."""
         try:
-            # Create message
-            msg = MIMEMultipart('alternative')
-            msg['From'] = f"{self.from_name} <{self.from_email}>"
-            msg['To'] = to_email
-            msg['Subject'] = subject
-            
-            # Set priority headers
-            if priority == 'high':
-                msg['X-Priority'] = '1'
-                msg['X-MSMail-Priority'] = 'High'
-                msg['Importance'] = 'High'
-            
-            # Attach HTML content
-            html_part = MIMEText(html_content, 'html')
-            msg.attach(html_part)
-            
-            # Send email
-            with smtplib.SMTP(self.smtp_server, self.smtp_port) as server:
-                server.starttls()
-                server.login(self.smtp_username, self.smtp_password)
-                server.send_message(msg)
+            self._get_transport().send(self._build_message(to_email, subject, html_content, priority))
             
             logger.info(f"Email sent successfully to {to_email}")
             return {'success': True}
@@ -12,6 +12,15 @@ from datetime import datetime, timedelta
 from fuzzywuzzy import fuzz
 import logging
 
+from lib.utils.search_suggest import SearchSuggester
+
+# Common search terms for Highland Tower Development
+COMMON_SEARCH_TERMS = [
+    'electrical outlets', 'concrete pour', 'floor 12', 'rfi status',
+    'daily reports', 'quality check', 'safety inspection', 'clash detection',
+    'material delivery', 'equipment status', 'personnel schedule'
+]
+
 class SearchManager:
     """Enterprise search manager with global search capabilities"""
     
@@ -20,6 +29,7 @@ class SearchManager:
         self.search_history = []
         self.setup_logging()
         self.initialize_search_indexes()
+        self.setup_suggestions()
     
     def setup_logging(self):
         """Setup search operation logging"""
@@ -58,6 +68,14 @@ class SearchManager:
             }
         }
     
+    def setup_suggestions(self):
+        """Seed suggestions with the common search terms and their words"""
+        words = {}
+        for term in COMMON_SEARCH_TERMS:
+            for word in term.split():
+                words[word] = words.get(word, 0) + 1
+        self.suggester = SearchSuggester(words)
+    
     def perform_global_search(self, query: str, filters: Dict = None) -> Dict[str, List[Dict]]:
         """Perform global search across all modules"""
         results = {}
@@ -209,18 +227,13 @@ class SearchManager:
         st.session_state.search_history = st.session_state.search_history[:50]
     
     def get_search_suggestions(self, partial_query: str) -> List[str]:
-        """Get search suggestions based on partial query"""
-        suggestions = []
-        
-        # Common search terms for Highland Tower Development
-        common_terms = [
-            'electrical outlets', 'concrete pour', 'floor 12', 'rfi status',
-            'daily reports', 'quality check', 'safety inspection', 'clash detection',
-            'material delivery', 'equipment status', 'personnel schedule'
-        ]
-        
-        for term in common_terms:
-            if partial_query.lower() in term.lower():
+        """Get search suggestions based on partial query (prefix and typo tolerant)"""
+        history = [entry['query'] for entry in st.session_state.get('search_history', [])]
+        suggestions = self.suggester.suggest(partial_query, limit=5, history=history + COMMON_SEARCH_TERMS)
+        
+        # Common terms matching anywhere, for mid-word input ("outlets" -> "electrical outlets")
+        for term in COMMON_SEARCH_TERMS:
+            if partial_query.lower() in term.lower() and term not in suggestions:
                 suggestions.append(term)
         
         return suggestions[:5]  # Return top 5 suggestions
@@ -8,10 +8,21 @@ import pandas as pd
 from typing import Dict, List, Any, Optional, Union
 from datetime import datetime, date
 import logging
+from functools import wraps
 from data.highland_tower_data import HIGHLAND_TOWER_DATA
+from lib.utils.tracing import span
 
 logger = logging.getLogger(__name__)
 
+def traced(method):
+    """Trace a controller method as a span named after it, with the model and table"""
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        with span(f"CRUDController.{method.__name__}", model=type(self.model).__name__,
+                  table=getattr(self.model, 'table_name', None)):
+            return method(self, *args, **kwargs)
+    return wrapper
+
 class CRUDController:
     """Complete CRUD controller with advanced UI capabilities"""
     
@@ -20,6 +31,7 @@ class CRUDController:
         self.session_key = session_key
         self.display_config = display_config
         
+    @traced
     def render_data_view(self, key_prefix: str = ""):
         """Render the main data view with search, filtering, and actions"""
         data = self.model.get_all()
@@ -96,6 +108,7 @@ class CRUDController:
         else:
             self._render_card_view(filtered_df, key_prefix)
     
+    @traced
     def _render_table_view(self, df: pd.DataFrame, key_prefix: str):
         """Render table view with standard Streamlit record selection"""
         if df.empty:
@@ -239,6 +252,7 @@ class CRUDController:
                 del st.session_state[f"{key_prefix}_edit_record"]
                 st.rerun()
     
+    @traced
     def _render_card_view(self, df: pd.DataFrame, key_prefix: str):
         """Render card view with actions"""
         if df.empty:
@@ -361,6 +375,7 @@ class CRUDController:
                         else:
                             st.error("Failed to update record")
     
+    @traced
     def render_create_form(self, form_config: Dict[str, Any], key_prefix: str = ""):
         """Render create form with validation"""
         st.subheader(f"📝 Create New {self.display_config.get('item_name', 'Record')}")
@@ -492,6 +507,7 @@ class CRUDController:
         else:
             return st.text_input(label, value=current_value, placeholder=placeholder, key=key)
     
+    @traced
     def render_analytics(self, key_prefix: str = ""):
         """Render analytics view with metrics and charts"""
         st.subheader(f"📈 {self.display_config.get('title', 'Analytics')}")
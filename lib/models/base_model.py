@@ -4,15 +4,52 @@ Provides foundational CRUD operations and database integration
 """
 
 import os
+import weakref
+from contextlib import contextmanager
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from typing import Dict, List, Any, Optional, Union
+from typing import Dict, List, Any, Optional, Union, Callable
 import pandas as pd
 from datetime import datetime
 import logging
 
+from lib.utils.page_instrumentation import db_timer, section
+from lib.utils.tracing import current_span, span
+
 logger = logging.getLogger(__name__)
 
+# Seconds a table's database rows stay in the shared cache (writes invalidate immediately)
+MODEL_CACHE_TTL = int(os.getenv('MODEL_CACHE_TTL', '120'))
+
+class DatabaseUnavailable(Exception):
+    """Raised when a query cannot reach the database, so nothing is cached"""
+
+# Callbacks notified after every successful write: listener(table_name, action, record_id, data, persisted)
+# persisted is False for writes that fell back to the current session's storage
+_write_listeners: List[Callable[..., None]] = []
+
+def register_write_listener(listener: Callable[..., None]):
+    """Register a callback invoked after create/update/delete on any model"""
+    if listener not in _write_listeners:
+        _write_listeners.append(listener)
+
+def unregister_write_listener(listener: Callable[..., None]):
+    """Remove a previously registered write callback"""
+    if listener in _write_listeners:
+        _write_listeners.remove(listener)
+
+# Models holding a database connection, and connection attempt counts (for metrics)
+_connected_models: "weakref.WeakSet[BaseModel]" = weakref.WeakSet()
+_connection_counts = {"opened": 0, "failed": 0}
+
+def get_connection_stats() -> Dict[str, int]:
+    """Open model connections and connection attempts since start"""
+    open_connections = sum(
+        1 for model in list(_connected_models)
+        if model._connection is not None and not model._connection.closed
+    )
+    return {"open": open_connections, **_connection_counts}
+
 class BaseModel:
     """Base model class with CRUD operations and database integration"""
     
@@ -22,6 +59,30 @@ class BaseModel:
         self.session_key = f"{table_name}_data"
         self._connection = None
         
+    @property
+    def cache_namespace(self) -> str:
+        """Cache namespace holding this table's database rows"""
+        return f"models.{self.table_name}"
+    
+    def invalidate_cache(self):
+        """Drop cached rows for this table on every pod"""
+        try:
+            from lib.utils.cache_engine import get_cache_engine
+            get_cache_engine().invalidate(namespace=self.cache_namespace)
+        except Exception as e:
+            logger.warning(f"Cache invalidation failed for {self.table_name}: {e}")
+    
+    def _notify_write(self, action: str, record_id: Any = None, data: Optional[Dict] = None,
+                      persisted: bool = True):
+        """Notify write listeners (KPI snapshots, caches, indexes) of a change"""
+        if persisted:
+            self.invalidate_cache()
+        for listener in list(_write_listeners):
+            try:
+                listener(self.table_name, action, record_id, data, persisted=persisted)
+            except Exception as e:
+                logger.warning(f"Write listener failed for {self.table_name}: {e}")
+    
     def get_connection(self):
         """Get database connection with proper error handling"""
         if self._connection is None or self._connection.closed:
@@ -33,11 +94,21 @@ class BaseModel:
                         cursor_factory=RealDictCursor
                     )
                     self._connection.autocommit = True
+                    _connection_counts["opened"] += 1
+                    _connected_models.add(self)
                     return self._connection
             except Exception as e:
+                _connection_counts["failed"] += 1
                 logger.error(f"Database connection failed: {e}")
         return self._connection
     
+    @contextmanager
+    def _sql(self, statement: str):
+        """Count a statement as page database time and trace it as a span"""
+        with db_timer(), span("SQL", **{"db.system": "postgresql", "db.statement": statement[:500],
+                                        "table": self.table_name}) as sql:
+            yield sql
+    
     def execute_query(self, query: str, params: tuple = None) -> List[Dict]:
         """Execute SELECT query with error handling"""
         conn = self.get_connection()
@@ -45,9 +116,11 @@ class BaseModel:
             return self._get_session_data()
         
         try:
-            with conn.cursor() as cursor:
+            with self._sql(query) as sql, conn.cursor() as cursor:
                 cursor.execute(query, params)
-                return [dict(row) for row in cursor.fetchall()]
+                rows = [dict(row) for row in cursor.fetchall()]
+                sql.set_attribute("rows", len(rows))
+                return rows
         except Exception as e:
             logger.error(f"Query execution failed: {e}")
             return self._get_session_data()
@@ -59,13 +132,28 @@ class BaseModel:
             return False
         
         try:
-            with conn.cursor() as cursor:
+            with self._sql(command), conn.cursor() as cursor:
                 cursor.execute(command, params)
                 return True
         except Exception as e:
             logger.error(f"Command execution failed: {e}")
             return False
     
+    def execute_insert(self, command: str, params: tuple = None) -> Optional[Dict]:
+        """Execute INSERT ... RETURNING and return the returned row (None on failure)"""
+        conn = self.get_connection()
+        if not conn:
+            return None
+        
+        try:
+            with self._sql(command), conn.cursor() as cursor:
+                cursor.execute(command, params)
+                row = cursor.fetchone()
+                return dict(row) if row else {}
+        except Exception as e:
+            logger.error(f"Command execution failed: {e}")
+            return None
+    
     def _get_session_data(self) -> List[Dict]:
         """Fallback to session data when database unavailable"""
         import streamlit as st
@@ -78,25 +166,110 @@ class BaseModel:
         import streamlit as st
         st.session_state[self.session_key] = data
     
+    def _query_all_from_database(self) -> List[Dict]:
+        """Fetch every row from the database, raising DatabaseUnavailable instead of falling back"""
+        conn = self.get_connection()
+        if not conn:
+            raise DatabaseUnavailable(self.table_name)
+        
+        try:
+            query = f"SELECT * FROM {self.table_name} ORDER BY id DESC"
+            with self._sql(query) as sql, conn.cursor() as cursor:
+                cursor.execute(query)
+                rows = [dict(row) for row in cursor.fetchall()]
+                sql.set_attribute("rows", len(rows))
+                return rows
+        except Exception as e:
+            logger.error(f"Query execution failed: {e}")
+            raise DatabaseUnavailable(self.table_name) from e
+    
+    def get_all_cached(self) -> List[Dict]:
+        """
+        Get every database row through the shared cache.
+        
+        Only database results are cached; session fallback data is per user
+        and never enters the cache. Raises DatabaseUnavailable when the
+        database cannot be queried.
+        """
+        from lib.utils.cache_engine import get_cache_engine
+        
+        computed = []
+        
+        def query_all():
+            computed.append(True)
+            return self._query_all_from_database()
+        
+        with span("BaseModel.get_all_cached", namespace=self.cache_namespace) as cached:
+            rows = get_cache_engine().get_or_compute(
+                self.cache_namespace, "all", query_all,
+                ttl=MODEL_CACHE_TTL, scope_id=""
+            )
+            cached.set_attribute("cache_hit", not computed)
+        # Callers may modify records, so never hand out the cached dicts themselves
+        return [dict(row) for row in rows]
+    
     def get_all(self) -> List[Dict]:
         """Get all records with Highland Tower data fallback"""
-        # Try database first
-        query = f"SELECT * FROM {self.table_name} ORDER BY id DESC"
-        results = self.execute_query(query)
+        with section("model_load"), span("BaseModel.get_all", model=type(self).__name__,
+                                          table=self.table_name) as load:
+            results = self._load_all()
+            load.set_attribute("rows", len(results))
+            return results
+    
+    def _load_all(self) -> List[Dict]:
+        """Database rows, else Highland Tower data, else session data"""
+        # Try database first (served from the shared cache when warm)
+        try:
+            results = self.get_all_cached()
+            source = "database"
+        except DatabaseUnavailable:
+            results = self._get_session_data()
+            source = "session"
         
         if results:
+            current_span().set_attribute("source", source)
             return results
         
         # Fallback to Highland Tower authentic project data
         highland_data = self._get_highland_tower_data()
         if highland_data:
+            current_span().set_attribute("source", "highland")
             return highland_data
         
         # Final fallback to session storage
+        current_span().set_attribute("source", "session")
         return self._get_session_data()
     
+    def get_all_shared(self) -> List[Dict]:
+        """
+        Get all records for process-wide consumers (search index, KPI snapshot).
+
+        Database rows, else Highland Tower data; never session data, which
+        belongs to the current user and must not reach shared state.
+        """
+        with span("BaseModel.get_all_shared", model=type(self).__name__,
+                  table=self.table_name) as load:
+            try:
+                results = self.get_all_cached()
+                source = "database"
+            except DatabaseUnavailable:
+                results = []
+            if not results:
+                results = self._get_highland_tower_data()
+                source = "highland"
+            load.set_attribute("source", source)
+            load.set_attribute("rows", len(results))
+            return results
+
     def _get_highland_tower_data(self) -> List[Dict]:
         """Get Highland Tower Development project data"""
+        with span("BaseModel._get_highland_tower_data", table=self.table_name) as highland:
+            highland_data = self._load_highland_tower_data()
+            highland.set_attribute("rows", len(highland_data))
+            return highland_data
+    
+    def _load_highland_tower_data(self) -> List[Dict]:
+        """Highland Tower records for this model's table ([] when there are none)"""
         try:
             from lib.data.highland_tower_data import HIGHLAND_TOWER_DATA
             
@@ -153,21 +326,24 @@ class BaseModel:
         placeholders = ', '.join(['%s'] * len(fields))
         field_names = ', '.join(fields)
         
-        query = f"INSERT INTO {self.table_name} ({field_names}) VALUES ({placeholders})"
+        # Return the id so write listeners can apply the insert incrementally
+        query = f"INSERT INTO {self.table_name} ({field_names}) VALUES ({placeholders}) RETURNING id"
         
-        success = self.execute_command(query, tuple(values))
+        inserted = self.execute_insert(query, tuple(values))
         
         # Fallback to session storage
-        if not success:
+        if inserted is None:
             session_data = self._get_session_data()
             new_id = max([item.get('id', 0) for item in session_data], default=0) + 1
             filtered_data['id'] = new_id
             filtered_data['created_at'] = datetime.now().isoformat()
             session_data.append(filtered_data)
             self._save_to_session(session_data)
+            self._notify_write('create', new_id, filtered_data, persisted=False)
             return True
         
-        return success
+        self._notify_write('create', inserted.get('id', filtered_data.get('id')), filtered_data)
+        return True
     
     def update(self, record_id: Union[int, str], data: Dict) -> bool:
         """Update existing record"""
@@ -194,8 +370,11 @@ class BaseModel:
                     item['updated_at'] = datetime.now().isoformat()
                     break
             self._save_to_session(session_data)
+            self._notify_write('update', record_id, filtered_data, persisted=False)
             return True
         
+        if success:
+            self._notify_write('update', record_id, filtered_data)
         return success
     
     def delete(self, record_id: Union[int, str]) -> bool:
@@ -209,8 +388,11 @@ class BaseModel:
             session_data = self._get_session_data()
             session_data = [item for item in session_data if str(item.get('id')) != str(record_id)]
             self._save_to_session(session_data)
+            self._notify_write('delete', record_id, persisted=False)
             return True
         
+        if success:
+            self._notify_write('delete', record_id)
         return success
     
     def search(self, search_term: str, fields: List[str] = None) -> List[Dict]:
@@ -3,17 +3,48 @@ Backup and recovery utilities for gcPanel.
 
 This module provides functions for database backups,
 automated backup verification, and point-in-time recovery.
+
+Dumps are streamed through a parallel compressor straight into the backup
+file with a running checksum (lib.utils.backup_stream); no shell, temp
+file or uncompressed copy is involved. PostgreSQL can also be dumped in
+directory format with parallel jobs (BACKUP_PG_FORMAT=directory).
+
+SQLite is backed up as database images taken with the online backup API
+(lib.utils.sqlite_backup): a full image, then incremental backups holding
+only changed pages, restored by rebuilding the image and swapping the file
+in. BACKUP_SQLITE_FORMAT=dump keeps SQL text dumps instead.
+
+With BACKUP_STORE=repository, backups go to a deduplicating chunk
+repository (lib.utils.backup_repository) instead of files: each backup is
+a manifest of content-defined chunks, so a nightly backup of a mostly
+unchanged database stores only the chunks that changed. The repository
+replaces the compressed files and SQLite incremental chains; by default
+(BACKUP_STORE=files) backups are files as described above.
+
+With WAL archiving enabled (lib.utils.wal_archive), point-in-time recovery
+replays archived WAL from the newest base backup before the target instead
+of restoring the nearest full backup.
 """
 
 import os
+import io
+import sqlite3
 import subprocess
 import logging
 import tempfile
 import datetime
 import json
 import shutil
-import gzip
-from pathlib import Path
+import time
+
+from lib.utils.backup_stream import (
+    BACKUP_COMPRESSION_LEVEL, EXTENSIONS, compress_stream, directory_sha256, directory_size,
+    feed_process, file_sha256, open_backup, process_output, read_chunks, resolve_compression, run_dump
+)
+from lib.utils.backup_repository import MANIFEST_SUFFIX, get_backup_repository
+from lib.utils.metrics import gauge, histogram
+from lib.utils import sqlite_backup
+from lib.utils.wal_archive import WAL_ARCHIVE_ENABLED, archiving_paused, get_wal_archiver, prepare_postgres_recovery
 
 # Setup logging
 logger = logging.getLogger(__name__)
@@ -21,26 +52,112 @@ logger = logging.getLogger(__name__)
 # Constants
 BACKUP_DIR = os.environ.get("BACKUP_DIR", "backups")
 RETENTION_DAYS = int(os.environ.get("BACKUP_RETENTION_DAYS", "30"))
+# "repository" (deduplicated chunks and manifests) or "files" (one file per backup)
+BACKUP_STORE = os.environ.get("BACKUP_STORE", "files").lower()
+# "plain" (SQL script, streamed through the compressor) or "directory" (pg_dump -Fd with parallel jobs)
+BACKUP_PG_FORMAT = os.environ.get("BACKUP_PG_FORMAT", "plain").lower()
+BACKUP_JOBS = int(os.environ.get("BACKUP_JOBS", str(min(os.cpu_count() or 2, 8))))
+# "image" (online backup API, full + incremental page backups) or "dump" (SQL text)
+BACKUP_SQLITE_FORMAT = os.environ.get("BACKUP_SQLITE_FORMAT", "image").lower()
+# Backups per chain: every BACKUP_FULL_EVERY-th backup is full, the ones in between incremental
+BACKUP_FULL_EVERY = int(os.environ.get("BACKUP_FULL_EVERY", "24"))
+
+SQL_BACKUP_SUFFIXES = (".sql.gz", ".sql.zst")
+DIRECTORY_BACKUP_SUFFIX = ".pgdump"
+IMAGE_BACKUP_SUFFIXES = (".sqlite.gz", ".sqlite.zst")
+DELTA_BACKUP_SUFFIXES = (".delta.gz", ".delta.zst")
+BACKUP_SUFFIXES = SQL_BACKUP_SUFFIXES + IMAGE_BACKUP_SUFFIXES + DELTA_BACKUP_SUFFIXES
+# Raw dump bytes batched per write to the compressor
+DUMP_BATCH_SIZE = 256 * 1024
 
 def ensure_backup_dir():
     """Ensure backup directory exists."""
     os.makedirs(BACKUP_DIR, exist_ok=True)
 
-def generate_backup_filename(prefix="backup", include_timestamp=True):
+def is_backup_name(name):
+    """Check if a file or directory name is a backup."""
+    return name.endswith(BACKUP_SUFFIXES) or name.endswith(DIRECTORY_BACKUP_SUFFIX)
+
+def is_page_backup(name):
+    """Check if a backup is a SQLite image or incremental page backup."""
+    return name.endswith(IMAGE_BACKUP_SUFFIXES) or name.endswith(DELTA_BACKUP_SUFFIXES)
+
+def is_repository_backup(backup_file):
+    """Check if a backup is a manifest in the backup repository."""
+    return backup_file.endswith(MANIFEST_SUFFIX)
+
+def _manifest_name(backup_file):
+    return os.path.basename(backup_file)[:-len(MANIFEST_SUFFIX)]
+
+def _backup_path(filename):
+    """Path of a backup listed by list_backups()."""
+    if is_repository_backup(filename):
+        return get_backup_repository().manifest_path(_manifest_name(filename))
+    return os.path.join(BACKUP_DIR, filename)
+
+def is_postgres():
+    """Check if the configured database is PostgreSQL."""
+    return os.environ.get("DATABASE_URL", "").startswith("postgresql")
+
+def get_sqlite_path():
+    """Path of the SQLite database."""
+    return os.environ.get("DB_PATH", "data/gcpanel.db")
+
+def generate_backup_filename(prefix="backup", include_timestamp=True, incremental=False):
     """
     Generate a filename for a backup.
     
+    The extension follows the backup format: .pgdump for PostgreSQL
+    directory-format dumps, .sqlite/.delta for SQLite full/incremental
+    images, otherwise .sql; then .gz or .zst by compression.
+    
     Args:
         prefix: Prefix for the filename
         include_timestamp: Whether to include a timestamp
-        
+        incremental: Whether the backup is a SQLite incremental backup
+    
     Returns:
         str: Backup filename
     """
+    compression = EXTENSIONS[resolve_compression()]
+    if is_postgres():
+        extension = DIRECTORY_BACKUP_SUFFIX if BACKUP_PG_FORMAT == "directory" else ".sql" + compression
+    elif incremental:
+        extension = ".delta" + compression
+    elif BACKUP_SQLITE_FORMAT == "image":
+        extension = ".sqlite" + compression
+    else:
+        extension = ".sql" + compression
+    
     if include_timestamp:
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-        return f"{prefix}_{timestamp}.sql.gz"
-    return f"{prefix}.sql.gz"
+        return f"{prefix}_{timestamp}{extension}"
+    return f"{prefix}{extension}"
+
+def get_connection_args(include_database=True):
+    """
+    Get PostgreSQL client arguments and environment for backup/restore.
+    
+    Args:
+        include_database: Whether to include the -d database argument
+    
+    Returns:
+        tuple: (argument list, environment dict with PGPASSWORD)
+    """
+    import urllib.parse
+    parsed_url = urllib.parse.urlparse(os.environ.get("DATABASE_URL", ""))
+    
+    args = ["-h", parsed_url.hostname or "localhost", "-p", str(parsed_url.port or 5432)]
+    if parsed_url.username:
+        args += ["-U", urllib.parse.unquote(parsed_url.username)]
+    if include_database:
+        args += ["-d", parsed_url.path.lstrip('/')]
+    
+    env = {}
+    password = urllib.parse.unquote(parsed_url.password) if parsed_url.password else os.environ.get("POSTGRES_PASSWORD")
+    if password:
+        env["PGPASSWORD"] = password
+    return args, env
 
 def get_connection_string():
     """
@@ -50,36 +167,198 @@ def get_connection_string():
         str: Connection options for PostgreSQL
     """
     # Check if using PostgreSQL
-    database_url = os.environ.get("DATABASE_URL", "")
+    if is_postgres():
+        args, _ = get_connection_args()
+        return " ".join(args)
     
-    if database_url and database_url.startswith("postgresql"):
-        # Parse components from DATABASE_URL
-        import urllib.parse
-        parsed_url = urllib.parse.urlparse(database_url)
+    # Using SQLite
+    return get_sqlite_path()
+
+def _sqlite_dump_chunks(db_path):
+    """
+    SQL dump of a SQLite database as encoded chunks.
+    
+    iterdump() reads in a single transaction that lasts the whole dump, so
+    unless the database is in WAL mode writers wait until it finishes.
+    """
+    conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    try:
+        batch = []
+        size = 0
+        for line in conn.iterdump():
+            data = (line + "\n").encode("utf-8")
+            batch.append(data)
+            size += len(data)
+            if size >= DUMP_BATCH_SIZE:
+                yield b"".join(batch)
+                batch = []
+                size = 0
+        if batch:
+            yield b"".join(batch)
+    finally:
+        conn.close()
+
+def _replay_sql(backup_file, db_path):
+    """
+    Execute a compressed SQL dump against a SQLite database, statement by statement.
+    
+    Args:
+        backup_file: .sql.gz or .sql.zst backup file
+        db_path: Database to load into
+    """
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        with open_backup(backup_file) as raw:
+            statement = ""
+            for line in io.TextIOWrapper(raw, encoding="utf-8"):
+                statement += line
+                if sqlite3.complete_statement(statement):
+                    conn.execute(statement)
+                    statement = ""
+            if statement.strip():
+                conn.execute(statement)
+    finally:
+        conn.close()
+
+def _record_backup_metrics(kind, report):
+    """Record duration and throughput of a backup or restore."""
+    histogram("gcpanel_backup_duration_milliseconds", "Backup and restore duration",
+              labels={"operation": kind}).observe(report["seconds"] * 1000)
+    if report.get("mb_per_second") is not None:
+        gauge("gcpanel_backup_throughput_mb_per_second", "Throughput of the last backup or restore",
+              labels={"operation": kind}).set(report["mb_per_second"])
+
+def _backup_chain(backup_file):
+    """
+    Files needed to restore a SQLite page backup: its full image, then incremental backups in order.
+    
+    Args:
+        backup_file: Path to a page backup
+    
+    Returns:
+        list: Backup file paths, oldest first
+    """
+    names = get_backup_metadata(backup_file).get("chain") or [os.path.basename(backup_file)]
+    chain = [os.path.join(os.path.dirname(backup_file), name) for name in names]
+    for path in chain:
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Backup chain is missing {os.path.basename(path)}")
+    return chain
+
+def _create_page_backup(db_path, backup_file, parent=None):
+    """
+    Snapshot a SQLite database into a full image or, given a parent, an incremental backup.
+    
+    Args:
+        db_path: Database to back up
+        backup_file: Backup file to write
+        parent: Optional page backup to diff against
+    
+    Returns:
+        dict: Pipeline report plus format, page counts and backup chain
+    """
+    snapshot_path = backup_file + ".snapshot"
+    try:
+        taken = sqlite_backup.snapshot(db_path, snapshot_path)
+        page_size = taken["page_size"]
         
-        # Extract connection parameters
-        user = parsed_url.username
-        password = parsed_url.password
-        host = parsed_url.hostname
-        port = parsed_url.port or 5432
-        dbname = parsed_url.path.lstrip('/')
+        parent_metadata = get_backup_metadata(parent) if parent else {}
+        if parent and parent_metadata.get("page_size") == page_size:
+            # Only the pages whose hash differs from the parent's
+            report, hashes = sqlite_backup.write_delta(
+                snapshot_path, backup_file, page_size, sqlite_backup.read_hashes(parent)
+            )
+            report["format"] = "incremental"
+            chain = parent_metadata["chain"] + [os.path.basename(backup_file)]
+        else:
+            report = sqlite_backup.write_image(snapshot_path, backup_file)
+            hashes = sqlite_backup.page_hashes(snapshot_path, page_size)
+            report["format"] = "full"
+            report["changed_pages"] = taken["page_count"]
+            chain = [os.path.basename(backup_file)]
         
-        return f"-h {host} -p {port} -U {user} -d {dbname}"
+        sqlite_backup.write_hashes(backup_file, hashes)
+    finally:
+        if os.path.exists(snapshot_path):
+            os.remove(snapshot_path)
+    
+    report.update({
+        "page_size": page_size,
+        "page_count": taken["page_count"],
+        "snapshot_seconds": taken["seconds"],
+        "chain": chain,
+    })
+    return report
+
+def _latest_page_backup():
+    """Newest SQLite page backup that an incremental backup can build on, if any."""
+    for backup in list_backups():
+        backup_file = os.path.join(BACKUP_DIR, backup.get("filename", ""))
+        if (is_page_backup(backup_file) and backup.get("chain")
+                and os.path.exists(backup_file) and os.path.exists(backup_file + ".pages")):
+            return backup_file
+    return None
+
+def _create_repository_backup():
+    """
+    Back up the database into the backup repository.
     
-    # Using SQLite
-    db_path = os.environ.get("DB_PATH", "data/gcpanel.db")
-    return db_path
+    PostgreSQL is stored as a plain pg_dump script and SQLite as an online
+    backup image, both uncompressed so that unchanged data produces the
+    same chunks as last time (chunks are compressed in the repository).
+    
+    Returns:
+        tuple: (success, manifest path)
+    """
+    ensure_backup_dir()
+    repository = get_backup_repository()
+    name = "backup_" + datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    metadata = {"application_version": os.environ.get("APP_VERSION", "unknown")}
+    
+    try:
+        if is_postgres():
+            conn_args, env = get_connection_args()
+            metadata.update({"database_type": "postgresql", "format": "sql"})
+            report = repository.store(name, process_output(["pg_dump", *conn_args, "--no-password"], env), metadata)
+        else:
+            db_path = get_sqlite_path()
+            if not os.path.exists(db_path):
+                logger.error(f"SQLite database not found: {db_path}")
+                return False, None
+            
+            snapshot_path = os.path.join(BACKUP_DIR, name + ".snapshot")
+            try:
+                taken = sqlite_backup.snapshot(db_path, snapshot_path)
+                metadata.update({"database_type": "sqlite", "format": "sqlite_image", "page_size": taken["page_size"]})
+                with open(snapshot_path, "rb") as f:
+                    report = repository.store(name, read_chunks(f), metadata)
+            finally:
+                if os.path.exists(snapshot_path):
+                    os.remove(snapshot_path)
+        
+        _record_backup_metrics("backup", report)
+        return True, repository.manifest_path(name)
+    
+    except Exception as e:
+        logger.error(f"Repository backup failed: {str(e)}")
+        return False, None
 
 def create_backup(backup_file=None):
     """
     Create a backup of the database.
     
+    Without a filename, the backup goes to the backup repository when
+    BACKUP_STORE is "repository" and the manifest path is returned.
+    
     Args:
         backup_file: Optional filename for the backup
         
     Returns:
         tuple: (success, backup_file)
     """
+    if not backup_file and BACKUP_STORE == "repository":
+        return _create_repository_backup()
+    
     ensure_backup_dir()
     
     if not backup_file:
@@ -87,46 +366,121 @@ def create_backup(backup_file=None):
     
     try:
         # Check if we're using PostgreSQL
-        database_url = os.environ.get("DATABASE_URL", "")
-        
-        if database_url and database_url.startswith("postgresql"):
-            # Use pg_dump for PostgreSQL
-            conn_string = get_connection_string()
+        if is_postgres():
+            conn_args, env = get_connection_args()
             
-            # Run pg_dump and pipe to gzip
-            cmd = f"PGPASSWORD='{os.environ.get('POSTGRES_PASSWORD')}' pg_dump {conn_string} | gzip > {backup_file}"
-            subprocess.run(cmd, shell=True, check=True)
+            if backup_file.endswith(DIRECTORY_BACKUP_SUFFIX):
+                # Directory format: one compressed file per table, dumped by parallel jobs
+                start = time.monotonic()
+                subprocess.run(
+                    ["pg_dump", *conn_args, "--no-password", "-Fd", "-j", str(BACKUP_JOBS),
+                     "-Z", str(BACKUP_COMPRESSION_LEVEL), "-f", backup_file],
+                    check=True, capture_output=True, env={**os.environ, **env}
+                )
+                size = directory_size(backup_file)
+                seconds = time.monotonic() - start
+                report = {
+                    "raw_bytes": None,
+                    "compressed_bytes": size,
+                    "seconds": round(seconds, 3),
+                    "mb_per_second": round(size / 1048576 / seconds, 2) if seconds > 0 else None,
+                    "ratio": None,
+                    "compression": "pg_dump",
+                    "jobs": BACKUP_JOBS,
+                    "files": directory_sha256(backup_file),
+                }
+            else:
+                # Plain SQL streamed from pg_dump through the compressor
+                report = run_dump(["pg_dump", *conn_args, "--no-password"], backup_file, env=env)
             
             logger.info(f"PostgreSQL backup created: {backup_file}")
             
         else:
             # SQLite backup
-            db_path = os.environ.get("DB_PATH", "data/gcpanel.db")
+            db_path = get_sqlite_path()
             
             # Check if database exists
             if not os.path.exists(db_path):
                 logger.error(f"SQLite database not found: {db_path}")
                 return False, None
             
-            # Create backup using sqlite3 dump
-            with tempfile.NamedTemporaryFile(mode='w') as temp_sql:
-                cmd = f"sqlite3 {db_path} .dump"
-                subprocess.run(cmd, shell=True, check=True, stdout=temp_sql)
-                
-                # Compress with gzip
-                with open(temp_sql.name, 'rb') as f_in:
-                    with gzip.open(backup_file, 'wb') as f_out:
-                        shutil.copyfileobj(f_in, f_out)
+            if backup_file.endswith(IMAGE_BACKUP_SUFFIXES):
+                # Full database image taken with the online backup API
+                report = _create_page_backup(db_path, backup_file)
+            else:
+                # Stream the SQL dump through the compressor
+                report = compress_stream(_sqlite_dump_chunks(db_path), backup_file)
             
             logger.info(f"SQLite backup created: {backup_file}")
         
+        logger.info(
+            f"Backup throughput: {report['compressed_bytes'] / 1048576:.1f} MB written in {report['seconds']:.1f}s"
+            + (f" ({report['mb_per_second']} MB/s)" if report.get("mb_per_second") else "")
+        )
+        _record_backup_metrics("backup", report)
+        
         # Add backup metadata
-        add_backup_metadata(backup_file)
+        add_backup_metadata(backup_file, report)
         
         return True, backup_file
+    
+    except Exception as e:
+        if isinstance(e, subprocess.CalledProcessError) and e.stderr:
+            logger.error(f"Backup failed: {e.stderr.decode(errors='replace').strip()}")
+        else:
+            logger.error(f"Backup failed: {str(e)}")
+        if backup_file.endswith(DIRECTORY_BACKUP_SUFFIX) and os.path.isdir(backup_file):
+            shutil.rmtree(backup_file, ignore_errors=True)
+        return False, None
+
+def create_incremental_backup(backup_file=None):
+    """
+    Create a SQLite backup of the pages changed since the latest backup.
+    
+    A full backup is made instead when there is no page backup to build
+    on, the chain already holds BACKUP_FULL_EVERY backups (the full one
+    included), or the database is not backed up as SQLite images. It is
+    written to backup_file, with a .delta suffix turned into .sqlite.
+    
+    Args:
+        backup_file: Optional filename for the backup
+    
+    Returns:
+        tuple: (success, backup_file)
+    """
+    if is_postgres() or BACKUP_SQLITE_FORMAT != "image" or (not backup_file and BACKUP_STORE == "repository"):
+        # Repository backups only store changed chunks anyway
+        return create_backup(backup_file)
+    
+    parent = _latest_page_backup()
+    if parent is None or len(get_backup_metadata(parent)["chain"]) >= BACKUP_FULL_EVERY:
+        # Named for an increment: keep the caller's path, with a full image's suffix
+        for delta_suffix, image_suffix in zip(DELTA_BACKUP_SUFFIXES, IMAGE_BACKUP_SUFFIXES):
+            if backup_file and backup_file.endswith(delta_suffix):
+                backup_file = backup_file[:-len(delta_suffix)] + image_suffix
+        return create_backup(backup_file)
+    
+    ensure_backup_dir()
+    if not backup_file:
+        backup_file = os.path.join(BACKUP_DIR, generate_backup_filename(incremental=True))
+    
+    try:
+        db_path = get_sqlite_path()
+        if not os.path.exists(db_path):
+            logger.error(f"SQLite database not found: {db_path}")
+            return False, None
         
+        report = _create_page_backup(db_path, backup_file, parent)
+        logger.info(
+            f"SQLite {report['format']} backup created: {backup_file} "
+            f"({report['changed_pages']} of {report['page_count']} pages)"
+        )
+        _record_backup_metrics("backup", report)
+        add_backup_metadata(backup_file, report)
+        return True, backup_file
+    
     except Exception as e:
-        logger.error(f"Backup failed: {str(e)}")
+        logger.error(f"Incremental backup failed: {str(e)}")
         return False, None
 
 def restore_backup(backup_file):
@@ -144,52 +498,96 @@ def restore_backup(backup_file):
         return False
     
     try:
-        # Check if we're using PostgreSQL
-        database_url = os.environ.get("DATABASE_URL", "")
+        start = time.monotonic()
         
-        if database_url and database_url.startswith("postgresql"):
-            # Use pg_restore for PostgreSQL
-            conn_string = get_connection_string()
+        # Check if we're using PostgreSQL
+        if is_postgres():
+            conn_args, env = get_connection_args()
             
-            # Run gunzip and pipe to psql
-            cmd = f"gunzip -c {backup_file} | PGPASSWORD='{os.environ.get('POSTGRES_PASSWORD')}' psql {conn_string}"
-            subprocess.run(cmd, shell=True, check=True)
+            if is_repository_backup(backup_file):
+                # Stream the dump from the repository's chunks into psql
+                repository_stream = get_backup_repository().read(_manifest_name(backup_file))
+                feed_process(["psql", *conn_args, "--no-password", "-q"], repository_stream, env=env)
+            elif backup_file.endswith(DIRECTORY_BACKUP_SUFFIX):
+                # Parallel restore of a directory-format dump
+                subprocess.run(
+                    ["pg_restore", *conn_args, "--no-password", "--clean", "--if-exists",
+                     "-j", str(BACKUP_JOBS), backup_file],
+                    check=True, capture_output=True, env={**os.environ, **env}
+                )
+            else:
+                # Stream the decompressed dump into psql
+                with open_backup(backup_file) as stream:
+                    feed_process(["psql", *conn_args, "--no-password", "-q"], read_chunks(stream), env=env)
             
             logger.info(f"PostgreSQL backup restored: {backup_file}")
             
         else:
             # SQLite restore
-            db_path = os.environ.get("DB_PATH", "data/gcpanel.db")
+            db_path = get_sqlite_path()
             
             # Create a backup of the current database first
-            current_backup = os.path.join(BACKUP_DIR, "pre_restore_" + generate_backup_filename())
-            create_backup(current_backup)
-            
-            # Extract SQL from gzip
-            with tempfile.NamedTemporaryFile(mode='wb', delete=False) as temp_sql:
-                with gzip.open(backup_file, 'rb') as f_in:
-                    shutil.copyfileobj(f_in, temp_sql)
+            if os.path.exists(db_path):
+                current_backup = os.path.join(BACKUP_DIR, "pre_restore_" + generate_backup_filename())
+                create_backup(current_backup)
             
+            # Load into a new file next to the database, then swap it in
+            restoring = db_path + ".restoring"
+            if os.path.exists(restoring):
+                os.remove(restoring)
             try:
-                # Delete existing database
-                if os.path.exists(db_path):
-                    os.remove(db_path)
-                
-                # Restore using sqlite3
-                cmd = f"sqlite3 {db_path} < {temp_sql.name}"
-                subprocess.run(cmd, shell=True, check=True)
-                
-                logger.info(f"SQLite backup restored: {backup_file}")
+                if is_repository_backup(backup_file) or is_page_backup(backup_file):
+                    if is_repository_backup(backup_file):
+                        # Reassemble the image from the repository's chunks
+                        get_backup_repository().restore_to(_manifest_name(backup_file), restoring)
+                    else:
+                        # Rebuild the image from the full backup and its increments
+                        sqlite_backup.materialize(_backup_chain(backup_file), restoring)
+                    if not sqlite_backup.quick_check(restoring):
+                        raise ValueError(f"Restored database failed integrity check: {backup_file}")
+                else:
+                    _replay_sql(backup_file, restoring)
+                with archiving_paused():
+                    sqlite_backup.swap_database(restoring, db_path)
             finally:
-                # Clean up temp file
-                os.unlink(temp_sql.name)
+                if os.path.exists(restoring):
+                    os.remove(restoring)
+            
+            logger.info(f"SQLite backup restored: {backup_file}")
         
+        _record_backup_metrics("restore", {"seconds": time.monotonic() - start})
         return True
         
     except Exception as e:
-        logger.error(f"Restore failed: {str(e)}")
+        if isinstance(e, subprocess.CalledProcessError) and e.stderr:
+            logger.error(f"Restore failed: {e.stderr.decode(errors='replace').strip()}")
+        else:
+            logger.error(f"Restore failed: {str(e)}")
         return False
 
+def verify_checksum(backup_file):
+    """
+    Check a backup against the checksums recorded when it was created.
+    
+    Args:
+        backup_file: Path to the backup file
+    
+    Returns:
+        bool: False if a checksum does not match; True if all match or none were recorded
+    """
+    metadata = get_backup_metadata(backup_file)
+    
+    if os.path.isdir(backup_file):
+        expected = metadata.get("files")
+        if expected is None:
+            return True
+        return directory_sha256(backup_file) == expected
+    
+    expected = metadata.get("sha256")
+    if expected is None:
+        return True
+    return file_sha256(backup_file) == expected
+
 def verify_backup(backup_file):
     """
     Verify a backup file is valid and can be restored.
@@ -204,79 +602,108 @@ def verify_backup(backup_file):
         logger.error(f"Backup file not found: {backup_file}")
         return False
     
+    if is_repository_backup(backup_file):
+        # Every chunk is re-hashed; nothing is restored
+        result = get_backup_repository().verify([_manifest_name(backup_file)])
+        if not result["ok"]:
+            logger.error(
+                f"Backup verification failed: {backup_file} "
+                f"({len(result['missing'])} chunks missing, {len(result['corrupt'])} corrupt)"
+            )
+        return result["ok"]
+    
     try:
+        # A corrupted file fails here without a restore
+        chain = _backup_chain(backup_file) if is_page_backup(backup_file) else [backup_file]
+        for chain_file in chain:
+            if not verify_checksum(chain_file):
+                logger.error(f"Backup checksum mismatch: {chain_file}")
+                return False
+        
         # Create a temporary directory for verification
         with tempfile.TemporaryDirectory() as temp_dir:
             # Check if we're using PostgreSQL
-            database_url = os.environ.get("DATABASE_URL", "")
-            
-            if database_url and database_url.startswith("postgresql"):
+            if is_postgres():
                 # Create a temporary database for verification
                 temp_db = "verify_backup"
+                server_args, env = get_connection_args(include_database=False)
+                client_env = {**os.environ, **env}
                 
                 # Create the test database
-                conn_string = get_connection_string().replace(f"-d {temp_db}", "")
-                create_cmd = f"PGPASSWORD='{os.environ.get('POSTGRES_PASSWORD')}' createdb {conn_string} {temp_db}"
-                subprocess.run(create_cmd, shell=True, check=True)
+                subprocess.run(["createdb", *server_args, "--no-password", temp_db],
+                               check=True, capture_output=True, env=client_env)
                 
                 try:
                     # Restore to the test database
-                    restore_cmd = f"gunzip -c {backup_file} | PGPASSWORD='{os.environ.get('POSTGRES_PASSWORD')}' psql {conn_string} -d {temp_db}"
-                    subprocess.run(restore_cmd, shell=True, check=True)
+                    if backup_file.endswith(DIRECTORY_BACKUP_SUFFIX):
+                        subprocess.run(
+                            ["pg_restore", *server_args, "--no-password", "-j", str(BACKUP_JOBS),
+                             "-d", temp_db, backup_file],
+                            check=True, capture_output=True, env=client_env
+                        )
+                    else:
+                        with open_backup(backup_file) as stream:
+                            feed_process(["psql", *server_args, "--no-password", "-q", "-d", temp_db],
+                                         read_chunks(stream), env=env)
                     
                     # Check if we can query the test database
-                    test_cmd = f"PGPASSWORD='{os.environ.get('POSTGRES_PASSWORD')}' psql {conn_string} -d {temp_db} -c 'SELECT 1'"
-                    result = subprocess.run(test_cmd, shell=True, check=True, capture_output=True)
+                    result = subprocess.run(
+                        ["psql", *server_args, "--no-password", "-d", temp_db, "-tAc", "SELECT 1"],
+                        check=True, capture_output=True, env=client_env
+                    )
                     
                     return "1" in result.stdout.decode()
                     
                 finally:
                     # Drop the test database
-                    drop_cmd = f"PGPASSWORD='{os.environ.get('POSTGRES_PASSWORD')}' dropdb {conn_string} {temp_db}"
-                    subprocess.run(drop_cmd, shell=True, check=True)
+                    subprocess.run(["dropdb", *server_args, "--no-password", temp_db],
+                                   check=True, capture_output=True, env=client_env)
             
             else:
                 # SQLite verification
                 temp_db = os.path.join(temp_dir, "verify.db")
                 
-                # Extract SQL from gzip
-                with tempfile.NamedTemporaryFile(mode='wb', delete=False) as temp_sql:
-                    with gzip.open(backup_file, 'rb') as f_in:
-                        shutil.copyfileobj(f_in, temp_sql)
+                # Restore to temporary database
+                if is_page_backup(backup_file):
+                    sqlite_backup.materialize(chain, temp_db)
+                    if not sqlite_backup.quick_check(temp_db):
+                        return False
+                else:
+                    _replay_sql(backup_file, temp_db)
                 
+                # Check if we can query the database
+                conn = sqlite3.connect(temp_db)
                 try:
-                    # Restore to temporary database
-                    cmd = f"sqlite3 {temp_db} < {temp_sql.name}"
-                    subprocess.run(cmd, shell=True, check=True)
-                    
-                    # Check if we can query the database
-                    test_cmd = f"sqlite3 {temp_db} 'SELECT 1'"
-                    result = subprocess.run(test_cmd, shell=True, check=True, capture_output=True)
-                    
-                    return "1" in result.stdout.decode()
-                
+                    return conn.execute("SELECT 1").fetchone() == (1,)
                 finally:
-                    # Clean up temp file
-                    os.unlink(temp_sql.name)
+                    conn.close()
     
     except Exception as e:
         logger.error(f"Backup verification failed: {str(e)}")
         return False
 
-def add_backup_metadata(backup_file):
+def _backup_size(backup_file):
+    if os.path.isdir(backup_file):
+        return directory_size(backup_file)
+    return os.path.getsize(backup_file)
+
+def add_backup_metadata(backup_file, report=None):
     """
     Add metadata to a backup file.
     
     Args:
         backup_file: Path to the backup file
+        report: Optional pipeline report (checksums, throughput) to include
     """
     metadata = {
         "filename": os.path.basename(backup_file),
         "created_at": datetime.datetime.now().isoformat(),
-        "database_type": "postgresql" if os.environ.get("DATABASE_URL", "").startswith("postgresql") else "sqlite",
-        "size_bytes": os.path.getsize(backup_file),
+        "database_type": "postgresql" if is_postgres() else "sqlite",
+        "size_bytes": _backup_size(backup_file),
         "application_version": os.environ.get("APP_VERSION", "unknown")
     }
+    if report:
+        metadata.update(report)
     
     # Create metadata file
     metadata_file = backup_file + ".meta"
@@ -293,6 +720,11 @@ def get_backup_metadata(backup_file):
     Returns:
         dict: Backup metadata
     """
+    if is_repository_backup(backup_file):
+        manifest = get_backup_repository().get_manifest(_manifest_name(backup_file))
+        manifest.pop("chunks", None)
+        return {**manifest, "filename": os.path.basename(backup_file), "repository": True}
+    
     metadata_file = backup_file + ".meta"
     
     if not os.path.exists(metadata_file):
@@ -300,7 +732,7 @@ def get_backup_metadata(backup_file):
         return {
             "filename": os.path.basename(backup_file),
             "created_at": datetime.datetime.fromtimestamp(os.path.getctime(backup_file)).isoformat(),
-            "size_bytes": os.path.getsize(backup_file)
+            "size_bytes": _backup_size(backup_file)
         }
     
     with open(metadata_file, 'r') as f:
@@ -318,11 +750,14 @@ def list_backups():
     backups = []
     
     for file in os.listdir(BACKUP_DIR):
-        if file.endswith(".sql.gz"):
+        if is_backup_name(file):
             backup_file = os.path.join(BACKUP_DIR, file)
             metadata = get_backup_metadata(backup_file)
             backups.append(metadata)
     
+    for manifest in get_backup_repository().manifests():
+        backups.append({**manifest, "filename": manifest["name"] + MANIFEST_SUFFIX, "repository": True})
+    
     # Sort by creation time (newest first)
     backups.sort(key=lambda x: x.get("created_at", ""), reverse=True)
     
@@ -340,8 +775,17 @@ def cleanup_old_backups():
     retention_date = datetime.datetime.now() - datetime.timedelta(days=RETENTION_DAYS)
     count = 0
     
+    # Full and incremental backups that newer page backups still build on
+    needed = set()
+    for backup in list_backups():
+        try:
+            if datetime.datetime.fromisoformat(backup.get("created_at", "")) >= retention_date:
+                needed.update(backup.get("chain", []))
+        except ValueError:
+            pass
+    
     for file in os.listdir(BACKUP_DIR):
-        if file.endswith(".sql.gz"):
+        if is_backup_name(file) and file not in needed:
             backup_file = os.path.join(BACKUP_DIR, file)
             metadata_file = backup_file + ".meta"
             
@@ -356,22 +800,38 @@ def cleanup_old_backups():
                 
                 # Remove if older than retention period
                 if created_at < retention_date:
-                    os.remove(backup_file)
-                    if os.path.exists(metadata_file):
-                        os.remove(metadata_file)
+                    if os.path.isdir(backup_file):
+                        shutil.rmtree(backup_file)
+                    else:
+                        os.remove(backup_file)
+                    for sidecar in (metadata_file, backup_file + ".pages"):
+                        if os.path.exists(sidecar):
+                            os.remove(sidecar)
                     count += 1
                     logger.info(f"Removed old backup: {file}")
             
             except Exception as e:
                 logger.error(f"Error processing backup for cleanup: {file}, {str(e)}")
     
+    # Expired manifests, then the chunks no remaining backup uses
+    try:
+        collected = get_backup_repository().gc(RETENTION_DAYS)
+        count += collected["manifests_removed"]
+        if collected["chunks_removed"]:
+            logger.info(
+                f"Removed {collected['chunks_removed']} unused chunks "
+                f"({collected['bytes_freed'] / 1048576:.1f} MB) from the backup repository"
+            )
+    except Exception as e:
+        logger.error(f"Error collecting backup repository: {str(e)}")
+    
     return count
 
 def scheduled_backup():
     """Perform a scheduled backup with verification."""
     logger.info("Starting scheduled backup")
     
-    success, backup_file = create_backup()
+    success, backup_file = create_incremental_backup()
     
     if success and backup_file:
         # Verify backup
@@ -389,16 +849,87 @@ def scheduled_backup():
     
     return False, None
 
+def _recover_from_wal_archive(target_time):
+    """
+    Recover the database to a point in time by replaying the WAL archive.
+    
+    Args:
+        target_time: Point in time to recover to
+    
+    Returns:
+        bool: Recovery result, or None if the archive has no base backup before the target
+    """
+    if is_postgres():
+        data_dir = os.path.join(BACKUP_DIR, "pitr_" + target_time.strftime("%Y%m%d_%H%M%S"))
+        try:
+            prepared = prepare_postgres_recovery(target_time, data_dir)
+        except ValueError as e:
+            logger.warning(f"WAL archive cannot recover to {target_time.isoformat()}: {str(e)}")
+            return None
+        # The server has to be restarted on the recovered data directory
+        logger.warning(
+            f"PostgreSQL recovery to {target_time.isoformat()} prepared in {data_dir} from "
+            f"{prepared['base']}; start it with: {prepared['start_command']}"
+        )
+        return True
+    
+    db_path = get_sqlite_path()
+    restoring = db_path + ".restoring"
+    if os.path.exists(restoring):
+        os.remove(restoring)
+    try:
+        try:
+            recovered = get_wal_archiver().recover(target_time, restoring)
+        except ValueError as e:
+            logger.warning(f"WAL archive cannot recover to {target_time.isoformat()}: {str(e)}")
+            return None
+        if not sqlite_backup.quick_check(restoring):
+            logger.error(f"Recovered database failed integrity check at {recovered['recovered_to']}")
+            return False
+        
+        # Keep the current database, then swap the recovered one in
+        if os.path.exists(db_path):
+            create_backup(os.path.join(BACKUP_DIR, "pre_restore_" + generate_backup_filename()))
+        with archiving_paused():
+            sqlite_backup.swap_database(restoring, db_path)
+        
+        logger.info(
+            f"Recovered to {recovered['recovered_to']} from {recovered['base']} "
+            f"and {recovered['segments']} WAL segments ({recovered['frames']} frames)"
+        )
+        return True
+    
+    except Exception as e:
+        logger.error(f"WAL archive recovery failed: {str(e)}")
+        return False
+    finally:
+        if os.path.exists(restoring):
+            os.remove(restoring)
+
 def point_in_time_recovery(timestamp):
     """
     Restore database to a specific point in time.
     
+    A timestamp is recovered from the WAL archive when archiving is
+    enabled and it has a base backup before the timestamp; otherwise the
+    nearest backup before it is restored.
+    
     Args:
         timestamp: ISO format timestamp or backup filename
         
     Returns:
         bool: True if successful, False otherwise
     """
+    if WAL_ARCHIVE_ENABLED and not (is_backup_name(timestamp) or is_repository_backup(timestamp)):
+        try:
+            target_time = datetime.datetime.fromisoformat(timestamp)
+        except ValueError:
+            logger.error(f"Invalid timestamp format: {timestamp}")
+            return False
+        recovered = _recover_from_wal_archive(target_time)
+        if recovered is not None:
+            return recovered
+    
     # List all backups
     backups = list_backups()
     
@@ -409,9 +940,9 @@ def point_in_time_recovery(timestamp):
     # Find the backup closest to the requested timestamp
     target_backup = None
     
-    if timestamp.endswith(".sql.gz"):
+    if is_backup_name(timestamp) or is_repository_backup(timestamp):
         # Direct filename provided
-        backup_path = os.path.join(BACKUP_DIR, timestamp)
+        backup_path = _backup_path(timestamp)
         if os.path.exists(backup_path):
             target_backup = backup_path
     else:
@@ -434,7 +965,7 @@ def point_in_time_recovery(timestamp):
                         closest_backup = backup
             
             if closest_backup:
-                target_backup = os.path.join(BACKUP_DIR, closest_backup.get("filename"))
+                target_backup = _backup_path(closest_backup.get("filename"))
         
         except ValueError:
             logger.error(f"Invalid timestamp format: {timestamp}")
@@ -446,4 +977,4 @@ def point_in_time_recovery(timestamp):
         return restore_backup(target_backup)
     
     logger.error(f"No suitable backup found for point-in-time recovery: {timestamp}")
-    return False
\ No newline at end of file
+    return False
@@ -0,0 +1,462 @@
+"""
+Deduplicating backup repository for gcPanel.
+
+This module stores backups as content-addressed chunks so that nightly
+backups of a mostly unchanged database only add what changed:
+- Backup streams are cut at content-defined boundaries (FastCDC-style
+  gear rolling hash with normalized chunking), so an insert shifts only
+  the chunks around it, not every chunk after it
+- Chunks are named by their SHA-256 and stored once, zlib-compressed,
+  under chunks/<first two hex digits>/
+- Each backup is a JSON manifest listing its chunks in order, with the
+  creation time, size and SHA-256 of the whole stream
+- Verification re-hashes chunks without restoring anything; point-in-time
+  recovery picks the newest manifest at or before a timestamp; garbage
+  collection drops expired manifests and the chunks no manifest uses
+
+Boundary hashes are vectorized with numpy when it is installed; the pure
+Python fallback finds the same boundaries.
+"""
+
+import os
+import json
+import time
+import zlib
+import bisect
+import hashlib
+import logging
+import datetime
+import threading
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Constants
+BACKUP_REPOSITORY_DIR = os.environ.get(
+    "BACKUP_REPOSITORY_DIR", os.path.join(os.environ.get("BACKUP_DIR", "backups"), "repository")
+)
+# Chunk sizes; the average must be a power of two
+CHUNK_MIN_SIZE = int(os.environ.get("BACKUP_CHUNK_MIN_SIZE", str(16 * 1024)))
+CHUNK_AVG_SIZE = int(os.environ.get("BACKUP_CHUNK_AVG_SIZE", str(64 * 1024)))
+CHUNK_MAX_SIZE = int(os.environ.get("BACKUP_CHUNK_MAX_SIZE", str(256 * 1024)))
+CHUNK_COMPRESSION_LEVEL = int(os.environ.get("BACKUP_CHUNK_COMPRESSION_LEVEL", "6"))
+# Unreferenced chunks younger than this are kept by gc (a backup may be writing them)
+GC_GRACE_SECONDS = int(os.environ.get("BACKUP_GC_GRACE_SECONDS", "3600"))
+# Bytes buffered before boundaries are searched
+SCAN_BUFFER_SIZE = 8 * 1024 * 1024
+
+MANIFEST_SUFFIX = ".manifest"
+
+# Gear table: one pseudo-random 32-bit value per byte value, fixed so boundaries never move
+GEAR = [int.from_bytes(hashlib.sha256(bytes([value])).digest()[:4], "big") for value in range(256)]
+HASH_MASK = 0xFFFFFFFF
+
+
+def _mask(bits: int) -> int:
+    """Mask of the top bits of the 32-bit hash (the bits that depend on the last 32 bytes)."""
+    return ((1 << bits) - 1) << (32 - bits)
+
+
+def _numpy():
+    try:
+        import numpy
+        return numpy
+    except ImportError:
+        return None
+
+
+class Chunker:
+    """
+    Content-defined chunking.
+
+    The gear hash of a position depends only on the 32 bytes ending there.
+    Before the average size a boundary needs a stricter mask (more zero
+    bits), after it a looser one, which keeps chunk sizes close to the
+    average; no chunk is shorter than min_size (except the last) or longer
+    than max_size.
+    """
+
+    def __init__(self, min_size: int = CHUNK_MIN_SIZE, avg_size: int = CHUNK_AVG_SIZE,
+                 max_size: int = CHUNK_MAX_SIZE):
+        if avg_size & (avg_size - 1) or not 64 <= min_size < avg_size < max_size:
+            raise ValueError("Chunk sizes need 64 <= min < avg < max with avg a power of two")
+        bits = avg_size.bit_length() - 1
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+        self.strict_mask = _mask(min(bits + 2, 32))
+        self.loose_mask = _mask(max(bits - 2, 1))
+
+    def _candidates(self, data) -> Tuple[List[int], List[int]]:
+        """Chunk ends (offset after the byte) where the strict and the loose mask match."""
+        numpy = _numpy()
+        if numpy is not None:
+            values = numpy.array(GEAR, dtype=numpy.uint32)[numpy.frombuffer(data, dtype=numpy.uint8)]
+            hashes = numpy.zeros(len(values), dtype=numpy.uint32)
+            for shift in range(min(32, len(values))):
+                hashes[shift:] += values[:len(values) - shift] << numpy.uint32(shift)
+            strict = numpy.flatnonzero((hashes & numpy.uint32(self.strict_mask)) == 0) + 1
+            loose = numpy.flatnonzero((hashes & numpy.uint32(self.loose_mask)) == 0) + 1
+            return strict.tolist(), loose.tolist()
+
+        strict, loose = [], []
+        rolling = 0
+        strict_mask, loose_mask = self.strict_mask, self.loose_mask
+        for offset, value in enumerate(data, start=1):
+            rolling = ((rolling << 1) + GEAR[value]) & HASH_MASK
+            if not rolling & loose_mask:
+                loose.append(offset)
+                if not rolling & strict_mask:
+                    strict.append(offset)
+        return strict, loose
+
+    @staticmethod
+    def _first(candidates: List[int], low: int, high: int) -> Optional[int]:
+        index = bisect.bisect_left(candidates, low)
+        if index < len(candidates) and candidates[index] < high:
+            return candidates[index]
+        return None
+
+    def _cut(self, data, final: bool) -> List[int]:
+        """Chunk ends in data that are certain with the bytes seen so far."""
+        strict, loose = self._candidates(data)
+        length = len(data)
+        ends = []
+        start = 0
+        while start < length:
+            end = self._first(strict, start + self.min_size, start + self.avg_size)
+            if end is None and (final or length >= start + self.avg_size):
+                end = self._first(loose, start + self.avg_size, start + self.max_size)
+                if end is None and (final or length >= start + self.max_size):
+                    end = min(start + self.max_size, length)
+            if end is None:
+                break
+            ends.append(end)
+            start = end
+        return ends
+
+    def chunks(self, blocks: Iterable[bytes]) -> Iterator[bytes]:
+        """
+        Cut a stream into chunks.
+
+        Args:
+            blocks: The stream, in blocks of any size
+
+        Yields:
+            bytes: Chunks, in order
+        """
+        pending = bytearray()
+        for block in blocks:
+            pending += block
+            if len(pending) < SCAN_BUFFER_SIZE:
+                continue
+            start = 0
+            for end in self._cut(pending, final=False):
+                yield bytes(pending[start:end])
+                start = end
+            del pending[:start]
+
+        start = 0
+        for end in self._cut(pending, final=True):
+            yield bytes(pending[start:end])
+            start = end
+
+
+class BackupRepository:
+    """Chunk store and backup manifests in one directory."""
+
+    def __init__(self, path: str = BACKUP_REPOSITORY_DIR, chunker: Optional[Chunker] = None):
+        self.path = path
+        self.chunker = chunker or Chunker()
+        self.chunk_dir = os.path.join(path, "chunks")
+        self.manifest_dir = os.path.join(path, "manifests")
+        self._lock = threading.Lock()
+
+    def _ensure_dirs(self):
+        os.makedirs(self.chunk_dir, exist_ok=True)
+        os.makedirs(self.manifest_dir, exist_ok=True)
+
+    def chunk_path(self, digest: str) -> str:
+        return os.path.join(self.chunk_dir, digest[:2], digest)
+
+    def manifest_path(self, name: str) -> str:
+        return os.path.join(self.manifest_dir, name + MANIFEST_SUFFIX)
+
+    def _put_chunk(self, digest: str, data: bytes) -> int:
+        """Store a chunk unless present; returns the bytes written (0 if it was already stored)."""
+        path = self.chunk_path(digest)
+        if os.path.exists(path):
+            # Refresh the mtime so a concurrent gc's grace period covers it
+            os.utime(path)
+            return 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        compressed = zlib.compress(data, CHUNK_COMPRESSION_LEVEL)
+        partial = f"{path}.{threading.get_ident()}.partial"
+        with open(partial, "wb") as f:
+            f.write(compressed)
+        os.replace(partial, path)
+        return len(compressed)
+
+    def read_chunk(self, digest: str) -> bytes:
+        """
+        Read a chunk and check it against its name.
+
+        Raises:
+            ValueError: If the chunk's content does not match its hash
+        """
+        with open(self.chunk_path(digest), "rb") as f:
+            data = zlib.decompress(f.read())
+        if hashlib.sha256(data).hexdigest() != digest:
+            raise ValueError(f"Chunk {digest} is corrupt")
+        return data
+
+    def store(self, name: str, blocks: Iterable[bytes], metadata: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Store a backup stream as chunks and write its manifest.
+
+        Args:
+            name: Backup name (unique in the repository)
+            blocks: The backup stream, in blocks of any size
+            metadata: Extra fields for the manifest (e.g. database_type)
+
+        Returns:
+            dict: The manifest without its chunk list, plus the store report
+                (new_chunks, stored_bytes, seconds, mb_per_second)
+        """
+        self._ensure_dirs()
+        if os.path.exists(self.manifest_path(name)):
+            raise ValueError(f"Backup {name} already exists")
+
+        start = time.monotonic()
+        stream_digest = hashlib.sha256()
+        chunks = []
+        size = 0
+        new_chunks = 0
+        stored_bytes = 0
+        for data in self.chunker.chunks(blocks):
+            digest = hashlib.sha256(data).hexdigest()
+            written = self._put_chunk(digest, data)
+            if written:
+                new_chunks += 1
+                stored_bytes += written
+            stream_digest.update(data)
+            chunks.append([digest, len(data)])
+            size += len(data)
+        seconds = time.monotonic() - start
+
+        manifest = {
+            **(metadata or {}),
+            "name": name,
+            "created_at": datetime.datetime.now().isoformat(),
+            "size_bytes": size,
+            "sha256": stream_digest.hexdigest(),
+            "chunk_count": len(chunks),
+            "new_chunks": new_chunks,
+            "stored_bytes": stored_bytes,
+            "seconds": round(seconds, 3),
+            "mb_per_second": round(size / 1048576 / seconds, 2) if seconds > 0 else None,
+            "chunks": chunks,
+        }
+        partial = self.manifest_path(name) + ".partial"
+        with open(partial, "w") as f:
+            json.dump(manifest, f)
+        os.replace(partial, self.manifest_path(name))
+
+        logger.info(
+            f"Stored backup {name}: {size / 1048576:.1f} MB in {len(chunks)} chunks, "
+            f"{new_chunks} new ({stored_bytes / 1048576:.1f} MB written)"
+        )
+        return {key: value for key, value in manifest.items() if key != "chunks"}
+
+    def get_manifest(self, name: str) -> Dict[str, Any]:
+        """Manifest of a backup, with its chunk list."""
+        with open(self.manifest_path(name), "r") as f:
+            return json.load(f)
+
+    def manifests(self) -> List[Dict[str, Any]]:
+        """Manifests without chunk lists, newest first."""
+        if not os.path.isdir(self.manifest_dir):
+            return []
+        manifests = []
+        for file in os.listdir(self.manifest_dir):
+            if not file.endswith(MANIFEST_SUFFIX):
+                continue
+            try:
+                manifest = self.get_manifest(file[:-len(MANIFEST_SUFFIX)])
+            except Exception as e:
+                logger.error(f"Error reading backup manifest {file}: {str(e)}")
+                continue
+            manifest.pop("chunks", None)
+            manifests.append(manifest)
+        manifests.sort(key=lambda manifest: manifest.get("created_at", ""), reverse=True)
+        return manifests
+
+    def find_manifest(self, timestamp: datetime.datetime) -> Optional[Dict[str, Any]]:
+        """Newest manifest created at or before a point in time, if any."""
+        for manifest in self.manifests():
+            if datetime.datetime.fromisoformat(manifest["created_at"]) <= timestamp:
+                return manifest
+        return None
+
+    def read(self, name: str) -> Iterator[bytes]:
+        """
+        The stream of a backup, chunk by chunk, each checked against its hash.
+
+        Raises:
+            ValueError: If a chunk is corrupt
+        """
+        for digest, _ in self.get_manifest(name)["chunks"]:
+            yield self.read_chunk(digest)
+
+    def restore_to(self, name: str, path: str):
+        """
+        Write the stream of a backup to a file.
+
+        Raises:
+            ValueError: If a chunk is corrupt or the stream does not match its checksum
+        """
+        manifest = self.get_manifest(name)
+        digest = hashlib.sha256()
+        with open(path, "wb") as f:
+            for chunk_digest, _ in manifest["chunks"]:
+                data = self.read_chunk(chunk_digest)
+                digest.update(data)
+                f.write(data)
+        if digest.hexdigest() != manifest["sha256"]:
+            raise ValueError(f"Backup {name} does not match its checksum")
+
+    def verify(self, names: Optional[List[str]] = None) -> Dict[str, Any]:
+        """
+        Check that backups can be restored, without restoring them.
+
+        Every chunk a backup needs is read and re-hashed (once, however many
+        backups share it), and the chunk sizes must add up to the backup size.
+
+        Args:
+            names: Backups to check (default: all)
+
+        Returns:
+            dict: ok, backups checked, chunks checked, "missing" and "corrupt"
+                chunk digests, and "failed" backup names
+        """
+        if names is None:
+            names = [manifest["name"] for manifest in self.manifests()]
+
+        checked: Dict[str, Optional[str]] = {}
+        failed = []
+        for name in names:
+            try:
+                manifest = self.get_manifest(name)
+            except Exception as e:
+                logger.error(f"Error reading backup manifest {name}: {str(e)}")
+                failed.append(name)
+                continue
+
+            ok = sum(length for _, length in manifest["chunks"]) == manifest["size_bytes"]
+            for digest, length in manifest["chunks"]:
+                if digest not in checked:
+                    try:
+                        checked[digest] = None if len(self.read_chunk(digest)) == length else "corrupt"
+                    except FileNotFoundError:
+                        checked[digest] = "missing"
+                    except Exception:
+                        checked[digest] = "corrupt"
+                ok = ok and checked[digest] is None
+            if not ok:
+                failed.append(name)
+
+        return {
+            "ok": not failed,
+            "backups": len(names),
+            "chunks": len(checked),
+            "missing": sorted(digest for digest, problem in checked.items() if problem == "missing"),
+            "corrupt": sorted(digest for digest, problem in checked.items() if problem == "corrupt"),
+            "failed": failed,
+        }
+
+    def delete(self, name: str):
+        """Delete a backup's manifest (its chunks go at the next gc)."""
+        os.remove(self.manifest_path(name))
+
+    def gc(self, retention_days: Optional[int] = None, keep_last: int = 1) -> Dict[str, int]:
+        """
+        Drop expired backups and the chunks no remaining backup uses.
+
+        Args:
+            retention_days: Delete manifests older than this (None keeps all)
+            keep_last: Newest backups kept regardless of age
+
+        Returns:
+            dict: manifests_removed, chunks_removed and bytes_freed
+        """
+        with self._lock:
+            manifests_removed = 0
+            if retention_days is not None:
+                cutoff = datetime.datetime.now() - datetime.timedelta(days=retention_days)
+                for manifest in self.manifests()[keep_last:]:
+                    if datetime.datetime.fromisoformat(manifest["created_at"]) < cutoff:
+                        self.delete(manifest["name"])
+                        manifests_removed += 1
+                        logger.info(f"Removed old backup: {manifest['name']}")
+
+            referenced = set()
+            for manifest in self.manifests():
+                referenced.update(digest for digest, _ in self.get_manifest(manifest["name"])["chunks"])
+
+            chunks_removed = 0
+            bytes_freed = 0
+            grace_cutoff = time.time() - GC_GRACE_SECONDS
+            if os.path.isdir(self.chunk_dir):
+                for root, _, files in os.walk(self.chunk_dir):
+                    for file in files:
+                        if file in referenced:
+                            continue
+                        path = os.path.join(root, file)
+                        try:
+                            stat = os.stat(path)
+                            if stat.st_mtime < grace_cutoff:
+                                os.remove(path)
+                                chunks_removed += 1
+                                bytes_freed += stat.st_size
+                        except FileNotFoundError:
+                            pass
+
+        return {"manifests_removed": manifests_removed, "chunks_removed": chunks_removed, "bytes_freed": bytes_freed}
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Repository size and deduplication.
+
+        Returns:
+            dict: backups, chunks, stored_bytes (on disk), logical_bytes (sum
+                of backup sizes) and dedup_ratio
+        """
+        chunks = 0
+        stored_bytes = 0
+        if os.path.isdir(self.chunk_dir):
+            for root, _, files in os.walk(self.chunk_dir):
+                for file in files:
+                    if not file.endswith(".partial"):
+                        chunks += 1
+                        stored_bytes += os.path.getsize(os.path.join(root, file))
+        manifests = self.manifests()
+        logical_bytes = sum(manifest.get("size_bytes", 0) for manifest in manifests)
+        return {
+            "backups": len(manifests),
+            "chunks": chunks,
+            "stored_bytes": stored_bytes,
+            "logical_bytes": logical_bytes,
+            "dedup_ratio": round(logical_bytes / stored_bytes, 2) if stored_bytes else None,
+        }
+
+
+_repository: Optional[BackupRepository] = None
+
+
+def get_backup_repository() -> BackupRepository:
+    """Get the backup repository in BACKUP_REPOSITORY_DIR."""
+    global _repository
+    if _repository is None:
+        _repository = BackupRepository()
+    return _repository
@@ -0,0 +1,400 @@
+"""
+Streaming backup pipeline for gcPanel.
+
+This module moves database dumps to and from backup files without temp
+files or shells:
+- Dump output is pumped through a multithreaded compressor straight into
+  the backup file, with a running SHA-256 of the bytes written
+- Compression is parallel gzip (pigz when installed, otherwise gzip
+  members compressed on a thread pool, which any gunzip reads) or zstd
+  (the zstandard package or the zstd binary), selected by BACKUP_COMPRESSION
+- Backup files are read back as decompressed streams for restore and
+  verification
+- Every pipeline reports raw and compressed bytes, seconds and throughput
+
+External programs are started with argument lists, never through a shell.
+"""
+
+import os
+import gzip
+import time
+import shutil
+import hashlib
+import logging
+import threading
+import subprocess
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import IO, Any, Dict, Iterable, Iterator, List, Optional
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Constants
+BACKUP_COMPRESSION = os.environ.get("BACKUP_COMPRESSION", "gzip").lower()
+BACKUP_COMPRESSION_LEVEL = int(os.environ.get("BACKUP_COMPRESSION_LEVEL", "6"))
+BACKUP_THREADS = int(os.environ.get("BACKUP_THREADS", str(os.cpu_count() or 2)))
+# Raw bytes per parallel gzip member
+BACKUP_BLOCK_SIZE = int(os.environ.get("BACKUP_BLOCK_SIZE", str(1024 * 1024)))
+PIPE_CHUNK_SIZE = 1024 * 1024
+
+EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def compression_for(path: str) -> str:
+    """Compression of a backup file, from its extension."""
+    return "zstd" if path.endswith(".zst") else "gzip"
+
+
+def _zstandard():
+    try:
+        import zstandard
+        return zstandard
+    except ImportError:
+        return None
+
+
+def resolve_compression(requested: str = BACKUP_COMPRESSION) -> str:
+    """
+    Compression that can actually be used here.
+
+    zstd needs the zstandard package or the zstd binary; without either,
+    gzip is used instead.
+    """
+    if requested == "zstd":
+        if _zstandard() is not None or shutil.which("zstd"):
+            return "zstd"
+        logger.warning("zstd requested but neither the zstandard package nor the zstd binary is available; using gzip")
+    return "gzip"
+
+
+class HashingWriter:
+    """File writer keeping a running SHA-256 and byte count of what it writes."""
+
+    def __init__(self, fileobj: IO[bytes]):
+        self._file = fileobj
+        self._hash = hashlib.sha256()
+        self.bytes = 0
+
+    def write(self, data: bytes) -> int:
+        self._hash.update(data)
+        self.bytes += len(data)
+        return self._file.write(data)
+
+    def flush(self):
+        self._file.flush()
+
+    @property
+    def sha256(self) -> str:
+        return self._hash.hexdigest()
+
+
+class ParallelGzipWriter:
+    """
+    Gzip compressor using a thread pool.
+
+    Raw input is cut into BACKUP_BLOCK_SIZE blocks, each compressed as its
+    own gzip member (zlib releases the GIL, so members compress in
+    parallel). Members are written in order; at most two blocks per
+    thread are in flight, which bounds memory.
+    """
+
+    def __init__(self, out, level: int = BACKUP_COMPRESSION_LEVEL, threads: int = BACKUP_THREADS,
+                 block_size: int = BACKUP_BLOCK_SIZE):
+        self._out = out
+        self._level = level
+        self._block_size = block_size
+        self._buffer = bytearray()
+        self._executor = ThreadPoolExecutor(max_workers=max(threads, 1), thread_name_prefix="backup-gzip")
+        self._pending: deque = deque()
+        self._max_pending = max(threads, 1) * 2
+
+    def _compress(self, block: bytes) -> bytes:
+        return gzip.compress(block, compresslevel=self._level, mtime=0)
+
+    def write(self, data: bytes):
+        self._buffer += data
+        while len(self._buffer) >= self._block_size:
+            block = bytes(self._buffer[:self._block_size])
+            del self._buffer[:self._block_size]
+            self._submit(block)
+
+    def _submit(self, block: bytes):
+        self._pending.append(self._executor.submit(self._compress, block))
+        while len(self._pending) >= self._max_pending:
+            self._out.write(self._pending.popleft().result())
+
+    def close(self):
+        try:
+            if self._buffer or not self._pending:
+                # An empty input still gets one (empty) member, so the file is valid gzip
+                self._submit(bytes(self._buffer))
+                self._buffer.clear()
+            while self._pending:
+                self._out.write(self._pending.popleft().result())
+        finally:
+            self._executor.shutdown(wait=True)
+
+
+class ProcessWriter:
+    """Compressor running as a child process (pigz or zstd), its output copied to a writer."""
+
+    def __init__(self, out, args: List[str]):
+        self._out = out
+        self._process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+        self._error: Optional[BaseException] = None
+        self._reader = threading.Thread(target=self._copy_output, name="backup-compressor", daemon=True)
+        self._reader.start()
+
+    def _copy_output(self):
+        try:
+            for chunk in iter(lambda: self._process.stdout.read(PIPE_CHUNK_SIZE), b""):
+                self._out.write(chunk)
+        except BaseException as e:
+            self._error = e
+
+    def write(self, data: bytes):
+        self._process.stdin.write(data)
+
+    def close(self):
+        self._process.stdin.close()
+        self._reader.join()
+        returncode = self._process.wait()
+        if self._error is not None:
+            raise self._error
+        if returncode != 0:
+            raise RuntimeError(f"Compressor exited with status {returncode}")
+
+
+class ZstdWriter:
+    """Multithreaded zstd compressor from the zstandard package."""
+
+    def __init__(self, out, level: int = BACKUP_COMPRESSION_LEVEL, threads: int = BACKUP_THREADS):
+        zstandard = _zstandard()
+        compressor = zstandard.ZstdCompressor(level=level, threads=threads)
+        self._writer = compressor.stream_writer(out, closefd=False)
+
+    def write(self, data: bytes):
+        self._writer.write(data)
+
+    def close(self):
+        self._writer.close()
+
+
+def open_compressor(out, compression: str):
+    """
+    Compressing writer for a compression, writing to out.
+
+    Args:
+        out: Writer receiving compressed bytes
+        compression: "gzip" or "zstd" (as returned by resolve_compression())
+
+    Returns:
+        Writer with write() and close()
+    """
+    if compression == "zstd":
+        if _zstandard() is not None:
+            return ZstdWriter(out)
+        return ProcessWriter(out, ["zstd", f"-{BACKUP_COMPRESSION_LEVEL}", f"-T{BACKUP_THREADS}", "-q", "-c"])
+    if shutil.which("pigz"):
+        return ProcessWriter(out, ["pigz", f"-{BACKUP_COMPRESSION_LEVEL}", "-p", str(BACKUP_THREADS), "-c"])
+    return ParallelGzipWriter(out)
+
+
+def throughput(raw_bytes: int, written_bytes: int, seconds: float) -> Dict[str, Any]:
+    """Throughput report of a pipeline run."""
+    return {
+        "raw_bytes": raw_bytes,
+        "compressed_bytes": written_bytes,
+        "seconds": round(seconds, 3),
+        "mb_per_second": round(raw_bytes / 1048576 / seconds, 2) if seconds > 0 else None,
+        "ratio": round(raw_bytes / written_bytes, 2) if written_bytes else None,
+    }
+
+
+def compress_stream(chunks: Iterable[bytes], backup_file: str, compression: str = None) -> Dict[str, Any]:
+    """
+    Compress a stream of raw chunks into a backup file.
+
+    The file is written under a temporary name and renamed when complete,
+    so a failed backup never leaves a truncated file behind.
+
+    Args:
+        chunks: Raw dump bytes, in order
+        backup_file: Destination path
+        compression: "gzip" or "zstd" (default: from the file extension)
+
+    Returns:
+        dict: throughput() report plus "sha256" of the file and "compression"
+    """
+    compression = compression or compression_for(backup_file)
+    partial = f"{backup_file}.partial"
+    start = time.monotonic()
+    raw_bytes = 0
+
+    try:
+        with open(partial, "wb") as f:
+            out = HashingWriter(f)
+            compressor = open_compressor(out, compression)
+            try:
+                for chunk in chunks:
+                    raw_bytes += len(chunk)
+                    compressor.write(chunk)
+            finally:
+                compressor.close()
+            out.flush()
+            os.fsync(f.fileno())
+        os.replace(partial, backup_file)
+    except BaseException:
+        if os.path.exists(partial):
+            os.remove(partial)
+        raise
+
+    report = throughput(raw_bytes, out.bytes, time.monotonic() - start)
+    report.update({"sha256": out.sha256, "compression": compression})
+    return report
+
+
+def process_output(args: List[str], env: Optional[Dict[str, str]] = None,
+                   chunk_size: int = PIPE_CHUNK_SIZE) -> Iterator[bytes]:
+    """
+    Run a program and yield its standard output in chunks.
+
+    Args:
+        args: Program and arguments (no shell)
+        env: Extra environment variables (e.g. PGPASSWORD)
+        chunk_size: Bytes per chunk
+
+    Raises:
+        RuntimeError: After the output, if the program exits with an error
+    """
+    process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               env={**os.environ, **(env or {})})
+    stderr: List[bytes] = []
+    stderr_reader = threading.Thread(target=lambda: stderr.append(process.stderr.read()), daemon=True)
+    stderr_reader.start()
+
+    try:
+        yield from iter(lambda: process.stdout.read(chunk_size), b"")
+    except BaseException:
+        process.kill()
+        raise
+    finally:
+        process.wait()
+        stderr_reader.join()
+
+    if process.returncode != 0:
+        message = b"".join(stderr).decode(errors="replace").strip()
+        raise RuntimeError(f"{args[0]} exited with status {process.returncode}: {message}")
+
+
+def run_dump(args: List[str], backup_file: str, env: Optional[Dict[str, str]] = None,
+             compression: str = None) -> Dict[str, Any]:
+    """
+    Run a dump program and compress its standard output into a backup file.
+
+    Args:
+        args: Program and arguments (no shell)
+        backup_file: Destination path
+        env: Extra environment variables (e.g. PGPASSWORD)
+        compression: "gzip" or "zstd" (default: from the file extension)
+
+    Returns:
+        dict: compress_stream() report
+
+    Raises:
+        RuntimeError: If the program exits with an error (no file is left behind)
+    """
+    return compress_stream(process_output(args, env), backup_file, compression)
+
+
+def open_backup(backup_file: str) -> IO[bytes]:
+    """
+    Decompressed stream of a backup file.
+
+    Args:
+        backup_file: .gz or .zst backup file
+
+    Returns:
+        Binary file object (close it when done)
+    """
+    if compression_for(backup_file) == "zstd":
+        zstandard = _zstandard()
+        if zstandard is not None:
+            return zstandard.ZstdDecompressor().stream_reader(open(backup_file, "rb"), closefd=True)
+        process = subprocess.Popen(["zstd", "-d", "-q", "-c", backup_file], stdout=subprocess.PIPE)
+        return process.stdout
+    return gzip.open(backup_file, "rb")
+
+
+def read_chunks(stream: IO[bytes], chunk_size: int = PIPE_CHUNK_SIZE) -> Iterable[bytes]:
+    """Chunks of a binary stream until it ends."""
+    return iter(lambda: stream.read(chunk_size), b"")
+
+
+def feed_process(args: List[str], chunks: Iterable[bytes], env: Optional[Dict[str, str]] = None) -> str:
+    """
+    Run a program with chunks piped to its standard input.
+
+    Args:
+        args: Program and arguments (no shell)
+        chunks: Bytes to write to its input
+        env: Extra environment variables
+
+    Returns:
+        str: The program's standard output
+
+    Raises:
+        RuntimeError: If the program exits with an error
+    """
+    process = subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                               env={**os.environ, **(env or {})})
+    output: Dict[str, bytes] = {}
+    readers = [
+        threading.Thread(target=lambda name=name, pipe=pipe: output.__setitem__(name, pipe.read()), daemon=True)
+        for name, pipe in (("stdout", process.stdout), ("stderr", process.stderr))
+    ]
+    for reader in readers:
+        reader.start()
+
+    try:
+        for chunk in chunks:
+            process.stdin.write(chunk)
+    except BrokenPipeError:
+        pass
+    finally:
+        process.stdin.close()
+    for reader in readers:
+        reader.join()
+
+    if process.wait() != 0:
+        message = output.get("stderr", b"").decode(errors="replace").strip()
+        raise RuntimeError(f"{args[0]} exited with status {process.returncode}: {message}")
+    return output.get("stdout", b"").decode(errors="replace")
+
+
+def file_sha256(path: str) -> str:
+    """SHA-256 of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in read_chunks(f):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def directory_sha256(path: str) -> Dict[str, str]:
+    """SHA-256 of every file in a directory (e.g. a pg_dump directory-format dump), by relative path."""
+    hashes = {}
+    for root, _, files in os.walk(path):
+        for name in sorted(files):
+            file_path = os.path.join(root, name)
+            hashes[os.path.relpath(file_path, path)] = file_sha256(file_path)
+    return hashes
+
+
+def directory_size(path: str) -> int:
+    """Total size of the files in a directory."""
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, files in os.walk(path) for name in files
+    )
@@ -0,0 +1,456 @@
+"""
+Cache Backends for gcPanel.
+
+This module defines the pluggable shared tier of the caching layer, so that
+replicas behind the Kubernetes service share one warm cache instead of each
+pod keeping its own:
+- CacheBackend interface (single and pipelined multi-key operations plus
+  cross-pod invalidation messages)
+- RedisCacheBackend for any Redis-protocol server
+- InMemoryBackend, an in-process fake for local development and testing
+- Compact serialization (msgpack for plain data, pickle protocol 5 otherwise)
+"""
+
+import os
+import json
+import time
+import uuid
+import pickle
+import logging
+import threading
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+try:
+    import msgpack
+    MSGPACK_AVAILABLE = True
+except ImportError:
+    MSGPACK_AVAILABLE = False
+
+# Constants
+CACHE_BACKEND_URL = os.environ.get("CACHE_BACKEND_URL", os.environ.get("REDIS_URL", ""))
+CACHE_KEY_PREFIX = os.environ.get("CACHE_KEY_PREFIX", "gcpanel:cache:")
+INVALIDATION_CHANNEL = os.environ.get("CACHE_INVALIDATION_CHANNEL", "gcpanel:cache:invalidate")
+
+# Serialization markers (first byte of every stored payload)
+_MSGPACK_MARKER = b"m"
+_PICKLE_MARKER = b"p"
+
+# Deepest nesting checked before falling back to pickle
+_MSGPACK_MAX_DEPTH = 32
+
+# Identifies this process in invalidation messages so it ignores its own
+NODE_ID = uuid.uuid4().hex
+
+_MISSING = object()
+
+InvalidationCallback = Callable[[Dict[str, Any]], None]
+# (namespace, key) of an entry, for operations spanning several namespaces
+EntryKey = Tuple[str, str]
+
+
+def _msgpack_safe(value: Any, depth: int = 0) -> bool:
+    """Whether msgpack round-trips a value without changing its types."""
+    if depth > _MSGPACK_MAX_DEPTH:
+        return False
+    if value is None or isinstance(value, (bool, int, float, str, bytes)):
+        return not isinstance(value, int) or -(2 ** 63) <= value < 2 ** 64
+    if type(value) is list:
+        return all(_msgpack_safe(item, depth + 1) for item in value)
+    if type(value) is dict:
+        return all(
+            isinstance(k, str) and _msgpack_safe(v, depth + 1) for k, v in value.items()
+        )
+    return False
+
+
+def serialize(value: Any) -> bytes:
+    """
+    Serialize a value for a shared backend.
+
+    Plain JSON-like data uses msgpack when it is installed; everything else
+    (tuples, datetimes, DataFrames, BytesIO) uses pickle protocol 5.
+
+    Args:
+        value: Value to serialize
+
+    Returns:
+        bytes: Marker byte followed by the encoded value
+    """
+    if MSGPACK_AVAILABLE and _msgpack_safe(value):
+        return _MSGPACK_MARKER + msgpack.packb(value, use_bin_type=True)
+    return _PICKLE_MARKER + pickle.dumps(value, protocol=5)
+
+
+def deserialize(payload: bytes) -> Any:
+    """
+    Deserialize a payload produced by serialize().
+
+    Args:
+        payload: Stored bytes
+
+    Returns:
+        any: The original value
+    """
+    marker, body = payload[:1], payload[1:]
+    if marker == _MSGPACK_MARKER:
+        return msgpack.unpackb(body, raw=False)
+    if marker == _PICKLE_MARKER:
+        return pickle.loads(body)
+    raise ValueError(f"Unknown cache payload marker {marker!r}")
+
+
+class CacheBackend(ABC):
+    """
+    Interface for a cache tier shared beyond this process.
+
+    Keys are addressed by (namespace, key). Backends that are shared between
+    pods also carry invalidation messages so each pod can drop its own
+    in-memory copies.
+    """
+
+    @abstractmethod
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        """Get a value, or default if it is missing or expired."""
+
+    @abstractmethod
+    def set(self, namespace: str, key: str, value: Any, ttl: int = None) -> bool:
+        """Store a value with a time to live in seconds."""
+
+    @abstractmethod
+    def delete(self, namespace: str, key: str) -> bool:
+        """Delete a single entry."""
+
+    @abstractmethod
+    def invalidate(self, namespace: str) -> int:
+        """Delete every entry in a namespace."""
+
+    @abstractmethod
+    def clear(self) -> int:
+        """Delete every entry written by this cache."""
+
+    def get_many(self, namespace: str, keys: Iterable[str]) -> Dict[str, Any]:
+        """
+        Get several values at once.
+
+        Returns:
+            dict: Found keys mapped to their values (missing keys are omitted)
+        """
+        found = {}
+        for key in keys:
+            value = self.get(namespace, key, _MISSING)
+            if value is not _MISSING:
+                found[key] = value
+        return found
+
+    def set_many(self, namespace: str, items: Dict[str, Any], ttl: int = None) -> int:
+        """
+        Store several values at once.
+
+        Returns:
+            int: Number of values stored
+        """
+        return sum(1 for key, value in items.items() if self.set(namespace, key, value, ttl))
+
+    def get_entries(self, entries: Iterable[EntryKey]) -> Dict[EntryKey, Any]:
+        """
+        Get entries from any number of namespaces at once.
+
+        The default makes one get_many() call per namespace; backends that
+        can do better (one round trip for everything) override it.
+
+        Returns:
+            dict: Found (namespace, key) pairs mapped to their values
+        """
+        by_namespace: Dict[str, List[str]] = {}
+        for namespace, key in entries:
+            by_namespace.setdefault(namespace, []).append(key)
+
+        found = {}
+        for namespace, keys in by_namespace.items():
+            for key, value in self.get_many(namespace, keys).items():
+                found[(namespace, key)] = value
+        return found
+
+    def set_entries(self, items: Dict[EntryKey, Tuple[Any, int]]) -> int:
+        """
+        Store entries of any number of namespaces at once.
+
+        Args:
+            items: (namespace, key) mapped to (value, ttl)
+
+        Returns:
+            int: Number of values stored
+        """
+        groups: Dict[Tuple[str, int], Dict[str, Any]] = {}
+        for (namespace, key), (value, ttl) in items.items():
+            groups.setdefault((namespace, ttl), {})[key] = value
+        return sum(self.set_many(namespace, values, ttl) for (namespace, ttl), values in groups.items())
+
+    def publish_invalidation(self, namespace: str = None, key: str = None, scope_id: str = None):
+        """Tell other pods to drop matching in-memory entries. No-op for local backends."""
+
+    def subscribe_invalidations(self, callback: InvalidationCallback):
+        """Receive invalidation messages published by other pods. No-op for local backends."""
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get backend statistics."""
+        return {}
+
+    def close(self):
+        """Release connections and background threads."""
+
+
+class RedisCacheBackend(CacheBackend):
+    """
+    Shared cache on a Redis-protocol server (Redis, KeyDB, Valkey, Dragonfly).
+
+    Multi-key operations are pipelined into one round trip, and invalidations
+    are broadcast on a pub/sub channel.
+    """
+
+    def __init__(self, url: str = CACHE_BACKEND_URL, prefix: str = CACHE_KEY_PREFIX,
+                 channel: str = INVALIDATION_CHANNEL, default_ttl: int = 300,
+                 socket_timeout: float = 0.5, client=None):
+        """
+        Args:
+            url: redis:// or rediss:// URL
+            prefix: Prefix for every key written by this backend
+            channel: Pub/sub channel for invalidation messages
+            default_ttl: TTL used when set() is called without one
+            socket_timeout: Seconds before a slow server is treated as a miss
+            client: Existing redis client (e.g. for tests)
+        """
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(
+                url, socket_timeout=socket_timeout, socket_connect_timeout=socket_timeout
+            )
+
+        self.client = client
+        self.prefix = prefix
+        self.channel = channel
+        self.default_ttl = default_ttl
+        self._pubsub_thread = None
+        self._stats = {"hits": 0, "misses": 0, "sets": 0, "published": 0, "received": 0}
+
+    def _redis_key(self, namespace: str, key: str) -> str:
+        return f"{self.prefix}{namespace}:{key}"
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        payload = self.client.get(self._redis_key(namespace, key))
+        if payload is None:
+            self._stats["misses"] += 1
+            return default
+        self._stats["hits"] += 1
+        return deserialize(payload)
+
+    def set(self, namespace: str, key: str, value: Any, ttl: int = None) -> bool:
+        ttl = ttl if ttl is not None else self.default_ttl
+        self.client.set(self._redis_key(namespace, key), serialize(value), ex=max(1, int(ttl)))
+        self._stats["sets"] += 1
+        return True
+
+    def delete(self, namespace: str, key: str) -> bool:
+        return bool(self.client.delete(self._redis_key(namespace, key)))
+
+    def invalidate(self, namespace: str) -> int:
+        return self._unlink_matching(f"{self.prefix}{namespace}:*")
+
+    def clear(self) -> int:
+        return self._unlink_matching(f"{self.prefix}*")
+
+    def _unlink_matching(self, pattern: str) -> int:
+        """Unlink keys matching a glob pattern in pipelined batches."""
+        removed = 0
+        pipe = self.client.pipeline(transaction=False)
+        for redis_key in self.client.scan_iter(match=pattern, count=500):
+            pipe.unlink(redis_key)
+            removed += 1
+            if removed % 500 == 0:
+                pipe.execute()
+        pipe.execute()
+        return removed
+
+    def get_many(self, namespace: str, keys: Iterable[str]) -> Dict[str, Any]:
+        found = self.get_entries((namespace, key) for key in keys)
+        return {key: value for (_, key), value in found.items()}
+
+    def set_many(self, namespace: str, items: Dict[str, Any], ttl: int = None) -> int:
+        return self.set_entries({(namespace, key): (value, ttl) for key, value in items.items()})
+
+    def get_entries(self, entries: Iterable[EntryKey]) -> Dict[EntryKey, Any]:
+        entries = list(entries)
+        if not entries:
+            return {}
+
+        payloads = self.client.mget([self._redis_key(namespace, key) for namespace, key in entries])
+        found = {}
+        for entry, payload in zip(entries, payloads):
+            if payload is None:
+                self._stats["misses"] += 1
+            else:
+                self._stats["hits"] += 1
+                found[entry] = deserialize(payload)
+        return found
+
+    def set_entries(self, items: Dict[EntryKey, Tuple[Any, int]]) -> int:
+        if not items:
+            return 0
+
+        pipe = self.client.pipeline(transaction=False)
+        for (namespace, key), (value, ttl) in items.items():
+            ttl = max(1, int(ttl if ttl is not None else self.default_ttl))
+            pipe.set(self._redis_key(namespace, key), serialize(value), ex=ttl)
+        pipe.execute()
+        self._stats["sets"] += len(items)
+        return len(items)
+
+    def publish_invalidation(self, namespace: str = None, key: str = None, scope_id: str = None):
+        message = {"origin": NODE_ID, "namespace": namespace, "key": key, "scope_id": scope_id}
+        self.client.publish(self.channel, json.dumps(message))
+        self._stats["published"] += 1
+
+    def subscribe_invalidations(self, callback: InvalidationCallback):
+        def handle(raw_message):
+            try:
+                message = json.loads(raw_message["data"])
+                if message.get("origin") == NODE_ID:
+                    return
+                self._stats["received"] += 1
+                callback(message)
+            except Exception as e:
+                logger.warning(f"Error handling cache invalidation message: {str(e)}")
+
+        pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+        pubsub.subscribe(**{self.channel: handle})
+        self._pubsub_thread = pubsub.run_in_thread(sleep_time=1.0, daemon=True)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": "redis", **self._stats}
+
+    def close(self):
+        if self._pubsub_thread is not None:
+            self._pubsub_thread.stop()
+            self._pubsub_thread = None
+        self.client.close()
+
+
+class InMemoryStore:
+    """
+    Storage and message bus shared by InMemoryBackend instances.
+
+    Two backends built on the same store behave like two pods talking to the
+    same Redis server.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.data: Dict[str, tuple] = {}
+        self.subscribers: List[tuple] = []
+
+
+class InMemoryBackend(CacheBackend):
+    """In-process fake of a shared backend, storing serialized payloads like Redis would."""
+
+    def __init__(self, store: InMemoryStore = None, default_ttl: int = 300, node_id: str = None):
+        self.store = store or InMemoryStore()
+        self.default_ttl = default_ttl
+        self.node_id = node_id or uuid.uuid4().hex
+        self._stats = {"hits": 0, "misses": 0, "sets": 0, "published": 0, "received": 0}
+
+    def _store_key(self, namespace: str, key: str) -> str:
+        return f"{namespace}:{key}"
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        with self.store.lock:
+            item = self.store.data.get(self._store_key(namespace, key))
+            if item is not None and time.time() >= item[1]:
+                del self.store.data[self._store_key(namespace, key)]
+                item = None
+
+        if item is None:
+            self._stats["misses"] += 1
+            return default
+        self._stats["hits"] += 1
+        return deserialize(item[0])
+
+    def set(self, namespace: str, key: str, value: Any, ttl: int = None) -> bool:
+        ttl = ttl if ttl is not None else self.default_ttl
+        payload = serialize(value)
+        with self.store.lock:
+            self.store.data[self._store_key(namespace, key)] = (payload, time.time() + ttl)
+        self._stats["sets"] += 1
+        return True
+
+    def delete(self, namespace: str, key: str) -> bool:
+        with self.store.lock:
+            return self.store.data.pop(self._store_key(namespace, key), None) is not None
+
+    def invalidate(self, namespace: str) -> int:
+        prefix = f"{namespace}:"
+        with self.store.lock:
+            matching = [store_key for store_key in self.store.data if store_key.startswith(prefix)]
+            for store_key in matching:
+                del self.store.data[store_key]
+        return len(matching)
+
+    def clear(self) -> int:
+        with self.store.lock:
+            removed = len(self.store.data)
+            self.store.data.clear()
+        return removed
+
+    def publish_invalidation(self, namespace: str = None, key: str = None, scope_id: str = None):
+        message = {"origin": self.node_id, "namespace": namespace, "key": key, "scope_id": scope_id}
+        with self.store.lock:
+            subscribers = list(self.store.subscribers)
+        self._stats["published"] += 1
+
+        for node_id, backend, callback in subscribers:
+            if node_id != self.node_id:
+                backend._stats["received"] += 1
+                callback(dict(message))
+
+    def subscribe_invalidations(self, callback: InvalidationCallback):
+        with self.store.lock:
+            self.store.subscribers.append((self.node_id, self, callback))
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {"backend": "memory", **self._stats}
+
+    def close(self):
+        with self.store.lock:
+            self.store.subscribers = [s for s in self.store.subscribers if s[0] != self.node_id]
+
+
+def create_backend_from_env() -> Optional[CacheBackend]:
+    """
+    Create the shared cache backend configured by the environment.
+
+    CACHE_BACKEND_URL (or REDIS_URL) selects the backend: redis:// and
+    rediss:// URLs use Redis, memory:// uses the in-process fake, and an
+    empty value disables the shared tier.
+
+    Returns:
+        CacheBackend: Connected backend, or None if none is configured or reachable
+    """
+    url = CACHE_BACKEND_URL
+    if not url:
+        return None
+
+    if url.startswith("memory://"):
+        return InMemoryBackend()
+
+    try:
+        backend = RedisCacheBackend(url)
+        backend.client.ping()
+        logger.info("Shared cache backend connected")
+        return backend
+    except Exception as e:
+        logger.warning(f"Shared cache backend unavailable, using local cache only: {str(e)}")
+        return None
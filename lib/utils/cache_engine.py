@@ -0,0 +1,1072 @@
+"""
+Shared Cache Engine for gcPanel.
+
+This module provides the process-wide cache that backs both
+``lib.utils.cache_manager.CacheManager`` and
+``core_backup.caching_layer``:
+- True LRU ordering with per-entry TTL
+- A byte budget based on approximate object sizing
+- Per-namespace entry and byte quotas
+- Explicit scoping (global, per-user, per-session)
+- Single-flight computation of misses and optional stale-while-revalidate
+- An optional persistent disk tier (``lib.utils.disk_cache``) for heavy artifacts
+- An optional shared tier (``lib.utils.cache_backends``) so replicas share
+  global entries and propagate invalidations to each other
+- Per-namespace hit/miss counts, compute time saved, evictions by reason
+  (ttl, size, invalidation) and memory footprint
+
+Entries live in one process-wide store, so a result computed for one
+session is reused by every other session unless it is scoped.
+"""
+
+import os
+import sys
+import time
+import pickle
+import hashlib
+import logging
+import functools
+import threading
+from contextlib import contextmanager
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Constants
+CACHE_MAX_BYTES = int(os.environ.get("CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+CACHE_DEFAULT_TTL = int(os.environ.get("CACHE_DEFAULT_TTL", "300"))
+CACHE_CLEANUP_INTERVAL = 60
+
+# Seconds to stop using a shared backend after it fails
+BACKEND_RETRY_INTERVAL = 30
+
+# Why an entry left the cache
+EVICT_TTL = "ttl"
+EVICT_SIZE = "size"
+EVICT_INVALIDATION = "invalidation"
+
+# Stop walking object graphs after this many objects and extrapolate
+_SIZE_WALK_LIMIT = 10000
+
+_MISSING = object()
+
+
+class CacheScope:
+    """Visibility of a cached value."""
+    GLOBAL = "global"
+    USER = "user"
+    SESSION = "session"
+
+
+def estimate_size(obj: Any) -> int:
+    """
+    Approximate the memory footprint of an object in bytes.
+
+    Walks containers recursively (bounded) and uses pandas' own accounting
+    for DataFrames and Series.
+
+    Args:
+        obj: Object to size
+
+    Returns:
+        int: Approximate size in bytes
+    """
+    if isinstance(obj, (bytes, bytearray, memoryview)):
+        return sys.getsizeof(obj)
+    if isinstance(obj, str):
+        return sys.getsizeof(obj)
+
+    memory_usage = getattr(obj, "memory_usage", None)
+    if callable(memory_usage) and obj.__class__.__module__.startswith("pandas"):
+        try:
+            usage = memory_usage(deep=True)
+            return int(usage.sum()) if hasattr(usage, "sum") else int(usage)
+        except Exception:
+            pass
+
+    seen = set()
+    stack = [obj]
+    total = 0
+    visited = 0
+
+    while stack:
+        current = stack.pop()
+        if id(current) in seen:
+            continue
+        seen.add(id(current))
+        visited += 1
+        total += sys.getsizeof(current, 64)
+
+        if visited >= _SIZE_WALK_LIMIT:
+            # Extrapolate from the average object size seen so far
+            return int(total + (total / visited) * len(stack))
+
+        if isinstance(current, dict):
+            stack.extend(current.keys())
+            stack.extend(current.values())
+        elif isinstance(current, (list, tuple, set, frozenset)):
+            stack.extend(current)
+        elif hasattr(current, "__dict__") and not isinstance(current, type):
+            stack.append(vars(current))
+
+    return total
+
+
+def _canonical(value: Any) -> Any:
+    """
+    An equivalent of a value whose pickle does not depend on ordering.
+
+    Set iteration order depends on the process's hash seed and dict order on
+    insertion, so both are sorted; lists and tuples are converted item by
+    item. Dicts and sets are tagged so they do not collide with tuples.
+    """
+    if isinstance(value, dict):
+        items = [(_canonical(key), _canonical(item)) for key, item in value.items()]
+        return ("__dict__", tuple(sorted(items, key=repr)))
+    if isinstance(value, (set, frozenset)):
+        return ("__set__", tuple(sorted((_canonical(item) for item in value), key=repr)))
+    if isinstance(value, list):
+        return [_canonical(item) for item in value]
+    if isinstance(value, tuple) and type(value) is tuple:
+        return tuple(_canonical(item) for item in value)
+    return value
+
+
+def make_key(args: tuple, kwargs: dict) -> str:
+    """
+    Build a stable cache key for a function call's arguments.
+
+    Arguments are canonicalized first, so the key is the same in every
+    process (the shared and disk tiers are read by other pods and after
+    restarts).
+
+    Args:
+        args: Positional arguments
+        kwargs: Keyword arguments
+
+    Returns:
+        str: Hex digest identifying the call
+    """
+    call = _canonical((args, dict(kwargs)))
+    try:
+        payload = pickle.dumps(call, protocol=4)
+    except Exception:
+        payload = repr(call).encode()
+    return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+
+def function_namespace(func: Callable) -> str:
+    """Default namespace for a decorated function."""
+    return f"{func.__module__}.{func.__qualname__}"
+
+
+def resolve_scope_id(scope: str) -> str:
+    """
+    Resolve the identifier that partitions a scoped cache entry.
+
+    Args:
+        scope: One of the CacheScope values
+
+    Returns:
+        str: "" for global scope, otherwise the user or session identifier
+    """
+    if scope == CacheScope.GLOBAL:
+        return ""
+
+    try:
+        import streamlit as st
+
+        if scope == CacheScope.USER:
+            username = st.session_state.get("username")
+            if not username and isinstance(st.session_state.get("user"), dict):
+                username = st.session_state.user.get("username")
+            return f"user:{username or 'anonymous'}"
+
+        if scope == CacheScope.SESSION:
+            from streamlit.runtime.scriptrunner import get_script_run_ctx
+
+            ctx = get_script_run_ctx()
+            return f"session:{ctx.session_id if ctx else 'none'}"
+    except Exception as e:
+        logger.debug(f"Could not resolve cache scope {scope}: {e}")
+
+    return f"{scope}:unknown"
+
+
+class CacheEntry:
+    """A single cached value and its bookkeeping."""
+
+    __slots__ = ("namespace", "key", "scope_id", "value", "size", "created_at", "expires_at", "stale_until",
+                 "prefetched", "cost")
+
+    def __init__(self, namespace, key, scope_id, value, size, expires_at, stale_until=None, cost=0.0):
+        self.namespace = namespace
+        self.key = key
+        self.scope_id = scope_id
+        self.value = value
+        self.size = size
+        self.created_at = time.time()
+        self.expires_at = expires_at
+        # Expired entries may still be served until stale_until while a refresh runs
+        self.stale_until = stale_until if stale_until is not None else expires_at
+        # Loaded ahead of demand and not read yet (see CacheEngine.prefetching)
+        self.prefetched = False
+        # Seconds it took to compute the value; every hit saves this much
+        self.cost = cost
+
+    def is_expired(self, now: float = None) -> bool:
+        return (now or time.time()) >= self.expires_at
+
+    def is_dead(self, now: float = None) -> bool:
+        return (now or time.time()) >= self.stale_until
+
+
+class _Flight:
+    """An in-progress computation that concurrent callers wait on."""
+
+    __slots__ = ("done", "value", "error", "generation")
+
+    def __init__(self, generation: Tuple[int, int] = (0, 0)):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+        # Invalidation generation when the computation started
+        self.generation = generation
+
+
+def _start_background(target: Callable, name: str) -> threading.Thread:
+    """
+    Start a daemon thread.
+
+    The thread gets no Streamlit script context: it refreshes an entry other
+    sessions read too, so it must not see the session that happened to start it.
+    """
+    thread = threading.Thread(target=target, name=name, daemon=True)
+    thread.start()
+    return thread
+
+
+class CacheEngine:
+    """
+    Process-wide LRU + TTL cache with byte and namespace budgets.
+
+    Every operation is O(1) apart from explicit invalidation by pattern and
+    the periodic expired-entry sweep.
+    """
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES, default_ttl: int = CACHE_DEFAULT_TTL):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._lock = threading.RLock()
+        # Global LRU order (oldest first) and per-namespace LRU order
+        self._lru: "OrderedDict[Tuple[str, str, str], CacheEntry]" = OrderedDict()
+        self._namespaces: Dict[str, "OrderedDict[Tuple[str, str, str], CacheEntry]"] = {}
+        self._namespace_bytes: Dict[str, int] = {}
+        self._quotas: Dict[str, Dict[str, Optional[int]]] = {}
+        self._total_bytes = 0
+        self._last_cleanup = time.time()
+        # Computations in progress, keyed like the LRU index
+        self._inflight: Dict[Tuple[str, str, str], _Flight] = {}
+        # Bumped by every invalidation (per namespace, and for the whole cache) so a
+        # computation that started before an invalidation does not store its result
+        self._generation = 0
+        self._namespace_generations: Dict[str, int] = {}
+        # Shared tier (e.g. Redis) for global entries; None keeps the cache pod-local
+        self._backend = None
+        self._backend_retry_at = 0.0
+        self._context = threading.local()
+        self._stats = {
+            "hits": 0, "misses": 0, "sets": 0, "evictions": 0, "expirations": 0,
+            "coalesced": 0, "stale_served": 0, "refreshes": 0, "disk_hits": 0,
+            "backend_hits": 0, "backend_errors": 0, "prefetch_loaded": 0, "prefetch_hits": 0,
+            "invalidations": 0, "computes": 0, "compute_seconds": 0.0, "saved_seconds": 0.0,
+            "stale_discarded": 0,
+        }
+        # Counters per namespace (one namespace per decorated function by default)
+        self._namespace_stats: Dict[str, Dict[str, float]] = {}
+
+    # -- configuration -----------------------------------------------------
+
+    def set_namespace_quota(self, namespace: str, max_entries: int = None, max_bytes: int = None):
+        """
+        Limit how much of the cache a namespace may use.
+
+        Args:
+            namespace: Namespace name
+            max_entries: Maximum number of entries (None for unlimited)
+            max_bytes: Maximum total size in bytes (None for unlimited)
+        """
+        with self._lock:
+            self._quotas[namespace] = {"max_entries": max_entries, "max_bytes": max_bytes}
+            self._enforce_namespace_quota(namespace)
+
+    def set_backend(self, backend):
+        """
+        Attach a shared cache backend.
+
+        Global-scope entries computed through get_or_compute are read from and
+        written to it, and invalidations are broadcast to the other pods.
+
+        Args:
+            backend: A lib.utils.cache_backends.CacheBackend, or None to detach
+        """
+        if self._backend is not None:
+            self._backend.close()
+        self._backend = backend
+        if backend is not None:
+            backend.subscribe_invalidations(self._on_remote_invalidation)
+
+    def _backend_call(self, operation: str, *args, default: Any = None):
+        """Call the shared backend, backing off for a while after a failure."""
+        backend = self._backend
+        if backend is None or time.time() < self._backend_retry_at:
+            return default
+        try:
+            return getattr(backend, operation)(*args)
+        except Exception as e:
+            self._stats["backend_errors"] += 1
+            self._backend_retry_at = time.time() + BACKEND_RETRY_INTERVAL
+            logger.warning(f"Shared cache backend {operation} failed: {str(e)}")
+            return default
+
+    def _on_remote_invalidation(self, message: Dict[str, Any]):
+        """Apply an invalidation published by another pod to this process only."""
+        namespace, key, scope_id = message.get("namespace"), message.get("key"), message.get("scope_id")
+        if namespace is None and scope_id is None:
+            self.clear(broadcast=False)
+        elif key is not None:
+            self.delete(namespace, key, scope_id=scope_id or "", broadcast=False)
+        else:
+            self.invalidate(namespace=namespace, scope_id=scope_id, broadcast=False)
+
+    @contextmanager
+    def prefetching(self):
+        """
+        Mark entries stored by this thread as prefetched while the block runs.
+
+        A prefetched entry counts as a prefetch hit the first time a caller
+        reads it, which gives the prefetch hit rate in get_stats(). Values the
+        block computes are written to the shared tier together, in one
+        set_entries() call, when the outermost block ends.
+        """
+        previous = getattr(self._context, "prefetching", False)
+        outermost = getattr(self._context, "deferred_writes", None) is None
+        self._context.prefetching = True
+        if outermost:
+            self._context.deferred_writes = {}
+        try:
+            yield
+        finally:
+            self._context.prefetching = previous
+            if outermost:
+                deferred, self._context.deferred_writes = self._context.deferred_writes, None
+                self._flush_deferred_writes(deferred)
+
+    def _flush_deferred_writes(self, deferred: Dict[Tuple[str, str], Tuple[_Flight, int]]):
+        """Write deferred shared-tier values whose namespaces were not invalidated since."""
+        items = {
+            (namespace, key): (flight.value, ttl)
+            for (namespace, key), (flight, ttl) in deferred.items()
+            if self._is_current(flight, namespace)
+        }
+        if items:
+            self._backend_call("set_entries", items)
+
+    def preload(self, entries: Iterable[Tuple[str, str]], ttl: int = None) -> int:
+        """
+        Load global entries missing from memory from the shared tier in one round trip.
+
+        Args:
+            entries: (namespace, key) pairs
+            ttl: Time to live of the loaded entries (defaults to the engine default)
+
+        Returns:
+            int: Entries loaded
+        """
+        if self._backend is None:
+            return 0
+
+        now = time.time()
+        with self._lock:
+            missing = []
+            generations = {}
+            for namespace, key in dict.fromkeys(entries):
+                entry = self._lru.get((namespace, "", key))
+                if entry is None or entry.is_expired(now):
+                    missing.append((namespace, key))
+                    generations[namespace] = self._current_generation(namespace)
+        if not missing:
+            return 0
+
+        found = self._backend_call("get_entries", missing, default={})
+        loaded = 0
+        with self._lock:
+            for (namespace, key), value in found.items():
+                if generations[namespace] != self._current_generation(namespace):
+                    continue
+                if self.set(namespace, key, value, ttl=ttl, scope_id="", cost=self._average_cost(namespace)):
+                    loaded += 1
+            self._stats["backend_hits"] += loaded
+        return loaded
+
+    def get_many(self, namespace: str, keys: Iterable[str], scope: str = CacheScope.GLOBAL,
+                 scope_id: str = None, ttl: int = None) -> Dict[str, Any]:
+        """
+        Get several values of a namespace.
+
+        Global keys missing from memory are fetched from the shared tier in
+        one round trip.
+
+        Args:
+            namespace: Namespace of the entries
+            keys: Entry keys
+            scope: Scope used when the entries were stored
+            scope_id: Explicit scope identifier (resolved from scope if None)
+            ttl: Time to live of entries loaded from the shared tier
+
+        Returns:
+            dict: Found keys mapped to their values (missing keys are omitted)
+        """
+        if scope_id is None:
+            scope_id = resolve_scope_id(scope)
+        keys = list(keys)
+        if scope_id == "":
+            self.preload(((namespace, key) for key in keys), ttl=ttl)
+
+        found = {}
+        for key in keys:
+            value = self.get(namespace, key, _MISSING, scope_id=scope_id)
+            if value is not _MISSING:
+                found[key] = value
+        return found
+
+    def _ns_stats(self, namespace: str) -> Dict[str, float]:
+        """Counters for one namespace, created on first use. Caller holds the lock."""
+        stats = self._namespace_stats.get(namespace)
+        if stats is None:
+            stats = self._namespace_stats[namespace] = {
+                "hits": 0, "misses": 0, "sets": 0, "computes": 0,
+                "compute_seconds": 0.0, "saved_seconds": 0.0,
+                "evictions_ttl": 0, "evictions_size": 0, "evictions_invalidation": 0,
+            }
+        return stats
+
+    def _record_miss(self, namespace: str):
+        """Count a miss. Caller holds the lock."""
+        self._stats["misses"] += 1
+        self._ns_stats(namespace)["misses"] += 1
+
+    def _record_hit(self, entry: CacheEntry):
+        """Count a hit, crediting prefetch for its first use of a prefetched entry. Caller holds the lock."""
+        stats = self._ns_stats(entry.namespace)
+        stats["hits"] += 1
+        stats["saved_seconds"] += entry.cost
+        self._stats["hits"] += 1
+        self._stats["saved_seconds"] += entry.cost
+        if entry.prefetched and not getattr(self._context, "prefetching", False):
+            entry.prefetched = False
+            self._stats["prefetch_hits"] += 1
+
+    # -- core operations ---------------------------------------------------
+
+    def get(self, namespace: str, key: str, default: Any = None, scope: str = CacheScope.GLOBAL,
+            scope_id: str = None) -> Any:
+        """
+        Get a value from the cache.
+
+        Args:
+            namespace: Namespace of the entry
+            key: Entry key
+            default: Returned when the key is missing or expired
+            scope: Scope used when the entry was stored
+            scope_id: Explicit scope identifier (resolved from scope if None)
+
+        Returns:
+            any: Cached value or default
+        """
+        if scope_id is None:
+            scope_id = resolve_scope_id(scope)
+        full_key = (namespace, scope_id, key)
+
+        with self._lock:
+            entry = self._lru.get(full_key)
+            if entry is None:
+                self._record_miss(namespace)
+                return default
+
+            if entry.is_expired():
+                if entry.is_dead():
+                    self._remove(full_key, EVICT_TTL)
+                self._record_miss(namespace)
+                return default
+
+            self._lru.move_to_end(full_key)
+            self._namespaces[namespace].move_to_end(full_key)
+            self._record_hit(entry)
+            return entry.value
+
+    def set(self, namespace: str, key: str, value: Any, ttl: int = None, scope: str = CacheScope.GLOBAL,
+            scope_id: str = None, size: int = None, stale_ttl: int = 0, cost: float = 0.0) -> bool:
+        """
+        Store a value in the cache.
+
+        Args:
+            namespace: Namespace of the entry
+            key: Entry key
+            value: Value to cache
+            ttl: Time to live in seconds (defaults to the engine default)
+            scope: Visibility of the entry
+            scope_id: Explicit scope identifier (resolved from scope if None)
+            size: Precomputed size in bytes (estimated if None)
+            stale_ttl: Seconds after expiry during which the value may still be
+                served by get_or_compute while it is refreshed
+            cost: Seconds it took to compute the value (for time-saved stats)
+
+        Returns:
+            bool: False if the value is too large to cache
+        """
+        if scope_id is None:
+            scope_id = resolve_scope_id(scope)
+        if size is None:
+            size = estimate_size(value)
+
+        quota = self._quotas.get(namespace, {})
+        limit = min(self.max_bytes, quota.get("max_bytes") or self.max_bytes)
+        if size > limit:
+            logger.debug(f"Not caching {namespace}:{key}, {size} bytes exceeds budget")
+            return False
+
+        full_key = (namespace, scope_id, key)
+        expires_at = time.time() + (ttl if ttl is not None else self.default_ttl)
+
+        with self._lock:
+            if full_key in self._lru:
+                self._remove(full_key)
+
+            entry = CacheEntry(namespace, key, scope_id, value, size, expires_at, expires_at + stale_ttl, cost)
+            if getattr(self._context, "prefetching", False):
+                entry.prefetched = True
+                self._stats["prefetch_loaded"] += 1
+            self._lru[full_key] = entry
+            self._namespaces.setdefault(namespace, OrderedDict())[full_key] = entry
+            self._namespace_bytes[namespace] = self._namespace_bytes.get(namespace, 0) + size
+            self._total_bytes += size
+            self._stats["sets"] += 1
+            self._ns_stats(namespace)["sets"] += 1
+
+            self._enforce_namespace_quota(namespace)
+            self._enforce_global_budget()
+            self._maybe_cleanup()
+        return True
+
+    def delete(self, namespace: str, key: str, scope: str = CacheScope.GLOBAL, scope_id: str = None,
+               broadcast: bool = True) -> bool:
+        """
+        Delete a single entry.
+
+        Args:
+            broadcast: Also delete it from the shared tier and other pods
+
+        Returns:
+            bool: True if an entry was removed
+        """
+        if scope_id is None:
+            scope_id = resolve_scope_id(scope)
+        with self._lock:
+            self._bump_generation(namespace)
+            removed = self._remove((namespace, scope_id, key), EVICT_INVALIDATION) is not None
+
+        if broadcast and self._backend is not None:
+            if scope_id == "":
+                self._backend_call("delete", namespace, key)
+            self._backend_call("publish_invalidation", namespace, key, scope_id)
+        return removed
+
+    def invalidate(self, namespace: str = None, scope_id: str = None,
+                   predicate: Callable[[CacheEntry], bool] = None, broadcast: bool = True) -> int:
+        """
+        Remove every entry matching the given criteria.
+
+        Namespace and scope invalidations are broadcast to other pods; an
+        arbitrary predicate cannot be, so predicate invalidations only apply
+        to this process.
+
+        Args:
+            namespace: Only entries in this namespace
+            scope_id: Only entries with this scope identifier
+            predicate: Additional filter on the entry
+            broadcast: Also invalidate the shared tier and other pods
+
+        Returns:
+            int: Number of entries removed
+        """
+        with self._lock:
+            self._bump_generation(namespace)
+            if namespace is not None:
+                candidates = list(self._namespaces.get(namespace, {}).items())
+            else:
+                candidates = list(self._lru.items())
+
+            removed = 0
+            for full_key, entry in candidates:
+                if scope_id is not None and entry.scope_id != scope_id:
+                    continue
+                if predicate is not None and not predicate(entry):
+                    continue
+                self._remove(full_key, EVICT_INVALIDATION)
+                removed += 1
+
+        if broadcast and predicate is None and self._backend is not None:
+            if namespace is not None and scope_id in (None, ""):
+                self._backend_call("invalidate", namespace)
+            self._backend_call("publish_invalidation", namespace, None, scope_id)
+        return removed
+
+    def clear(self, broadcast: bool = True):
+        """
+        Remove every entry.
+
+        Args:
+            broadcast: Also clear the shared tier and other pods
+        """
+        with self._lock:
+            self._bump_generation(None)
+            for namespace, entries in self._namespaces.items():
+                self._ns_stats(namespace)["evictions_invalidation"] += len(entries)
+            self._stats["invalidations"] += len(self._lru)
+            self._lru.clear()
+            self._namespaces.clear()
+            self._namespace_bytes.clear()
+            self._total_bytes = 0
+
+        if broadcast and self._backend is not None:
+            self._backend_call("clear")
+            self._backend_call("publish_invalidation", None, None, None)
+
+    def get_or_compute(self, namespace: str, key: str, compute: Callable[[], Any], ttl: int = None,
+                       scope: str = CacheScope.GLOBAL, scope_id: str = None, stale_ttl: int = 0,
+                       persist: bool = False) -> Any:
+        """
+        Get a value, computing it at most once across concurrent callers.
+
+        On a miss the first caller runs ``compute`` while every other caller
+        for the same key waits for its result (single-flight). With
+        ``stale_ttl`` set, an expired value still inside its stale window is
+        returned immediately and one background refresh replaces it. With
+        ``persist`` set, misses are first looked up in the disk tier and
+        computed values are written through to it.
+
+        Args:
+            namespace: Namespace of the entry
+            key: Entry key
+            compute: Zero-argument callable producing the value
+            ttl: Time to live in seconds
+            scope: Visibility of the entry
+            scope_id: Explicit scope identifier (resolved from scope if None)
+            stale_ttl: Seconds after expiry during which stale values are served
+            persist: Also keep the value in the node-local disk cache
+
+        Returns:
+            any: Cached or freshly computed value
+        """
+        if scope_id is None:
+            scope_id = resolve_scope_id(scope)
+        full_key = (namespace, scope_id, key)
+
+        with self._lock:
+            entry = self._lru.get(full_key)
+            now = time.time()
+
+            if entry is not None and not entry.is_expired(now):
+                self._lru.move_to_end(full_key)
+                self._namespaces[namespace].move_to_end(full_key)
+                self._record_hit(entry)
+                return entry.value
+
+            if entry is not None and not entry.is_dead(now):
+                # Serve the stale value; start a refresh unless one is running
+                self._lru.move_to_end(full_key)
+                self._namespaces[namespace].move_to_end(full_key)
+                self._record_hit(entry)
+                self._stats["stale_served"] += 1
+                if full_key not in self._inflight:
+                    flight = _Flight(self._current_generation(namespace))
+                    self._inflight[full_key] = flight
+                    self._stats["refreshes"] += 1
+                    _start_background(
+                        lambda: self._run_flight(full_key, flight, compute, ttl, stale_ttl, persist, background=True),
+                        name=f"cache-refresh-{namespace}",
+                    )
+                return entry.value
+
+            self._record_miss(namespace)
+            flight = self._inflight.get(full_key)
+            leader = flight is None
+            if leader:
+                flight = _Flight(self._current_generation(namespace))
+                self._inflight[full_key] = flight
+            else:
+                self._stats["coalesced"] += 1
+
+        if leader:
+            self._run_flight(full_key, flight, compute, ttl, stale_ttl, persist, check_disk=persist)
+        else:
+            flight.done.wait()
+
+        if flight.error is not None:
+            if not leader and not isinstance(flight.error, Exception):
+                # The leader's script was stopped or rerun; that is not this caller's failure
+                return self.get_or_compute(namespace, key, compute, ttl=ttl, scope_id=scope_id,
+                                           stale_ttl=stale_ttl, persist=persist)
+            raise flight.error
+        return flight.value
+
+    def _run_flight(self, full_key, flight: _Flight, compute: Callable[[], Any], ttl: int, stale_ttl: int,
+                    persist: bool = False, background: bool = False, check_disk: bool = False):
+        """Run a computation, store its result and release every waiter."""
+        namespace, scope_id, key = full_key
+        disk_key = f"{scope_id}|{key}"
+        ttl = ttl if ttl is not None else self.default_ttl
+        # Only global entries are shared; user and session entries stay on this pod
+        shared = self._backend is not None and scope_id == ""
+        try:
+            if shared and not background:
+                value = self._backend_call("get", namespace, key, _MISSING, default=_MISSING)
+                if value is not _MISSING:
+                    flight.value = value
+                    self._stats["backend_hits"] += 1
+                    self._store_flight(flight, full_key, ttl, stale_ttl, self._average_cost(namespace))
+                    return
+
+            if check_disk:
+                value = _disk_tier().get(namespace, disk_key, _MISSING)
+                if value is not _MISSING:
+                    flight.value = value
+                    self._stats["disk_hits"] += 1
+                    self._store_flight(flight, full_key, ttl, stale_ttl, self._average_cost(namespace))
+                    return
+
+            start = time.perf_counter()
+            flight.value = compute()
+            cost = time.perf_counter() - start
+            with self._lock:
+                stats = self._ns_stats(namespace)
+                stats["computes"] += 1
+                stats["compute_seconds"] += cost
+                self._stats["computes"] += 1
+                self._stats["compute_seconds"] += cost
+
+            if not self._store_flight(flight, full_key, ttl, stale_ttl, cost):
+                return
+            deferred = getattr(self._context, "deferred_writes", None)
+            if shared and deferred is not None and not background:
+                deferred[(namespace, key)] = (flight, ttl + stale_ttl)
+            elif shared:
+                self._backend_call("set", namespace, key, flight.value, ttl + stale_ttl)
+                if not self._is_current(flight, namespace):
+                    # Invalidated while publishing: take the value back out of the shared tier
+                    self._backend_call("delete", namespace, key)
+            if persist:
+                _disk_tier().set(namespace, disk_key, flight.value, ttl=ttl + stale_ttl)
+        except BaseException as e:
+            # Includes Streamlit's RerunException/StopException, so waiters never
+            # take an unfinished computation's None for its value
+            flight.error = e
+            if background:
+                # Nobody will see the exception; the stale value stays until it dies
+                logger.warning(f"Background cache refresh for {namespace} failed: {e!r}")
+            elif not isinstance(e, Exception):
+                raise
+        finally:
+            with self._lock:
+                self._inflight.pop(full_key, None)
+            flight.done.set()
+
+    def _current_generation(self, namespace: str) -> Tuple[int, int]:
+        """Invalidation generation of a namespace. Caller holds the lock."""
+        return self._generation, self._namespace_generations.get(namespace, 0)
+
+    def _bump_generation(self, namespace: Optional[str]):
+        """Start a new generation for a namespace (None: the whole cache). Caller holds the lock."""
+        if namespace is None:
+            self._generation += 1
+        else:
+            self._namespace_generations[namespace] = self._namespace_generations.get(namespace, 0) + 1
+
+    def _is_current(self, flight: _Flight, namespace: str) -> bool:
+        """Whether nothing invalidated a flight's namespace since it started."""
+        with self._lock:
+            return flight.generation == self._current_generation(namespace)
+
+    def _store_flight(self, flight: _Flight, full_key, ttl: int, stale_ttl: int, cost: float) -> bool:
+        """
+        Store a flight's value unless its namespace was invalidated while it ran.
+
+        Waiters still get the value, but it may predate the write behind the
+        invalidation, so it is not kept for later callers.
+
+        Returns:
+            bool: False if the value was discarded
+        """
+        namespace, scope_id, key = full_key
+        with self._lock:
+            if flight.generation != self._current_generation(namespace):
+                self._stats["stale_discarded"] += 1
+                return False
+            self.set(namespace, key, flight.value, ttl=ttl, scope_id=scope_id, stale_ttl=stale_ttl, cost=cost)
+            return True
+
+    def _average_cost(self, namespace: str) -> float:
+        """Mean compute time of a namespace, used for values loaded from another tier."""
+        with self._lock:
+            stats = self._ns_stats(namespace)
+            return stats["compute_seconds"] / stats["computes"] if stats["computes"] else 0.0
+
+    def cleanup_expired(self, namespace: str = None) -> int:
+        """
+        Remove expired entries.
+
+        Args:
+            namespace: Only sweep this namespace (None sweeps everything)
+
+        Returns:
+            int: Number of entries removed
+        """
+        now = time.time()
+        with self._lock:
+            entries = self._lru if namespace is None else self._namespaces.get(namespace, {})
+            expired = [full_key for full_key, entry in entries.items() if entry.is_dead(now)]
+            for full_key in expired:
+                self._remove(full_key, EVICT_TTL)
+            if namespace is None:
+                self._last_cleanup = now
+            return len(expired)
+
+    def keys(self, namespace: str, scope_id: str = None) -> list:
+        """
+        List the keys currently stored in a namespace.
+
+        Args:
+            namespace: Namespace name
+            scope_id: Only keys with this scope identifier
+
+        Returns:
+            list: Entry keys, least recently used first
+        """
+        with self._lock:
+            return [
+                entry.key for entry in self._namespaces.get(namespace, {}).values()
+                if scope_id is None or entry.scope_id == scope_id
+            ]
+
+    # -- statistics --------------------------------------------------------
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get cache statistics.
+
+        Returns:
+            dict: Totals, evictions by reason, and per-namespace counters with
+                entry counts, bytes and quotas
+        """
+        with self._lock:
+            requests = self._stats["hits"] + self._stats["misses"]
+            namespaces = {}
+            for namespace in set(self._namespaces) | set(self._namespace_stats):
+                stats = dict(self._ns_stats(namespace))
+                lookups = stats["hits"] + stats["misses"]
+                stats.update({
+                    "hit_ratio": stats["hits"] / lookups if lookups else 0,
+                    "avg_compute_ms": (
+                        stats["compute_seconds"] / stats["computes"] * 1000 if stats["computes"] else 0
+                    ),
+                    "entries": len(self._namespaces.get(namespace, ())),
+                    "bytes": self._namespace_bytes.get(namespace, 0),
+                    **self._quotas.get(namespace, {}),
+                })
+                namespaces[namespace] = stats
+
+            return {
+                **self._stats,
+                "hit_ratio": self._stats["hits"] / requests if requests else 0,
+                "prefetch_hit_rate": (
+                    self._stats["prefetch_hits"] / self._stats["prefetch_loaded"]
+                    if self._stats["prefetch_loaded"] else 0
+                ),
+                "entries": len(self._lru),
+                "bytes": self._total_bytes,
+                "max_bytes": self.max_bytes,
+                "last_cleanup": self._last_cleanup,
+                "backend": self._backend.get_stats() if self._backend is not None else None,
+                "evictions_by_reason": {
+                    EVICT_TTL: self._stats["expirations"],
+                    EVICT_SIZE: self._stats["evictions"],
+                    EVICT_INVALIDATION: self._stats["invalidations"],
+                },
+                "namespaces": namespaces,
+            }
+
+    def reset_stats(self):
+        """Reset hit/miss, timing and eviction counters (entries are kept)."""
+        with self._lock:
+            for name in self._stats:
+                self._stats[name] = 0.0 if isinstance(self._stats[name], float) else 0
+            self._namespace_stats.clear()
+
+    # -- internals ---------------------------------------------------------
+
+    def _remove(self, full_key, reason: str = None) -> Optional[CacheEntry]:
+        """
+        Remove an entry from every index. Caller holds the lock.
+
+        Args:
+            full_key: (namespace, scope_id, key)
+            reason: EVICT_TTL, EVICT_SIZE or EVICT_INVALIDATION to count the
+                removal as an eviction (None when the entry is being replaced)
+        """
+        entry = self._lru.pop(full_key, None)
+        if entry is None:
+            return None
+
+        if reason is not None:
+            self._ns_stats(entry.namespace)[f"evictions_{reason}"] += 1
+            global_counter = {EVICT_TTL: "expirations", EVICT_SIZE: "evictions"}.get(reason, "invalidations")
+            self._stats[global_counter] += 1
+
+        namespace_entries = self._namespaces.get(entry.namespace)
+        if namespace_entries is not None:
+            namespace_entries.pop(full_key, None)
+            if not namespace_entries:
+                del self._namespaces[entry.namespace]
+
+        self._namespace_bytes[entry.namespace] = self._namespace_bytes.get(entry.namespace, 0) - entry.size
+        if self._namespace_bytes[entry.namespace] <= 0:
+            self._namespace_bytes.pop(entry.namespace, None)
+        self._total_bytes -= entry.size
+        return entry
+
+    def _evict_oldest(self, entries: "OrderedDict") -> bool:
+        """Evict the least recently used entry of an LRU index. Caller holds the lock."""
+        if not entries:
+            return False
+        full_key = next(iter(entries))
+        self._remove(full_key, EVICT_SIZE)
+        return True
+
+    def _enforce_namespace_quota(self, namespace: str):
+        """Evict a namespace's LRU entries until it fits its quota. Caller holds the lock."""
+        quota = self._quotas.get(namespace)
+        if not quota:
+            return
+        max_entries = quota.get("max_entries")
+        max_bytes = quota.get("max_bytes")
+
+        while namespace in self._namespaces:
+            entries = self._namespaces[namespace]
+            over_entries = max_entries is not None and len(entries) > max_entries
+            over_bytes = max_bytes is not None and self._namespace_bytes.get(namespace, 0) > max_bytes
+            if not (over_entries or over_bytes) or not self._evict_oldest(entries):
+                break
+
+    def _enforce_global_budget(self):
+        """Evict globally least recently used entries until under budget. Caller holds the lock."""
+        while self._total_bytes > self.max_bytes and self._evict_oldest(self._lru):
+            pass
+
+    def _maybe_cleanup(self):
+        """Sweep expired entries at most once per cleanup interval. Caller holds the lock."""
+        if time.time() - self._last_cleanup >= CACHE_CLEANUP_INTERVAL:
+            self.cleanup_expired()
+
+
+def _disk_tier():
+    """The disk cache, imported lazily so the engine has no hard dependency on it."""
+    from lib.utils.disk_cache import get_disk_cache
+
+    return get_disk_cache()
+
+
+# Global engine instance shared by every cache decorator in the process
+_engine = CacheEngine()
+
+
+_backend_configured = False
+_backend_lock = threading.Lock()
+
+
+def get_cache_engine() -> CacheEngine:
+    """
+    Get the process-wide cache engine.
+
+    The shared backend configured by CACHE_BACKEND_URL / REDIS_URL is
+    attached on first use.
+    """
+    global _backend_configured
+
+    if not _backend_configured:
+        with _backend_lock:
+            if not _backend_configured:
+                _backend_configured = True
+                try:
+                    from lib.utils.cache_backends import create_backend_from_env
+
+                    backend = create_backend_from_env()
+                    if backend is not None:
+                        _engine.set_backend(backend)
+                except Exception as e:
+                    logger.warning(f"Could not configure shared cache backend: {str(e)}")
+
+    return _engine
+
+
+def cached(ttl: int = None, namespace: str = None, scope: str = CacheScope.GLOBAL,
+           max_entries: int = None, max_bytes: int = None, engine: CacheEngine = None,
+           stale_ttl: int = 0, persist: bool = False):
+    """
+    Decorator caching function results in the shared cache engine.
+
+    Concurrent calls with the same arguments share one computation.
+
+    Args:
+        ttl: Time to live in seconds
+        namespace: Namespace for the entries (defaults to the function's qualified name)
+        scope: CacheScope controlling who shares the cached result
+        max_entries: Entry quota for the namespace
+        max_bytes: Byte quota for the namespace
+        engine: Engine to use (defaults to the process-wide engine)
+        stale_ttl: Seconds an expired result may still be served while it is
+            refreshed in the background
+        persist: Keep results in the disk tier so they survive restarts and
+            are shared with other worker processes on the node
+    """
+    def decorator(func):
+        cache_namespace = namespace or function_namespace(func)
+        cache_engine = engine or get_cache_engine()
+
+        if max_entries is not None or max_bytes is not None:
+            cache_engine.set_namespace_quota(cache_namespace, max_entries=max_entries, max_bytes=max_bytes)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            return cache_engine.get_or_compute(
+                cache_namespace,
+                make_key(args, kwargs),
+                lambda: func(*args, **kwargs),
+                ttl=ttl,
+                scope_id=resolve_scope_id(scope),
+                stale_ttl=stale_ttl,
+                persist=persist,
+            )
+
+        def invalidate():
+            removed = cache_engine.invalidate(namespace=cache_namespace)
+            if persist:
+                removed += _disk_tier().invalidate(cache_namespace)
+            return removed
+
+        wrapper.cache_namespace = cache_namespace
+        wrapper.cache_invalidate = invalidate
+        return wrapper
+    return decorator
@@ -2,97 +2,79 @@
 Cache Manager for gcPanel.
 
 This module provides caching utilities to improve application performance:
-- Function-level caching with TTL (Time To Live)
-- Session-based caching for user-specific data
-- Data prefetching mechanisms for frequently accessed information
+- Function-level caching with TTL (Time To Live) on the shared cache engine
+- User- and session-scoped caching for user-specific data
+- Data prefetching mechanisms for frequently accessed information (lib.utils.prefetch)
 """
 
-import streamlit as st
-import functools
 import time
-import hashlib
-import json
-from datetime import datetime, timedelta
+import functools
+from datetime import datetime
+
+from lib.utils.cache_engine import (
+    CacheScope,
+    get_cache_engine,
+    make_key,
+    function_namespace,
+    resolve_scope_id,
+)
+
+# Namespace for values stored through user_data_cache
+USER_DATA_NAMESPACE = "user_data"
 
 class CacheManager:
     """
     Cache manager for improved application performance.
+    
+    All entries live in the process-wide cache engine, so cached results are
+    shared between sessions unless they are explicitly scoped.
     """
     
     @staticmethod
     def initialize_cache():
-        """Initialize application cache in session state."""
-        if "data_cache" not in st.session_state:
-            st.session_state.data_cache = {}
-        
-        if "cache_metadata" not in st.session_state:
-            st.session_state.cache_metadata = {
-                "size": 0,
-                "hits": 0,
-                "misses": 0,
-                "last_cleanup": datetime.now().timestamp()
-            }
+        """Initialize the shared cache engine."""
+        return get_cache_engine()
     
     @staticmethod
-    def cached(ttl_seconds=300, max_size=100, user_specific=False):
+    def cached(ttl_seconds=300, max_size=100, user_specific=False, scope=None, namespace=None,
+               stale_seconds=0, persist=False):
         """
         Decorator for caching function results.
         
+        Concurrent callers missing on the same arguments wait for a single
+        computation instead of each running the function.
+        
         Args:
             ttl_seconds (int): Time to live in seconds
-            max_size (int): Maximum number of items in cache
+            max_size (int): Maximum number of cached results for this function
             user_specific (bool): Whether cache depends on user identity
+            scope (str, optional): CacheScope value; overrides user_specific
+            namespace (str, optional): Cache namespace (defaults to the function name)
+            stale_seconds (int): Serve an expired result for this long while it
+                is refreshed in the background
+            persist (bool): Also keep results in the disk cache across restarts
         """
+        if scope is None:
+            scope = CacheScope.USER if user_specific else CacheScope.GLOBAL
+        
         def decorator(func):
+            engine = get_cache_engine()
+            cache_namespace = namespace or function_namespace(func)
+            engine.set_namespace_quota(cache_namespace, max_entries=max_size)
+            
             @functools.wraps(func)
             def wrapper(*args, **kwargs):
-                # Initialize cache if needed
-                CacheManager.initialize_cache()
-                
-                # Create a cache key
-                key_parts = [func.__name__]
-                
-                # Add user-specific info if needed
-                if user_specific and "user" in st.session_state:
-                    key_parts.append(st.session_state.user.get("username", "anonymous"))
-                
-                # Add args and kwargs to key
-                for arg in args:
-                    key_parts.append(str(arg))
-                
-                sorted_kwargs = sorted(kwargs.items())
-                for k, v in sorted_kwargs:
-                    key_parts.append(f"{k}={v}")
-                
-                # Create a hash-based key
-                key = hashlib.md5(json.dumps(key_parts).encode()).hexdigest()
-                
-                # Check if result in cache and not expired
-                if key in st.session_state.data_cache:
-                    entry = st.session_state.data_cache[key]
-                    if entry["expire_time"] > time.time():
-                        # Update hit counter
-                        st.session_state.cache_metadata["hits"] += 1
-                        return entry["data"]
-                
-                # Not in cache or expired, call the function
-                st.session_state.cache_metadata["misses"] += 1
-                result = func(*args, **kwargs)
-                
-                # Store in cache
-                st.session_state.data_cache[key] = {
-                    "data": result,
-                    "expire_time": time.time() + ttl_seconds
-                }
-                
-                # Update cache size
-                st.session_state.cache_metadata["size"] = len(st.session_state.data_cache)
-                
-                # Check if cleanup needed
-                if len(st.session_state.data_cache) > max_size:
-                    CacheManager.cleanup_cache()
-                
-                return result
+                return engine.get_or_compute(
+                    cache_namespace,
+                    make_key(args, kwargs),
+                    lambda: func(*args, **kwargs),
+                    ttl=ttl_seconds,
+                    scope_id=resolve_scope_id(scope),
+                    stale_ttl=stale_seconds,
+                    persist=persist,
+                )
+            
+            wrapper.cache_namespace = cache_namespace
             return wrapper
         return decorator
     
@@ -109,55 +91,20 @@ class CacheManager:
         Returns:
             any: Cached value or None if not found
         """
-        # Initialize cache if needed
-        CacheManager.initialize_cache()
-        
-        # Prefix the key with username for isolation
-        if "user" in st.session_state:
-            username = st.session_state.user.get("username", "anonymous")
-            full_key = f"user_{username}_{key}"
-        else:
-            full_key = f"user_anonymous_{key}"
+        engine = get_cache_engine()
         
         # Set value if provided
         if value is not None:
-            st.session_state.data_cache[full_key] = {
-                "data": value,
-                "expire_time": time.time() + (ttl_minutes * 60)
-            }
+            engine.set(USER_DATA_NAMESPACE, key, value, ttl=ttl_minutes * 60, scope=CacheScope.USER)
             return value
-            
-        # Get value if in cache and not expired
-        if full_key in st.session_state.data_cache:
-            entry = st.session_state.data_cache[full_key]
-            if entry["expire_time"] > time.time():
-                st.session_state.cache_metadata["hits"] += 1
-                return entry["data"]
         
-        # Not found or expired
-        st.session_state.cache_metadata["misses"] += 1
-        return None
+        # Get value if in cache and not expired
+        return engine.get(USER_DATA_NAMESPACE, key, scope=CacheScope.USER)
     
     @staticmethod
     def invalidate_user_cache():
-        """Invalidate all user-specific cache entries."""
-        if "data_cache" not in st.session_state:
-            return
-            
-        if "user" in st.session_state:
-            username = st.session_state.user.get("username", "anonymous")
-            prefix = f"user_{username}_"
-            
-            # Find all keys for this user
-            keys_to_remove = [k for k in st.session_state.data_cache.keys() 
-                             if k.startswith(prefix)]
-            
-            # Remove them
-            for key in keys_to_remove:
-                del st.session_state.data_cache[key]
-                
-            # Update cache size
-            st.session_state.cache_metadata["size"] = len(st.session_state.data_cache)
+        """Invalidate all cache entries scoped to the current user."""
+        get_cache_engine().invalidate(scope_id=resolve_scope_id(CacheScope.USER))
     
     @staticmethod
     def invalidate_cache(pattern=None):
@@ -165,58 +112,31 @@ class CacheManager:
         Invalidate cache entries matching a pattern.
         
         Args:
-            pattern (str, optional): Pattern to match keys. If None, clears all.
+            pattern (str, optional): Pattern matched against namespaces and keys. If None, clears all.
         """
-        if "data_cache" not in st.session_state:
-            return
-            
+        engine = get_cache_engine()
+        
         if pattern is None:
-            # Clear all
-            st.session_state.data_cache = {}
-            st.session_state.cache_metadata["size"] = 0
+            engine.clear()
         else:
-            # Clear matching pattern
-            keys_to_remove = [k for k in st.session_state.data_cache.keys() 
-                             if pattern in k]
-            
-            for key in keys_to_remove:
-                del st.session_state.data_cache[key]
-                
-            # Update cache size
-            st.session_state.cache_metadata["size"] = len(st.session_state.data_cache)
+            engine.invalidate(predicate=lambda entry: pattern in entry.namespace or pattern in entry.key)
     
     @staticmethod
     def cleanup_cache(force=False):
         """
-        Remove expired items and enforce size limits.
+        Remove expired items.
         
         Args:
             force (bool): Force cleanup regardless of timing
         """
-        # Check if we need to run cleanup
-        now = datetime.now().timestamp()
-        last_cleanup = st.session_state.cache_metadata.get("last_cleanup", 0)
+        engine = get_cache_engine()
+        stats = engine.get_stats()
         
         # Only run cleanup every 5 minutes unless forced
-        if not force and (now - last_cleanup < 300):
+        if not force and (time.time() - stats["last_cleanup"] < 300):
             return
-            
-        # Update last cleanup time
-        st.session_state.cache_metadata["last_cleanup"] = now
         
-        # Remove expired entries
-        current_time = time.time()
-        keys_to_remove = []
-        
-        for key, entry in st.session_state.data_cache.items():
-            if entry["expire_time"] < current_time:
-                keys_to_remove.append(key)
-                
-        for key in keys_to_remove:
-            del st.session_state.data_cache[key]
-        
-        # Update cache size
-        st.session_state.cache_metadata["size"] = len(st.session_state.data_cache)
+        engine.cleanup_expired()
     
     @staticmethod
     def get_cache_stats():
@@ -226,30 +146,13 @@ class CacheManager:
         Returns:
             dict: Cache statistics
         """
-        if "cache_metadata" not in st.session_state:
-            return {
-                "size": 0,
-                "hits": 0, 
-                "misses": 0,
-                "hit_ratio": 0,
-                "last_cleanup": "Never"
-            }
-            
-        stats = st.session_state.cache_metadata.copy()
+        stats = get_cache_engine().get_stats()
+        
+        stats["size"] = stats["entries"]
+        stats["last_cleanup"] = datetime.fromtimestamp(
+            stats["last_cleanup"]
+        ).strftime("%Y-%m-%d %H:%M:%S")
         
-        # Calculate hit ratio
-        total_requests = stats["hits"] + stats["misses"]
-        if total_requests > 0:
-            stats["hit_ratio"] = stats["hits"] / total_requests
-        else:
-            stats["hit_ratio"] = 0
-            
-        # Format last cleanup
-        if "last_cleanup" in stats:
-            stats["last_cleanup"] = datetime.fromtimestamp(
-                stats["last_cleanup"]
-            ).strftime("%Y-%m-%d %H:%M:%S")
-            
         return stats
 
 
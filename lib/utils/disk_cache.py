@@ -0,0 +1,416 @@
+"""
+Disk Cache for gcPanel.
+
+This module provides the persistent second tier behind the in-memory cache
+engine. Heavy artifacts (report PDFs, billing workbooks, rendered charts)
+survive pod restarts and are shared by every Streamlit worker process on the
+node:
+- SQLite index (WAL mode) safe for concurrent processes
+- Content-addressed blob store keyed by SHA-256, so identical artifacts are
+  stored once and corrupted blobs are detected on read
+- Atomic writes (temporary file + rename)
+- Size-bounded LRU eviction with per-entry TTL
+"""
+
+import os
+import time
+import pickle
+import sqlite3
+import hashlib
+import logging
+import tempfile
+import threading
+from typing import Any, Dict, Optional
+
+from lib.utils.cache_backends import CacheBackend
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Constants
+DISK_CACHE_DIR = os.environ.get("DISK_CACHE_DIR", "data/cache")
+DISK_CACHE_MAX_BYTES = int(os.environ.get("DISK_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+DISK_CACHE_DEFAULT_TTL = int(os.environ.get("DISK_CACHE_DEFAULT_TTL", str(24 * 3600)))
+
+# Only bump accessed_at when it is older than this, to avoid a write per read
+_TOUCH_INTERVAL = 60
+
+_MISSING = object()
+
+
+class DiskCache(CacheBackend):
+    """
+    Persistent, size-bounded LRU cache shared between processes.
+
+    Values are pickled and written to ``objects/<aa>/<sha256>``; the SQLite
+    index maps (namespace, key) to a content digest with size, expiry and
+    last-access time.
+    """
+
+    def __init__(self, directory: str = DISK_CACHE_DIR, max_bytes: int = DISK_CACHE_MAX_BYTES,
+                 default_ttl: int = DISK_CACHE_DEFAULT_TTL):
+        self.directory = directory
+        self.objects_dir = os.path.join(directory, "objects")
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self._local = threading.local()
+        self._stats = {"hits": 0, "misses": 0, "writes": 0, "evictions": 0, "corrupt": 0}
+
+        os.makedirs(self.objects_dir, exist_ok=True)
+        self._init_index()
+
+    # -- storage helpers ---------------------------------------------------
+
+    def _connect(self) -> sqlite3.Connection:
+        """Get this thread's connection to the index."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                os.path.join(self.directory, "index.db"),
+                timeout=30,
+                isolation_level=None,
+                check_same_thread=False,
+            )
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _init_index(self):
+        """Create the index table if needed."""
+        conn = self._connect()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS entries (
+                namespace TEXT NOT NULL,
+                key TEXT NOT NULL,
+                digest TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                expires_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                PRIMARY KEY (namespace, key)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_accessed ON entries(accessed_at)")
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_entries_digest ON entries(digest)")
+
+    def _blob_path(self, digest: str) -> str:
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def _write_blob(self, digest: str, payload: bytes):
+        """Atomically write a blob unless an identical one already exists."""
+        path = self._blob_path(digest)
+        if os.path.exists(path):
+            return
+
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(payload)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _read_blob(self, digest: str) -> Optional[bytes]:
+        """Read a blob and verify it against its digest."""
+        try:
+            with open(self._blob_path(digest), "rb") as f:
+                payload = f.read()
+        except FileNotFoundError:
+            return None
+
+        if hashlib.sha256(payload).hexdigest() != digest:
+            self._stats["corrupt"] += 1
+            logger.warning(f"Disk cache blob {digest} failed verification")
+            # Remove it so the next write of this content stores a good copy
+            try:
+                os.unlink(self._blob_path(digest))
+            except FileNotFoundError:
+                pass
+            return None
+        return payload
+
+    def _drop_orphan_blobs(self, conn: sqlite3.Connection, digests):
+        """Remove blobs no longer referenced by any entry."""
+        for digest in set(digests):
+            referenced = conn.execute(
+                "SELECT 1 FROM entries WHERE digest = ? LIMIT 1", (digest,)
+            ).fetchone()
+            if referenced:
+                continue
+            try:
+                os.unlink(self._blob_path(digest))
+            except FileNotFoundError:
+                pass
+
+    # -- core operations ---------------------------------------------------
+
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        """
+        Get a value from the disk cache.
+
+        Args:
+            namespace: Namespace of the entry
+            key: Entry key
+            default: Returned when the key is missing, expired or unreadable
+
+        Returns:
+            any: Cached value or default
+        """
+        now = time.time()
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT digest, expires_at, accessed_at FROM entries WHERE namespace = ? AND key = ?",
+                (namespace, key),
+            ).fetchone()
+
+            if row is None:
+                self._stats["misses"] += 1
+                return default
+
+            digest, expires_at, accessed_at = row
+            if now >= expires_at:
+                self.delete(namespace, key)
+                self._stats["misses"] += 1
+                return default
+
+            payload = self._read_blob(digest)
+            if payload is None:
+                self.delete(namespace, key)
+                self._stats["misses"] += 1
+                return default
+
+            if now - accessed_at >= _TOUCH_INTERVAL:
+                conn.execute(
+                    "UPDATE entries SET accessed_at = ? WHERE namespace = ? AND key = ?",
+                    (now, namespace, key),
+                )
+
+            self._stats["hits"] += 1
+            return pickle.loads(payload)
+        except Exception as e:
+            logger.error(f"Error reading disk cache entry {namespace}:{key}: {str(e)}")
+            return default
+
+    def set(self, namespace: str, key: str, value: Any, ttl: int = None) -> bool:
+        """
+        Store a value in the disk cache.
+
+        Args:
+            namespace: Namespace of the entry
+            key: Entry key
+            value: Picklable value
+            ttl: Time to live in seconds (defaults to the cache default)
+
+        Returns:
+            bool: True if the value was stored
+        """
+        try:
+            payload = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        except Exception as e:
+            logger.debug(f"Value for {namespace}:{key} is not picklable: {e}")
+            return False
+
+        size = len(payload)
+        if size > self.max_bytes:
+            return False
+
+        digest = hashlib.sha256(payload).hexdigest()
+        now = time.time()
+        expires_at = now + (ttl if ttl is not None else self.default_ttl)
+
+        try:
+            self._write_blob(digest, payload)
+
+            conn = self._connect()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                previous = conn.execute(
+                    "SELECT digest FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+                ).fetchone()
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries "
+                    "(namespace, key, digest, size, created_at, expires_at, accessed_at) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (namespace, key, digest, size, now, expires_at, now),
+                )
+                evicted = self._evict(conn)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+
+            if previous and previous[0] != digest:
+                evicted.append(previous[0])
+            self._drop_orphan_blobs(conn, evicted)
+
+            self._stats["writes"] += 1
+            return True
+        except Exception as e:
+            logger.error(f"Error writing disk cache entry {namespace}:{key}: {str(e)}")
+            return False
+
+    def delete(self, namespace: str, key: str) -> bool:
+        """
+        Delete a single entry.
+
+        Returns:
+            bool: True if an entry was removed
+        """
+        try:
+            conn = self._connect()
+            row = conn.execute(
+                "SELECT digest FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            if row is None:
+                return False
+            conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+            self._drop_orphan_blobs(conn, [row[0]])
+            return True
+        except Exception as e:
+            logger.error(f"Error deleting disk cache entry {namespace}:{key}: {str(e)}")
+            return False
+
+    def invalidate(self, namespace: str) -> int:
+        """
+        Remove every entry in a namespace.
+
+        Returns:
+            int: Number of entries removed
+        """
+        try:
+            conn = self._connect()
+            digests = [row[0] for row in conn.execute(
+                "SELECT digest FROM entries WHERE namespace = ?", (namespace,)
+            )]
+            conn.execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+            self._drop_orphan_blobs(conn, digests)
+            return len(digests)
+        except Exception as e:
+            logger.error(f"Error invalidating disk cache namespace {namespace}: {str(e)}")
+            return 0
+
+    def clear(self) -> int:
+        """
+        Remove every entry.
+
+        Returns:
+            int: Number of entries removed
+        """
+        try:
+            conn = self._connect()
+            digests = [row[0] for row in conn.execute("SELECT digest FROM entries")]
+            conn.execute("DELETE FROM entries")
+            self._drop_orphan_blobs(conn, digests)
+            return len(digests)
+        except Exception as e:
+            logger.error(f"Error clearing disk cache: {str(e)}")
+            return 0
+
+    def cleanup_expired(self) -> int:
+        """
+        Remove expired entries and their blobs.
+
+        Returns:
+            int: Number of entries removed
+        """
+        try:
+            conn = self._connect()
+            now = time.time()
+            digests = [row[0] for row in conn.execute(
+                "SELECT digest FROM entries WHERE expires_at <= ?", (now,)
+            )]
+            conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+            self._drop_orphan_blobs(conn, digests)
+            return len(digests)
+        except Exception as e:
+            logger.error(f"Error cleaning up disk cache: {str(e)}")
+            return 0
+
+    def _stored_bytes(self, conn: sqlite3.Connection) -> int:
+        """Bytes used by distinct blobs."""
+        row = conn.execute(
+            "SELECT COALESCE(SUM(size), 0) FROM (SELECT MAX(size) AS size FROM entries GROUP BY digest)"
+        ).fetchone()
+        return row[0]
+
+    def _evict(self, conn: sqlite3.Connection) -> list:
+        """
+        Drop expired entries, then least recently used ones, until under budget.
+        Runs inside the caller's write transaction.
+
+        Returns:
+            list: Digests of removed entries
+        """
+        now = time.time()
+        removed = [row[0] for row in conn.execute(
+            "SELECT digest FROM entries WHERE expires_at <= ?", (now,)
+        )]
+        conn.execute("DELETE FROM entries WHERE expires_at <= ?", (now,))
+
+        total = self._stored_bytes(conn)
+        if total <= self.max_bytes:
+            return removed
+
+        for namespace, key, digest, size in conn.execute(
+            "SELECT namespace, key, digest, size FROM entries ORDER BY accessed_at"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+            removed.append(digest)
+            # Shared blobs only free space once their last reference is gone
+            if not conn.execute("SELECT 1 FROM entries WHERE digest = ? LIMIT 1", (digest,)).fetchone():
+                total -= size
+            self._stats["evictions"] += 1
+
+        return removed
+
+    # -- statistics --------------------------------------------------------
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Get disk cache statistics.
+
+        Returns:
+            dict: Entry count, stored bytes and this process's hit/miss counters
+        """
+        try:
+            conn = self._connect()
+            entries = conn.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+            stored = self._stored_bytes(conn)
+        except Exception as e:
+            logger.error(f"Error reading disk cache stats: {str(e)}")
+            entries, stored = 0, 0
+
+        return {
+            **self._stats,
+            "entries": entries,
+            "bytes": stored,
+            "max_bytes": self.max_bytes,
+            "directory": self.directory,
+        }
+
+
+# Global disk cache instance, created on first use
+_disk_cache = None
+_disk_cache_lock = threading.Lock()
+
+
+def get_disk_cache() -> DiskCache:
+    """Get the node-local disk cache."""
+    global _disk_cache
+
+    if _disk_cache is None:
+        with _disk_cache_lock:
+            if _disk_cache is None:
+                _disk_cache = DiskCache()
+
+    return _disk_cache
@@ -0,0 +1,173 @@
+"""
+Federated Search for gcPanel.
+
+This module runs one query against several search sources at once and
+merges their answers:
+- Sources are queried concurrently on a shared thread pool
+- Each source has a deadline; a source that misses it is left out and the
+  response is marked partial (its search keeps running, so a slow cache
+  fill still completes for the next query)
+- Scores are normalized per source before merging, since sources do not
+  score on the same scale
+- Source searches run without any Streamlit script context: the sources
+  are shared by every session, so anything per user must be passed in as
+  an argument rather than read from session state
+"""
+
+import os
+import time
+import logging
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from lib.utils.metrics import gauge
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Constants
+FEDERATED_SEARCH_WORKERS = int(os.environ.get("FEDERATED_SEARCH_WORKERS", "8"))
+FEDERATED_SEARCH_DEADLINE = float(os.environ.get("FEDERATED_SEARCH_DEADLINE", "1.5"))
+
+# A source search takes (query, limit) and returns (score, result) pairs, best first
+SourceSearch = Callable[[str, int], List[Tuple[float, Dict[str, Any]]]]
+
+# Source searches submitted but not started yet
+_queue_depth = gauge("gcpanel_job_queue_depth", "Jobs waiting for a worker", labels={"queue": "federated_search"})
+
+
+class FederatedSearch:
+    """Concurrent search over registered sources with per-source deadlines."""
+
+    def __init__(self, max_workers: int = FEDERATED_SEARCH_WORKERS):
+        self.max_workers = max_workers
+        self._sources: Dict[str, Dict[str, Any]] = {}
+        self._executor: Optional[ThreadPoolExecutor] = None
+        # Source name -> search still running after its deadline
+        self._running: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, search: SourceSearch, deadline: Optional[float] = None,
+                 weight: float = 1.0):
+        """
+        Register a search source.
+
+        Args:
+            name: Source name (results are grouped under it)
+            search: Function taking (query, limit) and returning (score, result) pairs
+            deadline: Seconds the source may take (default FEDERATED_SEARCH_DEADLINE)
+            weight: Multiplier applied to the source's normalized scores
+        """
+        with self._lock:
+            self._sources[name] = {
+                "search": search,
+                "deadline": deadline if deadline is not None else FEDERATED_SEARCH_DEADLINE,
+                "weight": weight,
+            }
+
+    @property
+    def sources(self) -> List[str]:
+        return list(self._sources)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="federated-search"
+                )
+            return self._executor
+
+    def search(self, query: str, limit: int = 50, sources: Optional[Iterable[str]] = None) -> Dict[str, Any]:
+        """
+        Query sources concurrently and merge their results.
+
+        Each result gets a "score" normalized to the source's best hit
+        (times the source weight) and a "source" naming where it came from.
+        A source whose previous search is still running past its deadline is
+        not queried again until that search finishes.
+
+        Args:
+            query: Search query
+            limit: Maximum results per source and in the merged list
+            sources: Source names to query (default: all)
+
+        Returns:
+            dict: "results" (merged, best first), "by_source" (name -> results),
+                "sources" (name -> status, seconds and count) and "partial"
+        """
+        names = [name for name in (sources or self._sources) if name in self._sources]
+        executor = self._get_executor()
+        start = time.time()
+
+        futures: Dict[str, Future] = {}
+        status: Dict[str, Dict[str, Any]] = {}
+        for name in names:
+            with self._lock:
+                running = self._running.get(name)
+                if running is not None and not running.done():
+                    status[name] = {"status": "busy", "seconds": 0.0, "count": 0}
+                    continue
+                self._running.pop(name, None)
+            _queue_depth.inc()
+            futures[name] = executor.submit(self._timed, self._sources[name]["search"], query, limit)
+
+        by_source: Dict[str, List[Dict[str, Any]]] = {}
+        # Collect in deadline order; every wait is bounded by that source's own deadline
+        for name in sorted(futures, key=lambda source: self._sources[source]["deadline"]):
+            future = futures[name]
+            remaining = start + self._sources[name]["deadline"] - time.time()
+            try:
+                hits, seconds = future.result(timeout=max(remaining, 0.0))
+            except TimeoutError:
+                with self._lock:
+                    self._running[name] = future
+                status[name] = {"status": "timeout", "seconds": time.time() - start, "count": 0}
+                logger.warning(f"Search source {name} missed its deadline")
+                continue
+            except Exception as e:
+                status[name] = {"status": "error", "seconds": time.time() - start, "count": 0}
+                logger.error(f"Error searching {name}: {str(e)}")
+                continue
+
+            by_source[name] = self._normalize(name, hits[:limit])
+            status[name] = {"status": "ok", "seconds": seconds, "count": len(by_source[name])}
+
+        merged = [result for name in names for result in by_source.get(name, [])]
+        merged.sort(key=lambda result: result["score"], reverse=True)
+
+        return {
+            "results": merged[:limit],
+            "by_source": by_source,
+            "sources": status,
+            "partial": any(entry["status"] != "ok" for entry in status.values()),
+        }
+
+    @staticmethod
+    def _timed(search: SourceSearch, query: str, limit: int):
+        _queue_depth.dec()
+        start = time.time()
+        hits = search(query, limit)
+        return hits, time.time() - start
+
+    def _normalize(self, name: str, hits: List[Tuple[float, Dict[str, Any]]]) -> List[Dict[str, Any]]:
+        """Scale a source's scores to (0, weight], relative to its best hit."""
+        if not hits:
+            return []
+        best = max(score for score, _ in hits) or 1.0
+        weight = self._sources[name]["weight"]
+
+        results = []
+        for score, result in hits:
+            result = dict(result)
+            result["score"] = round(weight * score / best, 4)
+            result["source"] = name
+            results.append(result)
+        return results
+
+    def shutdown(self):
+        """Stop the worker threads (running searches are not interrupted)."""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
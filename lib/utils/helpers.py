@@ -8,9 +8,47 @@ from datetime import datetime
 
 def check_authentication() -> bool:
     """Check if user is authenticated"""
-    if 'authenticated' not in st.session_state:
-        st.session_state.authenticated = False
-    return st.session_state.authenticated
+    from lib.utils.metrics_exporter import start_metrics_server
+    from lib.utils.page_instrumentation import install_page_instrumentation, section
+    from lib.utils.session_memory import enforce_session_budget
+    
+    # Every page checks authentication, so pages opened directly are measured from their next run
+    # and a pod that has not served the home page still exposes /metrics
+    install_page_instrumentation()
+    start_metrics_server()
+    with section("session_memory"):
+        enforce_session_budget()
+    with section("auth"):
+        if 'authenticated' not in st.session_state:
+            st.session_state.authenticated = False
+        if st.session_state.authenticated:
+            track_page_view()
+        return st.session_state.authenticated
+
+def is_admin() -> bool:
+    """Check if the logged-in user is an administrator"""
+    # Database logins store the role title-cased ("Admin"), demo logins as "Administrator"
+    return bool(st.session_state.get('authenticated')) and st.session_state.get('user_role') in ('Admin', 'Administrator')
+
+def get_current_page_name() -> str:
+    """Get the name of the multipage script currently running"""
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        page = ctx.pages_manager.get_pages().get(ctx.page_script_hash, {})
+        return page.get("page_name") or "main"
+    except Exception:
+        return "main"
+
+def track_page_view():
+    """Record a page view for the current user's role once per page visit (not per rerun)"""
+    page = get_current_page_name()
+    if st.session_state.get('_last_tracked_page') == page:
+        return
+    st.session_state._last_tracked_page = page
+    
+    from lib.utils.monitoring import record_page_view
+    record_page_view(page, st.session_state.get('user_role'))
 
 def initialize_session_state():
     """Initialize session state variables"""
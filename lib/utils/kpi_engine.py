@@ -0,0 +1,644 @@
+"""
+KPI Snapshot Engine for Highland Tower Development
+
+Computes the headline project KPIs (progress, active RFIs, budget status,
+SPI/CPI and quality score) from the models and persists them as time-stamped
+snapshots. The Dashboard, Analytics and home pages read the latest snapshot
+from memory instead of scanning every module on each rerun.
+
+Snapshots are refreshed incrementally: a model write only marks the KPI
+components that depend on its table as dirty, and the next read recomputes
+just those components. A background scheduler also refreshes everything on
+a fixed interval so changes made by other pods are picked up.
+
+The history is kept to at most one row per hour and pod: an unchanged
+snapshot is not written, a snapshot taken in the same hour as the last one
+replaces it, and rows older than KPI_SNAPSHOT_KEEP_DAYS are deleted.
+"""
+
+import os
+import json
+import sqlite3
+import logging
+import threading
+from datetime import datetime, date, timedelta
+from typing import Dict, List, Any, Optional, Callable
+
+logger = logging.getLogger(__name__)
+
+# Constants
+KPI_SNAPSHOT_DB = os.environ.get("KPI_SNAPSHOT_DB", "data/gcpanel.db")
+KPI_REFRESH_INTERVAL = int(os.environ.get("KPI_REFRESH_INTERVAL", "900"))
+KPI_DELTA_WINDOW_HOURS = int(os.environ.get("KPI_DELTA_WINDOW_HOURS", "24"))
+KPI_SNAPSHOT_KEEP_DAYS = int(os.environ.get("KPI_SNAPSHOT_KEEP_DAYS", "90"))
+
+# KPI components and the model tables each one is computed from
+COMPONENT_TABLES = {
+    "progress": ("schedule_tasks",),
+    "rfis": ("rfis",),
+    "budget": ("cost_items",),
+    "earned_value": ("schedule_tasks", "cost_items"),
+    "quality": ("quality_control", "inspections"),
+}
+
+# Statuses that close out an RFI
+CLOSED_RFI_STATUSES = {"Responded", "Closed"}
+
+# Inspection results and the credit they contribute to the quality score
+QUALITY_RESULT_CREDIT = {
+    "pass": 1.0,
+    "conditional": 0.5,
+    "conditional pass": 0.5,
+    "fail": 0.0,
+    "retest required": 0.0,
+}
+
+
+def _load_models(tables):
+    """Load the records of the given tables (database or Highland Tower data, never session data)."""
+    from lib.models.rfi_model import RFIModel
+    from lib.models.cost_model import CostModel
+    from lib.models.all_models import ScheduleModel, QualityControlModel, InspectionModel
+
+    factories = {
+        "rfis": RFIModel,
+        "cost_items": CostModel,
+        "schedule_tasks": ScheduleModel,
+        "quality_control": QualityControlModel,
+        "inspections": InspectionModel,
+    }
+    return {table: factories[table]().get_all_shared() for table in tables if table in factories}
+
+
+def _to_float(value, default=0.0):
+    """Convert a model field to float, tolerating blanks and strings."""
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def _to_date(value):
+    """Parse a model date field (ISO string or date)."""
+    if isinstance(value, datetime):
+        return value.date()
+    if isinstance(value, date):
+        return value
+    try:
+        return datetime.strptime(str(value)[:10], "%Y-%m-%d").date()
+    except (TypeError, ValueError):
+        return None
+
+
+def _planned_fraction(task, today):
+    """Fraction of a task that should be complete today per its planned dates."""
+    start = _to_date(task.get("start_date"))
+    end = _to_date(task.get("end_date"))
+    if not start or not end:
+        return None
+    if today < start:
+        return 0.0
+    if today >= end:
+        return 1.0
+    span = (end - start).days or 1
+    return (today - start).days / span
+
+
+def compute_progress(records: Dict[str, List[Dict]], today: date = None) -> Dict[str, Any]:
+    """
+    Compute duration-weighted project progress from schedule tasks.
+
+    Args:
+        records: Model records keyed by table name
+        today: Evaluation date (defaults to today)
+
+    Returns:
+        dict: project_progress, planned_progress and progress_by_trade
+    """
+    today = today or date.today()
+    tasks = records.get("schedule_tasks", [])
+    if not tasks:
+        return {}
+
+    earned = planned = weight_total = 0.0
+    by_trade = {}
+    for task in tasks:
+        weight = max(_to_float(task.get("duration"), 1.0), 1.0)
+        percent = min(max(_to_float(task.get("percent_complete")), 0.0), 100.0)
+        planned_fraction = _planned_fraction(task, today)
+
+        earned += weight * percent
+        weight_total += weight
+        if planned_fraction is not None:
+            planned += weight * planned_fraction * 100
+
+        trade = task.get("trade") or "General"
+        trade_earned, trade_weight = by_trade.get(trade, (0.0, 0.0))
+        by_trade[trade] = (trade_earned + weight * percent, trade_weight + weight)
+
+    return {
+        "project_progress": round(earned / weight_total, 1),
+        "planned_progress": round(planned / weight_total, 1),
+        "progress_by_trade": {
+            trade: round(trade_earned / trade_weight, 1)
+            for trade, (trade_earned, trade_weight) in by_trade.items()
+        },
+    }
+
+
+def compute_rfis(records: Dict[str, List[Dict]], today: date = None) -> Dict[str, Any]:
+    """
+    Count open and overdue RFIs.
+
+    Args:
+        records: Model records keyed by table name
+        today: Evaluation date (defaults to today)
+
+    Returns:
+        dict: active_rfis, overdue_rfis and total_rfis
+    """
+    today = today or date.today()
+    rfis = records.get("rfis", [])
+    if not rfis:
+        return {}
+
+    active = [rfi for rfi in rfis if rfi.get("status") not in CLOSED_RFI_STATUSES]
+    overdue = [
+        rfi for rfi in active
+        if _to_date(rfi.get("due_date")) and _to_date(rfi.get("due_date")) < today
+    ]
+    return {
+        "active_rfis": len(active),
+        "overdue_rfis": len(overdue),
+        "total_rfis": len(rfis),
+    }
+
+
+def compute_budget(records: Dict[str, List[Dict]], today: date = None) -> Dict[str, Any]:
+    """
+    Roll up budgeted, committed and actual cost.
+
+    Args:
+        records: Model records keyed by table name
+        today: Unused, accepted for a uniform component signature
+
+    Returns:
+        dict: Budget totals and spend by category
+    """
+    items = records.get("cost_items", [])
+    if not items:
+        return {}
+
+    budget_total = actual = committed = 0.0
+    by_category = {}
+    for item in items:
+        item_budget = _to_float(item.get("budgeted", item.get("budget")))
+        item_actual = _to_float(item.get("actual"))
+        budget_total += item_budget
+        actual += item_actual
+        committed += _to_float(item.get("committed"))
+
+        category = item.get("category") or "Other"
+        spent, budgeted = by_category.get(category, (0.0, 0.0))
+        by_category[category] = (spent + item_actual, budgeted + item_budget)
+
+    return {
+        "budget_total": budget_total,
+        "actual_cost": actual,
+        "committed_cost": committed,
+        "budget_remaining": budget_total - actual,
+        "budget_by_category": {
+            category: {"spent": spent, "budget": budgeted}
+            for category, (spent, budgeted) in by_category.items()
+        },
+    }
+
+
+def compute_earned_value(records: Dict[str, List[Dict]], today: date = None) -> Dict[str, Any]:
+    """
+    Compute schedule and cost performance indices.
+
+    SPI compares duration-weighted earned progress to planned progress from the
+    schedule. CPI compares the earned value of cost items (completed items earn
+    their full budget, open items earn in proportion to committed spend) to the
+    actual cost.
+
+    Args:
+        records: Model records keyed by table name
+        today: Evaluation date (defaults to today)
+
+    Returns:
+        dict: spi and cpi (omitted when there is no basis for them)
+    """
+    result = {}
+
+    progress = compute_progress(records, today)
+    if progress.get("planned_progress"):
+        result["spi"] = round(progress["project_progress"] / progress["planned_progress"], 2)
+
+    earned_value = actual_cost = 0.0
+    for item in records.get("cost_items", []):
+        item_budget = _to_float(item.get("budgeted", item.get("budget")))
+        item_actual = _to_float(item.get("actual"))
+        item_committed = _to_float(item.get("committed"))
+        if item.get("status") == "Completed":
+            completion = 1.0
+        elif item_committed:
+            completion = min(item_actual / item_committed, 1.0)
+        else:
+            completion = 0.0
+        earned_value += item_budget * completion
+        actual_cost += item_actual
+
+    if actual_cost:
+        result["cpi"] = round(earned_value / actual_cost, 2)
+
+    return result
+
+
+def compute_quality(records: Dict[str, List[Dict]], today: date = None) -> Dict[str, Any]:
+    """
+    Score quality as the pass rate across QC and code inspections.
+
+    Args:
+        records: Model records keyed by table name
+        today: Unused, accepted for a uniform component signature
+
+    Returns:
+        dict: quality_score (percent) and inspections_scored
+    """
+    scored = 0
+    credit = 0.0
+    for table in ("quality_control", "inspections"):
+        for record in records.get(table, []):
+            result = str(record.get("result", "")).strip().lower()
+            if result in QUALITY_RESULT_CREDIT:
+                scored += 1
+                credit += QUALITY_RESULT_CREDIT[result]
+
+    if not scored:
+        return {}
+    return {
+        "quality_score": round(credit / scored * 100, 1),
+        "inspections_scored": scored,
+    }
+
+
+COMPONENT_FUNCTIONS: Dict[str, Callable[[Dict[str, List[Dict]], date], Dict[str, Any]]] = {
+    "progress": compute_progress,
+    "rfis": compute_rfis,
+    "budget": compute_budget,
+    "earned_value": compute_earned_value,
+    "quality": compute_quality,
+}
+
+
+class KPISnapshotEngine:
+    """Maintains the latest KPI snapshot in memory and persists its history."""
+
+    def __init__(self, db_path: str = KPI_SNAPSHOT_DB,
+                 record_loader: Callable[[set], Dict[str, List[Dict]]] = None):
+        self.db_path = db_path
+        self._record_loader = record_loader or _load_models
+        self._lock = threading.RLock()
+        self._computing = threading.local()
+        self._components: Dict[str, Dict[str, Any]] = {}
+        self._dirty = set(COMPONENT_TABLES)
+        self._latest: Optional[Dict[str, Any]] = None
+        self._baseline: Optional[Dict[str, Any]] = None
+        # Row id, taken_at and components of the last snapshot this engine persisted
+        self._persisted: Optional[Dict[str, Any]] = None
+        self._scheduler: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._init_store()
+        self._load_latest_from_store()
+
+    def _connect(self):
+        """Open a connection to the snapshot store."""
+        directory = os.path.dirname(self.db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def _init_store(self):
+        """Create the snapshot table if it doesn't exist."""
+        try:
+            with self._connect() as conn:
+                conn.execute("""
+                    CREATE TABLE IF NOT EXISTS kpi_snapshots (
+                        id INTEGER PRIMARY KEY AUTOINCREMENT,
+                        taken_at TEXT NOT NULL,
+                        payload TEXT NOT NULL
+                    )
+                """)
+                conn.execute(
+                    "CREATE INDEX IF NOT EXISTS idx_kpi_snapshots_taken_at ON kpi_snapshots (taken_at)"
+                )
+        except Exception as e:
+            logger.error(f"Error initializing KPI snapshot store: {str(e)}")
+
+    def _load_latest_from_store(self):
+        """Seed the in-memory snapshot from the most recent persisted one."""
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT id, payload FROM kpi_snapshots ORDER BY taken_at DESC LIMIT 1"
+                ).fetchone()
+        except Exception as e:
+            logger.error(f"Error loading KPI snapshot: {str(e)}")
+            return
+
+        if not row:
+            return
+
+        snapshot = json.loads(row[1])
+        self._persisted = {
+            "id": row[0],
+            "taken_at": snapshot["taken_at"],
+            "components": json.dumps(snapshot.get("components", {}), sort_keys=True, default=str),
+        }
+        self._latest = snapshot
+        self._components = snapshot.get("components", {})
+        self._baseline = self._load_baseline(snapshot["taken_at"])
+
+        # A recent snapshot is served as-is until the scheduler refreshes it
+        age = datetime.now() - datetime.fromisoformat(snapshot["taken_at"])
+        if age.total_seconds() < KPI_REFRESH_INTERVAL:
+            self._dirty = set(COMPONENT_TABLES) - set(self._components)
+
+    def _load_baseline(self, taken_at: str) -> Optional[Dict[str, Any]]:
+        """Get the snapshot the deltas are measured against."""
+        cutoff = (datetime.fromisoformat(taken_at) - timedelta(hours=KPI_DELTA_WINDOW_HOURS)).isoformat()
+        try:
+            with self._connect() as conn:
+                row = conn.execute(
+                    "SELECT payload FROM kpi_snapshots WHERE taken_at <= ? ORDER BY taken_at DESC LIMIT 1",
+                    (cutoff,)
+                ).fetchone()
+                if not row:
+                    row = conn.execute(
+                        "SELECT payload FROM kpi_snapshots ORDER BY taken_at ASC LIMIT 1"
+                    ).fetchone()
+        except Exception as e:
+            logger.error(f"Error loading KPI baseline: {str(e)}")
+            return None
+        return json.loads(row[0]) if row else None
+
+    def _persist(self, snapshot: Dict[str, Any]):
+        """
+        Write a snapshot to the store.
+
+        Nothing is written when the values are the same as the last persisted
+        snapshot's. A snapshot taken in the same hour as the last one replaces
+        it; otherwise a row is added and rows older than KPI_SNAPSHOT_KEEP_DAYS
+        are deleted.
+        """
+        components = json.dumps(snapshot["components"], sort_keys=True, default=str)
+        last = self._persisted
+        if last is not None and last["components"] == components:
+            return
+
+        taken_at = snapshot["taken_at"]
+        payload = json.dumps(snapshot, default=str)
+        try:
+            with self._connect() as conn:
+                # ISO timestamps share their first 13 characters (YYYY-MM-DDTHH) within an hour
+                if last is not None and last["taken_at"][:13] == taken_at[:13]:
+                    conn.execute(
+                        "UPDATE kpi_snapshots SET taken_at = ?, payload = ? WHERE id = ?",
+                        (taken_at, payload, last["id"])
+                    )
+                    row_id = last["id"]
+                else:
+                    row_id = conn.execute(
+                        "INSERT INTO kpi_snapshots (taken_at, payload) VALUES (?, ?)",
+                        (taken_at, payload)
+                    ).lastrowid
+                    cutoff = (datetime.fromisoformat(taken_at) - timedelta(days=KPI_SNAPSHOT_KEEP_DAYS)).isoformat()
+                    conn.execute("DELETE FROM kpi_snapshots WHERE taken_at < ?", (cutoff,))
+        except Exception as e:
+            logger.error(f"Error persisting KPI snapshot: {str(e)}")
+            return
+
+        self._persisted = {"id": row_id, "taken_at": taken_at, "components": components}
+
+    def on_model_write(self, table_name: str, action: str = None, record_id: Any = None, data: Dict = None,
+                       persisted: bool = True):
+        """Write listener: mark the components that depend on a table as dirty."""
+        if not persisted or getattr(self._computing, "active", False):
+            # Writes made while loading models (demo data seeding) are not real changes,
+            # and session-fallback writes are not part of the shared snapshot
+            return
+        affected = {name for name, tables in COMPONENT_TABLES.items() if table_name in tables}
+        if affected:
+            with self._lock:
+                self._dirty |= affected
+
+    def mark_all_dirty(self):
+        """Force every component to be recomputed on the next read."""
+        with self._lock:
+            self._dirty = set(COMPONENT_TABLES)
+
+    def refresh(self, components=None) -> Dict[str, Any]:
+        """
+        Recompute KPI components and persist a new snapshot.
+
+        Args:
+            components: Component names to recompute (defaults to the dirty set)
+
+        Returns:
+            dict: The new snapshot
+        """
+        with self._lock:
+            components = set(components) if components is not None else set(self._dirty)
+            if not components and self._latest:
+                return self._latest
+
+            tables = set()
+            for name in components:
+                tables.update(COMPONENT_TABLES[name])
+
+            self._computing.active = True
+            try:
+                records = self._record_loader(tables)
+            except Exception as e:
+                logger.error(f"Error loading records for KPI snapshot: {str(e)}")
+                records = {}
+            finally:
+                self._computing.active = False
+
+            today = date.today()
+            for name in components:
+                try:
+                    values = COMPONENT_FUNCTIONS[name](records, today)
+                except Exception as e:
+                    logger.error(f"Error computing KPI component {name}: {str(e)}")
+                    values = {}
+                # Keep the last known values when a source has no data (e.g. demo mode)
+                if values or name not in self._components:
+                    self._components[name] = values
+
+            self._dirty -= components
+
+            snapshot = {"taken_at": datetime.now().isoformat(), "components": dict(self._components)}
+            for values in self._components.values():
+                snapshot.update(values)
+
+            self._persist(snapshot)
+            self._latest = snapshot
+            self._baseline = self._load_baseline(snapshot["taken_at"])
+            return snapshot
+
+    def get_snapshot(self) -> Dict[str, Any]:
+        """
+        Get the latest KPI snapshot.
+
+        Returns the in-memory snapshot directly unless a model write has made
+        part of it dirty, in which case only the affected components are
+        recomputed.
+
+        Returns:
+            dict: Latest KPI values plus taken_at timestamp
+        """
+        if self._latest is not None and not self._dirty:
+            return self._latest
+        return self.refresh()
+
+    def get_deltas(self) -> Dict[str, float]:
+        """
+        Get the change of each numeric KPI against the baseline snapshot.
+
+        Returns:
+            dict: KPI name to delta (empty when there is no baseline)
+        """
+        latest = self.get_snapshot()
+        baseline = self._baseline
+        if not baseline or baseline.get("taken_at") == latest.get("taken_at"):
+            return {}
+
+        deltas = {}
+        for key, value in latest.items():
+            previous = baseline.get(key)
+            if isinstance(value, (int, float)) and isinstance(previous, (int, float)):
+                deltas[key] = value - previous
+        return deltas
+
+    def get_history(self, days: int = 30, limit: int = 500) -> List[Dict[str, Any]]:
+        """
+        Get persisted snapshots for trend charts.
+
+        Args:
+            days: How far back to look
+            limit: Maximum number of snapshots to return
+
+        Returns:
+            list: Snapshots ordered oldest first
+        """
+        since = (datetime.now() - timedelta(days=days)).isoformat()
+        try:
+            with self._connect() as conn:
+                rows = conn.execute(
+                    "SELECT payload FROM kpi_snapshots WHERE taken_at >= ? ORDER BY taken_at DESC LIMIT ?",
+                    (since, limit)
+                ).fetchall()
+        except Exception as e:
+            logger.error(f"Error loading KPI history: {str(e)}")
+            return []
+        return [json.loads(row[0]) for row in reversed(rows)]
+
+    def start_scheduler(self, interval_seconds: int = KPI_REFRESH_INTERVAL):
+        """Start a background thread that fully refreshes the snapshot periodically."""
+        with self._lock:
+            if self._scheduler and self._scheduler.is_alive():
+                return
+            self._stop_event.clear()
+            self._scheduler = threading.Thread(
+                target=self._run_scheduler, args=(interval_seconds,), daemon=True
+            )
+            self._scheduler.start()
+
+    def stop_scheduler(self):
+        """Stop the background refresh thread."""
+        self._stop_event.set()
+
+    def _run_scheduler(self, interval_seconds: int):
+        """Background loop for scheduled refreshes."""
+        while not self._stop_event.wait(interval_seconds):
+            try:
+                self.refresh(components=COMPONENT_TABLES.keys())
+            except Exception as e:
+                logger.error(f"Scheduled KPI refresh failed: {str(e)}")
+
+
+_engine: Optional[KPISnapshotEngine] = None
+_engine_lock = threading.Lock()
+
+
+def get_kpi_engine() -> KPISnapshotEngine:
+    """
+    Get the process-wide KPI snapshot engine.
+
+    The engine is created on first use, subscribes to model writes and starts
+    its refresh scheduler.
+
+    Returns:
+        KPISnapshotEngine: Shared engine instance
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                from lib.models.base_model import register_write_listener
+
+                engine = KPISnapshotEngine()
+                register_write_listener(engine.on_model_write)
+                engine.start_scheduler()
+                _engine = engine
+    return _engine
+
+
+def get_dashboard_metrics() -> Dict[str, Any]:
+    """
+    Get formatted headline metrics for the Dashboard and home page.
+
+    Returns:
+        dict: Metric label to (value, delta) tuples
+    """
+    engine = get_kpi_engine()
+    snapshot = engine.get_snapshot()
+    deltas = engine.get_deltas()
+
+    metrics = {}
+
+    if "project_progress" in snapshot:
+        delta = deltas.get("project_progress")
+        metrics["Project Progress"] = (
+            f"{snapshot['project_progress']:.1f}%",
+            f"{delta:+.1f}%" if delta is not None else None
+        )
+
+    if "active_rfis" in snapshot:
+        delta = deltas.get("active_rfis")
+        metrics["Active RFIs"] = (
+            str(snapshot["active_rfis"]),
+            f"{delta:+.0f}" if delta is not None else None
+        )
+
+    if "actual_cost" in snapshot:
+        remaining = snapshot.get("budget_remaining", 0)
+        metrics["Budget Status"] = (
+            f"${snapshot['actual_cost'] / 1_000_000:.1f}M",
+            "Under" if remaining >= 0 else "Over"
+        )
+
+    if "spi" in snapshot:
+        spi = snapshot["spi"]
+        if spi >= 1.02:
+            status = "Ahead"
+        elif spi >= 0.95:
+            status = "On Track"
+        else:
+            status = "Behind"
+        metrics["Schedule"] = (status, f"SPI {spi:.2f}")
+
+    return metrics
@@ -0,0 +1,400 @@
+"""
+Metrics core for gcPanel.
+
+This module provides in-process metrics with constant memory:
+- Counters and gauges
+- Log-linear (HDR-style) histograms: every value lands in a bucket within
+  HISTOGRAM_PRECISION of it, so percentiles are accurate to that relative
+  error however many values are recorded
+- Rolling time windows on histograms, for "last minute" percentiles next
+  to the lifetime totals
+- A registry of metric families with label sets, which lib.utils.monitoring
+  and the exporters read from
+
+Recording takes a short per-metric lock and no allocation beyond the first
+value of a bucket, so metrics can be recorded inline from request paths.
+"""
+
+import math
+import os
+import time
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Constants
+# Sub-buckets per power of two: 64 gives under 1.6% relative error per value
+HISTOGRAM_SUB_BUCKETS = int(os.environ.get("HISTOGRAM_SUB_BUCKETS", "64"))
+HISTOGRAM_PRECISION = 1.0 / HISTOGRAM_SUB_BUCKETS
+METRICS_WINDOW_SECONDS = int(os.environ.get("METRICS_WINDOW_SECONDS", "60"))
+METRICS_WINDOW_SLOTS = 6
+
+DEFAULT_QUANTILES = (0.5, 0.95, 0.99)
+
+LabelKey = Tuple[Tuple[str, str], ...]
+
+# Bucket shared by zero and negative values
+_ZERO_BUCKET = -(1 << 30)
+
+
+def _label_key(labels: Optional[Dict[str, Any]]) -> LabelKey:
+    return tuple(sorted((str(name), str(value)) for name, value in (labels or {}).items()))
+
+
+class Counter:
+    """Monotonically increasing value."""
+
+    kind = "counter"
+
+    def __init__(self):
+        self._value = 0.0
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self) -> float:
+        return self._value
+
+    def reset(self):
+        with self._lock:
+            self._value = 0.0
+
+
+class Gauge:
+    """Value that goes up and down, or is read from a callback when collected."""
+
+    kind = "gauge"
+
+    def __init__(self):
+        self._value = 0.0
+        self._callback: Optional[Callable[[], float]] = None
+        self._lock = threading.Lock()
+
+    def set(self, value: float):
+        with self._lock:
+            self._value = float(value)
+
+    def inc(self, amount: float = 1.0):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set_function(self, callback: Callable[[], float]):
+        """Read the gauge from a callback (e.g. a queue length) instead of storing it."""
+        self._callback = callback
+
+    @property
+    def value(self) -> float:
+        if self._callback is not None:
+            try:
+                return float(self._callback())
+            except Exception:
+                return math.nan
+        return self._value
+
+    def reset(self):
+        with self._lock:
+            self._value = 0.0
+
+
+def bucket_index(value: float) -> int:
+    """
+    Log-linear bucket of a value.
+
+    Each power of two is split into HISTOGRAM_SUB_BUCKETS equal-width
+    buckets, so a bucket's width is at most HISTOGRAM_PRECISION of its
+    values. Zero and negative values share one bucket below all others.
+    """
+    if value <= 0:
+        return _ZERO_BUCKET
+    mantissa, exponent = math.frexp(value)  # value = mantissa * 2**exponent, 0.5 <= mantissa < 1
+    return exponent * HISTOGRAM_SUB_BUCKETS + int((mantissa * 2 - 1) * HISTOGRAM_SUB_BUCKETS)
+
+
+def bucket_bounds(index: int) -> Tuple[float, float]:
+    """Lower and upper bound of a bucket."""
+    if index == _ZERO_BUCKET:
+        return 0.0, 0.0
+    exponent, sub = divmod(index, HISTOGRAM_SUB_BUCKETS)
+    base = math.ldexp(0.5, exponent)
+    width = base / HISTOGRAM_SUB_BUCKETS
+    return base + sub * width, base + (sub + 1) * width
+
+
+class _HistogramData:
+    """Bucket counts, count, sum and extremes of a set of values."""
+
+    __slots__ = ("buckets", "count", "sum", "min", "max")
+
+    def __init__(self):
+        self.buckets: Dict[int, int] = {}
+        self.count = 0
+        self.sum = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, index: int, value: float):
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.sum += value
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: "_HistogramData"):
+        for index, count in other.buckets.items():
+            self.buckets[index] = self.buckets.get(index, 0) + count
+        self.count += other.count
+        self.sum += other.sum
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        """Value at quantile q (bucket midpoint, clamped to the observed range)."""
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(q * self.count))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                low, high = bucket_bounds(index)
+                return min(max((low + high) / 2, self.min), self.max)
+        return self.max
+
+
+class Histogram:
+    """
+    Distribution of values with lifetime totals and a rolling window.
+
+    The window is a ring of METRICS_WINDOW_SLOTS slots covering
+    window_seconds; a slot is cleared when the ring comes back round to it,
+    so window percentiles cover the last window_seconds give or take one slot.
+    """
+
+    kind = "histogram"
+
+    def __init__(self, window_seconds: int = METRICS_WINDOW_SECONDS, slots: int = METRICS_WINDOW_SLOTS):
+        self.window_seconds = window_seconds
+        self._slot_seconds = window_seconds / slots
+        self._total = _HistogramData()
+        self._slots = [_HistogramData() for _ in range(slots)]
+        self._slot_epochs = [-1] * slots
+        self._lock = threading.Lock()
+
+    def observe(self, value: float):
+        """Record a value."""
+        index = bucket_index(value)
+        epoch = int(time.time() / self._slot_seconds)
+        position = epoch % len(self._slots)
+
+        with self._lock:
+            self._total.add(index, value)
+            if self._slot_epochs[position] != epoch:
+                self._slots[position] = _HistogramData()
+                self._slot_epochs[position] = epoch
+            self._slots[position].add(index, value)
+
+    def time(self):
+        """Context manager recording the elapsed milliseconds of its block."""
+        return _Timer(self)
+
+    def _window(self) -> _HistogramData:
+        oldest = int(time.time() / self._slot_seconds) - len(self._slots) + 1
+        window = _HistogramData()
+        with self._lock:
+            for data, epoch in zip(self._slots, self._slot_epochs):
+                if epoch >= oldest:
+                    window.merge(data)
+        return window
+
+    def _lifetime(self) -> _HistogramData:
+        data = _HistogramData()
+        with self._lock:
+            data.merge(self._total)
+        return data
+
+    def quantiles(self, quantiles: Iterable[float] = DEFAULT_QUANTILES, window: bool = True) -> Dict[float, float]:
+        """
+        Values at the given quantiles.
+
+        Args:
+            quantiles: Quantiles between 0 and 1
+            window: Over the rolling window (True) or all values recorded (False)
+
+        Returns:
+            dict: Quantile to value
+        """
+        data = self._window() if window else self._lifetime()
+        return {q: data.quantile(q) for q in quantiles}
+
+    def summary(self, window: bool = True) -> Dict[str, float]:
+        """Count, sum, mean, min, max, p50, p95 and p99."""
+        data = self._window() if window else self._lifetime()
+        summary = {
+            "count": data.count,
+            "sum": data.sum,
+            "mean": data.sum / data.count if data.count else 0.0,
+            "min": data.min if data.count else 0.0,
+            "max": data.max if data.count else 0.0,
+        }
+        for q in DEFAULT_QUANTILES:
+            summary[f"p{int(q * 100)}"] = data.quantile(q)
+        return summary
+
+    def cumulative_buckets(self, bounds: Iterable[float]) -> Tuple[List[Tuple[float, int]], int, float]:
+        """
+        Lifetime counts of values at or below each bound (for exposition formats).
+
+        Args:
+            bounds: Ascending upper bounds
+
+        Returns:
+            tuple: ([(bound, cumulative count)], total count, total sum)
+        """
+        data = self._lifetime()
+        ordered = sorted(data.buckets.items())
+        result = []
+        seen = 0
+        position = 0
+        for bound in bounds:
+            # A log bucket counts below a bound when its midpoint is
+            while position < len(ordered) and sum(bucket_bounds(ordered[position][0])) / 2 <= bound:
+                seen += ordered[position][1]
+                position += 1
+            result.append((bound, seen))
+        return result, data.count, data.sum
+
+    @property
+    def count(self) -> int:
+        return self._total.count
+
+    def reset(self):
+        with self._lock:
+            self._total = _HistogramData()
+            self._slots = [_HistogramData() for _ in self._slots]
+            self._slot_epochs = [-1] * len(self._slots)
+
+
+class _Timer:
+    def __init__(self, histogram: Histogram):
+        self._histogram = histogram
+
+    def __enter__(self):
+        self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self._histogram.observe((time.perf_counter() - self._start) * 1000)
+        return False
+
+
+_KINDS = {"counter": Counter, "gauge": Gauge, "histogram": Histogram}
+
+
+class MetricsRegistry:
+    """Metric families by name, each holding one metric per label set."""
+
+    def __init__(self):
+        self._families: Dict[str, Dict[str, Any]] = {}
+        self._lock = threading.Lock()
+
+    def _get(self, kind: str, name: str, description: str, labels: Optional[Dict[str, Any]]):
+        key = _label_key(labels)
+        family = self._families.get(name)
+        if family is not None:
+            if family["kind"] != kind:
+                raise ValueError(f"Metric {name} is a {family['kind']}, not a {kind}")
+            metric = family["metrics"].get(key)
+            if metric is not None:
+                return metric
+
+        with self._lock:
+            family = self._families.setdefault(
+                name, {"kind": kind, "description": description, "metrics": {}}
+            )
+            if family["kind"] != kind:
+                raise ValueError(f"Metric {name} is a {family['kind']}, not a {kind}")
+            metric = family["metrics"].get(key)
+            if metric is None:
+                metric = family["metrics"][key] = _KINDS[kind]()
+            return metric
+
+    def counter(self, name: str, description: str = "", labels: Optional[Dict[str, Any]] = None) -> Counter:
+        """Get or create a counter."""
+        return self._get("counter", name, description, labels)
+
+    def gauge(self, name: str, description: str = "", labels: Optional[Dict[str, Any]] = None) -> Gauge:
+        """Get or create a gauge."""
+        return self._get("gauge", name, description, labels)
+
+    def histogram(self, name: str, description: str = "", labels: Optional[Dict[str, Any]] = None) -> Histogram:
+        """Get or create a histogram (values are usually milliseconds)."""
+        return self._get("histogram", name, description, labels)
+
+    def family(self, name: str) -> Dict[LabelKey, Any]:
+        """
+        Metrics of one family.
+
+        Returns:
+            dict: Label key ((name, value), ...) to metric
+        """
+        with self._lock:
+            family = self._families.get(name)
+            return dict(family["metrics"]) if family else {}
+
+    def collect(self) -> List[Dict[str, Any]]:
+        """
+        Snapshot of every family, for exporters.
+
+        Returns:
+            list: Dicts with name, kind, description and metrics
+                ([(labels dict, metric)])
+        """
+        with self._lock:
+            families = [(name, dict(family), dict(family["metrics"])) for name, family in self._families.items()]
+        return [
+            {
+                "name": name,
+                "kind": family["kind"],
+                "description": family["description"],
+                "metrics": [(dict(key), metric) for key, metric in metrics.items()],
+            }
+            for name, family, metrics in families
+        ]
+
+    def reset(self, names: Optional[Iterable[str]] = None):
+        """Reset the values of the given families (default: all), keeping the metrics registered."""
+        with self._lock:
+            families = [self._families[name] for name in (names or self._families) if name in self._families]
+        for family in families:
+            for metric in list(family["metrics"].values()):
+                metric.reset()
+
+
+_registry = MetricsRegistry()
+
+
+def get_registry() -> MetricsRegistry:
+    """Get the process-wide metrics registry."""
+    return _registry
+
+
+def counter(name: str, description: str = "", labels: Optional[Dict[str, Any]] = None) -> Counter:
+    """Get or create a counter in the process-wide registry."""
+    return _registry.counter(name, description, labels)
+
+
+def gauge(name: str, description: str = "", labels: Optional[Dict[str, Any]] = None) -> Gauge:
+    """Get or create a gauge in the process-wide registry."""
+    return _registry.gauge(name, description, labels)
+
+
+def histogram(name: str, description: str = "", labels: Optional[Dict[str, Any]] = None) -> Histogram:
+    """Get or create a histogram in the process-wide registry."""
+    return _registry.histogram(name, description, labels)
@@ -0,0 +1,314 @@
+"""
+Metrics Exporter for gcPanel.
+
+This module serves the process metrics to Prometheus-compatible scrapers
+from a small HTTP server on METRICS_PORT, next to the Streamlit server:
+- GET /metrics: the lib.utils.metrics registry, shared cache statistics,
+  database connection statistics and job queue depths, in OpenMetrics text
+  format (or the Prometheus 0.0.4 text format for scrapers that do not
+  ask for OpenMetrics)
+- GET /healthz: liveness of the exporter itself
+
+Scrapes only read in-memory statistics: no page script runs and no
+database query is made. Other subsystems can add families with
+register_collector().
+"""
+
+import os
+import math
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from lib.utils.metrics import METRICS_WINDOW_SECONDS, get_registry
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Constants
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "9108"))
+METRICS_EXPORTER_ENABLED = os.environ.get("METRICS_EXPORTER_ENABLED", "true").lower() == "true"
+# Bucket bounds (milliseconds) for exposing histograms
+HISTOGRAM_BOUNDS = (1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+TEXT_CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# A family is {"name", "kind", "description", "samples": [(suffix, labels, value)]}
+Family = Dict[str, Any]
+
+_collectors: Dict[str, Callable[[], Iterable[Family]]] = {}
+_server: Optional[ThreadingHTTPServer] = None
+# Set once a start was attempted, so a taken port is reported once, not on every page run
+_server_started = False
+_server_lock = threading.Lock()
+
+
+def register_collector(name: str, collect: Callable[[], Iterable[Family]]):
+    """
+    Register a function contributing metric families to every scrape.
+
+    Args:
+        name: Collector name (re-registering replaces it)
+        collect: Function returning families: dicts with "name", "kind"
+            (counter, gauge, histogram or summary), "description" and
+            "samples" as (name suffix, labels dict, value) tuples
+    """
+    _collectors[name] = collect
+
+
+def _family(name: str, kind: str, description: str, samples: List[Tuple[str, Dict[str, Any], float]]) -> Family:
+    return {"name": name, "kind": kind, "description": description, "samples": samples}
+
+
+def _registry_families() -> List[Family]:
+    """Families of the lib.utils.metrics registry."""
+    families = []
+    for family in get_registry().collect():
+        name, kind, description = family["name"], family["kind"], family["description"]
+
+        if kind == "counter":
+            families.append(_family(name, kind, description, [
+                ("_total", labels, metric.value) for labels, metric in family["metrics"]
+            ]))
+        elif kind == "gauge":
+            families.append(_family(name, kind, description, [
+                ("", labels, metric.value) for labels, metric in family["metrics"]
+            ]))
+        elif kind == "histogram":
+            samples = []
+            window_samples: Dict[str, list] = {"p50": [], "p95": [], "p99": []}
+            for labels, metric in family["metrics"]:
+                buckets, count, total = metric.cumulative_buckets(HISTOGRAM_BOUNDS)
+                for bound, cumulative in buckets:
+                    samples.append(("_bucket", {**labels, "le": repr(float(bound))}, cumulative))
+                samples.append(("_bucket", {**labels, "le": "+Inf"}, count))
+                samples.append(("_count", labels, count))
+                samples.append(("_sum", labels, total))
+
+                # Quantiles over the rolling window, as gauges: they go down as the
+                # window slides, so they cannot be summary samples (whose _count and
+                # _sum must only grow); the cumulative _count and _sum are above
+                summary = metric.summary(window=True)
+                for quantile, quantile_samples in window_samples.items():
+                    quantile_samples.append(("", labels, summary[quantile]))
+
+            families.append(_family(name, kind, description, samples))
+            for quantile, quantile_samples in window_samples.items():
+                families.append(_family(
+                    f"{name}_window_{quantile}", "gauge",
+                    f"{description}, {quantile} over the last {METRICS_WINDOW_SECONDS} seconds", quantile_samples,
+                ))
+    return families
+
+
+def _cache_families() -> List[Family]:
+    """Shared cache engine statistics (lib.utils.cache_engine)."""
+    from lib.utils.monitoring import get_cache_metrics
+
+    stats = get_cache_metrics()
+    if not stats:
+        return []
+
+    families = [
+        _family("gcpanel_cache_hits", "counter", "Cache hits", [("_total", {}, stats["hits"])]),
+        _family("gcpanel_cache_misses", "counter", "Cache misses", [("_total", {}, stats["misses"])]),
+        _family("gcpanel_cache_evictions", "counter", "Cache evictions by reason", [
+            ("_total", {"reason": reason}, count) for reason, count in stats["evictions_by_reason"].items()
+        ]),
+        _family("gcpanel_cache_entries", "gauge", "Cached entries", [("", {}, stats["entries"])]),
+        _family("gcpanel_cache_bytes", "gauge", "Estimated cache memory", [("", {}, stats["bytes"])]),
+        _family("gcpanel_cache_max_bytes", "gauge", "Cache memory budget", [("", {}, stats["max_bytes"])]),
+        _family("gcpanel_cache_saved_seconds", "counter", "Compute time saved by cache hits", [
+            ("_total", {}, stats["saved_seconds"])
+        ]),
+        _family("gcpanel_cache_backend_errors", "counter", "Shared cache backend errors", [
+            ("_total", {}, stats["backend_errors"])
+        ]),
+    ]
+
+    namespaces = stats.get("namespaces", {})
+    families.extend([
+        _family("gcpanel_cache_namespace_hits", "counter", "Cache hits per namespace", [
+            ("_total", {"namespace": namespace}, ns["hits"]) for namespace, ns in namespaces.items()
+        ]),
+        _family("gcpanel_cache_namespace_misses", "counter", "Cache misses per namespace", [
+            ("_total", {"namespace": namespace}, ns["misses"]) for namespace, ns in namespaces.items()
+        ]),
+        _family("gcpanel_cache_namespace_bytes", "gauge", "Cache memory per namespace", [
+            ("", {"namespace": namespace}, ns["bytes"]) for namespace, ns in namespaces.items()
+        ]),
+    ])
+
+    disk = stats.get("disk")
+    if disk:
+        families.append(_family("gcpanel_disk_cache_bytes", "gauge", "Disk cache size", [("", {}, disk["bytes"])]))
+        families.append(_family("gcpanel_disk_cache_hits", "counter", "Disk cache hits", [("_total", {}, disk["hits"])]))
+    return families
+
+
+def _database_families() -> List[Family]:
+    """Model database connection statistics (lib.models.base_model)."""
+    try:
+        from lib.models.base_model import get_connection_stats
+    except ImportError:
+        # Database driver not installed: nothing connects
+        return []
+
+    stats = get_connection_stats()
+    return [
+        _family("gcpanel_db_connections_open", "gauge", "Open model database connections", [
+            ("", {}, stats["open"])
+        ]),
+        _family("gcpanel_db_connections_opened", "counter", "Model database connections opened", [
+            ("_total", {}, stats["opened"])
+        ]),
+        _family("gcpanel_db_connection_failures", "counter", "Failed model database connection attempts", [
+            ("_total", {}, stats["failed"])
+        ]),
+    ]
+
+
+_BUILTIN_COLLECTORS = (_registry_families, _cache_families, _database_families)
+
+
+def collect_families() -> List[Family]:
+    """Families from the registry, the built-in collectors and registered collectors."""
+    families = []
+    for collect in list(_BUILTIN_COLLECTORS) + list(_collectors.values()):
+        try:
+            families.extend(collect())
+        except Exception as e:
+            logger.error(f"Error collecting metrics from {getattr(collect, '__name__', collect)}: {str(e)}")
+    return families
+
+
+def _format_value(value: Any) -> str:
+    value = float(value)
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+
+def _format_labels(labels: Dict[str, Any]) -> str:
+    if not labels:
+        return ""
+    pairs = []
+    for name, value in labels.items():
+        text = str(value).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        pairs.append(f'{name}="{text}"')
+    return "{" + ",".join(pairs) + "}"
+
+
+def render_metrics(openmetrics: bool = True) -> str:
+    """
+    Render every metric family as exposition text.
+
+    Args:
+        openmetrics: OpenMetrics 1.0 format (True) or Prometheus text 0.0.4 (False)
+
+    Returns:
+        str: Exposition text
+    """
+    lines = []
+    seen = set()
+    for family in collect_families():
+        name, kind = family["name"], family["kind"]
+        if name in seen or not family["samples"]:
+            continue
+        seen.add(name)
+
+        # The 0.0.4 format names counters by their sample name
+        type_name = name if openmetrics or kind != "counter" else f"{name}_total"
+        description = family["description"].replace("\\", "\\\\").replace("\n", "\\n")
+        lines.append(f"# TYPE {type_name} {kind}")
+        if description:
+            lines.append(f"# HELP {type_name} {description}")
+        for suffix, labels, value in family["samples"]:
+            lines.append(f"{name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+
+    if openmetrics:
+        lines.append("# EOF")
+    return "\n".join(lines) + "\n"
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    """Serves /metrics and /healthz."""
+
+    def do_GET(self):
+        path = self.path.split("?", 1)[0]
+        if path == "/metrics":
+            openmetrics = "application/openmetrics-text" in self.headers.get("Accept", "")
+            try:
+                body = render_metrics(openmetrics).encode("utf-8")
+            except Exception as e:
+                logger.error(f"Error rendering metrics: {str(e)}")
+                self.send_error(500)
+                return
+            self._respond(200, OPENMETRICS_CONTENT_TYPE if openmetrics else TEXT_CONTENT_TYPE, body)
+        elif path == "/healthz":
+            self._respond(200, "text/plain; charset=utf-8", b"ok\n")
+        else:
+            self.send_error(404)
+
+    def _respond(self, status: int, content_type: str, body: bytes):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"Metrics request: {format % args}")
+
+
+def start_metrics_server(port: int = METRICS_PORT, host: str = "0.0.0.0") -> Optional[ThreadingHTTPServer]:
+    """
+    Start the metrics HTTP server once per process.
+
+    Safe to call on every page run: only the first call tries to bind.
+
+    Args:
+        port: Port to listen on
+        host: Address to bind
+
+    Returns:
+        ThreadingHTTPServer: The running server, or None if disabled or the port is taken
+    """
+    global _server, _server_started
+
+    if _server_started or not METRICS_EXPORTER_ENABLED:
+        return _server
+
+    with _server_lock:
+        if _server_started:
+            return _server
+        _server_started = True
+        try:
+            server = ThreadingHTTPServer((host, port), _MetricsHandler)
+        except OSError as e:
+            logger.warning(f"Metrics server not started on port {port}: {str(e)}")
+            return None
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="metrics-exporter", daemon=True).start()
+        _server = server
+
+    logger.info(f"Metrics exporter listening on {host}:{port}")
+    return _server
+
+
+def stop_metrics_server():
+    """Stop the metrics server if it is running."""
+    global _server, _server_started
+
+    with _server_lock:
+        server, _server = _server, None
+        _server_started = False
+    if server is not None:
+        server.shutdown()
+        server.server_close()
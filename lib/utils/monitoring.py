@@ -12,33 +12,31 @@ import json
 import traceback
 from datetime import datetime
 from functools import wraps
-from threading import Thread, Lock
-from queue import Queue
+
+from lib.utils.metrics import get_registry
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
 # Global monitoring state
 _monitoring_enabled = os.environ.get("ENABLE_MONITORING", "false").lower() == "true"
-_metrics_queue = Queue(maxsize=1000)
-_metrics_lock = Lock()
-_metrics = {
-    "requests": 0,
-    "errors": 0,
-    "response_times": [],
-    "active_users": 0,
-    "page_views": {},
-    "start_time": datetime.utcnow().isoformat()
-}
+_start_time = datetime.utcnow().isoformat()
+
+# Metric families (lib.utils.metrics); counters are named without the _total suffix
+REQUESTS = "gcpanel_requests"
+REQUEST_DURATION = "gcpanel_request_duration_milliseconds"
+FUNCTION_DURATION = "gcpanel_function_duration_milliseconds"
+ERRORS = "gcpanel_errors"
+PAGE_VIEWS = "gcpanel_page_views"
+ACTIVE_USERS = "gcpanel_active_users"
+
+MONITORING_METRICS = (REQUESTS, REQUEST_DURATION, FUNCTION_DURATION, ERRORS, PAGE_VIEWS, ACTIVE_USERS)
 
 def enable_monitoring():
     """Enable application monitoring."""
     global _monitoring_enabled
     _monitoring_enabled = True
     logger.info("Application monitoring enabled")
-    
-    # Start metrics processing thread
-    Thread(target=_process_metrics_queue, daemon=True).start()
 
 def disable_monitoring():
     """Disable application monitoring."""
@@ -50,57 +48,23 @@ def is_monitoring_enabled():
     """Check if monitoring is enabled."""
     return _monitoring_enabled
 
-def _process_metrics_queue():
-    """Background thread to process metrics queue."""
-    while True:
-        try:
-            # Get metric from queue
-            metric = _metrics_queue.get(block=True, timeout=1.0)
-            
-            # Process metric
-            with _metrics_lock:
-                if metric["type"] == "request":
-                    _metrics["requests"] += 1
-                    _metrics["response_times"].append(metric["response_time"])
-                    # Keep only last 1000 response times
-                    if len(_metrics["response_times"]) > 1000:
-                        _metrics["response_times"] = _metrics["response_times"][-1000:]
-                
-                elif metric["type"] == "error":
-                    _metrics["errors"] += 1
-                
-                elif metric["type"] == "page_view":
-                    page = metric["page"]
-                    _metrics["page_views"][page] = _metrics["page_views"].get(page, 0) + 1
-                
-                elif metric["type"] == "user_activity":
-                    _metrics["active_users"] = metric["count"]
-            
-            # Mark as done
-            _metrics_queue.task_done()
-        except Exception as e:
-            # Just log and continue
-            logger.error(f"Error processing metrics: {str(e)}")
-
-def record_request(response_time):
+def record_request(response_time, endpoint=None):
     """
     Record a request and its response time.
     
     Args:
         response_time: Response time in milliseconds
+        endpoint: Optional name of what was timed (recorded per endpoint as well)
     """
     if not _monitoring_enabled:
         return
     
-    try:
-        _metrics_queue.put({
-            "type": "request",
-            "timestamp": datetime.utcnow().isoformat(),
-            "response_time": response_time
-        }, block=False)
-    except Exception:
-        # Ignore if queue is full
-        pass
+    registry = get_registry()
+    registry.counter(REQUESTS, "Requests handled").inc()
+    registry.histogram(REQUEST_DURATION, "Request response time").observe(response_time)
+    if endpoint:
+        registry.histogram(FUNCTION_DURATION, "Response time per function",
+                           labels={"function": endpoint}).observe(response_time)
 
 def record_error(error_type, message):
     """
@@ -113,36 +77,19 @@ def record_error(error_type, message):
     if not _monitoring_enabled:
         return
     
-    try:
-        _metrics_queue.put({
-            "type": "error",
-            "timestamp": datetime.utcnow().isoformat(),
-            "error_type": error_type,
-            "message": message
-        }, block=False)
-    except Exception:
-        # Ignore if queue is full
-        pass
+    get_registry().counter(ERRORS, "Application errors", labels={"error_type": error_type}).inc()
+    logger.debug(f"Recorded {error_type}: {message}")
 
-def record_page_view(page):
+def record_page_view(page, role=None):
     """
     Record a page view.
     
     Args:
         page: Page name or path
+        role: Role of the viewing user (used to learn per-role navigation)
     """
-    if not _monitoring_enabled:
-        return
-    
-    try:
-        _metrics_queue.put({
-            "type": "page_view",
-            "timestamp": datetime.utcnow().isoformat(),
-            "page": page
-        }, block=False)
-    except Exception:
-        # Ignore if queue is full
-        pass
+    # Recorded even with monitoring off: role prefetching learns from these counts
+    get_registry().counter(PAGE_VIEWS, "Page views", labels={"page": page, "role": role or ""}).inc()
 
 def update_active_users(count):
     """
@@ -154,35 +101,109 @@ def update_active_users(count):
     if not _monitoring_enabled:
         return
     
+    get_registry().gauge(ACTIVE_USERS, "Active users").set(count)
+
+def _page_view_counts():
+    """Page view counts as (page, role, views) tuples."""
+    counts = []
+    for labels, counter in get_registry().family(PAGE_VIEWS).items():
+        labels = dict(labels)
+        counts.append((labels["page"], labels["role"], int(counter.value)))
+    return counts
+
+def get_role_page_views(role):
+    """
+    Get page view counts for one user role.
+    
+    Args:
+        role: User role
+        
+    Returns:
+        dict: Page name to view count
+    """
+    views = {}
+    for page, page_role, count in _page_view_counts():
+        if page_role == role and count:
+            views[page] = views.get(page, 0) + count
+    return views
+
+def get_cache_metrics():
+    """
+    Get shared cache metrics.
+    
+    Returns:
+        dict: Cache engine totals and per-namespace counters, plus prefetch,
+            disk tier and shared backend statistics when available
+    """
+    try:
+        from lib.utils.cache_engine import get_cache_engine
+        stats = get_cache_engine().get_stats()
+    except Exception as e:
+        logger.error(f"Error collecting cache metrics: {str(e)}")
+        return {}
+    
     try:
-        _metrics_queue.put({
-            "type": "user_activity",
-            "timestamp": datetime.utcnow().isoformat(),
-            "count": count
-        }, block=False)
-    except Exception:
-        # Ignore if queue is full
-        pass
+        from lib.utils import disk_cache
+        # Only report the disk tier once something has used it
+        if disk_cache._disk_cache is not None:
+            stats["disk"] = disk_cache._disk_cache.get_stats()
+    except Exception as e:
+        logger.debug(f"Disk cache metrics unavailable: {e}")
+    
+    return stats
 
 def get_metrics():
     """
     Get current metrics.
     
+    Response time percentiles are over the rolling metrics window
+    (METRICS_WINDOW_SECONDS); counts and the average cover the whole run.
+    
     Returns:
         dict: Current metrics
     """
-    with _metrics_lock:
-        # Create a copy
-        metrics_copy = dict(_metrics)
-        
-        # Add calculated metrics
-        metrics_copy["avg_response_time"] = sum(metrics_copy["response_times"]) / len(metrics_copy["response_times"]) if metrics_copy["response_times"] else 0
-        metrics_copy["response_times"] = len(metrics_copy["response_times"])  # Just return count
-        
-        # Add timestamp
-        metrics_copy["timestamp"] = datetime.utcnow().isoformat()
-        
-        return metrics_copy
+    registry = get_registry()
+    duration = registry.histogram(REQUEST_DURATION, "Request response time")
+    lifetime = duration.summary(window=False)
+    window = duration.summary(window=True)
+    
+    page_views = {}
+    page_views_by_role = {}
+    for page, role, count in _page_view_counts():
+        page_views[page] = page_views.get(page, 0) + count
+        if role:
+            role_views = page_views_by_role.setdefault(role, {})
+            role_views[page] = role_views.get(page, 0) + count
+    
+    metrics_copy = {
+        "requests": int(registry.counter(REQUESTS, "Requests handled").value),
+        "errors": int(sum(counter.value for counter in registry.family(ERRORS).values())),
+        "response_times": lifetime["count"],
+        "avg_response_time": lifetime["mean"],
+        "p50_response_time": window["p50"],
+        "p95_response_time": window["p95"],
+        "p99_response_time": window["p99"],
+        "max_response_time": window["max"],
+        "window_requests": window["count"],
+        "active_users": int(registry.gauge(ACTIVE_USERS, "Active users").value),
+        "page_views": page_views,
+        "page_views_by_role": page_views_by_role,
+        "start_time": _start_time,
+        "timestamp": datetime.utcnow().isoformat(),
+    }
+    
+    metrics_copy["cache"] = get_cache_metrics()
+    
+    return metrics_copy
+
+def _flatten_metrics(metrics, prefix=""):
+    """Flatten nested metric dicts into dotted names."""
+    for key, value in metrics.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            yield from _flatten_metrics(value, f"{name}.")
+        else:
+            yield name, value
 
 def export_metrics(format="json"):
     """
@@ -197,17 +218,13 @@ def export_metrics(format="json"):
     metrics = get_metrics()
     
     if format.lower() == "json":
-        return json.dumps(metrics, indent=2)
+        return json.dumps(metrics, indent=2, default=str)
     
     elif format.lower() == "csv":
         csv_lines = ["metric,value"]
         
-        for key, value in metrics.items():
-            if isinstance(value, dict):
-                for subkey, subvalue in value.items():
-                    csv_lines.append(f"{key}.{subkey},{subvalue}")
-            else:
-                csv_lines.append(f"{key},{value}")
+        for key, value in _flatten_metrics(metrics):
+            csv_lines.append(f"{key},{value}")
         
         return "\n".join(csv_lines)
     
@@ -239,7 +256,7 @@ def monitor_response_time(func):
             
             # Record response time
             response_time = (time.time() - start_time) * 1000  # ms
-            record_request(response_time)
+            record_request(response_time, endpoint=func.__qualname__)
             
             return result
         except Exception as e:
@@ -252,12 +269,424 @@ def monitor_response_time(func):
     
     return wrapper
 
+def render_cache_dashboard(allow_reset=False):
+    """
+    Render shared cache metrics in Streamlit.
+    
+    Shows per-namespace hit ratios, compute time saved, evictions by reason
+    and memory use so TTLs and budgets can be tuned from data.
+    
+    Args:
+        allow_reset: Show a button that resets the process-wide cache statistics
+    """
+    import streamlit as st
+    import pandas as pd
+    
+    stats = get_cache_metrics()
+    if not stats:
+        st.info("Cache metrics are not available.")
+        return
+    
+    col1, col2, col3, col4 = st.columns(4)
+    
+    with col1:
+        st.metric("Hit Ratio", f"{stats['hit_ratio']:.1%}")
+    
+    with col2:
+        st.metric("Memory", f"{stats['bytes'] / 1048576:.1f} MB", f"of {stats['max_bytes'] / 1048576:.0f} MB", delta_color="off")
+    
+    with col3:
+        st.metric("Compute Time Saved", f"{stats['saved_seconds']:.1f} s")
+    
+    with col4:
+        st.metric("Prefetch Hit Rate", f"{stats['prefetch_hit_rate']:.1%}")
+    
+    st.markdown("**Evictions by Reason**")
+    evictions = stats["evictions_by_reason"]
+    ecol1, ecol2, ecol3 = st.columns(3)
+    ecol1.metric("TTL Expired", evictions["ttl"])
+    ecol2.metric("Size / Quota", evictions["size"])
+    ecol3.metric("Invalidated", evictions["invalidation"])
+    
+    st.markdown("**Namespaces**")
+    if stats["namespaces"]:
+        namespace_df = pd.DataFrame([
+            {
+                "Namespace": namespace,
+                "Entries": ns["entries"],
+                "Size (KB)": round(ns["bytes"] / 1024, 1),
+                "Hits": ns["hits"],
+                "Misses": ns["misses"],
+                "Hit Ratio": f"{ns['hit_ratio']:.1%}",
+                "Avg Compute (ms)": round(ns["avg_compute_ms"], 1),
+                "Time Saved (s)": round(ns["saved_seconds"], 2),
+                "Evicted (TTL)": ns["evictions_ttl"],
+                "Evicted (Size)": ns["evictions_size"],
+                "Invalidated": ns["evictions_invalidation"],
+            }
+            for namespace, ns in stats["namespaces"].items()
+        ]).sort_values("Size (KB)", ascending=False)
+        
+        st.dataframe(namespace_df, use_container_width=True, hide_index=True)
+    else:
+        st.info("No cached namespaces yet.")
+    
+    tier_col1, tier_col2 = st.columns(2)
+    
+    with tier_col1:
+        st.markdown("**Disk Tier**")
+        disk = stats.get("disk")
+        if disk:
+            st.write(f"Entries: {disk['entries']} · {disk['bytes'] / 1048576:.1f} MB of {disk['max_bytes'] / 1048576:.0f} MB")
+            st.write(f"Hits: {disk['hits']} · Misses: {disk['misses']} · Evictions: {disk['evictions']}")
+        else:
+            st.write("Not in use")
+    
+    with tier_col2:
+        st.markdown("**Shared Backend**")
+        backend = stats.get("backend")
+        if backend:
+            st.write(f"Backend: {backend.get('backend', 'custom')} · Errors: {stats['backend_errors']}")
+            st.write(f"Hits: {backend.get('hits', 0)} · Misses: {backend.get('misses', 0)} · Invalidations received: {backend.get('received', 0)}")
+        else:
+            st.write("Not configured (pod-local cache)")
+    
+    if allow_reset and st.button("Reset Cache Statistics"):
+        from lib.utils.cache_engine import get_cache_engine
+        get_cache_engine().reset_stats()
+        st.success("Cache statistics reset!")
+        st.rerun()
+
+def render_session_memory_dashboard():
+    """
+    Render session state memory in Streamlit.
+    
+    Shows this server process's session totals against the per-session
+    budget, memory per key class and the largest keys of the largest
+    sessions, from lib.utils.session_memory.
+    """
+    import streamlit as st
+    import pandas as pd
+    from lib.utils.session_memory import KEY_CLASSES, enforce_session_budget, get_pod_memory
+    
+    enforce_session_budget(force=True)
+    pod = get_pod_memory()
+    
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Sessions", pod["sessions"])
+    col2.metric("Session Memory", f"{pod['bytes'] / 1048576:.1f} MB")
+    col3.metric("Largest Session", f"{pod['max_bytes'] / 1048576:.1f} MB",
+                f"budget {pod['budget_bytes'] / 1048576:.0f} MB", delta_color="off")
+    col4.metric("Average Session", f"{pod['mean_bytes'] / 1024:.0f} KB")
+    
+    st.markdown("**Memory by Key Class**")
+    class_df = pd.DataFrame([
+        {"Class": key_class, "Size (KB)": round(pod["by_class"][key_class] / 1024, 1)}
+        for key_class in KEY_CLASSES
+    ])
+    st.dataframe(class_df, use_container_width=True, hide_index=True)
+    
+    st.markdown("**Largest Sessions**")
+    sessions = sorted(pod["sessions_detail"].values(), key=lambda report: report["bytes"], reverse=True)[:10]
+    if sessions:
+        keys_df = pd.DataFrame([
+            {
+                "User": report["user"] or "(not logged in)",
+                "Session (KB)": round(report["bytes"] / 1024, 1),
+                "Key": key,
+                "Class": key_class,
+                "Key (KB)": round(size / 1024, 1),
+            }
+            for report in sessions
+            for key, key_class, size in report["keys"][:5]
+        ])
+        st.dataframe(keys_df, use_container_width=True, hide_index=True)
+
+def render_recovery_point_dashboard():
+    """
+    Render WAL archiving status in Streamlit.
+    
+    Shows the recovery-point gap (how much committed data is not archived
+    yet), the newest base backup and how much WAL a recovery to now would
+    replay, from lib.utils.wal_archive.
+    """
+    import streamlit as st
+    from lib.utils.wal_archive import WAL_ARCHIVE_ENABLED, WAL_ARCHIVE_INTERVAL, get_archive_status
+    
+    if not WAL_ARCHIVE_ENABLED:
+        st.info("WAL archiving is off (set WAL_ARCHIVE_ENABLED=true); recovery falls back to the nearest full backup.")
+        return
+    
+    status = get_archive_status()
+    gap = status.get("gap_seconds")
+    
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Recovery Point Gap", f"{gap:.0f}s" if gap is not None else "unknown")
+    col2.metric("Last Archived", (status.get("last_archived_at") or "never")[:19])
+    col3.metric("Newest Base Backup", (status.get("base_backup_at") or "none")[:19])
+    col4.metric("Archive Size", f"{status.get('archive_bytes', 0) / 1048576:.1f} MB")
+    
+    if status["backend"] == "sqlite":
+        st.caption(
+            f"{status['pending_frames']} committed WAL frames waiting for the next archive pass "
+            f"(every {WAL_ARCHIVE_INTERVAL:g}s); a recovery to now replays "
+            f"{status['segments_since_base']} segments onto the newest of {status['base_backups']} base images."
+        )
+    else:
+        st.caption(
+            f"Last archived segment {status.get('last_archived_wal') or 'none'}, "
+            f"{status.get('failed_count', 0)} failed attempts; {status['base_backups']} base backups."
+        )
+    
+    if status.get("last_error"):
+        st.error(f"Archiving error: {status['last_error']}")
+
+def render_notification_queue_dashboard(allow_requeue=False):
+    """
+    Render notification delivery status in Streamlit.
+    
+    Shows queue depth, delivery throughput and enqueue-to-delivery latency
+    per channel, and the dead-lettered deliveries, from
+    lib.utils.notification_queue.
+    
+    Args:
+        allow_requeue: Show a button that requeues the dead letters
+    """
+    import streamlit as st
+    import pandas as pd
+    from lib.utils.notification_queue import STATUS_WINDOW_SECONDS, get_notification_queue
+    
+    queue = get_notification_queue()
+    status = queue.status()
+    
+    def seconds(value):
+        return f"{value:.1f}s" if value is not None else "—"
+    
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("Queued", status["depth"], help=f"Oldest waiting {seconds(status['oldest_queued_seconds'])}")
+    col2.metric("Sent / min", status["sent_per_minute"])
+    col3.metric("Latency p50 / p95", f"{seconds(status['latency_p50'])} / {seconds(status['latency_p95'])}")
+    col4.metric("Dead Letters", status["dead"])
+    st.caption(f"Throughput and latency over the last {STATUS_WINDOW_SECONDS // 60} minutes; "
+               f"{status['workers']} delivery workers running in this process.")
+    
+    if status["channels"]:
+        rows = [dict(channel=channel, **counts) for channel, counts in sorted(status["channels"].items())]
+        st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+    else:
+        st.info("No notifications queued yet.")
+    
+    dead = queue.dead_letters(limit=50)
+    if dead:
+        st.markdown("**Dead Letters**")
+        st.dataframe(
+            pd.DataFrame(dead)[["id", "channel", "recipient", "subject", "attempts", "last_error"]],
+            use_container_width=True, hide_index=True
+        )
+        if allow_requeue and st.button("Requeue Dead Letters"):
+            st.success(f"Requeued {queue.requeue()} deliveries!")
+            st.rerun()
+
+def render_page_performance_dashboard(allow_reset=False):
+    """
+    Render the slowest pages in Streamlit.
+    
+    Shows per-page run time percentiles, database against Python time,
+    widgets and delta payload per run, and where each page's time goes by
+    section, from lib.utils.page_instrumentation.
+    
+    Args:
+        allow_reset: Show a button that resets the process-wide page statistics
+    """
+    import streamlit as st
+    import pandas as pd
+    from lib.utils.metrics import METRICS_WINDOW_SECONDS
+    from lib.utils.page_instrumentation import UNSECTIONED, reset_page_stats, slowest_pages
+    
+    period = st.radio(
+        "Period", [f"Last {METRICS_WINDOW_SECONDS} seconds", "Since server start"],
+        horizontal=True, key="page_performance_period"
+    )
+    window = period != "Since server start"
+    pages = slowest_pages(limit=26, window=window)
+    
+    if not pages:
+        st.info("No page runs recorded in this period.")
+        return
+    
+    st.markdown("**Slowest Pages**")
+    pages_df = pd.DataFrame([
+        {
+            "Page": page["page"],
+            "Runs": page["runs"],
+            "p50 (ms)": round(page["p50_ms"], 1),
+            "p95 (ms)": round(page["p95_ms"], 1),
+            "p99 (ms)": round(page["p99_ms"], 1),
+            "Max (ms)": round(page["max_ms"], 1),
+            "Avg DB (ms)": round(page["db_ms"], 1),
+            "Avg Python (ms)": round(page["python_ms"], 1),
+            "Avg Widgets": round(page["widgets"], 1),
+            "Avg Delta (KB)": round(page["delta_bytes"] / 1024, 1),
+        }
+        for page in pages
+    ])
+    st.dataframe(pages_df, use_container_width=True, hide_index=True)
+    
+    st.markdown("**Average Run Time by Section (ms)**")
+    sections = sorted({name for page in pages for name in page["sections"]} - {UNSECTIONED}) + [UNSECTIONED]
+    sections_df = pd.DataFrame(
+        [[round(page["sections"].get(name, 0.0), 1) for name in sections] for page in pages],
+        index=[page["page"] for page in pages], columns=sections
+    )
+    st.bar_chart(sections_df)
+    
+    if allow_reset and st.button("Reset Page Statistics"):
+        reset_page_stats()
+        st.success("Page statistics reset!")
+        st.rerun()
+
+def render_trace_dashboard():
+    """
+    Render the slowest recent page run traces in Streamlit.
+    
+    Shows a waterfall of the selected trace's spans (page, section,
+    controller, model, cache and SQL) with their attributes on hover, and
+    offers the buffered traces as OTLP JSON.
+    """
+    import streamlit as st
+    import plotly.graph_objects as go
+    from lib.utils.tracing import STATUS_CODE_ERROR, get_trace_buffer, slowest_traces, to_otlp
+    
+    traces = slowest_traces(limit=20)
+    if not traces:
+        st.info("No traces recorded yet.")
+        return
+    
+    def describe(trace):
+        started = datetime.fromtimestamp(trace.root.start_ns / 1e9).strftime("%H:%M:%S")
+        return f"{trace.root.name} · {trace.duration_ms:.0f} ms · {started}"
+    
+    choice = st.selectbox("Trace", range(len(traces)), format_func=lambda i: describe(traces[i]),
+                          key="trace_choice")
+    trace = traces[choice]
+    start_ns = trace.root.start_ns
+    
+    spans = trace.spans
+    labels = [f"{'  ' * item.depth}{item.name}" for item in spans]
+    figure = go.Figure(go.Bar(
+        y=list(range(len(spans))),
+        x=[max(item.duration_ms, 0.01) for item in spans],
+        base=[(item.start_ns - start_ns) / 1e6 for item in spans],
+        orientation="h",
+        marker_color=["#d62728" if item.status == STATUS_CODE_ERROR else "#1f77b4" for item in spans],
+        customdata=[
+            "<br>".join(f"{key}: {value}" for key, value in item.attributes.items()) or "-"
+            for item in spans
+        ],
+        hovertemplate="%{x:.2f} ms from %{base:.2f} ms<br>%{customdata}<extra></extra>",
+    ))
+    figure.update_layout(
+        height=max(200, 24 * len(spans) + 60),
+        margin=dict(t=10, l=10, r=10, b=30),
+        xaxis_title="Milliseconds from page run start",
+        yaxis=dict(tickmode="array", tickvals=list(range(len(spans))), ticktext=labels, autorange="reversed"),
+    )
+    st.plotly_chart(figure, use_container_width=True)
+    
+    if trace.dropped:
+        st.caption(f"{trace.dropped} spans beyond the per-trace limit were not recorded.")
+    
+    st.download_button(
+        "Download Traces (OTLP JSON)", json.dumps(to_otlp(get_trace_buffer().traces())),
+        file_name="gcpanel-traces.json", mime="application/json"
+    )
+
+def render_profiler_dashboard():
+    """
+    Render the sampling profiler in Streamlit.
+    
+    Starts a profile of the script runner threads and shows the last one
+    as a flamegraph. This should only be available to admin users.
+    """
+    import streamlit as st
+    import plotly.graph_objects as go
+    from lib.utils.sampling_profiler import (
+        PROFILER_DEFAULT_INTERVAL_MS, PROFILER_MAX_SECONDS, flamegraph_tree,
+        get_profile, start_profile, stop_profile
+    )
+    
+    profile = get_profile()
+    running = profile is not None and profile.running
+    
+    col1, col2, col3 = st.columns([2, 2, 1])
+    with col1:
+        seconds = st.slider("Duration (seconds)", 1, PROFILER_MAX_SECONDS, min(10, PROFILER_MAX_SECONDS),
+                            key="profiler_seconds", disabled=running)
+    with col2:
+        interval_ms = st.select_slider("Sample interval (ms)", options=[1, 2, 5, 10, 20, 50],
+                                       value=int(PROFILER_DEFAULT_INTERVAL_MS), key="profiler_interval",
+                                       disabled=running)
+    with col3:
+        if running:
+            if st.button("Stop Profile"):
+                stop_profile()
+                st.rerun()
+        elif st.button("Start Profile"):
+            if start_profile(seconds, interval_ms) is None:
+                st.warning("A profile is already running.")
+            st.rerun()
+    
+    if profile is None:
+        st.info("No profile taken yet. Start one while reproducing the slow page in another tab.")
+        return
+    
+    summary = profile.summary()
+    if running:
+        st.info(f"Profiling: {summary['elapsed']:.0f} of {summary['seconds']:.0f} seconds, "
+                f"{summary['samples']} samples so far.")
+        if st.button("Refresh"):
+            st.rerun()
+        return
+    
+    if summary["error"]:
+        st.error(f"Profile failed: {summary['error']}")
+    
+    mcol1, mcol2, mcol3, mcol4 = st.columns(4)
+    mcol1.metric("Duration", f"{summary['elapsed']:.1f} s")
+    mcol2.metric("Samples", summary["samples"])
+    mcol3.metric("Distinct Stacks", summary["stacks"])
+    mcol4.metric("Profiler CPU", f"{(summary['overhead'] or 0):.1%}")
+    
+    if not summary["samples"]:
+        st.info("No script runner thread was running during the profile.")
+        return
+    
+    tree = flamegraph_tree(profile.stacks)
+    figure = go.Figure(go.Icicle(
+        ids=tree["ids"],
+        labels=tree["labels"],
+        parents=tree["parents"],
+        values=tree["values"],
+        branchvalues="total",
+        tiling=dict(orientation="v", flip="y"),
+        hovertemplate="%{label}<br>%{value} samples (%{percentRoot:.1%})<extra></extra>",
+        maxdepth=25,
+    ))
+    figure.update_layout(height=700, margin=dict(t=10, l=10, r=10, b=10))
+    st.plotly_chart(figure, use_container_width=True)
+    
+    st.download_button(
+        "Download Collapsed Stacks", profile.collapsed(),
+        file_name=f"gcpanel-profile-{int(profile.started_at)}.folded", mime="text/plain"
+    )
+
 def render_metrics_dashboard():
     """
     Render a metrics dashboard in Streamlit.
     
     This should only be available to admin users.
     """
+    global _start_time
     import streamlit as st
     
     st.title("Application Metrics")
@@ -290,6 +719,15 @@ def render_metrics_dashboard():
     with col4:
         st.metric("Active Users", metrics["active_users"])
     
+    # Response time percentiles over the rolling window
+    st.caption(f"Response times, last {get_registry().histogram(REQUEST_DURATION).window_seconds} s "
+               f"({metrics['window_requests']} requests)")
+    pcol1, pcol2, pcol3, pcol4 = st.columns(4)
+    pcol1.metric("p50", f"{metrics['p50_response_time']:.1f} ms")
+    pcol2.metric("p95", f"{metrics['p95_response_time']:.1f} ms")
+    pcol3.metric("p99", f"{metrics['p99_response_time']:.1f} ms")
+    pcol4.metric("Max", f"{metrics['max_response_time']:.1f} ms")
+    
     # Page views
     st.subheader("Page Views")
     
@@ -324,12 +762,9 @@ def render_metrics_dashboard():
     st.subheader("Admin Controls")
     
     if st.button("Reset Metrics"):
-        with _metrics_lock:
-            _metrics["requests"] = 0
-            _metrics["errors"] = 0
-            _metrics["response_times"] = []
-            _metrics["page_views"] = {}
-            _metrics["start_time"] = datetime.utcnow().isoformat()
+        # Page views stay: prefetch learns each role's navigation from them
+        get_registry().reset(tuple(name for name in MONITORING_METRICS if name != PAGE_VIEWS))
+        _start_time = datetime.utcnow().isoformat()
         
         st.success("Metrics reset successfully!")
     
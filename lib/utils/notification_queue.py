@@ -0,0 +1,583 @@
+"""
+Notification Dispatch Queue for gcPanel.
+
+This module delivers notifications from a durable queue instead of a thread
+per message:
+- Deliveries (one per recipient and channel) are written to a SQLite queue
+  in one transaction and the caller returns at once; a fixed pool of
+  NOTIFICATION_WORKERS threads sends them
+- Workers claim up to NOTIFICATION_BATCH_SIZE due deliveries of one channel
+  at a time and hand the batch to that channel's sender, so a sender can
+  reuse one connection or client for the whole batch
+- A failed delivery is retried with exponential backoff and jitter; after
+  NOTIFICATION_MAX_ATTEMPTS attempts (or a permanent failure) it is
+  dead-lettered and kept for inspection and requeueing
+- Claimed deliveries hold a lease, so deliveries claimed by a process that
+  died are sent again once the lease expires
+- Every delivery keeps its status, attempts and last error; status()
+  reports queue depth, throughput and enqueue-to-delivery latency
+
+Delivery is at least once: a crash between sending and recording the
+result sends that batch again. In-app notifications are stored in the
+queue database's inbox table, keyed by delivery, so a repeat is harmless.
+"""
+
+import os
+import time
+import random
+import logging
+import sqlite3
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from lib.utils.metrics import counter, gauge, histogram
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Constants
+NOTIFICATION_QUEUE_DB = os.environ.get("NOTIFICATION_QUEUE_DB", "data/notification_queue.db")
+NOTIFICATION_WORKERS = int(os.environ.get("NOTIFICATION_WORKERS", "4"))
+NOTIFICATION_BATCH_SIZE = int(os.environ.get("NOTIFICATION_BATCH_SIZE", "50"))
+NOTIFICATION_MAX_ATTEMPTS = int(os.environ.get("NOTIFICATION_MAX_ATTEMPTS", "5"))
+# Delay before the first retry; it doubles with every further attempt
+NOTIFICATION_RETRY_DELAY = float(os.environ.get("NOTIFICATION_RETRY_DELAY", "30"))
+NOTIFICATION_RETRY_MAX_DELAY = float(os.environ.get("NOTIFICATION_RETRY_MAX_DELAY", "3600"))
+# A claimed batch not finished within this many seconds is claimed again
+NOTIFICATION_LEASE_SECONDS = float(os.environ.get("NOTIFICATION_LEASE_SECONDS", "300"))
+# Idle workers look for due retries at least this often
+NOTIFICATION_POLL_INTERVAL = float(os.environ.get("NOTIFICATION_POLL_INTERVAL", "5"))
+# Sent and dead-lettered deliveries are kept this long
+NOTIFICATION_KEEP_DAYS = int(os.environ.get("NOTIFICATION_KEEP_DAYS", "30"))
+
+QUEUED = "queued"
+SENDING = "sending"
+SENT = "sent"
+DEAD = "dead"
+
+# Window for throughput and latency in status()
+STATUS_WINDOW_SECONDS = 300
+CLEANUP_INTERVAL_SECONDS = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS deliveries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    channel TEXT NOT NULL,
+    recipient TEXT NOT NULL,
+    user_id TEXT,
+    subject TEXT,
+    body TEXT,
+    notification_type TEXT,
+    status TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    lease_until REAL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    sent_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_deliveries_due ON deliveries(status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_deliveries_channel_due ON deliveries(status, channel, next_attempt_at);
+CREATE INDEX IF NOT EXISTS idx_deliveries_sent ON deliveries(sent_at);
+CREATE TABLE IF NOT EXISTS inbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    delivery_id INTEGER UNIQUE,
+    user_id TEXT NOT NULL,
+    subject TEXT,
+    body TEXT,
+    notification_type TEXT,
+    created_at REAL NOT NULL,
+    is_read INTEGER NOT NULL DEFAULT 0,
+    read_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_inbox_user ON inbox(user_id, is_read, created_at);
+"""
+
+DELIVERY_FIELDS = ("channel", "recipient", "user_id", "subject", "body", "notification_type")
+
+
+class PermanentDeliveryError(Exception):
+    """A delivery failure that retrying cannot fix (e.g. a rejected address)."""
+
+
+# A sender takes a batch of deliveries of its channel (dicts with the
+# deliveries columns) and returns {delivery id: error} for the ones that
+# failed; an error that is a PermanentDeliveryError is not retried.
+Sender = Callable[[List[Dict[str, Any]]], Dict[int, Any]]
+
+_senders: Dict[str, Sender] = {}
+_senders_lock = threading.Lock()
+
+
+def register_sender(channel: str, sender: Sender):
+    """
+    Register the function that delivers a channel's notifications.
+
+    Args:
+        channel: Channel name (see notifications.NotificationChannel)
+        sender: Function taking a batch of deliveries and returning failures by id
+    """
+    with _senders_lock:
+        _senders[channel] = sender
+
+
+def _get_sender(channel: str) -> Optional[Sender]:
+    if channel not in _senders:
+        # The notification channels register themselves when imported
+        import lib.utils.notifications  # noqa: F401
+    return _senders.get(channel)
+
+
+def retry_delay(attempts: int) -> float:
+    """Seconds to wait before the next attempt after a number of failed attempts."""
+    delay = min(NOTIFICATION_RETRY_DELAY * 2 ** max(attempts - 1, 0), NOTIFICATION_RETRY_MAX_DELAY)
+    # Jitter keeps a burst of failures from retrying in lockstep
+    return delay * (0.5 + random.random() / 2)
+
+
+def _metric_outcome(channel: str, outcome: str, amount: int):
+    if amount:
+        counter("gcpanel_notifications", "Notification delivery attempts by outcome",
+                labels={"channel": channel, "outcome": outcome}).inc(amount)
+
+
+class NotificationQueue:
+    """Durable notification queue with a bounded pool of delivery workers."""
+
+    def __init__(self, db_path: str = NOTIFICATION_QUEUE_DB, workers: int = NOTIFICATION_WORKERS,
+                 batch_size: int = NOTIFICATION_BATCH_SIZE):
+        self.db_path = db_path
+        self.workers = workers
+        self.batch_size = batch_size
+        self._local = threading.local()
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        # Enqueues so far; idle workers wait on _wake until it changes
+        self._enqueued = 0
+        self._wake = threading.Condition()
+        self._last_cleanup = 0.0
+        self._initialized = False
+        # Deliveries not sent or dead-lettered yet, kept in memory for the depth gauge;
+        # counted once when the database is opened and again by every status()
+        self._depth = 0
+
+    # Storage
+
+    def _connect(self) -> sqlite3.Connection:
+        """This thread's connection to the queue database."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            directory = os.path.dirname(self.db_path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with self._lock:
+                if not self._initialized:
+                    conn.executescript(SCHEMA)
+                    self._depth = conn.execute(
+                        "SELECT COUNT(*) FROM deliveries WHERE status IN (?, ?)", (QUEUED, SENDING)
+                    ).fetchone()[0]
+                    self._initialized = True
+            self._local.conn = conn
+        return conn
+
+    def enqueue(self, deliveries: Iterable[Dict[str, Any]]) -> List[int]:
+        """
+        Queue deliveries and wake the workers.
+
+        Only a short insert transaction runs on the caller's thread; the
+        worker pool is started if it is not running yet.
+
+        Args:
+            deliveries: Dicts with channel, recipient and optionally user_id,
+                subject, body and notification_type
+
+        Returns:
+            list: Delivery ids, in the order given
+        """
+        now = time.time()
+        conn = self._connect()
+        ids = []
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            for delivery in deliveries:
+                cursor = conn.execute(
+                    "INSERT INTO deliveries (channel, recipient, user_id, subject, body, notification_type, "
+                    "status, next_attempt_at, created_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    tuple(delivery.get(field) for field in DELIVERY_FIELDS) + (QUEUED, now, now),
+                )
+                ids.append(cursor.lastrowid)
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        if ids:
+            self._adjust_depth(len(ids))
+            self.start()
+            with self._wake:
+                self._enqueued += 1
+                self._wake.notify_all()
+        return ids
+
+    def _claim(self) -> Tuple[Optional[str], List[Dict[str, Any]]]:
+        """
+        Lease the next batch of due deliveries of one channel.
+
+        The channel is the one with the longest-waiting due delivery, so a
+        burst on one channel does not hold back the others for long.
+        """
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            # Batches leased by a worker that died go back to the queue
+            conn.execute(
+                "UPDATE deliveries SET status = ?, lease_until = NULL WHERE status = ? AND lease_until < ?",
+                (QUEUED, SENDING, now),
+            )
+            row = conn.execute(
+                "SELECT channel FROM deliveries WHERE status = ? AND next_attempt_at <= ? "
+                "ORDER BY next_attempt_at LIMIT 1",
+                (QUEUED, now),
+            ).fetchone()
+            if row is None:
+                conn.execute("COMMIT")
+                return None, []
+
+            channel = row["channel"]
+            batch = [dict(delivery) for delivery in conn.execute(
+                "SELECT * FROM deliveries WHERE status = ? AND channel = ? AND next_attempt_at <= ? "
+                "ORDER BY next_attempt_at, id LIMIT ?",
+                (QUEUED, channel, now, self.batch_size),
+            )]
+            conn.executemany(
+                "UPDATE deliveries SET status = ?, attempts = attempts + 1, lease_until = ? WHERE id = ?",
+                [(SENDING, now + NOTIFICATION_LEASE_SECONDS, delivery["id"]) for delivery in batch],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+        for delivery in batch:
+            delivery["attempts"] += 1
+        return channel, batch
+
+    def _finish(self, channel: str, batch: List[Dict[str, Any]], failures: Dict[int, Any]):
+        """Record a sent batch: delivered, scheduled for retry or dead-lettered."""
+        now = time.time()
+        sent, retry, dead = [], [], []
+        for delivery in batch:
+            error = failures.get(delivery["id"])
+            if error is None:
+                sent.append((SENT, now, delivery["id"]))
+            elif isinstance(error, PermanentDeliveryError) or delivery["attempts"] >= NOTIFICATION_MAX_ATTEMPTS:
+                dead.append((DEAD, str(error), delivery["id"]))
+            else:
+                retry.append((QUEUED, now + retry_delay(delivery["attempts"]), str(error), delivery["id"]))
+
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "UPDATE deliveries SET status = ?, sent_at = ?, lease_until = NULL, last_error = NULL WHERE id = ?",
+                sent,
+            )
+            conn.executemany(
+                "UPDATE deliveries SET status = ?, next_attempt_at = ?, lease_until = NULL, last_error = ? "
+                "WHERE id = ?",
+                retry,
+            )
+            conn.executemany(
+                "UPDATE deliveries SET status = ?, lease_until = NULL, last_error = ? WHERE id = ?",
+                dead,
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        self._adjust_depth(-(len(sent) + len(dead)))
+
+        latency = histogram("gcpanel_notification_latency_milliseconds",
+                            "Time from enqueue to delivery", labels={"channel": channel})
+        for delivery in batch:
+            if delivery["id"] not in failures:
+                latency.observe((now - delivery["created_at"]) * 1000)
+        _metric_outcome(channel, "sent", len(sent))
+        _metric_outcome(channel, "retry", len(retry))
+        _metric_outcome(channel, "dead", len(dead))
+        if dead:
+            logger.warning(f"Dead-lettered {len(dead)} {channel} notifications: {dead[0][1]}")
+
+    def _deliver(self, channel: str, batch: List[Dict[str, Any]]):
+        sender = _get_sender(channel)
+        start = time.perf_counter()
+        if sender is None:
+            failures = {delivery["id"]: PermanentDeliveryError(f"No sender for channel {channel}")
+                        for delivery in batch}
+        else:
+            try:
+                failures = sender(batch) or {}
+            except Exception as e:
+                logger.error(f"Error sending {channel} notifications: {str(e)}")
+                failures = {delivery["id"]: e for delivery in batch}
+        histogram("gcpanel_notification_batch_milliseconds", "Time to send one batch of notifications",
+                  labels={"channel": channel}).observe((time.perf_counter() - start) * 1000)
+        self._finish(channel, batch, failures)
+
+    # Workers
+
+    @property
+    def running(self) -> bool:
+        return any(thread.is_alive() for thread in self._threads)
+
+    def start(self):
+        """Start the worker threads if they are not running."""
+        with self._lock:
+            if self.running:
+                return
+            self._stop = threading.Event()
+            self._threads = [
+                threading.Thread(target=self._run, name=f"notification-worker-{index}", daemon=True)
+                for index in range(self.workers)
+            ]
+            for thread in self._threads:
+                thread.start()
+        logger.info(f"Notification queue {self.db_path} started with {self.workers} workers")
+
+    def stop(self, timeout: float = 10.0):
+        """Stop the workers after their current batch."""
+        self._stop.set()
+        with self._wake:
+            self._wake.notify_all()
+        for thread in self._threads:
+            thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            seen = self._enqueued
+            try:
+                self._maybe_cleanup()
+                channel, batch = self._claim()
+                if batch:
+                    self._deliver(channel, batch)
+                    continue
+                wait = self._next_due_in()
+            except Exception as e:
+                logger.error(f"Notification worker error: {str(e)}")
+                wait = NOTIFICATION_POLL_INTERVAL
+
+            with self._wake:
+                if self._enqueued == seen and not self._stop.is_set():
+                    self._wake.wait(wait)
+
+    def _next_due_in(self) -> float:
+        row = self._connect().execute(
+            "SELECT MIN(next_attempt_at) FROM deliveries WHERE status = ?", (QUEUED,)
+        ).fetchone()
+        if row[0] is None:
+            return NOTIFICATION_POLL_INTERVAL
+        return min(max(row[0] - time.time(), 0.01), NOTIFICATION_POLL_INTERVAL)
+
+    def _maybe_cleanup(self):
+        with self._lock:
+            if time.time() - self._last_cleanup < CLEANUP_INTERVAL_SECONDS:
+                return
+            self._last_cleanup = time.time()
+        self.cleanup()
+
+    def cleanup(self, keep_days: int = NOTIFICATION_KEEP_DAYS) -> int:
+        """
+        Delete sent and dead-lettered deliveries older than keep_days.
+
+        Returns:
+            int: Deliveries deleted
+        """
+        cutoff = time.time() - keep_days * 86400
+        cursor = self._connect().execute(
+            "DELETE FROM deliveries WHERE (status = ? AND sent_at < ?) OR (status = ? AND created_at < ?)",
+            (SENT, cutoff, DEAD, cutoff),
+        )
+        return cursor.rowcount
+
+    # Inspection
+
+    def get_delivery(self, delivery_id: int) -> Optional[Dict[str, Any]]:
+        """A delivery's status, attempts, last error and timestamps."""
+        row = self._connect().execute("SELECT * FROM deliveries WHERE id = ?", (delivery_id,)).fetchone()
+        return dict(row) if row else None
+
+    def depth(self) -> int:
+        """Deliveries not sent or dead-lettered yet (tracked in memory, no query)."""
+        return self._depth
+
+    def _adjust_depth(self, change: int):
+        with self._lock:
+            self._depth = max(self._depth + change, 0)
+
+    def dead_letters(self, limit: int = 100) -> List[Dict[str, Any]]:
+        """Most recent dead-lettered deliveries."""
+        return [dict(row) for row in self._connect().execute(
+            "SELECT * FROM deliveries WHERE status = ? ORDER BY id DESC LIMIT ?", (DEAD, limit)
+        )]
+
+    def requeue(self, delivery_ids: Optional[Iterable[int]] = None) -> int:
+        """
+        Give dead-lettered deliveries a fresh set of attempts.
+
+        Args:
+            delivery_ids: Deliveries to requeue (default: all dead letters)
+
+        Returns:
+            int: Deliveries requeued
+        """
+        conn = self._connect()
+        now = time.time()
+        if delivery_ids is None:
+            count = conn.execute(
+                "UPDATE deliveries SET status = ?, attempts = 0, next_attempt_at = ? WHERE status = ?",
+                (QUEUED, now, DEAD),
+            ).rowcount
+        else:
+            count = sum(conn.execute(
+                "UPDATE deliveries SET status = ?, attempts = 0, next_attempt_at = ? WHERE id = ? AND status = ?",
+                (QUEUED, now, delivery_id, DEAD),
+            ).rowcount for delivery_id in delivery_ids)
+        if count:
+            self._adjust_depth(count)
+            self.start()
+            with self._wake:
+                self._enqueued += 1
+                self._wake.notify_all()
+        return count
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Queue status.
+
+        Returns:
+            dict: "channels" (channel -> counts of queued, retrying, sending,
+                sent and dead), "depth", "oldest_queued_seconds", and over the
+                last STATUS_WINDOW_SECONDS "sent_per_minute" and enqueue-to-delivery
+                "latency_p50"/"latency_p95" in seconds
+        """
+        conn = self._connect()
+        now = time.time()
+        channels: Dict[str, Dict[str, int]] = {}
+        for row in conn.execute(
+            "SELECT channel, status, attempts > 0 AS retried, COUNT(*) AS count FROM deliveries "
+            "GROUP BY channel, status, attempts > 0"
+        ):
+            counts = channels.setdefault(row["channel"], {QUEUED: 0, "retrying": 0, SENDING: 0, SENT: 0, DEAD: 0})
+            key = "retrying" if row["status"] == QUEUED and row["retried"] else row["status"]
+            counts[key] = counts.get(key, 0) + row["count"]
+
+        oldest = conn.execute(
+            "SELECT MIN(created_at) FROM deliveries WHERE status IN (?, ?)", (QUEUED, SENDING)
+        ).fetchone()[0]
+        latencies = sorted(row[0] for row in conn.execute(
+            "SELECT sent_at - created_at FROM deliveries WHERE status = ? AND sent_at >= ?",
+            (SENT, now - STATUS_WINDOW_SECONDS),
+        ))
+
+        def percentile(q: float) -> Optional[float]:
+            if not latencies:
+                return None
+            return round(latencies[min(int(q * len(latencies)), len(latencies) - 1)], 3)
+
+        depth = sum(counts[QUEUED] + counts["retrying"] + counts[SENDING] for counts in channels.values())
+        with self._lock:
+            # Correct any drift of the in-memory depth (e.g. deliveries removed by hand)
+            self._depth = depth
+
+        return {
+            "channels": channels,
+            "depth": depth,
+            "dead": sum(counts[DEAD] for counts in channels.values()),
+            "oldest_queued_seconds": round(now - oldest, 1) if oldest else None,
+            "sent_per_minute": round(len(latencies) * 60 / STATUS_WINDOW_SECONDS, 1),
+            "latency_p50": percentile(0.5),
+            "latency_p95": percentile(0.95),
+            "workers": self.workers if self.running else 0,
+        }
+
+    # In-app inbox
+
+    def store_in_app(self, deliveries: List[Dict[str, Any]]):
+        """Store in-app deliveries in the inbox (again storing one is a no-op)."""
+        now = time.time()
+        conn = self._connect()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.executemany(
+                "INSERT OR IGNORE INTO inbox (delivery_id, user_id, subject, body, notification_type, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(delivery.get("id"), str(delivery.get("user_id") or delivery["recipient"]), delivery.get("subject"),
+                  delivery.get("body"), delivery.get("notification_type"), delivery.get("created_at") or now)
+                 for delivery in deliveries],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+    def inbox(self, user_id: Any, unread_only: bool = False, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """A user's in-app notifications, newest first."""
+        query = "SELECT * FROM inbox WHERE user_id = ?"
+        if unread_only:
+            query += " AND is_read = 0"
+        query += " ORDER BY created_at DESC, id DESC"
+        params: Tuple[Any, ...] = (str(user_id),)
+        if limit is not None:
+            query += " LIMIT ?"
+            params += (limit,)
+        return [dict(row) for row in self._connect().execute(query, params)]
+
+    def mark_read(self, notification_id: int, user_id: Any) -> bool:
+        """Mark one of a user's in-app notifications as read (False if it is not theirs)."""
+        cursor = self._connect().execute(
+            "UPDATE inbox SET is_read = 1, read_at = ? WHERE id = ? AND user_id = ?",
+            (time.time(), notification_id, str(user_id))
+        )
+        return cursor.rowcount > 0
+
+
+# Process-wide queue
+
+_queue: Optional[NotificationQueue] = None
+_queue_lock = threading.Lock()
+
+
+def get_notification_queue() -> NotificationQueue:
+    """The notification queue of this process (workers start on first use)."""
+    global _queue
+
+    with _queue_lock:
+        if _queue is None:
+            _queue = NotificationQueue()
+    return _queue
+
+
+def start_notification_workers() -> NotificationQueue:
+    """Start delivering queued notifications, including any left from a previous run."""
+    queue = get_notification_queue()
+    try:
+        queue.start()
+    except Exception as e:
+        logger.error(f"Error starting notification workers: {str(e)}")
+    return queue
+
+
+def _queue_depth() -> float:
+    if _queue is None:
+        return 0.0
+    return float(_queue.depth())
+
+
+gauge("gcpanel_job_queue_depth", "Jobs waiting for a worker",
+      labels={"queue": "notifications"}).set_function(_queue_depth)
@@ -3,17 +3,25 @@ Notification utilities for gcPanel.
 
 This module provides functions for sending notifications
 via email and SMS for various application events.
+
+Notifications are not sent on the caller's thread: send_notification()
+and send_bulk_notification() queue one delivery per recipient and channel
+in lib.utils.notification_queue, whose workers call the batch senders
+registered at the bottom of this module.
 """
 
 import os
 import logging
 import json
+import sqlite3
 import smtplib
 from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime
-import threading
-from twilio.rest import Client
+
+from lib.utils.notification_queue import PermanentDeliveryError, get_notification_queue, register_sender
+from lib.utils.smtp_pool import get_smtp_transport
+from lib.utils.template_engine import PLACEHOLDERS, get_template_engine, render_template
 
 # Setup logging
 logger = logging.getLogger(__name__)
@@ -22,6 +30,9 @@ logger = logging.getLogger(__name__)
 NOTIFICATION_CONFIG_FILE = "config/notifications.json"
 NOTIFICATION_TEMPLATES_DIR = "templates/notifications"
 
+# Parsed config and the modification time of the file it was read from
+_config_cache = {"mtime": None, "config": None}
+
 # Notification Types
 class NotificationType:
     INFO = "info"
@@ -44,12 +55,15 @@ def load_notification_config():
     """
     Load notification configuration.
     
+    The parsed file is cached until its modification time changes, so
+    callers on the send path do not re-read it.
+    
     Returns:
         dict: Notification configuration
     """
-    ensure_dirs_exist()
-    
     if not os.path.exists(NOTIFICATION_CONFIG_FILE):
+        ensure_dirs_exist()
+        
         # Create default config
         default_config = {
             "channels": {
@@ -93,8 +107,13 @@ def load_notification_config():
         return default_config
     
     try:
-        with open(NOTIFICATION_CONFIG_FILE, 'r') as f:
-            return json.load(f)
+        mtime = os.path.getmtime(NOTIFICATION_CONFIG_FILE)
+        if _config_cache["mtime"] != mtime:
+            with open(NOTIFICATION_CONFIG_FILE, 'r') as f:
+                config = json.load(f)
+            _config_cache["config"] = config
+            _config_cache["mtime"] = mtime
+        return _config_cache["config"]
     except Exception as e:
         logger.error(f"Error loading notification config: {str(e)}")
         return {}
@@ -110,20 +129,35 @@ def save_notification_config(config):
     
     with open(NOTIFICATION_CONFIG_FILE, 'w') as f:
         json.dump(config, f, indent=2)
+    
+    _config_cache["config"] = config
+    _config_cache["mtime"] = os.path.getmtime(NOTIFICATION_CONFIG_FILE)
 
 def get_template(template_name):
     """
     Get a notification template.
     
+    Templates are parsed and compiled once and reloaded when their file
+    changes; the returned dict is shared, so it must not be modified.
+    
     Args:
         template_name: Name of the template
         
     Returns:
         dict: Template with subject and body
     """
-    template_file = os.path.join(NOTIFICATION_TEMPLATES_DIR, f"{template_name}.json")
+    try:
+        template = get_template_engine(NOTIFICATION_TEMPLATES_DIR).get(template_name)
+    except Exception as e:
+        logger.error(f"Error loading template {template_name}: {str(e)}")
+        return {
+            "subject": "Notification from gcPanel",
+            "body": "This is a notification from gcPanel."
+        }
     
-    if not os.path.exists(template_file):
+    if template is None:
+        template_file = os.path.join(NOTIFICATION_TEMPLATES_DIR, f"{template_name}.json")
+        
         # Create a default template
         default_template = {
             "subject": "Notification from gcPanel",
@@ -135,20 +169,17 @@ def get_template(template_name):
         
         return default_template
     
-    try:
-        with open(template_file, 'r') as f:
-            return json.load(f)
-    except Exception as e:
-        logger.error(f"Error loading template {template_name}: {str(e)}")
-        return {
-            "subject": "Notification from gcPanel",
-            "body": "This is a notification from gcPanel."
-        }
+    return template.data
 
 def format_template(template, context):
     """
     Format a template with context variables.
     
+    {name} placeholders are replaced in one pass (placeholders without a
+    value are left as they are), or the template is rendered with Jinja2
+    if it says "engine": "jinja2". Subject and body are compiled on first
+    use and the compilation is reused for every later recipient.
+    
     Args:
         template: Template dict with subject and body
         context: Dict of variables to substitute
@@ -156,24 +187,20 @@ def format_template(template, context):
     Returns:
         dict: Formatted template
     """
-    subject = template.get("subject", "")
-    body = template.get("body", "")
-    
-    # Simple string formatting
-    for key, value in context.items():
-        placeholder = f"{{{key}}}"
-        subject = subject.replace(placeholder, str(value))
-        body = body.replace(placeholder, str(value))
+    syntax = template.get("engine", PLACEHOLDERS)
     
     return {
-        "subject": subject,
-        "body": body
+        "subject": render_template(template.get("subject", ""), context, syntax),
+        "body": render_template(template.get("body", ""), context, syntax)
     }
 
 def send_in_app_notification(user_id, subject, body, notification_type=NotificationType.INFO):
     """
     Send an in-app notification.
     
+    The notification is stored in the inbox directly, without going
+    through the delivery queue.
+    
     Args:
         user_id: ID of the user to notify
         subject: Notification subject
@@ -184,23 +211,14 @@ def send_in_app_notification(user_id, subject, body, notification_type=Notificat
         bool: True if successful, False otherwise
     """
     try:
-        from core.database.config import get_db_session
-        from core.models.notification import Notification
-        
-        with get_db_session() as session:
-            notification = Notification(
-                user_id=user_id,
-                subject=subject,
-                body=body,
-                notification_type=notification_type,
-                created_at=datetime.utcnow(),
-                is_read=False
-            )
-            
-            session.add(notification)
-            session.commit()
-            
-            return True
+        get_notification_queue().store_in_app([{
+            "user_id": user_id,
+            "recipient": str(user_id),
+            "subject": subject,
+            "body": body,
+            "notification_type": notification_type
+        }])
+        return True
     
     except Exception as e:
         logger.error(f"Error sending in-app notification: {str(e)}")
@@ -226,30 +244,7 @@ def send_email_notification(to_email, subject, body):
         return False
     
     try:
-        # Create message
-        msg = MIMEMultipart("alternative")
-        msg["Subject"] = subject
-        msg["From"] = email_config.get("from_email", "noreply@example.com")
-        msg["To"] = to_email
-        
-        # Attach HTML content
-        msg.attach(MIMEText(body, "html"))
-        
-        # Send email
-        with smtplib.SMTP(
-            email_config.get("smtp_server"),
-            email_config.get("smtp_port", 587)
-        ) as server:
-            if email_config.get("smtp_use_tls", True):
-                server.starttls()
-            
-            if email_config.get("smtp_username") and email_config.get("smtp_password"):
-                server.login(
-                    email_config.get("smtp_username"),
-                    email_config.get("smtp_password")
-                )
-            
-            server.send_message(msg)
+        _smtp_transport(email_config).send(_email_message(email_config, to_email, subject, body))
         
         return True
     
@@ -257,6 +252,50 @@ def send_email_notification(to_email, subject, body):
         logger.error(f"Error sending email notification: {str(e)}")
         return False
 
+def _email_message(email_config, to_email, subject, body):
+    """Build an HTML email message (without a To header if to_email is None)."""
+    msg = MIMEMultipart("alternative")
+    msg["Subject"] = subject
+    msg["From"] = email_config.get("from_email", "noreply@example.com")
+    if to_email is not None:
+        msg["To"] = to_email
+    
+    # Attach HTML content
+    msg.attach(MIMEText(body, "html"))
+    return msg
+
+def _smtp_transport(email_config):
+    """Pooled SMTP transport for the configured server and account."""
+    return get_smtp_transport(
+        email_config.get("smtp_server"),
+        email_config.get("smtp_port", 587),
+        username=email_config.get("smtp_username"),
+        password=email_config.get("smtp_password"),
+        use_tls=email_config.get("smtp_use_tls", True),
+        use_ssl=email_config.get("smtp_use_ssl", False)
+    )
+
+def _email_failure(error):
+    """
+    Queue failure for an SMTP error or refusal.
+    
+    5xx replies are permanent; connection errors and 4xx replies (e.g.
+    greylisting) are retried.
+    """
+    if isinstance(error, tuple):
+        code, reply = error
+        text = f"{code} {reply.decode(errors='replace') if isinstance(reply, bytes) else reply}"
+    elif isinstance(error, smtplib.SMTPRecipientsRefused):
+        code = min(code for code, _ in error.recipients.values())
+        text = str(error)
+    else:
+        code = getattr(error, "smtp_code", None)
+        text = str(error)
+    
+    if code is not None and code >= 500:
+        return PermanentDeliveryError(text)
+    return text
+
 def send_sms_notification(to_phone, message):
     """
     Send an SMS notification using Twilio.
@@ -285,6 +324,8 @@ def send_sms_notification(to_phone, message):
         return False
     
     try:
+        from twilio.rest import Client
+        
         # Initialize Twilio client
         client = Client(account_sid, auth_token)
         
@@ -302,119 +343,298 @@ def send_sms_notification(to_phone, message):
         logger.error(f"Error sending SMS notification: {str(e)}")
         return False
 
-def send_notification(
-    user_id, 
-    template_name, 
-    context=None, 
+def get_user_contacts(user_ids):
+    """
+    Look up users' contact details in the application database.
+    
+    Args:
+        user_ids: IDs of the users
+        
+    Returns:
+        dict: User ID (as a string) -> user row (email, and phone and names where the schema has them)
+    """
+    ids = [str(user_id) for user_id in user_ids]
+    if not ids:
+        return {}
+    
+    try:
+        if os.environ.get("DATABASE_URL", "").startswith("postgresql"):
+            from lib.database.connection import get_db_manager
+            
+            rows = get_db_manager().execute_query("SELECT * FROM users WHERE id::text = ANY(%s)", (ids,))
+            return {str(row["id"]): dict(row) for row in rows}
+        
+        conn = sqlite3.connect(f"file:{os.environ.get('DB_PATH', 'data/gcpanel.db')}?mode=ro", uri=True)
+        conn.row_factory = sqlite3.Row
+        try:
+            users = {}
+            # Stay under SQLite's limit on bound parameters
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                query = f"SELECT * FROM users WHERE id IN ({', '.join('?' * len(chunk))})"
+                for row in conn.execute(query, chunk):
+                    users[str(row["id"])] = dict(row)
+            return users
+        finally:
+            conn.close()
+    
+    except Exception as e:
+        logger.error(f"Error getting users: {str(e)}")
+        return {}
+
+def send_bulk_notification(
+    user_ids,
+    template_name,
+    context=None,
     notification_type=NotificationType.INFO,
     channels=None
 ):
     """
-    Send a notification to a user through configured channels.
+    Queue a notification to many users.
+    
+    Users are looked up in one query, the template is rendered per user
+    ({first_name} defaults to the user's name) and every delivery is queued
+    in one transaction; the queue's workers send them in batches per channel.
     
     Args:
-        user_id: ID of the user to notify
+        user_ids: IDs of the users to notify
         template_name: Name of the notification template
         context: Dict of variables to substitute in the template
         notification_type: Type of notification
         channels: List of channels to use (defaults to configured channels for the notification type)
         
     Returns:
-        dict: Results by channel
+        dict: User ID -> {channel: delivery ID} for the deliveries queued
     """
     if context is None:
         context = {}
     
     config = load_notification_config()
-    
-    # Get user
-    try:
-        from core.database.config import get_db_session
-        from core.models.user import User
-        
-        with get_db_session() as session:
-            user = session.query(User).filter(User.id == user_id).first()
-            
-            if not user:
-                logger.error(f"User not found: {user_id}")
-                return {channel: False for channel in ["in_app", "email", "sms"]}
-    
-    except Exception as e:
-        logger.error(f"Error getting user: {str(e)}")
-        return {channel: False for channel in ["in_app", "email", "sms"]}
-    
-    # Get template
-    template = get_template(template_name)
-    formatted = format_template(template, context)
+    channel_config = config.get("channels", {})
+    preferences = config.get("user_preferences", {})
     
     # Determine channels to use
     if channels is None:
         channels = config.get("notification_levels", {}).get(notification_type, ["in_app"])
+    channels = [
+        channel for channel in channels
+        if channel_config.get(channel, {}).get("enabled", channel == NotificationChannel.IN_APP)
+    ]
     
-    # Check user preferences
-    user_preferences = config.get("user_preferences", {}).get(str(user_id), config.get("user_preferences", {}).get("default", {}))
-    
-    # Send notifications
-    results = {}
-    
-    def send_notifications_async():
+    template = get_template(template_name)
+    users = get_user_contacts(user_ids)
+    
+    deliveries = []
+    owners = []
+    for user_id in user_ids:
+        user = users.get(str(user_id))
+        if not user:
+            logger.error(f"User not found: {user_id}")
+            continue
+        
+        # Check user preferences
+        user_preferences = preferences.get(str(user_id), preferences.get("default", {}))
+        
+        user_context = {"first_name": user.get("first_name") or user.get("username", "")}
+        user_context.update(context)
+        formatted = format_template(template, user_context)
+        
+        base = {
+            "user_id": user_id,
+            "subject": formatted["subject"],
+            "body": formatted["body"],
+            "notification_type": notification_type
+        }
+        
         if "in_app" in channels and user_preferences.get("in_app", True):
-            results["in_app"] = send_in_app_notification(
-                user_id,
-                formatted["subject"],
-                formatted["body"],
-                notification_type
-            )
-        
-        if "email" in channels and user_preferences.get("email", True) and user.email:
-            results["email"] = send_email_notification(
-                user.email,
-                formatted["subject"],
-                formatted["body"]
-            )
-        
-        if "sms" in channels and user_preferences.get("sms", False) and user.phone_number:
+            deliveries.append(dict(base, channel=NotificationChannel.IN_APP, recipient=str(user_id)))
+            owners.append((user_id, NotificationChannel.IN_APP))
+        
+        if "email" in channels and user_preferences.get("email", True) and user.get("email"):
+            deliveries.append(dict(base, channel=NotificationChannel.EMAIL, recipient=user["email"]))
+            owners.append((user_id, NotificationChannel.EMAIL))
+        
+        phone = user.get("phone_number") or user.get("phone")
+        if "sms" in channels and user_preferences.get("sms", False) and phone:
             # Truncate message for SMS (160 chars)
             sms_message = formatted["subject"] + ": " + formatted["body"]
             if len(sms_message) > 160:
                 sms_message = sms_message[:157] + "..."
-                
-            results["sms"] = send_sms_notification(
-                user.phone_number,
-                sms_message
-            )
+            
+            deliveries.append(dict(base, channel=NotificationChannel.SMS, recipient=phone, body=sms_message))
+            owners.append((user_id, NotificationChannel.SMS))
     
-    # Run notifications in a separate thread to not block the main thread
-    thread = threading.Thread(target=send_notifications_async)
-    thread.daemon = True
-    thread.start()
+    try:
+        delivery_ids = get_notification_queue().enqueue(deliveries)
+    except Exception as e:
+        logger.error(f"Error queueing notifications: {str(e)}")
+        return {}
     
+    results = {}
+    for (user_id, channel), delivery_id in zip(owners, delivery_ids):
+        results.setdefault(user_id, {})[channel] = delivery_id
     return results
 
-def mark_notification_read(notification_id):
+def send_notification(
+    user_id, 
+    template_name, 
+    context=None, 
+    notification_type=NotificationType.INFO,
+    channels=None
+):
+    """
+    Send a notification to a user through configured channels.
+    
+    The notification is queued and this returns at once; use
+    get_delivery_status() to follow a delivery.
+    
+    Args:
+        user_id: ID of the user to notify
+        template_name: Name of the notification template
+        context: Dict of variables to substitute in the template
+        notification_type: Type of notification
+        channels: List of channels to use (defaults to configured channels for the notification type)
+        
+    Returns:
+        dict: Delivery ID by channel, for the channels the notification was queued on
+    """
+    return send_bulk_notification(
+        [user_id],
+        template_name,
+        context=context,
+        notification_type=notification_type,
+        channels=channels
+    ).get(user_id, {})
+
+def get_delivery_status(delivery_id):
+    """
+    Get the status of a queued notification delivery.
+    
+    Args:
+        delivery_id: ID returned by send_notification
+        
+    Returns:
+        dict: Delivery with status ("queued", "sending", "sent" or "dead"), attempts and last_error, or None
+    """
+    try:
+        return get_notification_queue().get_delivery(delivery_id)
+    except Exception as e:
+        logger.error(f"Error getting delivery status: {str(e)}")
+        return None
+
+def deliver_in_app(deliveries):
+    """Queue sender for in-app notifications: stores the batch in the inbox."""
+    get_notification_queue().store_in_app(deliveries)
+    return {}
+
+def deliver_email(deliveries):
+    """
+    Queue sender for email: sends a batch over pooled SMTP sessions.
+    
+    Deliveries with the same rendered subject and body (templates without
+    per-user fields) go out as one message to BCC batches; the others are
+    sent as individual messages, concurrently.
+    
+    Args:
+        deliveries: Queued email deliveries
+        
+    Returns:
+        dict: Delivery ID -> error for the messages not sent
+    """
+    email_config = load_notification_config().get("channels", {}).get("email", {})
+    if not email_config.get("enabled", False):
+        return {delivery["id"]: PermanentDeliveryError("Email notifications are disabled") for delivery in deliveries}
+    
+    transport = _smtp_transport(email_config)
+    groups = {}
+    for delivery in deliveries:
+        groups.setdefault((delivery["subject"], delivery["body"]), []).append(delivery)
+    
+    failures = {}
+    individual = []
+    for (subject, body), group in groups.items():
+        if len(group) == 1:
+            individual.extend(group)
+            continue
+        
+        refused = transport.send_bcc(
+            _email_message(email_config, None, subject, body),
+            [delivery["recipient"] for delivery in group]
+        )
+        for delivery in group:
+            if delivery["recipient"] in refused:
+                failures[delivery["id"]] = _email_failure(refused[delivery["recipient"]])
+    
+    results = transport.send_many([
+        (_email_message(email_config, delivery["recipient"], delivery["subject"], delivery["body"]), None)
+        for delivery in individual
+    ])
+    for delivery, result in zip(individual, results):
+        if isinstance(result, Exception):
+            failures[delivery["id"]] = _email_failure(result)
+    
+    return failures
+
+def deliver_sms(deliveries):
+    """
+    Queue sender for SMS: sends a batch with one Twilio client.
+    
+    Args:
+        deliveries: Queued SMS deliveries
+        
+    Returns:
+        dict: Delivery ID -> error for the messages not sent
+    """
+    sms_config = load_notification_config().get("channels", {}).get("sms", {})
+    if not sms_config.get("enabled", False):
+        return {delivery["id"]: PermanentDeliveryError("SMS notifications are disabled") for delivery in deliveries}
+    
+    # Get Twilio credentials
+    account_sid = sms_config.get("twilio_account_sid") or os.environ.get("TWILIO_ACCOUNT_SID")
+    auth_token = sms_config.get("twilio_auth_token") or os.environ.get("TWILIO_AUTH_TOKEN")
+    from_phone = sms_config.get("twilio_phone_number") or os.environ.get("TWILIO_PHONE_NUMBER")
+    
+    if not all([account_sid, auth_token, from_phone]):
+        return {delivery["id"]: "Missing Twilio credentials" for delivery in deliveries}
+    
+    from twilio.rest import Client
+    
+    client = Client(account_sid, auth_token)
+    failures = {}
+    for delivery in deliveries:
+        try:
+            client.messages.create(body=delivery["body"], from_=from_phone, to=delivery["recipient"])
+        except Exception as e:
+            failures[delivery["id"]] = str(e)
+    
+    return failures
+
+register_sender(NotificationChannel.IN_APP, deliver_in_app)
+register_sender(NotificationChannel.EMAIL, deliver_email)
+register_sender(NotificationChannel.SMS, deliver_sms)
+
+def _inbox_entry(row):
+    """An inbox row as returned by the notification getters."""
+    entry = dict(row)
+    entry["is_read"] = bool(entry["is_read"])
+    entry["created_at"] = datetime.fromtimestamp(entry["created_at"]).isoformat()
+    if entry.get("read_at"):
+        entry["read_at"] = datetime.fromtimestamp(entry["read_at"]).isoformat()
+    return entry
+
+def mark_notification_read(notification_id, user_id):
     """
     Mark an in-app notification as read.
     
     Args:
         notification_id: ID of the notification
+        user_id: ID of the user the notification belongs to
         
     Returns:
         bool: True if successful, False otherwise
     """
     try:
-        from core.database.config import get_db_session
-        from core.models.notification import Notification
-        
-        with get_db_session() as session:
-            notification = session.query(Notification).filter(Notification.id == notification_id).first()
-            
-            if notification:
-                notification.is_read = True
-                notification.read_at = datetime.utcnow()
-                session.commit()
-                return True
-            
-            return False
+        return get_notification_queue().mark_read(notification_id, user_id)
     
     except Exception as e:
         logger.error(f"Error marking notification as read: {str(e)}")
@@ -431,16 +651,7 @@ def get_unread_notifications(user_id):
         list: Unread notifications
     """
     try:
-        from core.database.config import get_db_session
-        from core.models.notification import Notification
-        
-        with get_db_session() as session:
-            notifications = session.query(Notification).\
-                filter(Notification.user_id == user_id, Notification.is_read == False).\
-                order_by(Notification.created_at.desc()).\
-                all()
-            
-            return [n.to_dict() for n in notifications]
+        return [_inbox_entry(row) for row in get_notification_queue().inbox(user_id, unread_only=True)]
     
     except Exception as e:
         logger.error(f"Error getting unread notifications: {str(e)}")
@@ -458,17 +669,7 @@ def get_recent_notifications(user_id, limit=10):
         list: Recent notifications
     """
     try:
-        from core.database.config import get_db_session
-        from core.models.notification import Notification
-        
-        with get_db_session() as session:
-            notifications = session.query(Notification).\
-                filter(Notification.user_id == user_id).\
-                order_by(Notification.created_at.desc()).\
-                limit(limit).\
-                all()
-            
-            return [n.to_dict() for n in notifications]
+        return [_inbox_entry(row) for row in get_notification_queue().inbox(user_id, limit=limit)]
     
     except Exception as e:
         logger.error(f"Error getting recent notifications: {str(e)}")
@@ -479,12 +680,9 @@ def initialize_notification_system():
     ensure_dirs_exist()
     load_notification_config()
     
-    # Create notification model if it doesn't exist
-    try:
-        from core.models.notification import Notification
-        logger.info("Notification model initialized")
-    except ImportError:
-        logger.warning("Notification model not available")
+    # Deliver anything left in the queue by a previous run
+    from lib.utils.notification_queue import start_notification_workers
+    start_notification_workers()
     
     # Create default templates
     create_default_templates()
@@ -499,7 +697,7 @@ def send_delivery_notification(user_id, delivery_data):
         delivery_data: Dict containing delivery information
         
     Returns:
-        dict: Results by channel
+        dict: Delivery ID by channel
     """
     context = {
         "delivery_id": delivery_data.get("id", ""),
@@ -0,0 +1,381 @@
+"""
+Page Run Instrumentation for gcPanel.
+
+This module measures the cost of every Streamlit page script run (each
+rerun included) without pages opting in:
+- Wall time of the run, split into named sections (auth, model load, data
+  view, analytics, ...) by the section() context manager
+- Database time (model queries and commands) against Python time
+- Widgets created and delta bytes sent to the browser by the run
+- A trace per run (lib.utils.tracing), with each section as a span
+
+Runs are aggregated per page into the lib.utils.metrics registry, which the
+Settings page and the metrics exporter read from. The script runner hooks
+are installed once per process by install_page_instrumentation(); outside a
+page run, section() and db_timer() cost a context variable lookup.
+
+The hooks wrap private ScriptRunner methods, checked against Streamlit
+STREAMLIT_CHECKED_VERSION. If either method is missing the hooks are not
+installed at all and an error is logged, rather than measuring half a run.
+"""
+
+import os
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Dict, List, Optional
+
+from lib.utils.metrics import get_registry
+from lib.utils.tracing import end_trace, span, start_trace
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Constants
+PAGE_INSTRUMENTATION_ENABLED = os.environ.get("PAGE_INSTRUMENTATION_ENABLED", "true").lower() == "true"
+# Streamlit release whose ScriptRunner internals the hooks were checked against (see uv.lock)
+STREAMLIT_CHECKED_VERSION = "1.45.1"
+# Private ScriptRunner methods the hooks wrap
+HOOKED_METHODS = ("_run_script", "_enqueue_forward_msg")
+
+# Metric families (lib.utils.metrics), labelled by page (and section)
+PAGE_RUN_DURATION = "gcpanel_page_run_milliseconds"
+PAGE_SECTION_DURATION = "gcpanel_page_section_milliseconds"
+PAGE_DB_DURATION = "gcpanel_page_db_milliseconds"
+PAGE_PYTHON_DURATION = "gcpanel_page_python_milliseconds"
+PAGE_WIDGETS = "gcpanel_page_widgets"
+PAGE_DELTA_BYTES = "gcpanel_page_delta_bytes"
+
+PAGE_METRICS = (PAGE_RUN_DURATION, PAGE_SECTION_DURATION, PAGE_DB_DURATION,
+                PAGE_PYTHON_DURATION, PAGE_WIDGETS, PAGE_DELTA_BYTES)
+
+# Time of a run outside every named section
+UNSECTIONED = "other"
+
+_current_run: contextvars.ContextVar = contextvars.ContextVar("gcpanel_page_run", default=None)
+_installed = False
+_install_lock = threading.Lock()
+
+
+class PageRun:
+    """Measurements of one page script run."""
+
+    __slots__ = ("start", "sections", "db_ms", "db_calls", "delta_bytes", "widgets", "_stack", "finished", "trace")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        # Section name -> exclusive milliseconds (nested sections are not counted twice)
+        self.sections: Dict[str, float] = {}
+        self.db_ms = 0.0
+        self.db_calls = 0
+        self.delta_bytes = 0
+        self.widgets = 0
+        # [name, start, milliseconds spent in nested sections]
+        self._stack: List[List[Any]] = []
+        self.finished = False
+        # Root span of the run's trace
+        self.trace = None
+
+    def enter(self, name: str):
+        self._stack.append([name, time.perf_counter(), 0.0])
+
+    def exit(self):
+        name, start, nested = self._stack.pop()
+        elapsed = (time.perf_counter() - start) * 1000
+        self.sections[name] = self.sections.get(name, 0.0) + elapsed - nested
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.start) * 1000
+
+
+def current_run() -> Optional[PageRun]:
+    """The page run in progress on this thread, if any."""
+    return _current_run.get()
+
+
+@contextmanager
+def section(name: str):
+    """
+    Attribute the time of a block to a named section of the current page run.
+
+    Args:
+        name: Section name (e.g. "auth", "model_load", "data_view")
+    """
+    run = _current_run.get()
+    if run is None:
+        yield
+        return
+
+    run.enter(name)
+    try:
+        with span(f"section:{name}", section=name):
+            yield
+    finally:
+        run.exit()
+
+
+@contextmanager
+def db_timer():
+    """Count the time of a block as database time of the current page run."""
+    run = _current_run.get()
+    if run is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        run.db_ms += (time.perf_counter() - start) * 1000
+        run.db_calls += 1
+
+
+def begin_run() -> PageRun:
+    """
+    Start measuring a page run on this thread.
+
+    A run still open on the thread (a rerun started from inside it) is
+    recorded first.
+
+    Returns:
+        PageRun: The new run
+    """
+    previous = _current_run.get()
+    if previous is not None and not previous.finished:
+        end_run(previous)
+
+    run = PageRun()
+    run.trace = start_trace("page_run")
+    _current_run.set(run)
+    return run
+
+
+def end_run(run: PageRun, page: Optional[str] = None):
+    """
+    Finish a page run and record it under its page.
+
+    Args:
+        run: Run returned by begin_run()
+        page: Page name (default: the page the script run context is on)
+    """
+    if run.finished:
+        return
+    run.finished = True
+    if _current_run.get() is run:
+        _current_run.set(None)
+
+    wall_ms = run.elapsed_ms()
+    try:
+        ctx = _get_script_run_ctx()
+        if page is None:
+            page = context_page_name(ctx)
+        if ctx is not None and not run.widgets:
+            run.widgets = len(getattr(ctx, "widget_ids_this_run", ()) or ())
+        record_run(page, wall_ms, run)
+        if run.trace is not None:
+            run.trace.name = f"page:{page}"
+            run.trace.set_attributes(page=page, widgets=run.widgets, delta_bytes=run.delta_bytes,
+                                     db_ms=round(run.db_ms, 3))
+    except Exception as e:
+        logger.error(f"Error recording page run: {str(e)}")
+    finally:
+        end_trace(run.trace)
+
+
+def record_run(page: str, wall_ms: float, run: PageRun):
+    """
+    Record a finished run in the metrics registry.
+
+    Args:
+        page: Page name
+        wall_ms: Wall time of the run in milliseconds
+        run: Measurements of the run
+    """
+    registry = get_registry()
+    labels = {"page": page}
+    registry.histogram(PAGE_RUN_DURATION, "Page script run wall time", labels).observe(wall_ms)
+    registry.histogram(PAGE_DB_DURATION, "Database time per page run", labels).observe(run.db_ms)
+    registry.histogram(PAGE_PYTHON_DURATION, "Python (non-database) time per page run",
+                       labels).observe(max(wall_ms - run.db_ms, 0.0))
+    registry.histogram(PAGE_WIDGETS, "Widgets created per page run", labels).observe(run.widgets)
+    registry.histogram(PAGE_DELTA_BYTES, "Delta bytes sent to the browser per page run",
+                       labels).observe(run.delta_bytes)
+
+    sections = dict(run.sections)
+    sections[UNSECTIONED] = max(wall_ms - sum(sections.values()), 0.0)
+    for name, milliseconds in sections.items():
+        registry.histogram(PAGE_SECTION_DURATION, "Page script run time per section",
+                           {"page": page, "section": name}).observe(milliseconds)
+
+    # Page runs are the requests of a Streamlit app
+    from lib.utils.monitoring import record_request
+    record_request(wall_ms, endpoint=f"page:{page}")
+
+
+def _get_script_run_ctx():
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        return get_script_run_ctx()
+    except Exception:
+        return None
+
+
+def context_page_name(ctx) -> str:
+    """Name of the page a script run context is on."""
+    try:
+        page = ctx.pages_manager.get_pages().get(ctx.page_script_hash, {})
+        return page.get("page_name") or "main"
+    except Exception:
+        return "main"
+
+
+def install_page_instrumentation() -> bool:
+    """
+    Hook the Streamlit script runner so every page run is measured.
+
+    Wraps ScriptRunner._run_script (one measured run per call) and
+    ScriptRunner._enqueue_forward_msg (delta bytes). Safe to call on every
+    script run: the hooks are installed once per process. Nothing is
+    patched if the running Streamlit lacks either method.
+
+    Returns:
+        bool: Whether the hooks are installed
+    """
+    global _installed
+
+    if _installed:
+        return True
+    if not PAGE_INSTRUMENTATION_ENABLED:
+        return False
+
+    with _install_lock:
+        if _installed:
+            return True
+        try:
+            import streamlit
+            from streamlit.runtime.scriptrunner.script_runner import ScriptRunner
+        except ImportError as e:
+            logger.error(f"Page instrumentation disabled: {str(e)}")
+            return False
+
+        version = getattr(streamlit, "__version__", "unknown")
+        missing = [name for name in HOOKED_METHODS if not callable(getattr(ScriptRunner, name, None))]
+        if missing:
+            logger.error(
+                f"Page instrumentation disabled: ScriptRunner.{', ScriptRunner.'.join(missing)} not found "
+                f"in Streamlit {version} (checked against {STREAMLIT_CHECKED_VERSION})"
+            )
+            return False
+        if version != STREAMLIT_CHECKED_VERSION:
+            logger.warning(
+                f"Page instrumentation hooks were checked against Streamlit {STREAMLIT_CHECKED_VERSION}, "
+                f"running {version}"
+            )
+
+        original_run = ScriptRunner._run_script
+        original_enqueue = ScriptRunner._enqueue_forward_msg
+
+        @wraps(original_run)
+        def _run_script(self, *args, **kwargs):
+            run = begin_run()
+            try:
+                return original_run(self, *args, **kwargs)
+            finally:
+                end_run(run)
+
+        @wraps(original_enqueue)
+        def _enqueue_forward_msg(self, msg):
+            run = _current_run.get()
+            if run is not None:
+                try:
+                    if msg.WhichOneof("type") == "delta":
+                        run.delta_bytes += msg.ByteSize()
+                except Exception:
+                    pass
+            return original_enqueue(self, msg)
+
+        ScriptRunner._run_script = _run_script
+        ScriptRunner._enqueue_forward_msg = _enqueue_forward_msg
+        _installed = True
+
+    logger.info("Page run instrumentation installed")
+    return True
+
+
+def get_page_stats(window: bool = True) -> List[Dict[str, Any]]:
+    """
+    Per-page run statistics.
+
+    Args:
+        window: Over the rolling metrics window (True) or since the process started (False)
+
+    Returns:
+        list: Dicts with page, runs, wall time percentiles, mean database and
+            Python time, mean widgets and delta bytes, and mean milliseconds
+            per section
+    """
+    registry = get_registry()
+
+    def by_page(name: str) -> Dict[str, Dict[str, float]]:
+        return {
+            dict(key)["page"]: histogram.summary(window=window)
+            for key, histogram in registry.family(name).items()
+        }
+
+    db = by_page(PAGE_DB_DURATION)
+    python = by_page(PAGE_PYTHON_DURATION)
+    widgets = by_page(PAGE_WIDGETS)
+    delta = by_page(PAGE_DELTA_BYTES)
+
+    sections: Dict[str, Dict[str, float]] = {}
+    for key, histogram in registry.family(PAGE_SECTION_DURATION).items():
+        labels = dict(key)
+        summary = histogram.summary(window=window)
+        if summary["count"]:
+            sections.setdefault(labels["page"], {})[labels["section"]] = summary["mean"]
+
+    stats = []
+    for page, wall in by_page(PAGE_RUN_DURATION).items():
+        if not wall["count"]:
+            continue
+        empty = {"mean": 0.0}
+        stats.append({
+            "page": page,
+            "runs": wall["count"],
+            "mean_ms": wall["mean"],
+            "p50_ms": wall["p50"],
+            "p95_ms": wall["p95"],
+            "p99_ms": wall["p99"],
+            "max_ms": wall["max"],
+            "db_ms": db.get(page, empty)["mean"],
+            "python_ms": python.get(page, empty)["mean"],
+            "widgets": widgets.get(page, empty)["mean"],
+            "delta_bytes": delta.get(page, empty)["mean"],
+            "sections": sections.get(page, {}),
+        })
+    return stats
+
+
+def slowest_pages(limit: int = 10, window: bool = True, by: str = "p95_ms") -> List[Dict[str, Any]]:
+    """
+    Pages with the slowest runs.
+
+    Args:
+        limit: Maximum number of pages
+        window: Over the rolling metrics window (True) or since the process started (False)
+        by: Statistic to rank by (a key of get_page_stats() entries)
+
+    Returns:
+        list: get_page_stats() entries, slowest first
+    """
+    return sorted(get_page_stats(window), key=lambda stats: stats[by], reverse=True)[:limit]
+
+
+def reset_page_stats():
+    """Reset every page run metric."""
+    get_registry().reset(PAGE_METRICS)
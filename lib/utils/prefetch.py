@@ -0,0 +1,265 @@
+"""
+Prefetching for gcPanel.
+
+This module warms the shared cache so the first click into a module is
+served from memory:
+- Startup warm-up of the hot tables and KPI aggregates
+- Entries another pod already computed are fetched from the shared tier in
+  one round trip, and newly computed ones are written back in one batch
+- Predictive prefetch after login of the pages a user's role usually opens,
+  learned from per-role page-view counts in lib.utils.monitoring
+- Prefetch hit-rate reporting (prefetched entries that were later read)
+"""
+
+import os
+import time
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from lib.utils.cache_engine import get_cache_engine
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Constants
+PREFETCH_ENABLED = os.environ.get("PREFETCH_ENABLED", "true").lower() == "true"
+PREFETCH_HOT_PAGES = [
+    page.strip() for page in os.environ.get(
+        "PREFETCH_HOT_PAGES", "dashboard,rfis,cost_management,scheduling"
+    ).split(",") if page.strip()
+]
+PREFETCH_PAGES_PER_ROLE = int(os.environ.get("PREFETCH_PAGES_PER_ROLE", "4"))
+
+# Page key (normalized page name) -> model class in lib.models.all_models
+PAGE_MODELS = {
+    "rfis": "RFIModel",
+    "daily_reports": "DailyReportModel",
+    "submittals": "SubmittalModel",
+    "contracts": "ContractModel",
+    "safety": "SafetyModel",
+    "deliveries": "DeliveryModel",
+    "preconstruction": "PreconstructionModel",
+    "engineering": "EngineeringModel",
+    "field_operations": "FieldOperationModel",
+    "cost_management": "CostModel",
+    "bim": "BIMModel",
+    "closeout": "CloseoutModel",
+    "transmittals": "TransmittalModel",
+    "scheduling": "ScheduleModel",
+    "quality_control": "QualityControlModel",
+    "progress_photos": "ProgressPhotoModel",
+    "subcontractor_management": "SubcontractorModel",
+    "inspections": "InspectionModel",
+    "issues_risks": "IssueRiskModel",
+    "documents": "DocumentModel",
+    "unit_prices": "UnitPriceModel",
+    "material_management": "MaterialModel",
+    "equipment_tracking": "EquipmentModel",
+}
+
+# Pages each role opens first until enough page views have been recorded
+DEFAULT_ROLE_PAGES = {
+    "Administrator": ["dashboard", "rfis", "cost_management", "analytics"],
+    "Project Manager": ["dashboard", "rfis", "cost_management", "scheduling"],
+    "Engineer": ["rfis", "submittals", "engineering", "inspections"],
+}
+
+_warmed = False
+_warm_lock = threading.Lock()
+
+
+def normalize_page(page: str) -> str:
+    """
+    Turn a page name or script path into a page key.
+
+    "03_📄_RFIs.py", "RFIs" and "Cost Management" become "rfis" and
+    "cost_management".
+    """
+    name = os.path.splitext(os.path.basename(str(page)))[0]
+    parts = [part for part in name.replace(" ", "_").split("_") if part]
+    # Drop the numeric prefix and icon of multipage script names
+    while parts and (parts[0].isdigit() or not parts[0].isascii()):
+        parts.pop(0)
+    return "_".join(parts).lower()
+
+
+def _load_model_page(model_name: str) -> Callable[[], None]:
+    def load():
+        from lib.models import all_models
+        from lib.models.base_model import DatabaseUnavailable
+
+        try:
+            getattr(all_models, model_name)().get_all_cached()
+        except DatabaseUnavailable:
+            # Demo mode: pages read static project data, nothing to prefetch
+            pass
+    return load
+
+
+def _load_kpis():
+    from lib.utils.kpi_engine import get_kpi_engine
+
+    engine = get_kpi_engine()
+    engine.get_snapshot()
+    engine.get_history(days=90)
+
+
+def get_page_loader(page: str) -> Optional[Callable[[], None]]:
+    """
+    Get the function that loads a page's data into the cache.
+
+    Args:
+        page: Page name, key or script path
+
+    Returns:
+        callable: Loader, or None if the page has nothing to prefetch
+    """
+    key = normalize_page(page)
+    if key in ("dashboard", "analytics"):
+        return _load_kpis
+    if key in PAGE_MODELS:
+        return _load_model_page(PAGE_MODELS[key])
+    return None
+
+
+def _page_cache_entries(pages: List[str]) -> List[Tuple[str, str]]:
+    """(namespace, key) of the shared cache entries the loaders of these pages read."""
+    from lib.models import all_models
+
+    entries = []
+    for page in pages:
+        model_name = PAGE_MODELS.get(normalize_page(page))
+        if model_name is not None:
+            # BaseModel.get_all_cached stores a table's rows under the key "all"
+            entries.append((getattr(all_models, model_name)().cache_namespace, "all"))
+    return entries
+
+
+def predict_pages(role: str, limit: int = PREFETCH_PAGES_PER_ROLE) -> List[str]:
+    """
+    Predict the pages a user with this role is most likely to open.
+
+    Args:
+        role: User role
+        limit: Maximum number of pages
+
+    Returns:
+        list: Page keys, most likely first
+    """
+    from lib.utils.monitoring import get_role_page_views
+
+    counts: Dict[str, int] = {}
+    for page, views in get_role_page_views(role).items():
+        key = normalize_page(page)
+        counts[key] = counts.get(key, 0) + views
+
+    ranked = sorted(counts, key=counts.get, reverse=True)
+    # Fill up with the role defaults while there is little history
+    for page in DEFAULT_ROLE_PAGES.get(role, PREFETCH_HOT_PAGES):
+        if page not in ranked:
+            ranked.append(page)
+
+    return [page for page in ranked if get_page_loader(page)][:limit]
+
+
+def prefetch_pages(pages: List[str]) -> Dict[str, float]:
+    """
+    Load pages' data into the cache, marking new entries as prefetched.
+
+    Args:
+        pages: Page keys
+
+    Returns:
+        dict: Page key to load time in seconds (failed pages are omitted)
+    """
+    timings = {}
+    engine = get_cache_engine()
+
+    with engine.prefetching():
+        try:
+            from lib.models.base_model import MODEL_CACHE_TTL
+
+            engine.preload(_page_cache_entries(pages), ttl=MODEL_CACHE_TTL)
+        except Exception as e:
+            logger.warning(f"Prefetch from the shared cache failed: {str(e)}")
+
+        for page in pages:
+            loader = get_page_loader(page)
+            if loader is None:
+                continue
+            start = time.time()
+            try:
+                loader()
+                timings[page] = time.time() - start
+            except Exception as e:
+                logger.warning(f"Prefetch of {page} failed: {str(e)}")
+
+    return timings
+
+
+def warm_cache(background: bool = True) -> bool:
+    """
+    Warm the shared cache with the hot pages once per process.
+
+    Args:
+        background: Run the warm-up in a daemon thread
+
+    Returns:
+        bool: True if this call started the warm-up
+    """
+    global _warmed
+
+    if not PREFETCH_ENABLED:
+        return False
+
+    with _warm_lock:
+        if _warmed:
+            return False
+        _warmed = True
+
+    def run():
+        timings = prefetch_pages(PREFETCH_HOT_PAGES)
+        logger.info(f"Cache warm-up finished: {timings}")
+
+    if background:
+        threading.Thread(target=run, name="cache-warmup", daemon=True).start()
+    else:
+        run()
+    return True
+
+
+def prefetch_for_role(role: str) -> Optional[threading.Thread]:
+    """
+    Prefetch, in the background, the pages a role usually opens after login.
+
+    Args:
+        role: User role
+
+    Returns:
+        Thread: The prefetch thread, or None if prefetching is disabled
+    """
+    if not PREFETCH_ENABLED:
+        return None
+
+    pages = predict_pages(role)
+    thread = threading.Thread(
+        target=prefetch_pages, args=(pages,), name="cache-prefetch", daemon=True
+    )
+    thread.start()
+    return thread
+
+
+def get_prefetch_stats() -> Dict[str, float]:
+    """
+    Get prefetch effectiveness.
+
+    Returns:
+        dict: Entries loaded by prefetch, how many were later read, and the hit rate
+    """
+    stats = get_cache_engine().get_stats()
+    return {
+        "loaded": stats["prefetch_loaded"],
+        "hits": stats["prefetch_hits"],
+        "hit_rate": stats["prefetch_hit_rate"],
+    }
@@ -153,7 +153,7 @@ class ProductionValidator:
     def _validate_caching_system(self):
         """Validate caching implementation."""
         try:
-            from utils.cache_manager import CacheManager
+            from lib.utils.cache_manager import CacheManager
             cache_manager = CacheManager()
             self.validation_results["info"].append("✅ Cache manager available")
         except ImportError:
@@ -0,0 +1,252 @@
+"""
+Sampling Profiler for gcPanel.
+
+This module profiles a live server process without a debugger attached:
+- A background thread samples the stacks of the Streamlit script runner
+  threads every few milliseconds for a fixed number of seconds
+- Samples are aggregated into collapsed stacks ("page;frame;frame count"),
+  the input format of flamegraph.pl and speedscope
+- flamegraph_tree() turns them into the node lists of an icicle chart
+
+Overhead is bounded: one profile runs at a time, for at most
+PROFILER_MAX_SECONDS, no faster than PROFILER_MIN_INTERVAL_MS, with stack
+depth and distinct stacks capped. The profiler reports the share of a CPU
+it used, so a profile of a live pod can be judged from its own cost.
+"""
+
+import os
+import sys
+import time
+import logging
+import threading
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Constants
+PROFILER_MAX_SECONDS = int(os.environ.get("PROFILER_MAX_SECONDS", "60"))
+PROFILER_MIN_INTERVAL_MS = float(os.environ.get("PROFILER_MIN_INTERVAL_MS", "1"))
+PROFILER_DEFAULT_INTERVAL_MS = float(os.environ.get("PROFILER_DEFAULT_INTERVAL_MS", "10"))
+PROFILER_MAX_STACKS = int(os.environ.get("PROFILER_MAX_STACKS", "10000"))
+PROFILER_MAX_DEPTH = 200
+# Threads whose name starts with this are sampled (Streamlit names them "ScriptRunner.scriptThread")
+PROFILER_THREAD_PREFIX = os.environ.get("PROFILER_THREAD_PREFIX", "ScriptRunner")
+
+# Stacks seen after PROFILER_MAX_STACKS distinct ones are counted under this frame
+TRUNCATED_STACK = "[other stacks]"
+
+_project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class SamplingProfiler:
+    """One profile: samples script runner thread stacks on a background thread."""
+
+    def __init__(self, seconds: float, interval_ms: float = PROFILER_DEFAULT_INTERVAL_MS,
+                 thread_prefix: str = PROFILER_THREAD_PREFIX):
+        self.seconds = min(max(seconds, 0.1), PROFILER_MAX_SECONDS)
+        # Best effort: a thread busy in Python code keeps the GIL for up to sys.getswitchinterval()
+        self.interval = max(interval_ms, PROFILER_MIN_INTERVAL_MS) / 1000
+        self.thread_prefix = thread_prefix
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self.ticks = 0
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.cpu_seconds = 0.0
+        self.error: Optional[str] = None
+        self._labels: Dict[Any, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self):
+        self.started_at = time.time()
+        self._thread = threading.Thread(target=self._run, name="sampling-profiler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling early (the samples taken so far are kept)."""
+        self._stop.set()
+
+    def join(self, timeout: Optional[float] = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        deadline = time.monotonic() + self.seconds
+        cpu_start = time.thread_time()
+        next_tick = time.monotonic()
+        try:
+            while not self._stop.is_set():
+                now = time.monotonic()
+                if now >= deadline:
+                    break
+                self._sample()
+                # Fixed-rate ticks; a late tick is skipped rather than bunched up
+                next_tick += self.interval
+                if next_tick < now:
+                    next_tick = now + self.interval
+                self._stop.wait(max(next_tick - time.monotonic(), 0.0))
+        except Exception as e:
+            self.error = str(e)
+            logger.error(f"Error sampling stacks: {str(e)}")
+        finally:
+            self.cpu_seconds = time.thread_time() - cpu_start
+            self.finished_at = time.time()
+
+    def _sample(self):
+        self.ticks += 1
+        threads = {
+            thread.ident: thread for thread in threading.enumerate()
+            if thread.name.startswith(self.thread_prefix)
+        }
+        if not threads:
+            return
+
+        frames = sys._current_frames()
+        for ident, thread in threads.items():
+            frame = frames.get(ident)
+            if frame is None:
+                continue
+            names = []
+            while frame is not None and len(names) < PROFILER_MAX_DEPTH:
+                names.append(self._label(frame.f_code))
+                frame = frame.f_back
+            names.append(self._thread_label(thread))
+            names.reverse()
+
+            stack = ";".join(names)
+            if stack not in self.stacks and len(self.stacks) >= PROFILER_MAX_STACKS:
+                stack = f"{names[0]};{TRUNCATED_STACK}"
+            self.stacks[stack] += 1
+            self.samples += 1
+
+    def _label(self, code) -> str:
+        """Frame label "function (path:first line)"; cached per code object."""
+        label = self._labels.get(code)
+        if label is None:
+            path = code.co_filename
+            if path.startswith(_project_root):
+                path = os.path.relpath(path, _project_root)
+            else:
+                path = "/".join(path.replace("\\", "/").split("/")[-2:])
+            # ";" separates frames in collapsed stacks
+            label = f"{code.co_name} ({path}:{code.co_firstlineno})".replace(";", ":")
+            self._labels[code] = label
+        return label
+
+    @staticmethod
+    def _thread_label(thread: threading.Thread) -> str:
+        """Root frame: the page the thread is running, when Streamlit has attached a context."""
+        ctx = getattr(thread, "streamlit_script_run_ctx", None)
+        if ctx is None:
+            return thread.name
+        from lib.utils.page_instrumentation import context_page_name
+        return f"page:{context_page_name(ctx)}"
+
+    def collapsed(self) -> str:
+        """Samples in collapsed-stack format, one "frame;frame;frame count" line per stack."""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        State of the profile.
+
+        Returns:
+            dict: running, seconds requested and elapsed, interval_ms, ticks,
+                samples, distinct stacks, overhead (share of one CPU used
+                by sampling) and error
+        """
+        end = self.finished_at or time.time()
+        elapsed = end - self.started_at if self.started_at else 0.0
+        return {
+            "running": self.running,
+            "seconds": self.seconds,
+            "elapsed": elapsed,
+            "interval_ms": self.interval * 1000,
+            "ticks": self.ticks,
+            "samples": self.samples,
+            "stacks": len(self.stacks),
+            "overhead": self.cpu_seconds / elapsed if elapsed and not self.running else None,
+            "error": self.error,
+        }
+
+
+_profiler: Optional[SamplingProfiler] = None
+_profiler_lock = threading.Lock()
+
+
+def start_profile(seconds: float, interval_ms: float = PROFILER_DEFAULT_INTERVAL_MS) -> Optional[SamplingProfiler]:
+    """
+    Start a profile of the script runner threads.
+
+    Args:
+        seconds: How long to sample (capped at PROFILER_MAX_SECONDS)
+        interval_ms: Milliseconds between samples (at least PROFILER_MIN_INTERVAL_MS)
+
+    Returns:
+        SamplingProfiler: The new profile, or None if one is already running
+    """
+    global _profiler
+
+    with _profiler_lock:
+        if _profiler is not None and _profiler.running:
+            return None
+        _profiler = SamplingProfiler(seconds, interval_ms)
+        _profiler.start()
+
+    logger.info(f"Sampling profiler started for {_profiler.seconds}s every {_profiler.interval * 1000:g}ms")
+    return _profiler
+
+
+def stop_profile():
+    """Stop the running profile early."""
+    with _profiler_lock:
+        if _profiler is not None:
+            _profiler.stop()
+
+
+def get_profile() -> Optional[SamplingProfiler]:
+    """The running or most recent profile of this process, if any."""
+    return _profiler
+
+
+def flamegraph_tree(stacks: Dict[str, int], min_fraction: float = 0.001) -> Dict[str, List[Any]]:
+    """
+    Icicle chart nodes for collapsed stacks.
+
+    Every node's value is the samples of its subtree. Nodes with less than
+    min_fraction of all samples are dropped (their samples stay in the
+    parent), so a chart stays responsive however many stacks there are.
+
+    Args:
+        stacks: Collapsed stack to sample count
+        min_fraction: Smallest share of samples shown as its own node
+
+    Returns:
+        dict: "ids", "labels", "parents" and "values" lists (root id "all")
+    """
+    totals: Counter = Counter()
+    for stack, count in stacks.items():
+        prefix = "all"
+        totals[prefix] += count
+        for frame in stack.split(";"):
+            prefix = f"{prefix};{frame}"
+            totals[prefix] += count
+
+    threshold = totals["all"] * min_fraction
+    tree = {"ids": ["all"], "labels": ["all"], "parents": [""], "values": [totals["all"]]}
+    for node, value in totals.items():
+        if node == "all" or value < threshold:
+            continue
+        parent, label = node.rsplit(";", 1)
+        tree["ids"].append(node)
+        tree["labels"].append(label)
+        tree["parents"].append(parent)
+        tree["values"].append(value)
+    return tree
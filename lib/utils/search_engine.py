@@ -2,101 +2,390 @@
 Global Search Engine for Highland Tower Development
 
 Advanced search and filtering across all modules with intelligent suggestions.
+Queries are answered from an inverted index (lib.utils.search_index) with
+BM25 ranking, so search cost does not grow with a full scan of every record.
+The shared engine (get_search_engine) follows model writes and source file
+changes incrementally instead of rebuilding the index, and persists it as a
+memory-mapped segment (lib.utils.search_segments) so new processes start
+searching without re-indexing.
 """
 
 import streamlit as st
 from datetime import datetime
-from typing import Dict, List, Any, Optional
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import os
 import re
+import json
+import time
 import logging
+import threading
+
+from lib.utils.search_index import InvertedIndex
+from lib.utils.search_segments import open_segment_index, segment_path, write_segment
+from lib.utils.search_suggest import SearchSuggester
+
+# Fields the search filters match exactly
+SEARCH_FACETS = ("module", "status")
+
+# Seconds between compactions of the index while it has tombstones
+SEARCH_COMPACT_INTERVAL = int(os.environ.get("SEARCH_COMPACT_INTERVAL", "300"))
+# Seconds after which model tables are re-synced anyway, to pick up writes made by other processes
+SEARCH_RESYNC_INTERVAL = int(os.environ.get("SEARCH_RESYNC_INTERVAL", "120"))
+# Seconds between writes of the index segment (0 disables persistence)
+SEARCH_SEGMENT_INTERVAL = int(os.environ.get("SEARCH_SEGMENT_INTERVAL", "60"))
+# Seconds between rebuilds of the suggestion vocabulary while the index changes
+SEARCH_SUGGEST_INTERVAL = int(os.environ.get("SEARCH_SUGGEST_INTERVAL", "60"))
+
+# Model tables kept in the shared index: table -> (model class in lib.models.all_models, module label)
+SEARCH_MODEL_SOURCES = {
+    "rfis": ("RFIModel", "RFIs"),
+    "submittals": ("SubmittalModel", "Submittals"),
+    "safety_incidents": ("SafetyModel", "Safety"),
+    "inspections": ("InspectionModel", "Inspections"),
+    "documents": ("DocumentModel", "Documents"),
+    "daily_reports": ("DailyReportModel", "Daily Reports"),
+    "contracts": ("ContractModel", "Contracts"),
+    "transmittals": ("TransmittalModel", "Transmittals"),
+    "issues_risks": ("IssueRiskModel", "Issues & Risks"),
+    "quality_control": ("QualityControlModel", "Quality Control"),
+    "schedule_tasks": ("ScheduleModel", "Scheduling"),
+    "subcontractors": ("SubcontractorModel", "Subcontractors"),
+}
 
 class GlobalSearchEngine:
     """Advanced search engine for the Highland Tower Development dashboard."""
     
-    def __init__(self):
+    def __init__(self, model_sources: Optional[Dict[str, tuple]] = None):
         self.logger = logging.getLogger(__name__)
-        self.search_index = {}
+        self.search_index = InvertedIndex(facets=SEARCH_FACETS)
         self.search_history = []
         
+        # Incremental maintenance: which keys each source contributed, and
+        # which sources must be re-read before the next query
+        self.model_sources = dict(model_sources or {})
+        self.file_sources: Dict[str, Dict[str, Any]] = {}
+        self._source_keys: Dict[str, set] = {}
+        self._synced_at: Dict[str, float] = {}
+        self._dirty_sources = set(self.model_sources)
+        self._last_compaction = time.time()
+        self._lock = threading.RLock()
+        self._loading = threading.local()
+        # Per-source refresh locks, and model writes seen per table (to detect writes during a re-read)
+        self._source_locks: Dict[str, threading.Lock] = {}
+        self._write_counts: Dict[str, int] = {}
+        
+        # Persisted segment: file mtimes it was built from, and the index generation written
+        self._segment_reader = None
+        self._segment_mtimes: Dict[str, float] = {}
+        self._persisted_generation = self.search_index.generation
+        
+        # Typo-tolerant completion over the index vocabulary and recent queries
+        self.suggester = SearchSuggester()
+        self._suggest_generation = None
+        self._suggest_built_at = 0.0
+        
     def index_data(self, data: List[Dict[str, Any]]):
-        """Index data for faster searching."""
-        self.search_index = {}
-        
-        for item in data:
-            # Create searchable text from all fields
-            searchable_text = ""
-            for key, value in item.items():
-                if isinstance(value, (str, int, float)):
-                    searchable_text += f" {str(value).lower()}"
+        """Index data for faster searching (only changed records are re-indexed)."""
+        self.sync_source("data", data)
+    
+    def sync_source(self, source: str, records: List[Dict[str, Any]], module: Optional[str] = None,
+                    key_field: str = "id", prepare: Optional[Callable[[Dict], Dict]] = None) -> Dict[str, int]:
+        """
+        Bring the index in line with the current records of one source.
+        
+        Records are compared with their indexed version: unchanged ones are
+        left alone, changed ones are replaced and missing ones tombstoned.
+        
+        Args:
+            source: Source name, used to prefix keys
+            records: Current records of the source
+            module: Module label stored on every record (for filters and grouping)
+            key_field: Field identifying a record within the source
+            prepare: Optional function turning a raw record into the indexed record
             
-            # Store with metadata
-            item_id = item.get("id", f"item_{len(self.search_index)}")
-            self.search_index[item_id] = {
-                "data": item,
-                "searchable_text": searchable_text,
-                "module": item.get("module", "Unknown")
-            }
+        Returns:
+            dict: Counts of added, replaced and removed records
+        """
+        counts = {"added": 0, "replaced": 0, "removed": 0}
+        
+        with self._lock:
+            previous = self._source_keys.get(source, set())
+            current = set()
+            
+            for position, record in enumerate(records):
+                document = prepare(record) if prepare else dict(record)
+                if module:
+                    document["module"] = module
+                key = f"{source}:{record.get(key_field, f'item_{position}')}"
+                current.add(key)
+                
+                existing = self.search_index.get_document(key)
+                if existing == document:
+                    continue
+                self.search_index.add_document(key, document)
+                counts["replaced" if existing is not None else "added"] += 1
+            
+            for key in previous - current:
+                self.search_index.remove_document(key)
+                counts["removed"] += 1
+            
+            self._source_keys[source] = current
+            self._synced_at[source] = time.time()
+            self._dirty_sources.discard(source)
+            self.maybe_compact()
+        
+        return counts
     
-    def search(self, query: str, filters: Dict[str, Any] = None) -> List[Dict[str, Any]]:
-        """Perform intelligent search with filtering."""
-        if not query or not self.search_index:
-            return []
+    def add_file_source(self, source: str, path: str, module: str, key_field: str = "id",
+                        prepare: Optional[Callable[[Dict], Dict]] = None):
+        """
+        Register a JSON file of records; it is re-synced whenever the file changes.
         
-        query_lower = query.lower()
-        results = []
+        Args:
+            source: Source name
+            path: Path of a JSON file holding a list of records
+            module: Module label for its records
+            key_field: Field identifying a record
+            prepare: Optional function turning a raw record into the indexed record
+        """
+        with self._lock:
+            if source not in self.file_sources:
+                self.file_sources[source] = {
+                    "path": path, "module": module, "key_field": key_field,
+                    "prepare": prepare, "mtime": self._segment_mtimes.get(source),
+                }
+    
+    def on_model_write(self, table_name: str, action: str = None, record_id: Any = None, data: Dict = None,
+                       persisted: bool = True):
+        """Write listener: apply a model change to the index without re-reading the table."""
+        if not persisted:
+            # Session-fallback records belong to one user; the index is shared by all
+            return
+        if table_name not in self.model_sources or getattr(self._loading, "active", False):
+            return
         
-        # Search through indexed data
-        for item_id, indexed_item in self.search_index.items():
-            score = self._calculate_relevance_score(query_lower, indexed_item)
+        with self._lock:
+            self._write_counts[table_name] = self._write_counts.get(table_name, 0) + 1
+            if table_name not in self._source_keys:
+                # Not loaded yet; the first query reads the whole table anyway
+                return
             
-            if score > 0:
-                result = indexed_item["data"].copy()
-                result["_search_score"] = score
-                result["_search_highlights"] = self._get_highlights(query_lower, indexed_item)
-                results.append(result)
+            key = f"{table_name}:{record_id}"
+            existing = self.search_index.get_document(key) if record_id is not None else None
+            
+            if action == "delete" and record_id is not None:
+                self.search_index.remove_document(key)
+                self._source_keys[table_name].discard(key)
+            elif action == "update" and existing is not None:
+                self.search_index.add_document(key, {**existing, **(data or {})})
+            elif action == "create" and record_id is not None:
+                record = {"id": record_id, **(data or {}), "module": self.model_sources[table_name][1]}
+                self.search_index.add_document(key, record)
+                self._source_keys[table_name].add(key)
+            else:
+                # Not enough to apply directly (e.g. an id assigned by the database)
+                self._dirty_sources.add(table_name)
+            
+            self.maybe_compact()
+    
+    def refresh(self, sources: Optional[Iterable[str]] = None):
+        """
+        Re-read model tables that are new, dirty or due for a re-sync, and JSON files that changed.
         
-        # Sort by relevance score
-        results.sort(key=lambda x: x["_search_score"], reverse=True)
+        Sources are read outside the engine lock (each under its own lock),
+        so searches and refreshes of other sources are not held up by a slow
+        table.
         
-        # Apply filters if provided
-        if filters:
-            results = self._apply_filters(results, filters)
+        Args:
+            sources: Source names to refresh (default: all)
+        """
+        wanted = set(sources) if sources is not None else None
         
-        # Add to search history
-        self._add_to_history(query)
+        for table in self.model_sources:
+            if wanted is None or table in wanted:
+                self._refresh_source(table, self._load_table)
         
-        return results[:50]  # Return top 50 results
+        for source in list(self.file_sources):
+            if wanted is None or source in wanted:
+                self._refresh_source(source, self._load_file)
     
-    def _calculate_relevance_score(self, query: str, indexed_item: Dict[str, Any]) -> int:
-        """Calculate relevance score for search results."""
-        searchable_text = indexed_item["searchable_text"]
-        score = 0
+    def _is_stale(self, source: str) -> bool:
+        if source in self.model_sources:
+            return (source in self._dirty_sources
+                    or time.time() - self._synced_at.get(source, 0) >= SEARCH_RESYNC_INTERVAL)
+        spec = self.file_sources[source]
+        try:
+            mtime = os.path.getmtime(spec["path"])
+        except OSError:
+            mtime = None
+        return mtime != spec["mtime"]
+    
+    def _refresh_source(self, source: str, load: Callable[[str], Optional[tuple]]):
+        with self._lock:
+            source_lock = self._source_locks.setdefault(source, threading.Lock())
+        
+        with source_lock:
+            # Another thread may have refreshed the source while this one waited
+            if not self._is_stale(source):
+                return
+            writes = self._write_counts.get(source, 0)
+            loaded = load(source)
+            if loaded is None:
+                return
+            records, options = loaded
+            
+            with self._lock:
+                self.sync_source(source, records, **options)
+                if self._write_counts.get(source, 0) != writes:
+                    # Written while being read: the records may predate the write
+                    self._dirty_sources.add(source)
+    
+    def _load_table(self, table: str) -> Optional[tuple]:
+        model_name, module = self.model_sources[table]
+        self._loading.active = True
+        try:
+            from lib.models import all_models
+            records = getattr(all_models, model_name)().get_all_shared()
+        except Exception as e:
+            self.logger.error(f"Error loading {table} for search: {str(e)}")
+            return None
+        finally:
+            self._loading.active = False
+        return records, {"module": module}
+    
+    def _load_file(self, source: str) -> Optional[tuple]:
+        spec = self.file_sources[source]
+        try:
+            mtime = os.path.getmtime(spec["path"])
+        except OSError:
+            mtime = None
         
-        # Exact phrase match (highest score)
-        if query in searchable_text:
-            score += 100
+        records = []
+        if mtime is not None:
+            try:
+                with open(spec["path"], "r") as f:
+                    records = json.load(f)
+            except Exception as e:
+                self.logger.error(f"Error loading {spec['path']} for search: {str(e)}")
+                return None
+        spec["mtime"] = mtime
+        return records, {"module": spec["module"], "key_field": spec["key_field"], "prepare": spec["prepare"]}
+    
+    def maybe_compact(self) -> bool:
+        """Compact the index when tombstones pile up or the compaction interval has passed."""
+        with self._lock:
+            index = self.search_index
+            due = index.tombstone_count and time.time() - self._last_compaction >= SEARCH_COMPACT_INTERVAL
+            if not (due or index.needs_compaction()):
+                return False
+            result = index.compact()
+            self._last_compaction = time.time()
+            self.logger.info(f"Search index compacted: {result}")
+            return True
+    
+    def load_segment(self, path: str) -> bool:
+        """
+        Replace the index with a persisted segment.
         
-        # Individual word matches
-        query_words = query.split()
-        for word in query_words:
-            if word in searchable_text:
-                score += 10
-                
-                # Bonus for matches in important fields
-                data = indexed_item["data"]
-                if word in str(data.get("title", "")).lower():
-                    score += 20
-                if word in str(data.get("id", "")).lower():
-                    score += 15
-                if word in str(data.get("status", "")).lower():
-                    score += 10
-        
-        return score
-    
-    def _get_highlights(self, query: str, indexed_item: Dict[str, Any]) -> List[str]:
+        Sources are treated as synced as of the segment's write, so only those
+        due for a re-sync (or whose files changed since) are read again.
+        
+        Args:
+            path: Segment file path
+            
+        Returns:
+            bool: True if the segment was loaded
+        """
+        if not os.path.exists(path):
+            return False
+        
+        try:
+            index, reader = open_segment_index(path, facets=SEARCH_FACETS)
+        except Exception as e:
+            self.logger.error(f"Error loading search segment {path}: {str(e)}")
+            return False
+        
+        with self._lock:
+            meta = reader.meta
+            source_keys: Dict[str, set] = {source: set() for source in meta.get("synced_at", {})}
+            for key in index.keys():
+                source_keys.setdefault(key.split(":", 1)[0], set()).add(key)
+            
+            self.search_index = index
+            self._segment_reader = reader
+            self._source_keys = source_keys
+            self._synced_at = dict(meta.get("synced_at", {}))
+            self._dirty_sources -= set(self._synced_at)
+            self._segment_mtimes = dict(meta.get("file_mtimes", {}))
+            for source, spec in self.file_sources.items():
+                spec["mtime"] = self._segment_mtimes.get(source)
+            self._persisted_generation = index.generation
+        
+        self.logger.info(f"Search segment loaded: {len(index)} documents from {path}")
+        return True
+    
+    def persist(self, path: str) -> bool:
+        """
+        Write the index to a segment file if it changed since the last write.
+        
+        Args:
+            path: Segment file path
+            
+        Returns:
+            bool: True if a segment was written
+        """
+        with self._lock:
+            index = self.search_index
+            if index.generation == self._persisted_generation or not self._synced_at:
+                return False
+            
+            meta = {
+                "synced_at": dict(self._synced_at),
+                "file_mtimes": {source: spec["mtime"] for source, spec in self.file_sources.items()},
+            }
+            try:
+                stats = write_segment(index, path, meta)
+            except Exception as e:
+                self.logger.error(f"Error writing search segment {path}: {str(e)}")
+                return False
+            self._persisted_generation = index.generation
+        
+        self.logger.info(f"Search segment written: {stats}")
+        return True
+    
+    def search(self, query: str, filters: Dict[str, Any] = None, limit: int = 50,
+               track_history: bool = True, sources: Optional[Iterable[str]] = None) -> List[Dict[str, Any]]:
+        """Perform ranked search (BM25 over the inverted index) with filtering (refreshing only `sources`, if given)."""
+        if not query:
+            return []
+        
+        self.refresh(sources)
+        if not len(self.search_index):
+            return []
+        
+        query_lower = query.lower()
+        results = []
+        facet_filters = {
+            field: value for field, value in (filters or {}).items()
+            if field in SEARCH_FACETS and value
+        }
+        
+        # Filters are applied during retrieval; only the top results are copied and highlighted
+        for _, score, item in self.search_index.search(query, k=limit, filters=facet_filters):
+            result = item.copy()
+            result["_search_score"] = round(score, 4)
+            result["_search_highlights"] = self._get_highlights(query_lower, item)
+            results.append(result)
+        
+        # Add to search history
+        if track_history:
+            self._add_to_history(query)
+        
+        return results
+    
+    def _get_highlights(self, query: str, data: Dict[str, Any]) -> List[str]:
         """Get highlighted text snippets for search results."""
         highlights = []
-        data = indexed_item["data"]
         
         # Check important fields for highlights
         important_fields = ["title", "description", "id", "status"]
@@ -140,7 +429,7 @@ class GlobalSearchEngine:
         return filtered_results
     
     def _add_to_history(self, query: str):
-        """Add search query to history."""
+        """Add search query to this session's history."""
         if "search_history" not in st.session_state:
             st.session_state.search_history = []
         
@@ -155,42 +444,78 @@ class GlobalSearchEngine:
         st.session_state.search_history = st.session_state.search_history[:20]
     
     def get_search_suggestions(self, partial_query: str) -> List[str]:
-        """Get search suggestions based on partial query."""
+        """Get search suggestions (recent queries, term completions and typo corrections)."""
         if not partial_query or len(partial_query) < 2:
             return []
         
-        suggestions = []
+        # The vocabulary follows the index, rebuilt at most every SEARCH_SUGGEST_INTERVAL seconds
+        generation = self.search_index.generation
+        if generation != self._suggest_generation and (
+            self._suggest_generation is None or time.time() - self._suggest_built_at >= SEARCH_SUGGEST_INTERVAL
+        ):
+            self.suggester.rebuild(self.search_index.doc_frequencies())
+            self._suggest_generation = generation
+            self._suggest_built_at = time.time()
         
-        # Get suggestions from search history
         history = st.session_state.get("search_history", [])
-        for query in history:
-            if partial_query.lower() in query.lower():
-                suggestions.append(query)
-        
-        # Get suggestions from indexed data
-        common_terms = set()
-        for indexed_item in self.search_index.values():
-            data = indexed_item["data"]
-            for field in ["title", "id", "status"]:
-                if field in data:
-                    text = str(data[field]).lower()
-                    if partial_query.lower() in text:
-                        common_terms.add(data[field])
-        
-        suggestions.extend(list(common_terms))
-        
-        # Remove duplicates and limit
-        unique_suggestions = list(dict.fromkeys(suggestions))
-        return unique_suggestions[:10]
+        return self.suggester.suggest(partial_query, limit=10, history=history)
     
     def get_popular_searches(self) -> List[str]:
-        """Get popular search terms."""
-        # This would be enhanced with actual usage analytics
-        return [
+        """Get popular search terms (this session's recent queries first, then common ones)."""
+        defaults = [
             "RFI status",
             "submittal approval",
             "safety inspection",
             "schedule delay",
             "Highland Tower progress",
             "transmittal pending"
-        ]
\ No newline at end of file
+        ]
+        recent = st.session_state.get("search_history", [])
+        unique = {}
+        for query in list(recent) + defaults:
+            unique.setdefault(query.lower(), query)
+        return list(unique.values())[:len(defaults)]
+
+
+_engine: Optional[GlobalSearchEngine] = None
+_engine_lock = threading.Lock()
+
+
+def _persist_loop(engine: GlobalSearchEngine, path: str):
+    while True:
+        time.sleep(SEARCH_SEGMENT_INTERVAL)
+        try:
+            engine.refresh()
+            engine.persist(path)
+        except Exception as e:
+            engine.logger.error(f"Error persisting search index: {str(e)}")
+
+
+def get_search_engine() -> GlobalSearchEngine:
+    """
+    Get the process-wide search engine.
+
+    The engine starts from the persisted segment when there is one, indexes
+    the model tables in SEARCH_MODEL_SOURCES on first query and subscribes
+    to model writes to keep them current. A background thread keeps the
+    index fresh and writes it back every SEARCH_SEGMENT_INTERVAL seconds.
+
+    Returns:
+        GlobalSearchEngine: Shared engine instance
+    """
+    global _engine
+    if _engine is None:
+        with _engine_lock:
+            if _engine is None:
+                from lib.models.base_model import register_write_listener
+
+                engine = GlobalSearchEngine(model_sources=SEARCH_MODEL_SOURCES)
+                if SEARCH_SEGMENT_INTERVAL > 0:
+                    path = segment_path()
+                    engine.load_segment(path)
+                    threading.Thread(
+                        target=_persist_loop, args=(engine, path), name="search-persist", daemon=True
+                    ).start()
+                register_write_listener(engine.on_model_write)
+                _engine = engine
+    return _engine
@@ -0,0 +1,612 @@
+"""
+Search Index for gcPanel.
+
+This module provides the inverted index behind global search:
+- Tokenization tuned for construction data (document numbers such as
+  "HT-2024-001", CSI MasterFormat codes such as "03 30 00", dates)
+- Postings lists per term with BM25F scoring and per-field boosts
+- Quantized, impact-ordered postings so top-k retrieval only scores the
+  postings that can still reach the top k, keeping results in a bounded heap
+"""
+
+import re
+import sys
+import math
+import heapq
+import logging
+import threading
+from array import array
+from bisect import bisect_left, insort
+from itertools import chain, combinations, repeat
+from operator import add, mul, neg
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# BM25 parameters
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# Field weights; fields not listed get DEFAULT_FIELD_BOOST
+FIELD_BOOSTS = {
+    "id": 3.0,
+    "number": 3.0,
+    "rfi_number": 3.0,
+    "title": 2.5,
+    "name": 2.0,
+    "subject": 2.0,
+    "status": 1.5,
+    "trade": 1.2,
+    "description": 1.0,
+}
+DEFAULT_FIELD_BOOST = 1.0
+
+# Term weights are stored as integers 1..IMPACT_LEVELS (compact, exact enough to rank)
+IMPACT_LEVELS = 255
+
+# Postings scored between two checks of the top-k cut-off
+SEARCH_BLOCK_SIZE = 64
+# Largest number of term subsets intersected for a minimum-match query
+MAX_MATCH_COMBINATIONS = 10
+
+# Compaction: purge tombstones once they make up this share of the postings'
+# documents, and recompute weights once the live document count has drifted
+# this far from the count the weights were computed with
+COMPACT_TOMBSTONE_RATIO = 0.1
+REWEIGHT_DRIFT_RATIO = 0.2
+
+STOPWORDS = frozenset({
+    "a", "an", "and", "are", "as", "at", "be", "by", "for", "from", "in",
+    "is", "it", "of", "on", "or", "the", "to", "with",
+})
+
+# Words, numbers and hyphen/slash/dot-joined identifiers ("ht-2024-001", "s-301", "v1.2")
+_TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-/.][a-z0-9]+)*")
+_COMPOUND_SPLIT_RE = re.compile(r"[-/.]")
+# CSI MasterFormat section numbers written "03 30 00", "03-30-00" or "033000"
+_CSI_RE = re.compile(r"(?<!\d)(\d{2})[ .\-]?(\d{2})[ .\-]?(\d{2})(?!\d)")
+
+
+def tokenize(text: Any) -> List[str]:
+    """
+    Split text into normalized search terms.
+
+    Identifiers are indexed whole and by their parts, so "HT-2024-001"
+    matches queries for "ht-2024-001", "2024" or "001". CSI codes are also
+    indexed in compact form, so "03 30 00" and "033000" match each other.
+
+    Args:
+        text: Text (or any value) to tokenize
+
+    Returns:
+        list: Terms in order of appearance (duplicates kept for term frequency)
+    """
+    if text is None:
+        return []
+
+    text = str(text).lower()
+    tokens = []
+
+    for match in _TOKEN_RE.finditer(text):
+        token = match.group()
+        if not token.isalnum():
+            tokens.append(token)
+            tokens.extend(part for part in _COMPOUND_SPLIT_RE.split(token) if part)
+        elif token not in STOPWORDS:
+            tokens.append(token)
+
+    for match in _CSI_RE.finditer(text):
+        compact = "".join(match.groups())
+        if compact != match.group():
+            tokens.append(compact)
+
+    return tokens
+
+
+def field_boost(field: str) -> float:
+    """Boost applied to matches in a field."""
+    return FIELD_BOOSTS.get(field, DEFAULT_FIELD_BOOST)
+
+
+def searchable_fields(record: Dict[str, Any]) -> Dict[str, str]:
+    """Fields of a record that are indexed (scalar values only)."""
+    return {
+        field: str(value)
+        for field, value in record.items()
+        if isinstance(value, (str, int, float)) and not isinstance(value, bool) and not field.startswith("_")
+    }
+
+
+class InvertedIndex:
+    """
+    In-memory inverted index with BM25F ranking.
+
+    Each posting stores the document's precomputed term weight (the
+    saturated, length-normalized, boosted term frequency, quantized to
+    IMPACT_LEVELS), so a query score is a sum of idf * weight. Each term also
+    keeps its document ids in descending weight order, which lets search()
+    skip the postings that cannot reach the top k.
+
+    Updates are incremental: removing a document only tombstones it (its
+    postings stay in place and are skipped by search), replacing one
+    tombstones the old version and adds the new one under a fresh internal
+    id. compact() purges tombstoned postings and, when the collection has
+    changed enough, recomputes every weight.
+    """
+
+    def __init__(self, k1: float = BM25_K1, b: float = BM25_B, facets: Iterable[str] = ()):
+        self.k1 = k1
+        self.b = b
+        self.facets = tuple(facets)
+        self._lock = threading.RLock()
+
+        # term -> {doc_id: quantized weight}
+        self._postings: Dict[str, Dict[int, int]] = {}
+        # term -> doc ids by descending weight, then ascending id (built lazily, kept sorted on insert)
+        self._impacts: Dict[str, array] = {}
+
+        self._docs: Dict[int, Dict[str, Any]] = {}
+        self._doc_keys: Dict[int, str] = {}
+        self._key_to_doc: Dict[str, int] = {}
+        # doc_id -> indexed terms and field lengths, needed to remove a document
+        self._doc_terms: Dict[int, Tuple[str, ...]] = {}
+        self._doc_lengths: Dict[int, Dict[str, int]] = {}
+        self._field_totals: Dict[str, int] = {}
+        # Exact-match filter fields: field -> value -> doc ids
+        self._facets: Dict[str, Dict[Any, set]] = {field: {} for field in self.facets}
+        # Removed documents whose postings have not been purged yet
+        self._tombstones: set = set()
+
+        self._next_doc_id = 0
+        self._weighted_doc_count = 0
+        # Bumped on every change, so callers can key caches on index contents
+        self.generation = 0
+
+    # -- properties --------------------------------------------------------
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._key_to_doc
+
+    @property
+    def term_count(self) -> int:
+        return len(self._postings)
+
+    @property
+    def tombstone_count(self) -> int:
+        return len(self._tombstones)
+
+    # -- indexing ----------------------------------------------------------
+
+    @staticmethod
+    def _analyze(record: Dict[str, Any]):
+        """Term frequencies per field and field lengths for a record."""
+        term_fields: Dict[str, Dict[str, int]] = {}
+        lengths: Dict[str, int] = {}
+
+        for field, text in searchable_fields(record).items():
+            tokens = tokenize(text)
+            if not tokens:
+                continue
+            lengths[field] = len(tokens)
+            for token in tokens:
+                fields = term_fields.setdefault(token, {})
+                fields[field] = fields.get(field, 0) + 1
+
+        return term_fields, lengths
+
+    def _field_norms(self) -> Dict[str, Tuple[float, float]]:
+        """Per-field (boost, b / average length) from the current statistics."""
+        doc_count = max(len(self._docs), 1)
+        return {
+            field: (field_boost(field), self.b / ((total / doc_count) or 1.0))
+            for field, total in self._field_totals.items()
+        }
+
+    def _weights(self, term_fields: Dict[str, Dict[str, int]], lengths: Dict[str, int],
+                 norms: Dict[str, Tuple[float, float]]) -> Dict[str, int]:
+        """Quantized BM25F term weights for one document."""
+        field_factors = {}
+        for field, length in lengths.items():
+            boost, b_per_avg = norms.get(field, (field_boost(field), self.b))
+            field_factors[field] = boost / (1 - self.b + b_per_avg * length)
+
+        weights = {}
+        for term, field_tfs in term_fields.items():
+            pseudo_tf = 0.0
+            for field, tf in field_tfs.items():
+                pseudo_tf += tf * field_factors[field]
+            weights[term] = max(1, round(IMPACT_LEVELS * pseudo_tf / (self.k1 + pseudo_tf)))
+        return weights
+
+    def _store(self, key: str, record: Dict[str, Any],
+               term_fields: Dict[str, Dict[str, int]], lengths: Dict[str, int]) -> int:
+        """Register a document and its statistics; postings are written by the caller."""
+        doc_id = self._next_doc_id
+        self._next_doc_id += 1
+
+        self._docs[doc_id] = record
+        self._doc_keys[doc_id] = key
+        self._key_to_doc[key] = doc_id
+        self._doc_terms[doc_id] = tuple(sys.intern(term) for term in term_fields)
+        self._doc_lengths[doc_id] = lengths
+        for field, length in lengths.items():
+            self._field_totals[field] = self._field_totals.get(field, 0) + length
+        for field, values in self._facets.items():
+            values.setdefault(record.get(field), set()).add(doc_id)
+
+        return doc_id
+
+    def add_document(self, key: str, record: Dict[str, Any]) -> int:
+        """
+        Add or replace a document.
+
+        The document is weighted against the current field averages;
+        reweight() brings every posting back in line after heavy churn.
+
+        Args:
+            key: Stable external key (e.g. "rfis:12")
+            record: Record to index and return from searches
+
+        Returns:
+            int: Internal document id
+        """
+        with self._lock:
+            if key in self._key_to_doc:
+                self.remove_document(key)
+
+            term_fields, lengths = self._analyze(record)
+            doc_id = self._store(key, record, term_fields, lengths)
+
+            for term, weight in self._weights(term_fields, lengths, self._field_norms()).items():
+                postings = self._postings.setdefault(sys.intern(term), {})
+                postings[doc_id] = weight
+                impacts = self._impacts.get(term)
+                if impacts is not None:
+                    insort(impacts, doc_id, key=lambda d: (-postings[d], d))
+
+            self.generation += 1
+            return doc_id
+
+    def remove_document(self, key: str) -> bool:
+        """
+        Remove a document by tombstoning it.
+
+        Its postings are skipped by search() from now on and purged by the
+        next compact().
+
+        Returns:
+            bool: True if the key was indexed
+        """
+        with self._lock:
+            doc_id = self._key_to_doc.pop(key, None)
+            if doc_id is None:
+                return False
+
+            self._tombstones.add(doc_id)
+            for field, length in self._doc_lengths.pop(doc_id, {}).items():
+                self._field_totals[field] -= length
+            record = self._docs.pop(doc_id)
+            for field, values in self._facets.items():
+                values.get(record.get(field), set()).discard(doc_id)
+            self._doc_keys.pop(doc_id, None)
+
+            self.generation += 1
+            return True
+
+    def needs_compaction(self) -> bool:
+        """Whether enough has changed since the last compaction to run one."""
+        live = len(self._docs)
+        if self._tombstones and len(self._tombstones) >= COMPACT_TOMBSTONE_RATIO * max(live, 1):
+            return True
+        return abs(live - self._weighted_doc_count) > REWEIGHT_DRIFT_RATIO * max(self._weighted_doc_count, 1)
+
+    def compact(self) -> Dict[str, int]:
+        """
+        Purge tombstoned postings, and recompute weights if the collection drifted.
+
+        Returns:
+            dict: Number of purged documents and whether weights were recomputed
+        """
+        with self._lock:
+            purged = len(self._tombstones)
+            for doc_id in self._tombstones:
+                for term in self._doc_terms.pop(doc_id, ()):
+                    postings = self._postings.get(term)
+                    if postings is None or doc_id not in postings:
+                        continue
+                    impacts = self._impacts.get(term)
+                    if impacts is not None:
+                        position = bisect_left(impacts, (-postings[doc_id], doc_id), key=lambda d: (-postings[d], d))
+                        del impacts[position]
+                    del postings[doc_id]
+                    if not postings:
+                        del self._postings[term]
+                        self._impacts.pop(term, None)
+            self._tombstones = set()
+
+            live = len(self._docs)
+            reweighted = abs(live - self._weighted_doc_count) > REWEIGHT_DRIFT_RATIO * max(self._weighted_doc_count, 1)
+            if reweighted:
+                self.reweight()
+
+            self.generation += 1
+            return {"purged": purged, "reweighted": int(reweighted)}
+
+    def build(self, documents: Iterable[Tuple[str, Dict[str, Any]]]):
+        """
+        Replace the index contents with a batch of documents.
+
+        Field averages are computed over the whole batch before any weight
+        is assigned, so bulk builds get exact BM25 statistics.
+
+        Args:
+            documents: (key, record) pairs
+        """
+        with self._lock:
+            self.__init__(self.k1, self.b, self.facets)
+
+            for key, record in documents:
+                if key in self._key_to_doc:
+                    self.remove_document(key)
+                term_fields, lengths = self._analyze(record)
+                self._store(key, record, term_fields, lengths)
+
+            self.reweight()
+
+    def reweight(self):
+        """Recompute every posting weight from the current field averages and re-sort postings."""
+        with self._lock:
+            norms = self._field_norms()
+            self._postings = {}
+            for doc_id, record in self._docs.items():
+                # Re-analyzed rather than kept: per-field frequencies would dominate memory
+                term_fields, _ = self._analyze(record)
+                self._doc_terms[doc_id] = tuple(sys.intern(term) for term in term_fields)
+                for term, weight in self._weights(term_fields, self._doc_lengths[doc_id], norms).items():
+                    self._postings.setdefault(sys.intern(term), {})[doc_id] = weight
+
+            for doc_id in self._tombstones:
+                self._doc_terms.pop(doc_id, None)
+            self._tombstones = set()
+            self._impacts = {}
+            self._weighted_doc_count = len(self._docs)
+            self.generation += 1
+
+    # -- querying ----------------------------------------------------------
+
+    def idf(self, term: str) -> float:
+        """Inverse document frequency of a term (BM25 form, always positive)."""
+        doc_freq = len(self._postings.get(term, ()))
+        # Tombstoned documents still hold postings until compaction, so count them on both sides
+        doc_count = len(self._docs) + len(self._tombstones)
+        return math.log(1 + (doc_count - doc_freq + 0.5) / (doc_freq + 0.5))
+
+    def _impact_list(self, term: str) -> array:
+        impacts = self._impacts.get(term)
+        if impacts is None:
+            postings = self._postings[term]
+            impacts = array("q", sorted(postings, key=lambda d: (-postings[d], d)))
+            self._impacts[term] = impacts
+        return impacts
+
+    def search(self, query: str, k: int = 50,
+               predicate: Optional[Callable[[Dict[str, Any]], bool]] = None,
+               filters: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float, Dict[str, Any]]]:
+        """
+        Return the k best matching documents.
+
+        Retrieval walks impact-ordered postings (highest weight first) in
+        small blocks, keeping the best k scores in a heap. The k-th best
+        score, theta, bounds which unseen documents can still enter the top k.
+        An unseen document contributes at most each list's weight at the
+        current position, and:
+        - a term is *required* when the other terms' remaining maxima cannot
+          reach theta without it; then only its postings above
+          ``theta - (other maxima)`` need scoring
+        - otherwise theta is split across the terms in proportion to their
+          remaining maxima, and a document can only qualify if it beats its
+          share on at least one term
+        Whichever condition leaves the fewest postings to read is followed,
+        and the walk stops once it is satisfied. When several terms are
+        required at once, the remaining candidates are the intersection of
+        their postings, which is scored directly; likewise when theta rules
+        out documents matching fewer than n of the terms, the documents
+        matching at least n are found by intersecting term subsets. Results
+        are exact up to the order of documents tied at the cut-off.
+
+        Args:
+            query: Free-text query
+            k: Number of results
+            predicate: Optional filter on the stored record
+            filters: Exact values for facet fields (cheaper than a predicate,
+                since they also narrow the candidate intersections)
+
+        Returns:
+            list: (key, score, record) tuples, best first
+        """
+        with self._lock:
+            terms = [term for term in dict.fromkeys(tokenize(query)) if term in self._postings]
+            # An identifier found whole ("ht-2024-001") is matched as such, not by its parts,
+            # unless a part was also typed on its own ("ht-2024-001 2024")
+            typed = {match.group() for match in _TOKEN_RE.finditer(str(query).lower())}
+            parts = {
+                part for term in terms if _COMPOUND_SPLIT_RE.search(term)
+                for part in _COMPOUND_SPLIT_RE.split(term)
+            } - typed
+            terms = [term for term in terms if term not in parts]
+            if not terms or k <= 0:
+                return []
+
+            allowed = None
+            for field, value in (filters or {}).items():
+                if field not in self._facets:
+                    raise ValueError(f"{field} is not a facet of this index")
+                matching = self._facets[field].get(value, set())
+                allowed = matching if allowed is None else allowed & matching
+            if allowed is not None and not allowed:
+                return []
+
+            idfs = [self.idf(term) for term in terms]
+            lists = [self._impact_list(term) for term in terms]
+            postings = [self._postings[term] for term in terms]
+            docs = self._docs
+            # Tombstoned documents count as already scored, so they are never returned
+            scored = set(self._tombstones)
+            heap: List[Tuple[float, int]] = []
+            positions = [0] * len(terms)
+
+            def score_docs(doc_ids: Iterable[int]):
+                fresh = [doc_id for doc_id in doc_ids if doc_id not in scored]
+                scored.update(fresh)
+                if allowed is not None:
+                    fresh = [doc_id for doc_id in fresh if doc_id in allowed]
+                if predicate is not None:
+                    fresh = [doc_id for doc_id in fresh if predicate(docs[doc_id])]
+                if not fresh:
+                    return
+                # Column-wise scoring keeps the per-document work in C
+                scores = [0.0] * len(fresh)
+                for idf, term_postings in zip(idfs, postings):
+                    weights = map(term_postings.get, fresh, repeat(0))
+                    scores = list(map(add, scores, map(mul, repeat(idf), weights)))
+                heap[:] = heapq.nlargest(k, chain(heap, zip(scores, map(neg, fresh))))
+                heapq.heapify(heap)
+
+            def score_block(index: int):
+                impacts = lists[index]
+                start = positions[index]
+                positions[index] = min(start + SEARCH_BLOCK_SIZE, len(impacts))
+                score_docs(impacts[start:positions[index]])
+
+            def cut(index: int, min_contribution: float) -> int:
+                # Number of postings whose contribution exceeds min_contribution
+                if min_contribution <= 0.0:
+                    return len(lists[index])
+                term_postings = postings[index]
+                return bisect_left(lists[index], (-min_contribution / idfs[index], -math.inf),
+                                   key=lambda doc_id: (-term_postings[doc_id], doc_id))
+
+            while True:
+                theta = heap[0][0] if len(heap) == k else 0.0
+                # Every posting before a list's position has been scored, so an
+                # unseen document contributes at most the weight at the position
+                bounds = [
+                    idf * term_postings[impacts[position]] if position < len(impacts) else 0.0
+                    for idf, impacts, term_postings, position in zip(idfs, lists, postings, positions)
+                ]
+                total_bound = sum(bounds)
+                if total_bound <= theta:
+                    break
+
+                # Pigeonhole condition: postings above each term's share of theta
+                shares = [
+                    max(0, cut(i, theta * bound / total_bound) - positions[i])
+                    for i, bound in enumerate(bounds)
+                ]
+                best_remaining = sum(shares)
+                walk = [i for i, remaining in enumerate(shares) if remaining]
+
+                # Required-term condition: one term's postings above what the others cannot cover
+                required = {}
+                for i, bound in enumerate(bounds):
+                    floor = theta - (total_bound - bound)
+                    if floor > 0.0:
+                        required[i] = remaining = max(0, cut(i, floor) - positions[i])
+                        if remaining < best_remaining:
+                            best_remaining = remaining
+                            walk = [i] if remaining else []
+
+                if walk and len(required) > 1:
+                    # Remaining candidates contain every required term, within the
+                    # shortest required prefix: intersect and finish
+                    base = min(required, key=required.get)
+                    candidates = set(lists[base][positions[base]:positions[base] + required[base]])
+                    for i in required:
+                        if i != base:
+                            candidates = postings[i].keys() & candidates
+                    if allowed is not None:
+                        candidates &= allowed
+                    score_docs(candidates - scored)
+                    break
+
+                if walk and len(terms) > 3:
+                    # Fewer than min_match terms cannot reach theta: score documents matching enough terms
+                    ranked_bounds = sorted(bounds, reverse=True)
+                    min_match = next(
+                        (n for n in range(1, len(terms) + 1) if sum(ranked_bounds[:n]) > theta),
+                        len(terms),
+                    )
+                    # Pairs alone match too many documents to be worth intersecting
+                    if min_match > 2 and math.comb(len(terms), min_match) <= MAX_MATCH_COMBINATIONS:
+                        candidates = set()
+                        for combination in combinations(postings, min_match):
+                            candidates |= self._intersect(combination)
+                        score_docs((candidates & allowed if allowed is not None else candidates) - scored)
+                        break
+
+                if not walk:
+                    break
+                for i in walk:
+                    score_block(i)
+
+            ranked = sorted(heap, reverse=True)
+            return [
+                (self._doc_keys[-neg_doc_id], score / IMPACT_LEVELS, docs[-neg_doc_id])
+                for score, neg_doc_id in ranked
+            ]
+
+    @staticmethod
+    def _intersect(postings: Iterable[Dict[int, int]]) -> set:
+        """Document ids present in all the given postings (smallest first, at C speed)."""
+        ordered = sorted(postings, key=len)
+        common = ordered[0].keys() & ordered[1].keys()
+        for term_postings in ordered[2:]:
+            common &= term_postings.keys()
+        return common
+
+    def get_document(self, key: str) -> Optional[Dict[str, Any]]:
+        """Get an indexed record by key."""
+        doc_id = self._key_to_doc.get(key)
+        return self._docs.get(doc_id) if doc_id is not None else None
+
+    def documents(self) -> Iterable[Tuple[str, Dict[str, Any]]]:
+        """Iterate over (key, record) pairs."""
+        with self._lock:
+            items = [(self._doc_keys[doc_id], record) for doc_id, record in self._docs.items()]
+        return items
+
+    def keys(self) -> List[str]:
+        """All indexed document keys."""
+        with self._lock:
+            return list(self._key_to_doc)
+
+    def terms(self) -> List[str]:
+        """All indexed terms."""
+        with self._lock:
+            return list(self._postings)
+
+    def doc_frequencies(self) -> Dict[str, int]:
+        """Number of documents holding each term (tombstoned ones included until compaction)."""
+        with self._lock:
+            # Segment-backed postings (lib.utils.search_segments) count without decoding
+            frequencies = getattr(self._postings, "doc_frequencies", None)
+            if frequencies:
+                return frequencies()
+            return {term: len(postings) for term, postings in self._postings.items()}
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get index statistics."""
+        with self._lock:
+            # Segment-backed postings (lib.utils.search_segments) count without decoding
+            total_postings = getattr(self._postings, "total_postings", None)
+            return {
+                "documents": len(self._docs),
+                "terms": len(self._postings),
+                "postings": total_postings() if total_postings else sum(map(len, self._postings.values())),
+                "tombstones": len(self._tombstones),
+                "generation": self.generation,
+            }
@@ -8,18 +8,19 @@ Features:
 - Global search across multiple data sources
 - Advanced filtering with multiple criteria
 - Context-sensitive search suggestions
-- Search result caching for performance
+- Incrementally maintained search index (lib.utils.search_engine)
+- Concurrent per-module search with deadlines (lib.utils.federated_search)
 """
 
 import streamlit as st
-import json
-import os
 import re
+import threading
 from datetime import datetime
 import pandas as pd
 from typing import List, Dict, Any, Callable, Optional, Union
 
-from utils.cache_manager import CacheManager, cached
+from lib.utils.federated_search import FederatedSearch
+from lib.utils.search_index import tokenize
 
 class SearchManager:
     """
@@ -86,11 +87,83 @@ class SearchManager:
             }
     
     @staticmethod
-    @cached(ttl_seconds=300)  # Cache search results for 5 minutes
+    def _get_search_engine():
+        """Get the shared search engine with the cost management and document files registered."""
+        from lib.utils.search_engine import get_search_engine
+        
+        engine = get_search_engine()
+        for source, module, path, key_field, fields, _ in SEARCH_SOURCES.values():
+            if path is None:
+                # Model table, indexed by the engine itself
+                continue
+            engine.add_file_source(
+                source, path, module, key_field=key_field,
+                prepare=lambda record, fields=fields: SearchManager._prepare_record(record, fields)
+            )
+        return engine
+    
+    @staticmethod
+    def _prepare_record(record: Dict[str, Any], fields: List[str]) -> Dict[str, Any]:
+        """Build the indexed form of a record: its searchable fields plus nested text."""
+        document = {}
+        for field in fields:
+            value = record.get(field)
+            if isinstance(value, list):
+                # Tags and line items: index the text of each entry
+                value = " ".join(
+                    str(item.get("description") or item.get("title") or "") if isinstance(item, dict) else str(item)
+                    for item in value
+                )
+            if value not in (None, ""):
+                document[field] = value
+        document["status"] = record.get("status", "Unknown")
+        # Kept for formatting results; underscore fields are not indexed
+        document["_record"] = record
+        return document
+    
+    @staticmethod
+    def _get_federated_search() -> FederatedSearch:
+        """Get the federated search with one source per result group in SEARCH_SOURCES."""
+        global _federated_search
+        if _federated_search is None:
+            with _federated_lock:
+                if _federated_search is None:
+                    engine = SearchManager._get_search_engine()
+                    federated = FederatedSearch()
+                    for label, (source, module, _, _, fields, formatter) in SEARCH_SOURCES.items():
+                        federated.register(
+                            label, SearchManager._source_search(engine, source, module, fields, formatter)
+                        )
+                    _federated_search = federated
+        return _federated_search
+    
+    @staticmethod
+    def _source_search(engine, source: str, module: str, fields: List[str],
+                       formatter: Callable[[Dict[str, Any]], Dict[str, Any]]) -> Callable:
+        """Build the search function of one result group (refreshes only its own source)."""
+        def search(query: str, limit: int) -> List[tuple]:
+            query_terms = set(tokenize(query))
+            hits = []
+            for hit in engine.search(query, filters={"module": module}, limit=limit,
+                                     track_history=False, sources=[source]):
+                result = formatter(hit.get("_record", hit))
+                result["matches"] = [
+                    field for field in fields
+                    if field in hit and query_terms & set(tokenize(hit[field]))
+                ]
+                hits.append((hit["_search_score"], result))
+            return hits
+        return search
+    
+    @staticmethod
     def perform_global_search(query: str) -> Dict[str, Any]:
         """
         Perform a global search across all modules.
         
+        Modules are searched concurrently, each refreshing only its own
+        source; a module that misses its deadline is left out and listed in
+        st.session_state.search_incomplete. Scores are normalized per module.
+        
         Args:
             query (str): The search query string
             
@@ -99,310 +172,128 @@ class SearchManager:
         """
         results = {}
         
-        # Clean and prepare search terms
-        search_terms = [term.lower() for term in query.split() if len(term) > 1]
-        
-        if not search_terms:
-            return results
-            
-        # Search in proposals
-        proposals_results = SearchManager._search_in_proposals(search_terms)
-        if proposals_results:
-            results["Proposals"] = proposals_results
-            
-        # Search in T&M tickets
-        tm_tickets_results = SearchManager._search_in_tm_tickets(search_terms)
-        if tm_tickets_results:
-            results["T&M Tickets"] = tm_tickets_results
-            
-        # Search in change orders
-        change_orders_results = SearchManager._search_in_change_orders(search_terms)
-        if change_orders_results:
-            results["Change Orders"] = change_orders_results
-            
-        # Search in documents
-        document_results = SearchManager._search_in_documents(search_terms)
-        if document_results:
-            results["Documents"] = document_results
-            
-        # Add any other module searches as needed
-        
-        return results
-    
-    @staticmethod
-    def _search_in_proposals(search_terms: List[str]) -> List[Dict[str, Any]]:
-        """Search in proposals module data."""
-        results = []
-        
-        # Check if proposals data exists
-        file_path = "data/cost_management/proposals.json"
-        if not os.path.exists(file_path):
+        if not query or not query.strip():
             return results
         
         try:
-            # Load proposals data
-            with open(file_path, 'r') as f:
-                proposals = json.load(f)
+            response = SearchManager._get_federated_search().search(query)
             
-            # Search in each proposal
-            for proposal in proposals:
-                score = 0
-                matches = []
-                
-                # Fields to search in
-                searchable_fields = [
-                    "proposal_id", "title", "company_name", "description", 
-                    "scope_of_work", "notes", "proposal_type"
-                ]
-                
-                # Check each search term against each field
-                for field in searchable_fields:
-                    if field not in proposal:
-                        continue
-                        
-                    field_value = str(proposal[field]).lower()
-                    
-                    for term in search_terms:
-                        if term in field_value:
-                            score += 1
-                            matches.append(field)
-                
-                # Also search in line items descriptions
-                if "line_items" in proposal:
-                    for item in proposal["line_items"]:
-                        if "description" in item:
-                            for term in search_terms:
-                                if term in item["description"].lower():
-                                    score += 1
-                                    matches.append("line_items")
-                
-                # If any matches found, add to results
-                if score > 0:
-                    results.append({
-                        "id": proposal["proposal_id"],
-                        "title": proposal["title"],
-                        "subtitle": f"{proposal['company_name']} - ${proposal['total_amount']:,.2f}",
-                        "status": proposal.get("status", "Unknown"),
-                        "date": proposal.get("submission_date", ""),
-                        "score": score,
-                        "matches": list(set(matches)),
-                        "type": "proposal",
-                        "url": f"?module=Cost Management&tab=Proposals&proposal_id={proposal['proposal_id']}"
-                    })
+            for label in SEARCH_SOURCES:
+                if response["by_source"].get(label):
+                    results[label] = response["by_source"][label]
+            
+            st.session_state.search_incomplete = [
+                label for label, status in response["sources"].items() if status["status"] != "ok"
+            ]
         
         except Exception as e:
-            st.error(f"Error searching proposals: {str(e)}")
+            st.error(f"Error performing search: {str(e)}")
         
-        # Sort by score (descending)
-        results.sort(key=lambda x: x["score"], reverse=True)
         return results
     
     @staticmethod
-    def _search_in_tm_tickets(search_terms: List[str]) -> List[Dict[str, Any]]:
-        """Search in T&M tickets module data."""
-        results = []
-        
-        # Check if T&M tickets data exists
-        file_path = "data/cost_management/tm_tickets.json"
-        if not os.path.exists(file_path):
-            return results
-        
-        try:
-            # Load T&M tickets data
-            with open(file_path, 'r') as f:
-                tickets = json.load(f)
-            
-            # Search in each ticket
-            for ticket in tickets:
-                score = 0
-                matches = []
-                
-                # Fields to search in
-                searchable_fields = [
-                    "ticket_id", "description", "company_name", "detailed_description", 
-                    "notes", "work_type", "location", "worker_name", "supervisor_name"
-                ]
-                
-                # Check each search term against each field
-                for field in searchable_fields:
-                    if field not in ticket:
-                        continue
-                        
-                    field_value = str(ticket[field]).lower()
-                    
-                    for term in search_terms:
-                        if term in field_value:
-                            score += 1
-                            matches.append(field)
-                
-                # Also search in line items descriptions
-                if "line_items" in ticket:
-                    for item in ticket["line_items"]:
-                        if "description" in item:
-                            for term in search_terms:
-                                if term in item["description"].lower():
-                                    score += 1
-                                    matches.append("line_items")
-                
-                # If any matches found, add to results
-                if score > 0:
-                    results.append({
-                        "id": ticket["ticket_id"],
-                        "title": ticket["description"],
-                        "subtitle": f"{ticket['company_name']} - ${ticket['total_amount']:,.2f}",
-                        "status": ticket.get("status", "Unknown"),
-                        "date": ticket.get("work_date", ""),
-                        "score": score,
-                        "matches": list(set(matches)),
-                        "type": "tm_ticket",
-                        "url": f"?module=Cost Management&tab=T&M Tickets&ticket_id={ticket['ticket_id']}"
-                    })
-        
-        except Exception as e:
-            st.error(f"Error searching T&M tickets: {str(e)}")
-        
-        # Sort by score (descending)
-        results.sort(key=lambda x: x["score"], reverse=True)
-        return results
+    def _format_proposal(proposal: Dict[str, Any]) -> Dict[str, Any]:
+        """Format a proposal as a search result."""
+        return {
+            "id": proposal["proposal_id"],
+            "title": proposal["title"],
+            "subtitle": f"{proposal['company_name']} - ${proposal['total_amount']:,.2f}",
+            "status": proposal.get("status", "Unknown"),
+            "date": proposal.get("submission_date", ""),
+            "type": "proposal",
+            "url": f"?module=Cost Management&tab=Proposals&proposal_id={proposal['proposal_id']}"
+        }
     
     @staticmethod
-    def _search_in_change_orders(search_terms: List[str]) -> List[Dict[str, Any]]:
-        """Search in change orders module data."""
-        results = []
-        
-        # Check if change orders data exists
-        file_path = "data/cost_management/change_orders.json"
-        if not os.path.exists(file_path):
-            return results
-        
-        try:
-            # Load change orders data
-            with open(file_path, 'r') as f:
-                change_orders = json.load(f)
-            
-            # Search in each change order
-            for change_order in change_orders:
-                score = 0
-                matches = []
-                
-                # Fields to search in
-                searchable_fields = [
-                    "co_id", "title", "company_name", "description", 
-                    "justification", "notes", "co_type", "approver"
-                ]
-                
-                # Check each search term against each field
-                for field in searchable_fields:
-                    if field not in change_order:
-                        continue
-                        
-                    field_value = str(change_order[field]).lower()
-                    
-                    for term in search_terms:
-                        if term in field_value:
-                            score += 1
-                            matches.append(field)
-                
-                # Also search in linked items
-                if "linked_proposals" in change_order:
-                    for item in change_order["linked_proposals"]:
-                        if "title" in item:
-                            for term in search_terms:
-                                if term in item["title"].lower():
-                                    score += 1
-                                    matches.append("linked_proposals")
-                
-                if "linked_tm_tickets" in change_order:
-                    for item in change_order["linked_tm_tickets"]:
-                        if "description" in item:
-                            for term in search_terms:
-                                if term in item["description"].lower():
-                                    score += 1
-                                    matches.append("linked_tm_tickets")
-                
-                # If any matches found, add to results
-                if score > 0:
-                    results.append({
-                        "id": change_order["co_id"],
-                        "title": change_order["title"],
-                        "subtitle": f"{change_order['company_name']} - ${change_order['total_amount']:,.2f}",
-                        "status": change_order.get("status", "Unknown"),
-                        "date": change_order.get("submission_date", ""),
-                        "score": score,
-                        "matches": list(set(matches)),
-                        "type": "change_order",
-                        "url": f"?module=Cost Management&tab=Change Orders&co_id={change_order['co_id']}"
-                    })
-        
-        except Exception as e:
-            st.error(f"Error searching change orders: {str(e)}")
-        
-        # Sort by score (descending)
-        results.sort(key=lambda x: x["score"], reverse=True)
-        return results
+    def _format_tm_ticket(ticket: Dict[str, Any]) -> Dict[str, Any]:
+        """Format a T&M ticket as a search result."""
+        return {
+            "id": ticket["ticket_id"],
+            "title": ticket["description"],
+            "subtitle": f"{ticket['company_name']} - ${ticket['total_amount']:,.2f}",
+            "status": ticket.get("status", "Unknown"),
+            "date": ticket.get("work_date", ""),
+            "type": "tm_ticket",
+            "url": f"?module=Cost Management&tab=T&M Tickets&ticket_id={ticket['ticket_id']}"
+        }
     
     @staticmethod
-    def _search_in_documents(search_terms: List[str]) -> List[Dict[str, Any]]:
-        """Search in documents module data."""
-        results = []
-        
-        # Check if documents data exists
-        file_path = "data/documents/document_metadata.json"
-        if not os.path.exists(file_path):
-            return results
-        
-        try:
-            # Load document metadata
-            with open(file_path, 'r') as f:
-                documents = json.load(f)
-            
-            # Search in each document's metadata
-            for document in documents:
-                score = 0
-                matches = []
-                
-                # Fields to search in
-                searchable_fields = [
-                    "document_id", "title", "description", "filename", 
-                    "author", "tags", "category", "document_type"
-                ]
-                
-                # Check each search term against each field
-                for field in searchable_fields:
-                    if field not in document:
-                        continue
-                    
-                    # Handle tags separately as they might be a list
-                    if field == "tags" and isinstance(document[field], list):
-                        field_value = " ".join(document[field]).lower()
-                    else:
-                        field_value = str(document[field]).lower()
-                    
-                    for term in search_terms:
-                        if term in field_value:
-                            score += 1
-                            matches.append(field)
-                
-                # If any matches found, add to results
-                if score > 0:
-                    results.append({
-                        "id": document["document_id"],
-                        "title": document["title"],
-                        "subtitle": f"{document.get('document_type', 'Document')} - {document.get('version', 'Unknown')}",
-                        "status": document.get("status", "Unknown"),
-                        "date": document.get("date_uploaded", ""),
-                        "score": score,
-                        "matches": list(set(matches)),
-                        "type": "document",
-                        "url": f"?module=Documents&document_id={document['document_id']}"
-                    })
-        
-        except Exception as e:
-            st.error(f"Error searching documents: {str(e)}")
-        
-        # Sort by score (descending)
-        results.sort(key=lambda x: x["score"], reverse=True)
-        return results
+    def _format_change_order(change_order: Dict[str, Any]) -> Dict[str, Any]:
+        """Format a change order as a search result."""
+        return {
+            "id": change_order["co_id"],
+            "title": change_order["title"],
+            "subtitle": f"{change_order['company_name']} - ${change_order['total_amount']:,.2f}",
+            "status": change_order.get("status", "Unknown"),
+            "date": change_order.get("submission_date", ""),
+            "type": "change_order",
+            "url": f"?module=Cost Management&tab=Change Orders&co_id={change_order['co_id']}"
+        }
+    
+    @staticmethod
+    def _format_rfi(rfi: Dict[str, Any]) -> Dict[str, Any]:
+        """Format an RFI as a search result."""
+        return {
+            "id": rfi.get("rfi_number") or rfi["id"],
+            "title": rfi.get("title", "RFI"),
+            "subtitle": f"{rfi.get('trade', 'General')} - {rfi.get('priority', 'Normal')} priority",
+            "status": rfi.get("status", "Unknown"),
+            "date": rfi.get("date_submitted", ""),
+            "type": "rfi",
+            "url": f"?module=RFIs&rfi_id={rfi['id']}"
+        }
+    
+    @staticmethod
+    def _format_submittal(submittal: Dict[str, Any]) -> Dict[str, Any]:
+        """Format a submittal as a search result."""
+        return {
+            "id": submittal.get("submittal_number") or submittal["id"],
+            "title": submittal.get("title", "Submittal"),
+            "subtitle": f"{submittal.get('submittal_type', 'Submittal')} - {submittal.get('trade', 'General')}",
+            "status": submittal.get("status", "Unknown"),
+            "date": submittal.get("date_submitted", ""),
+            "type": "submittal",
+            "url": f"?module=Submittals&submittal_id={submittal['id']}"
+        }
+    
+    @staticmethod
+    def _format_safety_incident(incident: Dict[str, Any]) -> Dict[str, Any]:
+        """Format a safety incident as a search result."""
+        return {
+            "id": incident["id"],
+            "title": f"{incident.get('incident_type', 'Incident')} - {incident.get('location', 'Unknown location')}",
+            "subtitle": f"{incident.get('severity', 'Unknown')} severity - reported by {incident.get('reported_by', 'Unknown')}",
+            "status": incident.get("status", "Unknown"),
+            "date": incident.get("date_occurred", ""),
+            "type": "safety_incident",
+            "url": f"?module=Safety&incident_id={incident['id']}"
+        }
+    
+    @staticmethod
+    def _format_inspection(inspection: Dict[str, Any]) -> Dict[str, Any]:
+        """Format an inspection as a search result."""
+        return {
+            "id": inspection.get("permit_number") or inspection["id"],
+            "title": f"{inspection.get('inspection_type', 'General')} Inspection - {inspection.get('location', 'Unknown location')}",
+            "subtitle": f"{inspection.get('inspector', 'Unknown')} - {inspection.get('result', 'Pending')}",
+            "status": inspection.get("status", "Unknown"),
+            "date": inspection.get("inspection_date", ""),
+            "type": "inspection",
+            "url": f"?module=Inspections&inspection_id={inspection['id']}"
+        }
+    
+    @staticmethod
+    def _format_document(document: Dict[str, Any]) -> Dict[str, Any]:
+        """Format a document as a search result."""
+        return {
+            "id": document["document_id"],
+            "title": document["title"],
+            "subtitle": f"{document.get('document_type', 'Document')} - {document.get('version', 'Unknown')}",
+            "status": document.get("status", "Unknown"),
+            "date": document.get("date_uploaded", ""),
+            "type": "document",
+            "url": f"?module=Documents&document_id={document['document_id']}"
+        }
     
     @staticmethod
     def render_search_results(results: Dict[str, List[Dict[str, Any]]]):
@@ -414,6 +305,10 @@ class SearchManager:
         """
         total_results = sum(len(module_results) for module_results in results.values())
         
+        incomplete = st.session_state.get("search_incomplete", [])
+        if incomplete:
+            st.caption(f"Results may be incomplete: {', '.join(incomplete)} did not respond in time.")
+        
         if total_results == 0:
             st.info("No results found. Try different keywords or check spelling.")
             return
@@ -683,4 +578,60 @@ class SearchManager:
 
 
 # Initialize search manager instance
-search_manager = SearchManager
\ No newline at end of file
+search_manager = SearchManager
+
+
+_federated_search: Optional[FederatedSearch] = None
+_federated_lock = threading.Lock()
+
+# Result group -> (index source, module filter value, JSON file, id field, searchable fields, result formatter).
+# Sources without a file are model tables indexed by lib.utils.search_engine (SEARCH_MODEL_SOURCES).
+SEARCH_SOURCES = {
+    "RFIs": (
+        "rfis", "RFIs", None, "id",
+        ["id", "title", "description", "trade", "submitted_by", "location", "drawing_reference", "response"],
+        SearchManager._format_rfi,
+    ),
+    "Submittals": (
+        "submittals", "Submittals", None, "id",
+        ["id", "submittal_number", "title", "trade", "specification_section", "submittal_type",
+         "submitted_by", "reviewer", "comments"],
+        SearchManager._format_submittal,
+    ),
+    "Safety": (
+        "safety_incidents", "Safety", None, "id",
+        ["id", "incident_type", "description", "location", "reported_by", "root_cause", "corrective_action"],
+        SearchManager._format_safety_incident,
+    ),
+    "Inspections": (
+        "inspections", "Inspections", None, "id",
+        ["id", "inspection_type", "inspector", "location", "trade", "deficiencies",
+         "corrective_actions", "permit_number", "notes"],
+        SearchManager._format_inspection,
+    ),
+    "Proposals": (
+        "proposals", "Proposals", "data/cost_management/proposals.json", "proposal_id",
+        ["proposal_id", "title", "company_name", "description", "scope_of_work",
+         "notes", "proposal_type", "line_items"],
+        SearchManager._format_proposal,
+    ),
+    "T&M Tickets": (
+        "tm_tickets", "T&M Tickets", "data/cost_management/tm_tickets.json", "ticket_id",
+        ["ticket_id", "description", "company_name", "detailed_description", "notes",
+         "work_type", "location", "worker_name", "supervisor_name", "line_items"],
+        SearchManager._format_tm_ticket,
+    ),
+    "Change Orders": (
+        "change_orders", "Change Orders", "data/cost_management/change_orders.json", "co_id",
+        ["co_id", "title", "company_name", "description", "justification", "notes",
+         "co_type", "approver", "linked_proposals", "linked_tm_tickets"],
+        SearchManager._format_change_order,
+    ),
+    "Documents": (
+        # Distinct from the "Documents" module of the documents model table
+        "document_files", "Document Library", "data/documents/document_metadata.json", "document_id",
+        ["document_id", "title", "description", "filename", "author", "tags",
+         "category", "document_type"],
+        SearchManager._format_document,
+    ),
+}
@@ -0,0 +1,654 @@
+"""
+Search Segments for gcPanel.
+
+This module persists the search index (lib.utils.search_index) as a single
+read-only segment file, so a new process can search without re-reading and
+re-tokenizing every table:
+- Sorted term dictionary, looked up by binary search
+- Impact-ordered postings: per term, one group per weight level holding the
+  delta-encoded document ids (fixed width per group, so decoding stays in C)
+- A one-byte field-norm array per field (document field lengths)
+- Keys, records and facet postings for filters
+
+Segments are opened with mmap: nothing is decoded up front except the keys,
+terms and records are decoded on first use, and processes opening the same
+segment share its pages through the OS page cache.
+"""
+
+import os
+import sys
+import math
+import mmap
+import time
+import pickle
+import struct
+import logging
+import tempfile
+import threading
+from array import array
+from collections import OrderedDict
+from itertools import accumulate, repeat
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from lib.utils.search_index import InvertedIndex
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Constants
+SEARCH_SEGMENT_DIR = os.environ.get("SEARCH_SEGMENT_DIR", "data/search")
+SEGMENT_MAGIC = b"GCSEG001"
+SEGMENT_RECORD_CACHE = 2048
+
+_HEADER = struct.Struct("<QQ")  # meta offset, meta length
+_GROUP = struct.Struct("<BBI")  # weight, id width, id count
+_WIDTH_CODES = {1: "B", 2: "H", 4: "I"}
+
+
+# -- encoding -----------------------------------------------------------------
+
+def encode_norm(length: int) -> int:
+    """
+    Encode a field length in one byte.
+
+    Lengths below 128 are exact; longer ones are stored on a log scale
+    (about 4% precision), which is plenty for length normalization.
+    """
+    if length < 128:
+        return length
+    return min(255, 128 + int(round(math.log2(length / 128) * 16)))
+
+
+def decode_norm(code: int) -> int:
+    """Decode a one-byte field length."""
+    if code < 128:
+        return code
+    return int(round(128 * 2 ** ((code - 128) / 16)))
+
+
+def _encode_ids(doc_ids: List[int]) -> Tuple[int, bytes]:
+    """Delta-encode ascending doc ids at the narrowest fixed width that fits."""
+    deltas = [doc_ids[0]] + [b - a for a, b in zip(doc_ids, doc_ids[1:])]
+    largest = max(deltas)
+    width = 1 if largest < 1 << 8 else 2 if largest < 1 << 16 else 4
+    return width, array(_WIDTH_CODES[width], deltas).tobytes()
+
+
+def _encode_postings(postings: Dict[int, int]) -> bytes:
+    """Encode a term's postings as weight groups, highest weight first."""
+    groups: Dict[int, List[int]] = {}
+    for doc_id, weight in postings.items():
+        groups.setdefault(weight, []).append(doc_id)
+
+    chunks = []
+    for weight in sorted(groups, reverse=True):
+        doc_ids = sorted(groups[weight])
+        width, data = _encode_ids(doc_ids)
+        chunks.append(_GROUP.pack(weight, width, len(doc_ids)))
+        chunks.append(data)
+    return b"".join(chunks)
+
+
+def _string_table(values: Iterable[bytes]) -> bytes:
+    """Offsets (count + 1 uint64) followed by the concatenated values."""
+    offsets = array("Q", [0])
+    blobs = []
+    for value in values:
+        blobs.append(value)
+        offsets.append(offsets[-1] + len(value))
+    return offsets.tobytes() + b"".join(blobs)
+
+
+# -- writing ------------------------------------------------------------------
+
+def write_segment(index: InvertedIndex, path: str, meta: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Write the live documents of an index to a segment file.
+
+    Tombstoned documents are dropped and doc ids are renumbered densely. The
+    file is written to a temporary name and renamed into place, so readers
+    never see a partial segment and existing mmaps stay valid.
+
+    Args:
+        index: Index to persist
+        path: Segment file path
+        meta: Extra metadata stored with the segment (e.g. sync times)
+
+    Returns:
+        dict: Segment statistics (documents, terms, bytes, seconds)
+    """
+    start = time.time()
+
+    with index._lock:
+        old_ids = sorted(index._docs.keys())
+        renumber = {old_id: new_id for new_id, old_id in enumerate(old_ids)}
+        fields = sorted(index._field_totals)
+
+        keys = [index._doc_keys[doc_id].encode("utf-8") for doc_id in old_ids]
+        records = [pickle.dumps(index._docs[doc_id], protocol=5) for doc_id in old_ids]
+
+        norms = {field: bytearray(len(old_ids)) for field in fields}
+        for new_id, old_id in enumerate(old_ids):
+            for field, length in index._doc_lengths[old_id].items():
+                norms[field][new_id] = encode_norm(length)
+
+        terms = sorted(term for term in index.terms())
+        postings_blob = bytearray()
+        posting_offsets = array("Q", [0])
+        for term in terms:
+            postings = {
+                renumber[doc_id]: weight
+                for doc_id, weight in index._postings[term].items()
+                if doc_id in renumber
+            }
+            if postings:
+                postings_blob += _encode_postings(postings)
+            posting_offsets.append(len(postings_blob))
+
+        facets: Dict[str, Dict[Any, Tuple[int, int]]] = {}
+        for field in index.facets:
+            facets[field] = {}
+            for value, doc_ids in index._facets[field].items():
+                live = sorted(renumber[doc_id] for doc_id in doc_ids if doc_id in renumber)
+                if live:
+                    begin = len(postings_blob)
+                    postings_blob += _encode_postings(dict.fromkeys(live, 0))
+                    facets[field][value] = (begin, len(postings_blob))
+
+        header = {
+            "doc_count": len(old_ids),
+            "field_totals": {field: index._field_totals[field] for field in fields},
+            "weighted_doc_count": index._weighted_doc_count,
+            "k1": index.k1,
+            "b": index.b,
+            "facets": facets,
+            "byteorder": sys.byteorder,
+            "written_at": time.time(),
+            "meta": meta or {},
+        }
+
+    sections = {
+        "keys": _string_table(keys),
+        "records": _string_table(records),
+        "terms": _string_table(term.encode("utf-8") for term in terms),
+        "term_postings": posting_offsets.tobytes(),
+        "postings": bytes(postings_blob),
+    }
+    for field in fields:
+        sections[f"norms:{field}"] = bytes(norms[field])
+
+    directory = os.path.dirname(path) or "."
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".segment-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(b"\0" * (len(SEGMENT_MAGIC) + _HEADER.size))
+            offsets = {}
+            for name, data in sections.items():
+                # 8-byte alignment keeps the offset arrays cheap to view
+                f.write(b"\0" * (-f.tell() % 8))
+                offsets[name] = (f.tell(), len(data))
+                f.write(data)
+            header["sections"] = offsets
+            meta_bytes = pickle.dumps(header, protocol=5)
+            meta_offset = f.tell()
+            f.write(meta_bytes)
+            f.seek(0)
+            f.write(SEGMENT_MAGIC + _HEADER.pack(meta_offset, len(meta_bytes)))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except Exception:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+    return {
+        "documents": len(old_ids),
+        "terms": len(terms),
+        "bytes": os.path.getsize(path),
+        "seconds": time.time() - start,
+    }
+
+
+# -- reading ------------------------------------------------------------------
+
+class SegmentReader:
+    """Read-only, memory-mapped view of a segment file."""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._view = memoryview(self._mmap)
+
+        magic_size = len(SEGMENT_MAGIC)
+        if self._mmap[:magic_size] != SEGMENT_MAGIC:
+            raise ValueError(f"{path} is not a search segment")
+        meta_offset, meta_length = _HEADER.unpack_from(self._mmap, magic_size)
+        self.header = pickle.loads(self._mmap[meta_offset:meta_offset + meta_length])
+        if self.header["byteorder"] != sys.byteorder:
+            raise ValueError(f"{path} was written on a {self.header['byteorder']}-endian machine")
+
+        self.doc_count: int = self.header["doc_count"]
+        self.field_totals: Dict[str, int] = dict(self.header["field_totals"])
+        self.meta: Dict[str, Any] = self.header["meta"]
+
+        self._key_offsets, self._key_blob = self._table("keys")
+        self._record_offsets, self._record_blob = self._table("records")
+        self._term_offsets, self._term_blob = self._table("terms")
+        self.term_count = len(self._term_offsets) - 1
+        start, length = self.header["sections"]["term_postings"]
+        self._posting_offsets = self._view[start:start + length].cast("Q")
+        self._postings_start = self.header["sections"]["postings"][0]
+
+    def _table(self, name: str):
+        start, length = self.header["sections"][name]
+        count = self.header["doc_count"] if name != "terms" else None
+        if count is None:
+            # Term count is implied by the term_postings array
+            count = self.header["sections"]["term_postings"][1] // 8 - 1
+        offsets_size = (count + 1) * 8
+        offsets = self._view[start:start + offsets_size].cast("Q")
+        return offsets, start + offsets_size
+
+    def _string(self, offsets, blob_start: int, position: int) -> bytes:
+        return self._mmap[blob_start + offsets[position]:blob_start + offsets[position + 1]]
+
+    def key(self, doc_id: int) -> str:
+        return self._string(self._key_offsets, self._key_blob, doc_id).decode("utf-8")
+
+    def keys(self) -> List[str]:
+        """All keys, in doc id order (decoded in one pass)."""
+        blob = self._mmap[self._key_blob:self._key_blob + self._key_offsets[self.doc_count]]
+        offsets = self._key_offsets
+        return [blob[offsets[i]:offsets[i + 1]].decode("utf-8") for i in range(self.doc_count)]
+
+    def record(self, doc_id: int) -> Dict[str, Any]:
+        return pickle.loads(self._string(self._record_offsets, self._record_blob, doc_id))
+
+    def lengths(self, doc_id: int) -> Dict[str, int]:
+        """Field lengths of a document, from the norm arrays."""
+        lengths = {}
+        for field in self.field_totals:
+            start, _ = self.header["sections"][f"norms:{field}"]
+            code = self._mmap[start + doc_id]
+            if code:
+                lengths[field] = decode_norm(code)
+        return lengths
+
+    def term(self, position: int) -> str:
+        return self._string(self._term_offsets, self._term_blob, position).decode("utf-8")
+
+    def find_term(self, term: str) -> int:
+        """Position of a term in the dictionary, or -1."""
+        target = term.encode("utf-8")
+        low, high = 0, self.term_count
+        while low < high:
+            middle = (low + high) // 2
+            if self._string(self._term_offsets, self._term_blob, middle) < target:
+                low = middle + 1
+            else:
+                high = middle
+        if low < self.term_count and self._string(self._term_offsets, self._term_blob, low) == target:
+            return low
+        return -1
+
+    def terms(self) -> Iterator[str]:
+        for position in range(self.term_count):
+            yield self.term(position)
+
+    def _decode(self, start: int, end: int) -> Tuple[Dict[int, int], array]:
+        """Decode weight groups into {doc_id: weight} and doc ids in impact order."""
+        postings: Dict[int, int] = {}
+        ordered = array("q")
+        position = self._postings_start + start
+        end += self._postings_start
+        while position < end:
+            weight, width, count = _GROUP.unpack_from(self._mmap, position)
+            position += _GROUP.size
+            deltas = array(_WIDTH_CODES[width])
+            deltas.frombytes(self._view[position:position + count * width])
+            position += count * width
+            doc_ids = list(accumulate(deltas))
+            postings.update(zip(doc_ids, repeat(weight)))
+            ordered.extend(doc_ids)
+        return postings, ordered
+
+    def postings(self, term: str) -> Optional[Tuple[Dict[int, int], array]]:
+        position = self.find_term(term)
+        if position < 0:
+            return None
+        return self._decode(self._posting_offsets[position], self._posting_offsets[position + 1])
+
+    def _count(self, start: int, end: int) -> int:
+        """Number of doc ids in a postings range (reads group headers only)."""
+        total = 0
+        position = self._postings_start + start
+        end += self._postings_start
+        while position < end:
+            _, width, count = _GROUP.unpack_from(self._mmap, position)
+            total += count
+            position += _GROUP.size + count * width
+        return total
+
+    def postings_count(self, position: int) -> int:
+        """Document frequency of the term at a dictionary position."""
+        return self._count(self._posting_offsets[position], self._posting_offsets[position + 1])
+
+    def posting_total(self) -> int:
+        """Number of term postings in the segment."""
+        # Facet postings are stored after the last term's
+        return self._count(0, self._posting_offsets[self.term_count])
+
+    def facet_values(self, field: str) -> List[Any]:
+        return list(self.header["facets"].get(field, {}))
+
+    def facet(self, field: str, value: Any) -> Optional[set]:
+        span = self.header["facets"].get(field, {}).get(value)
+        if span is None:
+            return None
+        postings, _ = self._decode(*span)
+        return set(postings)
+
+    def close(self):
+        try:
+            self._posting_offsets.release()
+            for view in (self._key_offsets, self._record_offsets, self._term_offsets):
+                view.release()
+            self._view.release()
+            self._mmap.close()
+        except (BufferError, ValueError):
+            # Still referenced; the mapping is released with the last reference
+            pass
+
+
+# -- segment-backed index structures -----------------------------------------
+#
+# These mappings stand in for InvertedIndex's dicts. Segment documents keep
+# their segment doc ids; anything added after loading lives in the overlay.
+
+class _SegmentDocs(dict):
+    """doc_id -> record; segment records are unpickled on access (LRU-cached)."""
+
+    def __init__(self, reader: SegmentReader):
+        super().__init__()
+        self._reader = reader
+        self._removed = set()
+        self._cache: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def _in_segment(self, doc_id) -> bool:
+        return isinstance(doc_id, int) and 0 <= doc_id < self._reader.doc_count and doc_id not in self._removed
+
+    def _load(self, doc_id: int) -> Dict[str, Any]:
+        with self._cache_lock:
+            record = self._cache.get(doc_id)
+            if record is not None:
+                self._cache.move_to_end(doc_id)
+                return record
+        record = self._reader.record(doc_id)
+        with self._cache_lock:
+            self._cache[doc_id] = record
+            if len(self._cache) > SEGMENT_RECORD_CACHE:
+                self._cache.popitem(last=False)
+        return record
+
+    def __getitem__(self, doc_id):
+        if dict.__contains__(self, doc_id):
+            return dict.__getitem__(self, doc_id)
+        if self._in_segment(doc_id):
+            return self._load(doc_id)
+        raise KeyError(doc_id)
+
+    def get(self, doc_id, default=None):
+        try:
+            return self[doc_id]
+        except KeyError:
+            return default
+
+    def __contains__(self, doc_id) -> bool:
+        return dict.__contains__(self, doc_id) or self._in_segment(doc_id)
+
+    def pop(self, doc_id, *default):
+        if dict.__contains__(self, doc_id):
+            return dict.pop(self, doc_id)
+        if self._in_segment(doc_id):
+            record = self._load(doc_id)
+            self._removed.add(doc_id)
+            with self._cache_lock:
+                self._cache.pop(doc_id, None)
+            return record
+        if default:
+            return default[0]
+        raise KeyError(doc_id)
+
+    def __len__(self) -> int:
+        return dict.__len__(self) + self._reader.doc_count - len(self._removed)
+
+    def keys(self):
+        return list(iter(self))
+
+    def __iter__(self):
+        for doc_id in range(self._reader.doc_count):
+            if doc_id not in self._removed:
+                yield doc_id
+        yield from dict.keys(self)
+
+    def items(self):
+        return [(doc_id, self[doc_id]) for doc_id in self]
+
+    def values(self):
+        return [self[doc_id] for doc_id in self]
+
+
+class _SegmentLengths(dict):
+    """doc_id -> field lengths; segment documents read the norm arrays."""
+
+    def __init__(self, reader: SegmentReader, docs: _SegmentDocs):
+        super().__init__()
+        self._reader = reader
+        self._docs = docs
+
+    def __getitem__(self, doc_id):
+        if dict.__contains__(self, doc_id):
+            return dict.__getitem__(self, doc_id)
+        if self._docs._in_segment(doc_id):
+            return self._reader.lengths(doc_id)
+        raise KeyError(doc_id)
+
+    def pop(self, doc_id, *default):
+        if dict.__contains__(self, doc_id):
+            return dict.pop(self, doc_id)
+        if isinstance(doc_id, int) and 0 <= doc_id < self._reader.doc_count:
+            # Called while the document is being removed, so do not check _removed
+            return self._reader.lengths(doc_id)
+        if default:
+            return default[0]
+        raise KeyError(doc_id)
+
+
+class _SegmentDocTerms(dict):
+    """doc_id -> indexed terms; segment documents are re-analyzed when asked (removal only)."""
+
+    def __init__(self, reader: SegmentReader):
+        super().__init__()
+        self._reader = reader
+
+    def pop(self, doc_id, *default):
+        if dict.__contains__(self, doc_id):
+            return dict.pop(self, doc_id)
+        if isinstance(doc_id, int) and 0 <= doc_id < self._reader.doc_count:
+            term_fields, _ = InvertedIndex._analyze(self._reader.record(doc_id))
+            return tuple(term_fields)
+        if default:
+            return default[0]
+        raise KeyError(doc_id)
+
+
+class _SegmentPostings(dict):
+    """term -> {doc_id: weight}; segment terms are decoded on first access."""
+
+    def __init__(self, reader: SegmentReader, impacts: Dict[str, array]):
+        super().__init__()
+        self._reader = reader
+        self._impacts = impacts
+        self._deleted = set()
+        self._new_terms = set()
+
+    def _materialize(self, term) -> bool:
+        if dict.__contains__(self, term):
+            return True
+        if term in self._deleted or not isinstance(term, str):
+            return False
+        decoded = self._reader.postings(term)
+        if decoded is None:
+            return False
+        postings, ordered = decoded
+        dict.__setitem__(self, term, postings)
+        # Segment order (weight descending, id ascending) is the index's impact order
+        self._impacts.setdefault(term, ordered)
+        return True
+
+    def __contains__(self, term) -> bool:
+        return self._materialize(term)
+
+    def __getitem__(self, term):
+        if self._materialize(term):
+            return dict.__getitem__(self, term)
+        raise KeyError(term)
+
+    def get(self, term, default=None):
+        return dict.__getitem__(self, term) if self._materialize(term) else default
+
+    def setdefault(self, term, default=None):
+        if not self._materialize(term):
+            self._deleted.discard(term)
+            if self._reader.find_term(term) < 0:
+                self._new_terms.add(term)
+            dict.__setitem__(self, term, default)
+        return dict.__getitem__(self, term)
+
+    def __delitem__(self, term):
+        dict.__delitem__(self, term)
+        self._new_terms.discard(term)
+        self._deleted.add(term)
+
+    def __iter__(self):
+        for term in self._reader.terms():
+            if term not in self._deleted:
+                yield term
+        yield from self._new_terms
+
+    def keys(self):
+        return list(iter(self))
+
+    def __len__(self) -> int:
+        return self._reader.term_count - len(self._deleted) + len(self._new_terms)
+
+    def doc_frequencies(self) -> Dict[str, int]:
+        """term -> document count, from group headers for terms not decoded yet."""
+        frequencies = {}
+        for position, term in enumerate(self._reader.terms()):
+            if term not in self._deleted and not dict.__contains__(self, term):
+                frequencies[term] = self._reader.postings_count(position)
+        for term, postings in dict.items(self):
+            frequencies[term] = len(postings)
+        return frequencies
+
+    def total_postings(self) -> int:
+        """Posting count without decoding every term (decoded terms are counted exactly)."""
+        total = self._reader.posting_total()
+        for term, postings in dict.items(self):
+            position = self._reader.find_term(term)
+            if position >= 0:
+                total -= self._reader.postings_count(position)
+            total += len(postings)
+        for term in self._deleted:
+            position = self._reader.find_term(term)
+            if position >= 0:
+                total -= self._reader.postings_count(position)
+        return total
+
+
+class _SegmentFacet(dict):
+    """value -> doc ids for one facet field; decoded per value on first access."""
+
+    def __init__(self, reader: SegmentReader, field: str):
+        super().__init__()
+        self._reader = reader
+        self._field = field
+
+    def _materialize(self, value) -> bool:
+        if dict.__contains__(self, value):
+            return True
+        try:
+            doc_ids = self._reader.facet(self._field, value)
+        except TypeError:
+            # Unhashable or incomparable value
+            return False
+        if doc_ids is None:
+            return False
+        dict.__setitem__(self, value, doc_ids)
+        return True
+
+    def get(self, value, default=None):
+        return dict.__getitem__(self, value) if self._materialize(value) else default
+
+    def __getitem__(self, value):
+        if self._materialize(value):
+            return dict.__getitem__(self, value)
+        raise KeyError(value)
+
+    def setdefault(self, value, default=None):
+        if not self._materialize(value):
+            dict.__setitem__(self, value, default)
+        return dict.__getitem__(self, value)
+
+    def items(self):
+        for value in self._reader.facet_values(self._field):
+            self._materialize(value)
+        return dict.items(self)
+
+
+def open_segment_index(path: str, facets: Iterable[str] = ()) -> Tuple[InvertedIndex, SegmentReader]:
+    """
+    Open a segment as a searchable, updatable index.
+
+    Only the keys are decoded up front; postings, records and facets are
+    decoded from the mapped file on first use. Documents added afterwards are
+    held in memory alongside the segment.
+
+    Args:
+        path: Segment file path
+        facets: Facet fields of the index
+
+    Returns:
+        tuple: (index, reader)
+    """
+    reader = SegmentReader(path)
+    index = InvertedIndex(k1=reader.header["k1"], b=reader.header["b"], facets=facets)
+
+    docs = _SegmentDocs(reader)
+    index._docs = docs
+    index._doc_lengths = _SegmentLengths(reader, docs)
+    index._doc_terms = _SegmentDocTerms(reader)
+    index._postings = _SegmentPostings(reader, index._impacts)
+    index._facets = {field: _SegmentFacet(reader, field) for field in index.facets}
+    index._field_totals = dict(reader.field_totals)
+
+    keys = reader.keys()
+    index._doc_keys = dict(enumerate(keys))
+    index._key_to_doc = {key: doc_id for doc_id, key in enumerate(keys)}
+    index._next_doc_id = reader.doc_count
+    index._weighted_doc_count = reader.header["weighted_doc_count"]
+    index.generation = 1
+
+    return index, reader
+
+
+def segment_path(name: str = "global") -> str:
+    """Path of a named segment under SEARCH_SEGMENT_DIR."""
+    return os.path.join(SEARCH_SEGMENT_DIR, f"{name}.seg")
@@ -0,0 +1,332 @@
+"""
+Search Suggestions for gcPanel.
+
+This module serves as-you-type suggestions for the search box:
+- Prefix completion from a trie over the indexed terms (ranked by document
+  frequency), after the caller's own recent queries that match
+- Typo correction from a trigram index over the terms, with candidates
+  verified by bounded edit distance ("curtan wall" -> "curtain wall")
+
+Completion walks only the best branches of the trie, so its cost depends on
+the number of suggestions asked for, not on the size of the vocabulary.
+
+A suggester holds only the index vocabulary and is shared by every session;
+recent queries are per user and are passed in with each call.
+"""
+
+import heapq
+import logging
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Constants
+SUGGEST_LIMIT = 10
+CORRECTION_CACHE_SIZE = 1000
+# Edit distance allowed when correcting a word, by word length
+FUZZY_MAX_EDITS = ((3, 0), (5, 1), (None, 2))
+
+_TRIM_CHARS = ".,;:!?\"'()[]{}"
+
+
+def levenshtein(a: str, b: str, max_distance: Optional[int] = None) -> int:
+    """
+    Edit distance between two strings.
+
+    Args:
+        a: First string
+        b: Second string
+        max_distance: Stop early once the distance is known to exceed this
+
+    Returns:
+        int: Edit distance, or max_distance + 1 if it exceeds max_distance
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    limit = max_distance if max_distance is not None else len(a)
+    if len(a) - len(b) > limit:
+        return limit + 1
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            ))
+        if min(current) > limit:
+            return limit + 1
+        previous = current
+    return min(previous[-1], limit + 1)
+
+
+def max_edits(word: str) -> int:
+    """Edit distance tolerated when correcting a word of this length."""
+    for length, edits in FUZZY_MAX_EDITS:
+        if length is None or len(word) <= length:
+            return edits
+    return 0
+
+
+class _Node:
+    __slots__ = ("children", "weight", "best")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        # Weight of the string ending here (0 if none), and the best weight in the subtree
+        self.weight = 0
+        self.best = 0
+
+
+class PrefixTrie:
+    """Weighted strings with top-k prefix completion."""
+
+    def __init__(self):
+        self._root = _Node()
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def __contains__(self, text: str) -> bool:
+        node = self._find(text)
+        return node is not None and node.weight > 0
+
+    def _find(self, prefix: str) -> Optional[_Node]:
+        node = self._root
+        for char in prefix:
+            node = node.children.get(char)
+            if node is None:
+                return None
+        return node
+
+    def weight(self, text: str) -> int:
+        node = self._find(text)
+        return node.weight if node is not None else 0
+
+    def set(self, text: str, weight: int):
+        """Insert a string, or change its weight (a weight of 0 removes it)."""
+        path = [self._root]
+        node = self._root
+        for char in text:
+            child = node.children.get(char)
+            if child is None:
+                if weight <= 0:
+                    return
+                child = node.children[char] = _Node()
+            node = child
+            path.append(node)
+
+        self._size += (weight > 0) - (node.weight > 0)
+        node.weight = max(weight, 0)
+
+        # Recompute subtree maxima bottom-up, pruning empty branches
+        for depth in range(len(path) - 1, -1, -1):
+            current = path[depth]
+            current.best = max([current.weight] + [child.best for child in current.children.values()])
+            if depth and not current.best:
+                del path[depth - 1].children[text[depth - 1]]
+
+    def add(self, text: str, amount: int = 1):
+        """Increase a string's weight."""
+        self.set(text, self.weight(text) + amount)
+
+    def complete(self, prefix: str, limit: int = SUGGEST_LIMIT) -> List[str]:
+        """
+        Highest-weighted strings starting with a prefix.
+
+        Branches are expanded best-first by their subtree maximum, so only
+        the nodes leading to the results (and their siblings) are visited.
+
+        Args:
+            prefix: String prefix
+            limit: Maximum number of results
+
+        Returns:
+            list: Strings, highest weight first
+        """
+        start = self._find(prefix)
+        if start is None or not start.best:
+            return []
+
+        results = []
+        counter = 0
+        # (-weight, tiebreak, is_result, text, node)
+        heap = [(-start.best, counter, False, prefix, start)]
+        while heap and len(results) < limit:
+            _, _, is_result, text, node = heapq.heappop(heap)
+            if is_result:
+                results.append(text)
+                continue
+            if node.weight:
+                counter += 1
+                heapq.heappush(heap, (-node.weight, counter, True, text, None))
+            for char, child in node.children.items():
+                counter += 1
+                heapq.heappush(heap, (-child.best, counter, False, text + char, child))
+        return results
+
+
+class TrigramIndex:
+    """Fuzzy lookup of words by shared trigrams, verified by edit distance."""
+
+    def __init__(self, words: Iterable[str] = ()):
+        self._words: List[str] = []
+        self._grams: Dict[str, List[int]] = {}
+        for word in words:
+            self.add(word)
+
+    @staticmethod
+    def trigrams(word: str) -> List[str]:
+        padded = f"$${word}$$"
+        return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+    def add(self, word: str):
+        word_id = len(self._words)
+        self._words.append(word)
+        for gram in set(self.trigrams(word)):
+            self._grams.setdefault(gram, []).append(word_id)
+
+    def lookup(self, word: str, max_distance: int) -> List[Tuple[int, str]]:
+        """
+        Words within an edit distance of a word.
+
+        A word within distance d shares all but at most 3 * d of the query's
+        trigrams, so it must contain one of the (3 * d + 1) rarest of them:
+        only those postings are read, and candidates are then checked by
+        trigram count and edit distance.
+
+        Args:
+            word: Word to look up
+            max_distance: Maximum edit distance
+
+        Returns:
+            list: (distance, word) pairs, closest first
+        """
+        grams = set(self.trigrams(word))
+        required = len(grams) - 3 * max_distance
+        if required <= 0:
+            return []
+
+        rarest = sorted(grams, key=lambda gram: len(self._grams.get(gram, ())))[:len(grams) - required + 1]
+        candidates = set()
+        for gram in rarest:
+            candidates.update(self._grams.get(gram, ()))
+
+        matches = []
+        for word_id in candidates:
+            candidate = self._words[word_id]
+            if abs(len(candidate) - len(word)) > max_distance:
+                continue
+            if len(grams.intersection(self.trigrams(candidate))) < required:
+                continue
+            distance = levenshtein(word, candidate, max_distance)
+            if distance <= max_distance:
+                matches.append((distance, candidate))
+        return sorted(matches)
+
+
+class SearchSuggester:
+    """As-you-type suggestions from indexed terms and a user's recent queries."""
+
+    def __init__(self, terms: Optional[Dict[str, int]] = None):
+        self._lock = threading.RLock()
+        self.rebuild(terms or {})
+
+    def rebuild(self, terms: Dict[str, int]):
+        """
+        Replace the term vocabulary.
+
+        Args:
+            terms: Term to weight (e.g. document frequency)
+        """
+        trie = PrefixTrie()
+        for term, weight in terms.items():
+            if weight > 0:
+                trie.set(term, weight)
+        trigrams = TrigramIndex(term for term in terms if len(term) > 3 and term.isalpha())
+
+        with self._lock:
+            self._terms = trie
+            self._trigrams = trigrams
+            self._frequencies = terms
+            # Earlier words are re-corrected on every keystroke, so corrections are cached
+            self._corrections: Dict[str, str] = {}
+
+    def correct(self, word: str) -> str:
+        """
+        Closest known term to a word (the word itself if known or nothing is close).
+
+        Args:
+            word: Word as typed
+
+        Returns:
+            str: Corrected word
+        """
+        with self._lock:
+            if word in self._terms or not word.isalpha():
+                return word
+            if word in self._corrections:
+                return self._corrections[word]
+
+            corrected = word
+            matches = self._trigrams.lookup(word, max_edits(word))
+            if matches:
+                # Closest first, then the more common term
+                corrected = min(matches, key=lambda match: (match[0], -self._frequencies.get(match[1], 0)))[1]
+
+            if len(self._corrections) >= CORRECTION_CACHE_SIZE:
+                self._corrections.clear()
+            self._corrections[word] = corrected
+            return corrected
+
+    def suggest(self, partial_query: str, limit: int = SUGGEST_LIMIT, history: Iterable[str] = ()) -> List[str]:
+        """
+        Suggestions for a partially typed query.
+
+        Queries from history starting with the input come first. Then the input is
+        completed from the vocabulary: complete words are corrected if they
+        are unknown, and the last word is completed by prefix (or corrected,
+        when nothing starts with it).
+
+        Args:
+            partial_query: Text typed so far
+            limit: Maximum number of suggestions
+            history: The user's recent queries, most recent first
+
+        Returns:
+            list: Suggested queries
+        """
+        query = normalize_query(partial_query)
+        if len(query) < 2:
+            return []
+
+        suggestions = []
+        for past in history:
+            past = normalize_query(past)
+            if past.startswith(query) and len(suggestions) < limit:
+                suggestions.append(past)
+
+        with self._lock:
+            words = [word.strip(_TRIM_CHARS) for word in query.split()]
+            words = [word for word in words if word]
+            if words:
+                head = [self.correct(word) for word in words[:-1]]
+                last = words[-1]
+                completions = self._terms.complete(last, limit)
+                if not completions:
+                    corrected = self.correct(last)
+                    completions = [corrected] if corrected != last else []
+                for completion in completions:
+                    suggestions.append(" ".join(head + [completion]))
+
+        return list(dict.fromkeys(suggestions))[:limit]
+
+
+def normalize_query(query: str) -> str:
+    """Lower-case a query and collapse whitespace."""
+    return " ".join(str(query).lower().split())
@@ -0,0 +1,306 @@
+"""
+Session Memory Accounting for gcPanel.
+
+This module keeps st.session_state from growing without bound:
+- Measures the approximate footprint of each session, per key and per key
+  class, and reports it per pod (sessions, total, largest session)
+- Enforces SESSION_MEMORY_BUDGET_MB per session by evicting keys in class
+  order: cache-class keys first (recomputable), then view record copies,
+  then trimming history lists to their newest entries
+
+Keys classed as data (session fallback records) or state (login, widget
+values, open edit forms, the audit log) are never evicted, so a session over budget on those alone is
+only reported. Measurement is throttled to once per
+SESSION_MEMORY_CHECK_SECONDS per session.
+"""
+
+import os
+import time
+import fnmatch
+import logging
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from lib.utils.cache_engine import estimate_size
+from lib.utils.metrics import counter, gauge
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Constants
+SESSION_MEMORY_BUDGET_MB = float(os.environ.get("SESSION_MEMORY_BUDGET_MB", "32"))
+SESSION_MEMORY_CHECK_SECONDS = float(os.environ.get("SESSION_MEMORY_CHECK_SECONDS", "10"))
+# Reports of sessions not seen for this long are dropped when liveness cannot be checked
+SESSION_REPORT_TTL = int(os.environ.get("SESSION_REPORT_TTL", "1800"))
+# History lists are never trimmed below this many entries
+HISTORY_MIN_ENTRIES = 20
+
+# Key classes in eviction order; DATA and STATE are never evicted
+CACHE = "cache"
+VIEW = "view"
+HISTORY = "history"
+DATA = "data"
+STATE = "state"
+KEY_CLASSES = (CACHE, VIEW, HISTORY, DATA, STATE)
+
+# (key pattern, class); the first matching pattern wins, unmatched keys are STATE
+_key_rules: List[Tuple[str, str]] = [
+    ("data_cache", CACHE),
+    ("*_cache", CACHE),
+    ("last_search_results", CACHE),
+    ("*_view_record", VIEW),
+    # CRUDController keeps an edit form open from this key; dropping it loses the edit
+    ("*_edit_record", STATE),
+    # AuditManager caps the log itself; trimming it here would drop audit entries
+    ("audit_log", STATE),
+    ("collaboration_events", HISTORY),
+    ("search_history", HISTORY),
+    ("notifications", HISTORY),
+    ("*_data", DATA),
+]
+# History lists kept newest first (the rest append, newest last)
+NEWEST_FIRST_KEYS = {"search_history", "notifications"}
+
+# Session id -> last report
+_reports: Dict[str, Dict[str, Any]] = {}
+_reports_lock = threading.Lock()
+
+_CHECKED_AT_KEY = "_memory_checked_at"
+
+
+def register_key_class(pattern: str, key_class: str):
+    """
+    Class session keys matching a pattern (ahead of the built-in rules).
+
+    Args:
+        pattern: fnmatch pattern over session_state keys
+        key_class: One of KEY_CLASSES
+    """
+    if key_class not in KEY_CLASSES:
+        raise ValueError(f"Unknown session key class: {key_class}")
+    _key_rules.insert(0, (pattern, key_class))
+
+
+def classify_key(key: str) -> str:
+    """Class of a session_state key."""
+    for pattern, key_class in _key_rules:
+        if fnmatch.fnmatchcase(key, pattern):
+            return key_class
+    return STATE
+
+
+def measure_session(state: Any) -> Dict[str, Any]:
+    """
+    Approximate footprint of a session state.
+
+    Args:
+        state: st.session_state (or any mapping)
+
+    Returns:
+        dict: "bytes" (total), "by_class" (class -> bytes) and "keys"
+            ((key, class, bytes) tuples, largest first)
+    """
+    keys = []
+    by_class = {key_class: 0 for key_class in KEY_CLASSES}
+    for key in list(state.keys()):
+        key = str(key)
+        try:
+            size = estimate_size(state[key])
+        except Exception:
+            continue
+        key_class = classify_key(key)
+        by_class[key_class] += size
+        keys.append((key, key_class, size))
+
+    keys.sort(key=lambda entry: entry[2], reverse=True)
+    return {"bytes": sum(by_class.values()), "by_class": by_class, "keys": keys}
+
+
+def _trim_history(state: Any, key: str) -> int:
+    """Drop the older half of a history list; returns bytes freed (0 if nothing was dropped)."""
+    entries = state[key]
+    if not isinstance(entries, list) or len(entries) <= HISTORY_MIN_ENTRIES:
+        return 0
+    keep = max(len(entries) // 2, HISTORY_MIN_ENTRIES)
+    before = estimate_size(entries)
+    state[key] = entries[:keep] if key in NEWEST_FIRST_KEYS else entries[-keep:]
+    return before - estimate_size(state[key])
+
+
+def enforce_budget(state: Any, budget_bytes: int) -> Dict[str, Any]:
+    """
+    Evict from a session state until it fits a budget.
+
+    Cache-class keys go first, then view copies (largest first within
+    a class), then history lists are halved down to HISTORY_MIN_ENTRIES.
+
+    Args:
+        state: st.session_state (or any mapping)
+        budget_bytes: Budget for the whole session
+
+    Returns:
+        dict: measure_session() of the state afterwards, plus "evicted"
+            (class -> keys evicted or trimmed) and "over_budget"
+    """
+    measured = measure_session(state)
+    total = measured["bytes"]
+    evicted = {CACHE: [], VIEW: [], HISTORY: []}
+
+    for key_class in (CACHE, VIEW):
+        for key, entry_class, size in measured["keys"]:
+            if total <= budget_bytes:
+                break
+            if entry_class != key_class:
+                continue
+            del state[key]
+            total -= size
+            evicted[key_class].append(key)
+
+    history = [key for key, key_class, _ in measured["keys"] if key_class == HISTORY]
+    while total > budget_bytes and history:
+        freed_any = False
+        for key in history:
+            if total <= budget_bytes:
+                break
+            freed = _trim_history(state, key)
+            if freed > 0:
+                total -= freed
+                freed_any = True
+                if key not in evicted[HISTORY]:
+                    evicted[HISTORY].append(key)
+        if not freed_any:
+            break
+
+    for key_class, keys in evicted.items():
+        if keys:
+            counter("gcpanel_session_evictions", "Session state keys evicted or trimmed",
+                    labels={"class": key_class}).inc(len(keys))
+
+    if any(evicted.values()):
+        measured = measure_session(state)
+    measured["evicted"] = evicted
+    measured["over_budget"] = measured["bytes"] > budget_bytes
+    return measured
+
+
+def _session_id() -> Optional[str]:
+    try:
+        from streamlit.runtime.scriptrunner import get_script_run_ctx
+        ctx = get_script_run_ctx()
+        return ctx.session_id if ctx else None
+    except Exception:
+        return None
+
+
+def enforce_session_budget(force: bool = False) -> Optional[Dict[str, Any]]:
+    """
+    Measure the current session, evict over SESSION_MEMORY_BUDGET_MB and report it for the pod.
+
+    Call once per script run; the work is done at most every
+    SESSION_MEMORY_CHECK_SECONDS unless forced.
+
+    Args:
+        force: Measure even if the session was measured recently
+
+    Returns:
+        dict: enforce_budget() result, or None if skipped
+    """
+    import streamlit as st
+
+    now = time.time()
+    if not force and now - st.session_state.get(_CHECKED_AT_KEY, 0.0) < SESSION_MEMORY_CHECK_SECONDS:
+        return None
+    st.session_state[_CHECKED_AT_KEY] = now
+
+    budget = int(SESSION_MEMORY_BUDGET_MB * 1024 * 1024)
+    try:
+        result = enforce_budget(st.session_state, budget)
+    except Exception as e:
+        logger.error(f"Error enforcing session memory budget: {str(e)}")
+        return None
+
+    if result["over_budget"]:
+        largest = ", ".join(f"{key} ({size // 1024} KB)" for key, _, size in result["keys"][:3])
+        logger.warning(f"Session over memory budget at {result['bytes'] // 1024} KB after eviction: {largest}")
+
+    session_id = _session_id()
+    if session_id:
+        with _reports_lock:
+            _reports[session_id] = {
+                "bytes": result["bytes"],
+                "by_class": result["by_class"],
+                "keys": result["keys"][:20],
+                "user": st.session_state.get("username") or "",
+                "checked_at": now,
+            }
+        _prune_reports()
+    return result
+
+
+def _prune_reports():
+    """Drop reports of sessions that have ended."""
+    try:
+        from streamlit.runtime import Runtime
+        runtime = Runtime.instance()
+        is_active = runtime.is_active_session
+    except Exception:
+        is_active = None
+
+    cutoff = time.time() - SESSION_REPORT_TTL
+    with _reports_lock:
+        for session_id, report in list(_reports.items()):
+            try:
+                ended = not is_active(session_id) if is_active else report["checked_at"] < cutoff
+            except Exception:
+                ended = report["checked_at"] < cutoff
+            if ended:
+                del _reports[session_id]
+
+
+def get_pod_memory() -> Dict[str, Any]:
+    """
+    Session memory of this server process.
+
+    Returns:
+        dict: sessions, bytes (total), by_class, max_bytes and mean_bytes
+            per session, budget_bytes, and "sessions_detail" (session id ->
+            last report)
+    """
+    _prune_reports()
+    with _reports_lock:
+        reports = {session_id: dict(report) for session_id, report in _reports.items()}
+
+    by_class = {key_class: 0 for key_class in KEY_CLASSES}
+    for report in reports.values():
+        for key_class, size in report["by_class"].items():
+            by_class[key_class] += size
+
+    sizes = [report["bytes"] for report in reports.values()]
+    return {
+        "sessions": len(reports),
+        "bytes": sum(sizes),
+        "by_class": by_class,
+        "max_bytes": max(sizes) if sizes else 0,
+        "mean_bytes": sum(sizes) / len(sizes) if sizes else 0,
+        "budget_bytes": int(SESSION_MEMORY_BUDGET_MB * 1024 * 1024),
+        "sessions_detail": reports,
+    }
+
+
+def _reported_bytes(key_class: Optional[str] = None) -> float:
+    with _reports_lock:
+        if key_class is None:
+            return sum(report["bytes"] for report in _reports.values())
+        return sum(report["by_class"].get(key_class, 0) for report in _reports.values())
+
+
+def _reported_sessions() -> float:
+    with _reports_lock:
+        return len(_reports)
+
+
+gauge("gcpanel_session_memory_bytes", "Session state memory of reported sessions").set_function(_reported_bytes)
+gauge("gcpanel_sessions_reported", "Sessions with a session memory report").set_function(_reported_sessions)
+for _key_class in KEY_CLASSES:
+    gauge("gcpanel_session_memory_class_bytes", "Session state memory per key class",
+          labels={"class": _key_class}).set_function(lambda key_class=_key_class: _reported_bytes(key_class))
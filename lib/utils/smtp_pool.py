@@ -0,0 +1,378 @@
+"""
+Pooled SMTP Transport for gcPanel.
+
+This module sends email over persistent SMTP sessions instead of a new
+connection (TCP, TLS handshake and login) per message:
+- A transport keeps up to SMTP_POOL_SIZE open sessions per server and
+  account; a session is reused for up to SMTP_MESSAGES_PER_SESSION
+  messages and closed after SMTP_IDLE_TIMEOUT seconds unused, before
+  the server drops it
+- send_many() sends a list of messages concurrently, one pooled session
+  per worker, with many messages per session
+- send_bcc() sends one rendered message to a distribution list in
+  batches of SMTP_MAX_RECIPIENTS envelope recipients, so a daily report
+  to 500 people is 10 transactions, not 500
+- A token bucket limits recipients per second to SMTP_RATE_LIMIT (with
+  bursts of SMTP_RATE_BURST) to stay under provider sending limits
+
+A message that fails on a session the server dropped while it sat in the
+pool is sent again on another session. For local testing, point the
+transport at a stand-in server (e.g. `python -m aiosmtpd -n -l
+localhost:8025`) with TLS off.
+"""
+
+import os
+import ssl
+import copy
+import time
+import atexit
+import logging
+import smtplib
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from email.message import Message
+from email.utils import getaddresses, parseaddr
+from typing import Any, Deque, Dict, Iterable, List, Optional, Sequence, Tuple
+
+from lib.utils.metrics import counter, histogram
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Constants
+SMTP_POOL_SIZE = int(os.environ.get("SMTP_POOL_SIZE", "4"))
+# Many providers end a session after this many messages
+SMTP_MESSAGES_PER_SESSION = int(os.environ.get("SMTP_MESSAGES_PER_SESSION", "100"))
+# Envelope recipients per message for BCC sends
+SMTP_MAX_RECIPIENTS = int(os.environ.get("SMTP_MAX_RECIPIENTS", "50"))
+# Recipients per second (0 for no limit) and how many may go out at once
+SMTP_RATE_LIMIT = float(os.environ.get("SMTP_RATE_LIMIT", "0"))
+SMTP_RATE_BURST = int(os.environ.get("SMTP_RATE_BURST", "100"))
+SMTP_IDLE_TIMEOUT = float(os.environ.get("SMTP_IDLE_TIMEOUT", "60"))
+SMTP_TIMEOUT = float(os.environ.get("SMTP_TIMEOUT", "30"))
+
+# Errors after which a session cannot be used again
+_BROKEN_SESSION_ERRORS = (smtplib.SMTPServerDisconnected, ConnectionError, TimeoutError, ssl.SSLError)
+
+
+class TokenBucket:
+    """Blocking rate limiter: rate tokens per second, up to burst saved."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate = rate
+        self.burst = max(burst, 1)
+        self._tokens = float(self.burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int = 1):
+        """Wait until tokens are available and take them (no-op when rate is 0)."""
+        if self.rate <= 0:
+            return
+        # A request larger than the bucket waits for a full bucket and overdraws it
+        needed = min(tokens, self.burst)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= needed:
+                    self._tokens -= tokens
+                    return
+                wait = (needed - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class _Session:
+    """An open SMTP connection and its usage."""
+
+    def __init__(self, server: smtplib.SMTP):
+        self.server = server
+        self.messages = 0
+        self.last_used = time.monotonic()
+
+    def close(self):
+        try:
+            self.server.quit()
+        except Exception:
+            self.server.close()
+
+
+def _flatten(message: Message) -> Tuple[str, List[str], bytes]:
+    """Sender, header recipients and wire bytes of a message (Bcc removed)."""
+    sender = parseaddr(message.get("Sender") or message.get("From") or "")[1]
+    recipients = [
+        address for _, address in getaddresses(
+            message.get_all("To", []) + message.get_all("Cc", []) + message.get_all("Bcc", [])
+        ) if address
+    ]
+    if "Bcc" in message:
+        message = copy.copy(message)
+        del message["Bcc"]
+    return sender, recipients, message.as_bytes(policy=message.policy.clone(linesep="\r\n"))
+
+
+class SmtpTransport:
+    """Pool of SMTP sessions to one server and account."""
+
+    def __init__(self, host: str, port: int = 587, username: Optional[str] = None,
+                 password: Optional[str] = None, use_tls: bool = True, use_ssl: bool = False,
+                 pool_size: int = SMTP_POOL_SIZE, rate_limit: float = SMTP_RATE_LIMIT,
+                 rate_burst: int = SMTP_RATE_BURST):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.use_tls = use_tls
+        self.use_ssl = use_ssl
+        self.pool_size = max(pool_size, 1)
+        self.throttle = TokenBucket(rate_limit, rate_burst)
+        self._idle: Deque[_Session] = deque()
+        self._open = 0
+        self._available = threading.Condition()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    # Sessions
+
+    def _connect(self) -> _Session:
+        context = ssl.create_default_context()
+        if self.use_ssl:
+            server = smtplib.SMTP_SSL(self.host, self.port, timeout=SMTP_TIMEOUT, context=context)
+        else:
+            server = smtplib.SMTP(self.host, self.port, timeout=SMTP_TIMEOUT)
+        try:
+            if self.use_tls and not self.use_ssl:
+                server.starttls(context=context)
+            if self.username and self.password:
+                server.login(self.username, self.password)
+        except Exception:
+            server.close()
+            raise
+        counter("gcpanel_smtp_sessions", "SMTP sessions opened").inc()
+        return _Session(server)
+
+    def _acquire(self) -> _Session:
+        """An idle session, a new one if the pool has room, or the next one released."""
+        stale = []
+        try:
+            with self._available:
+                while True:
+                    while self._idle:
+                        session = self._idle.pop()
+                        if time.monotonic() - session.last_used < SMTP_IDLE_TIMEOUT:
+                            return session
+                        self._open -= 1
+                        stale.append(session)
+                    if self._open < self.pool_size:
+                        self._open += 1
+                        break
+                    self._available.wait()
+        finally:
+            for session in stale:
+                session.close()
+
+        try:
+            return self._connect()
+        except Exception:
+            with self._available:
+                self._open -= 1
+                self._available.notify()
+            raise
+
+    def _release(self, session: _Session, broken: bool = False):
+        session.last_used = time.monotonic()
+        retire = broken or session.messages >= SMTP_MESSAGES_PER_SESSION
+        with self._available:
+            if retire:
+                self._open -= 1
+            else:
+                self._idle.append(session)
+            self._available.notify()
+        if retire:
+            session.close()
+
+    # Sending
+
+    def _send(self, sender: str, recipients: List[str], data: bytes) -> Dict[str, Tuple[int, bytes]]:
+        """Send wire bytes to envelope recipients over a pooled session."""
+        self.throttle.acquire(len(recipients))
+        start = time.perf_counter()
+        # Every stale pooled session is retired as it fails, so this ends on a fresh one
+        for attempt in range(self.pool_size + 1):
+            session = self._acquire()
+            reused = session.messages > 0
+            try:
+                refused = session.server.sendmail(sender, recipients, data)
+            except _BROKEN_SESSION_ERRORS:
+                self._release(session, broken=True)
+                if reused and attempt < self.pool_size:
+                    # The server dropped a pooled session; send again on another one
+                    continue
+                counter("gcpanel_smtp_messages", "SMTP messages by outcome", labels={"outcome": "failed"}).inc()
+                raise
+            except smtplib.SMTPException:
+                # sendmail() reset the transaction, so the session is still usable
+                session.messages += 1
+                self._release(session)
+                counter("gcpanel_smtp_messages", "SMTP messages by outcome", labels={"outcome": "failed"}).inc()
+                raise
+            except Exception:
+                self._release(session, broken=True)
+                raise
+
+            session.messages += 1
+            self._release(session)
+            counter("gcpanel_smtp_messages", "SMTP messages by outcome", labels={"outcome": "sent"}).inc()
+            counter("gcpanel_smtp_recipients", "SMTP envelope recipients accepted").inc(len(recipients) - len(refused))
+            histogram("gcpanel_smtp_send_milliseconds", "Time to send one SMTP message").observe(
+                (time.perf_counter() - start) * 1000
+            )
+            return refused
+
+    def send(self, message: Message, recipients: Optional[Iterable[str]] = None) -> Dict[str, Tuple[int, bytes]]:
+        """
+        Send a message.
+
+        Args:
+            message: Message to send
+            recipients: Envelope recipients (default: its To, Cc and Bcc addresses)
+
+        Returns:
+            dict: Refused recipients -> (SMTP code, server reply)
+
+        Raises:
+            smtplib.SMTPException: If the message was not accepted for any recipient
+        """
+        sender, header_recipients, data = _flatten(message)
+        return self._send(sender, list(recipients) if recipients is not None else header_recipients, data)
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._available:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.pool_size, thread_name_prefix="smtp")
+            return self._executor
+
+    def send_many(self, messages: Sequence[Tuple[Message, Optional[Iterable[str]]]]) -> List[Any]:
+        """
+        Send messages concurrently over the pool's sessions.
+
+        Args:
+            messages: (message, envelope recipients or None) pairs
+
+        Returns:
+            list: Per message, the refused recipients dict, or the exception that failed it
+        """
+        def send_one(item):
+            message, recipients = item
+            try:
+                return self.send(message, recipients)
+            except Exception as e:
+                return e
+
+        if len(messages) <= 1:
+            return [send_one(item) for item in messages]
+        return list(self._get_executor().map(send_one, messages))
+
+    def send_bcc(self, message: Message, recipients: Iterable[str],
+                 batch_size: int = SMTP_MAX_RECIPIENTS) -> Dict[str, Any]:
+        """
+        Send one message to many recipients without disclosing them.
+
+        The message is flattened once and sent in batches of envelope
+        recipients; its To header is left as given (the sender's address if
+        it has none, set on a copy).
+
+        Args:
+            message: Message to send
+            recipients: Addresses to send it to
+            batch_size: Envelope recipients per SMTP transaction
+
+        Returns:
+            dict: Recipient -> error for the recipients it was not sent to
+        """
+        if "To" not in message:
+            # On a copy, so the caller's message is not changed (a shallow copy shares the header list)
+            message = copy.deepcopy(message)
+            message["To"] = message.get("From", "undisclosed-recipients:;")
+        sender, _, data = _flatten(message)
+        recipients = list(dict.fromkeys(recipients))
+        batches = [recipients[start:start + batch_size] for start in range(0, len(recipients), batch_size)]
+
+        def send_batch(batch):
+            try:
+                return batch, self._send(sender, batch, data)
+            except Exception as e:
+                return batch, e
+
+        if len(batches) <= 1:
+            results = [send_batch(batch) for batch in batches]
+        else:
+            results = list(self._get_executor().map(send_batch, batches))
+
+        failures: Dict[str, Any] = {}
+        for batch, result in results:
+            if isinstance(result, smtplib.SMTPRecipientsRefused):
+                failures.update(result.recipients)
+            elif isinstance(result, Exception):
+                failures.update((recipient, result) for recipient in batch)
+            else:
+                failures.update(result)
+        return failures
+
+    def close(self):
+        """Close the idle sessions (sessions in use close when released)."""
+        with self._available:
+            sessions, self._idle = list(self._idle), deque()
+            self._open -= len(sessions)
+            executor, self._executor = self._executor, None
+        for session in sessions:
+            session.close()
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        """Open and idle sessions."""
+        with self._available:
+            return {"open": self._open, "idle": len(self._idle), "pool_size": self.pool_size}
+
+
+# Process-wide transports, one per server and account
+
+_transports: Dict[Tuple[Any, ...], SmtpTransport] = {}
+_transports_lock = threading.Lock()
+
+
+def get_smtp_transport(host: str, port: int = 587, username: Optional[str] = None,
+                       password: Optional[str] = None, use_tls: bool = True,
+                       use_ssl: bool = False) -> SmtpTransport:
+    """
+    The shared transport for an SMTP server and account.
+
+    Args:
+        host: SMTP server
+        port: SMTP port
+        username: Login user (no login if empty)
+        password: Login password
+        use_tls: Upgrade the connection with STARTTLS
+        use_ssl: Connect with implicit TLS (port 465)
+
+    Returns:
+        SmtpTransport: Transport whose sessions are shared by all callers
+    """
+    key = (host, int(port), username, password, bool(use_tls), bool(use_ssl))
+    with _transports_lock:
+        transport = _transports.get(key)
+        if transport is None:
+            transport = SmtpTransport(host, int(port), username, password, use_tls, use_ssl)
+            _transports[key] = transport
+    return transport
+
+
+@atexit.register
+def close_smtp_transports():
+    """Close the idle sessions of every transport."""
+    with _transports_lock:
+        transports = list(_transports.values())
+    for transport in transports:
+        transport.close()
@@ -0,0 +1,220 @@
+"""
+SQLite page-level backups for gcPanel.
+
+This module backs up a live SQLite database without dumping it to SQL:
+- Snapshots use the online backup API (sqlite3.Connection.backup) in
+  steps of SQLITE_BACKUP_PAGES pages, so readers are never blocked and
+  writers only between steps
+- A full backup is the compressed database image; an incremental backup
+  holds only the pages whose hash changed since the previous backup in its
+  chain, plus the page hashes needed to diff the next one
+- Restore rebuilds the image from a chain (full image + deltas in order)
+  into a new file, checks it and swaps it in place of the database
+
+Snapshots copy pages verbatim, so an unchanged page has the same bytes
+(and hash) in every snapshot of the same database.
+"""
+
+import os
+import time
+import struct
+import hashlib
+import logging
+import sqlite3
+from typing import Any, Dict, List, Tuple
+
+from lib.utils.backup_stream import compress_stream, open_backup, read_chunks
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Constants
+SQLITE_BACKUP_PAGES = int(os.environ.get("SQLITE_BACKUP_PAGES", "1024"))
+# Pause between backup steps so writers get the database
+SQLITE_BACKUP_SLEEP = float(os.environ.get("SQLITE_BACKUP_SLEEP", "0.005"))
+
+PAGE_HASH_SIZE = 16
+DELTA_MAGIC = b"GCPDELTA1"
+# Delta header after the magic: page size, page count, changed pages
+DELTA_HEADER = struct.Struct(">III")
+PAGE_NUMBER = struct.Struct(">I")
+
+
+def snapshot(db_path: str, dest_path: str) -> Dict[str, Any]:
+    """
+    Copy a live database to a file with the online backup API.
+
+    Args:
+        db_path: Database to copy
+        dest_path: New database file
+
+    Returns:
+        dict: page_size, page_count and seconds taken
+    """
+    start = time.monotonic()
+    source = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+    dest = sqlite3.connect(dest_path)
+    try:
+        source.backup(dest, pages=SQLITE_BACKUP_PAGES, sleep=SQLITE_BACKUP_SLEEP)
+        page_size = dest.execute("PRAGMA page_size").fetchone()[0]
+        page_count = dest.execute("PRAGMA page_count").fetchone()[0]
+    finally:
+        dest.close()
+        source.close()
+
+    return {"page_size": page_size, "page_count": page_count, "seconds": round(time.monotonic() - start, 3)}
+
+
+def _pages(path: str, page_size: int):
+    with open(path, "rb") as f:
+        for page in iter(lambda: f.read(page_size), b""):
+            yield page
+
+
+def page_hashes(path: str, page_size: int) -> bytes:
+    """Hashes of every page of a database file, concatenated in page order."""
+    return b"".join(
+        hashlib.blake2b(page, digest_size=PAGE_HASH_SIZE).digest() for page in _pages(path, page_size)
+    )
+
+
+def write_hashes(backup_file: str, hashes: bytes):
+    """Store the page hashes of a backup next to it (as backup_file.pages)."""
+    with open(backup_file + ".pages", "wb") as f:
+        f.write(hashes)
+
+
+def read_hashes(backup_file: str) -> bytes:
+    """Page hashes stored with a backup, or b"" if there are none."""
+    try:
+        with open(backup_file + ".pages", "rb") as f:
+            return f.read()
+    except FileNotFoundError:
+        return b""
+
+
+def write_image(snapshot_path: str, backup_file: str) -> Dict[str, Any]:
+    """
+    Compress a snapshot into a full backup.
+
+    Returns:
+        dict: compress_stream() report
+    """
+    with open(snapshot_path, "rb") as f:
+        return compress_stream(read_chunks(f), backup_file)
+
+
+def write_delta(snapshot_path: str, backup_file: str, page_size: int,
+                parent_hashes: bytes) -> Tuple[Dict[str, Any], bytes]:
+    """
+    Write the pages of a snapshot that differ from its parent backup.
+
+    Args:
+        snapshot_path: Snapshot of the database
+        backup_file: Incremental backup to write
+        page_size: Page size of the snapshot
+        parent_hashes: Page hashes of the parent backup
+
+    Returns:
+        tuple: (compress_stream() report plus "changed_pages", page hashes of the snapshot)
+    """
+    hashes = []
+    changed = []
+    for number, page in enumerate(_pages(snapshot_path, page_size), start=1):
+        digest = hashlib.blake2b(page, digest_size=PAGE_HASH_SIZE).digest()
+        hashes.append(digest)
+        offset = (number - 1) * PAGE_HASH_SIZE
+        if parent_hashes[offset:offset + PAGE_HASH_SIZE] != digest:
+            changed.append(number)
+
+    def records():
+        yield DELTA_MAGIC + DELTA_HEADER.pack(page_size, len(hashes), len(changed))
+        with open(snapshot_path, "rb") as f:
+            for number in changed:
+                f.seek((number - 1) * page_size)
+                yield PAGE_NUMBER.pack(number) + f.read(page_size)
+
+    report = compress_stream(records(), backup_file)
+    report["changed_pages"] = len(changed)
+    return report, b"".join(hashes)
+
+
+def read_exact(stream, size: int) -> bytes:
+    """Read exactly size bytes from a (decompressing) stream."""
+    data = b""
+    while len(data) < size:
+        chunk = stream.read(size - len(data))
+        if not chunk:
+            raise ValueError("Truncated backup stream")
+        data += chunk
+    return data
+
+
+def apply_delta(backup_file: str, image_path: str) -> int:
+    """
+    Apply an incremental backup to a database image in place.
+
+    Returns:
+        int: Pages written
+    """
+    with open_backup(backup_file) as stream, open(image_path, "r+b") as image:
+        if read_exact(stream, len(DELTA_MAGIC)) != DELTA_MAGIC:
+            raise ValueError(f"Not an incremental backup: {backup_file}")
+        page_size, page_count, changed = DELTA_HEADER.unpack(read_exact(stream, DELTA_HEADER.size))
+        for _ in range(changed):
+            number = PAGE_NUMBER.unpack(read_exact(stream, PAGE_NUMBER.size))[0]
+            image.seek((number - 1) * page_size)
+            image.write(read_exact(stream, page_size))
+        image.truncate(page_count * page_size)
+    return changed
+
+
+def materialize(chain: List[str], dest_path: str):
+    """
+    Rebuild a database image from a backup chain.
+
+    Args:
+        chain: Full backup followed by its incremental backups, oldest first
+        dest_path: Database file to create
+    """
+    with open_backup(chain[0]) as stream, open(dest_path, "wb") as f:
+        for chunk in read_chunks(stream):
+            f.write(chunk)
+    for backup_file in chain[1:]:
+        apply_delta(backup_file, dest_path)
+
+
+def quick_check(path: str) -> bool:
+    """Whether a database file passes PRAGMA quick_check."""
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    try:
+        return conn.execute("PRAGMA quick_check").fetchone()[0] == "ok"
+    finally:
+        conn.close()
+
+
+def swap_database(new_path: str, db_path: str):
+    """
+    Replace the contents of a database with another database file.
+
+    The file is never renamed over a live database: connections opened
+    before the swap would keep the old inode (and, in WAL mode, the old
+    -wal/-shm files) and corrupt the database on their next write. The
+    pages are copied into the live database through the backup API
+    instead, which takes the write lock on it and is safe with any
+    connections open. new_path is removed afterwards.
+    """
+    if not os.path.exists(db_path):
+        os.replace(new_path, db_path)
+        return
+
+    conn = sqlite3.connect(db_path, timeout=30, isolation_level=None)
+    try:
+        source = sqlite3.connect(new_path)
+        try:
+            source.backup(conn, pages=SQLITE_BACKUP_PAGES)
+        finally:
+            source.close()
+    finally:
+        conn.close()
+    os.remove(new_path)
@@ -0,0 +1,271 @@
+"""
+Template Engine for gcPanel.
+
+This module compiles notification and report templates once and renders
+them many times:
+- Placeholder templates ({name}, unknown names left as they are) and
+  str.format templates ({name:spec}, unknown names are an error) are
+  compiled into a plan: the literal text split around the fields, so a
+  render is one list copy, one conversion per field and one join
+- Templates marked "engine": "jinja2" are compiled with Jinja2 when it is
+  installed
+- Compiled templates are cached by source text, so every caller with the
+  same text shares one compilation
+- Template files are parsed and compiled on first use and again when
+  their modification time or size changes; a file is checked at most
+  every TEMPLATE_CHECK_INTERVAL seconds
+"""
+
+import os
+import re
+import json
+import time
+import string
+import logging
+import functools
+import threading
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+from lib.utils.metrics import counter
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+try:
+    import jinja2
+    JINJA2_AVAILABLE = True
+except ImportError:
+    JINJA2_AVAILABLE = False
+
+# Constants
+TEMPLATE_CHECK_INTERVAL = float(os.environ.get("TEMPLATE_CHECK_INTERVAL", "2"))
+TEMPLATE_CACHE_SIZE = int(os.environ.get("TEMPLATE_CACHE_SIZE", "512"))
+
+# Template syntaxes
+PLACEHOLDERS = "placeholders"
+FORMAT = "format"
+JINJA2 = "jinja2"
+
+_PLACEHOLDER = re.compile(r"\{([^{}]+)\}")
+_CONVERSIONS = {"r": repr, "s": str, "a": ascii}
+
+
+class CompiledTemplate:
+    """A template split into literal parts and the fields between them."""
+
+    __slots__ = ("source", "syntax", "names", "_parts", "_fields", "_jinja")
+
+    def __init__(self, source: str, syntax: str = PLACEHOLDERS):
+        self.source = source
+        self.syntax = syntax
+        self._parts: List[str] = []
+        # (index in _parts, name, format spec, conversion)
+        self._fields: Optional[List[Tuple[int, str, str, Optional[str]]]] = []
+        self._jinja = None
+
+        if syntax == JINJA2:
+            if not JINJA2_AVAILABLE:
+                raise RuntimeError("Jinja2 is not installed")
+            self._jinja = _jinja_environment().from_string(source)
+        elif syntax == FORMAT:
+            self._compile_format(source)
+        else:
+            self._compile_placeholders(source)
+
+        self.names = frozenset(name for _, name, _, _ in self._fields or ())
+
+    def _compile_placeholders(self, source: str):
+        position = 0
+        for match in _PLACEHOLDER.finditer(source):
+            if match.start() > position:
+                self._parts.append(source[position:match.start()])
+            self._fields.append((len(self._parts), match.group(1), "", None))
+            # Left in place when the context has no value for it
+            self._parts.append(match.group(0))
+            position = match.end()
+        if position < len(source):
+            self._parts.append(source[position:])
+
+    def _compile_format(self, source: str):
+        for literal, name, spec, conversion in string.Formatter().parse(source):
+            if literal:
+                self._parts.append(literal)
+            if name is None:
+                continue
+            if not name.isidentifier() or "{" in (spec or ""):
+                # Positional, attribute, index and nested fields are left to str.format
+                self._parts, self._fields = [], None
+                return
+            self._fields.append((len(self._parts), name, spec or "", conversion))
+            self._parts.append("")
+
+    def render(self, context: Mapping[str, Any]) -> str:
+        """
+        Render the template.
+
+        Args:
+            context: Values by field name
+
+        Returns:
+            str: Rendered text
+
+        Raises:
+            KeyError: If a str.format template's field has no value
+        """
+        if self._jinja is not None:
+            return self._jinja.render(context)
+        if self._fields is None:
+            return self.source.format_map(context)
+        if not self._fields:
+            # Not the source: a str.format template's literal parts have {{ and }} unescaped
+            return "".join(self._parts)
+
+        parts = self._parts.copy()
+        if self.syntax == FORMAT:
+            for index, name, spec, conversion in self._fields:
+                value = context[name]
+                if conversion:
+                    value = _CONVERSIONS[conversion](value)
+                parts[index] = format(value, spec)
+        else:
+            for index, name, _, _ in self._fields:
+                if name in context:
+                    parts[index] = str(context[name])
+        return "".join(parts)
+
+
+_jinja_env = None
+
+
+def _jinja_environment():
+    global _jinja_env
+
+    if _jinja_env is None:
+        # Templates hold HTML written by administrators, rendered as before without escaping
+        _jinja_env = jinja2.Environment(autoescape=False)
+    return _jinja_env
+
+
+@functools.lru_cache(maxsize=TEMPLATE_CACHE_SIZE)
+def compile_template(source: str, syntax: str = PLACEHOLDERS) -> CompiledTemplate:
+    """
+    Compile a template, or return the compilation of the same text.
+
+    Args:
+        source: Template text
+        syntax: PLACEHOLDERS, FORMAT or JINJA2
+
+    Returns:
+        CompiledTemplate: Compiled template
+    """
+    counter("gcpanel_template_compiles", "Templates compiled", labels={"syntax": syntax}).inc()
+    return CompiledTemplate(source, syntax)
+
+
+def render_template(source: str, context: Mapping[str, Any], syntax: str = PLACEHOLDERS) -> str:
+    """Render template text, compiling it on first use."""
+    return compile_template(source, syntax).render(context)
+
+
+class TemplateFile:
+    """A JSON template file: its fields and their compiled templates."""
+
+    __slots__ = ("data", "compiled", "signature", "checked_at")
+
+    def __init__(self, data: Dict[str, Any], signature: Tuple[int, int], syntax: str):
+        self.data = data
+        self.signature = signature
+        self.checked_at = time.monotonic()
+        syntax = data.get("engine", syntax)
+        self.compiled = {
+            key: compile_template(value, syntax)
+            for key, value in data.items()
+            if isinstance(value, str) and key != "engine"
+        }
+
+    def render(self, context: Mapping[str, Any]) -> Dict[str, str]:
+        """Every text field of the template, rendered."""
+        return {key: template.render(context) for key, template in self.compiled.items()}
+
+
+class TemplateEngine:
+    """JSON templates in a directory, compiled on first use and when they change."""
+
+    def __init__(self, directory: str, syntax: str = PLACEHOLDERS,
+                 check_interval: float = TEMPLATE_CHECK_INTERVAL):
+        self.directory = directory
+        self.syntax = syntax
+        self.check_interval = check_interval
+        self._files: Dict[str, TemplateFile] = {}
+        self._lock = threading.Lock()
+
+    def path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.json")
+
+    def get(self, name: str) -> Optional[TemplateFile]:
+        """
+        A template, reloaded if its file changed since it was last checked.
+
+        Args:
+            name: Template name (file name without .json)
+
+        Returns:
+            TemplateFile: The template, or None if there is no such file
+
+        Raises:
+            ValueError: If the file is not valid JSON
+        """
+        template = self._files.get(name)
+        now = time.monotonic()
+        if template is not None and now - template.checked_at < self.check_interval:
+            return template
+
+        path = self.path(name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            with self._lock:
+                self._files.pop(name, None)
+            return None
+
+        signature = (stat.st_mtime_ns, stat.st_size)
+        if template is not None and template.signature == signature:
+            template.checked_at = now
+            return template
+
+        with open(path, "r") as f:
+            template = TemplateFile(json.load(f), signature, self.syntax)
+        with self._lock:
+            self._files[name] = template
+        counter("gcpanel_template_loads", "Template files loaded or reloaded").inc()
+        return template
+
+    def render(self, name: str, context: Mapping[str, Any]) -> Optional[Dict[str, str]]:
+        """A template's text fields rendered with context, or None if there is no such template."""
+        template = self.get(name)
+        return template.render(context) if template is not None else None
+
+    def invalidate(self, name: Optional[str] = None):
+        """Forget a loaded template (or all of them), so the next get() reads the file."""
+        with self._lock:
+            if name is None:
+                self._files.clear()
+            else:
+                self._files.pop(name, None)
+
+
+# Process-wide engines, one per directory
+
+_engines: Dict[str, TemplateEngine] = {}
+_engines_lock = threading.Lock()
+
+
+def get_template_engine(directory: str, syntax: str = PLACEHOLDERS) -> TemplateEngine:
+    """The shared template engine for a directory."""
+    key = os.path.abspath(directory)
+    with _engines_lock:
+        engine = _engines.get(key)
+        if engine is None:
+            engine = TemplateEngine(directory, syntax)
+            _engines[key] = engine
+    return engine
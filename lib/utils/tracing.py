@@ -0,0 +1,297 @@
+"""
+Tracing for gcPanel.
+
+This module records where the time of a page run goes across layers
+(page -> controller -> model -> cache -> SQL) without an external collector:
+- Nested spans with attributes (page, model, table, rows, cache hit, ...),
+  kept in a context variable so each script thread traces its own run
+- Each page run is one trace; finished traces go to an in-memory ring
+  buffer of the last TRACE_BUFFER_SIZE traces
+- Traces are exported as OTLP JSON (ExportTraceServiceRequest), one trace
+  per line, to TRACE_EXPORT_PATH when set, so they can be loaded into any
+  OpenTelemetry-compatible tool later
+
+Outside a trace, span() costs a context variable lookup and records nothing.
+"""
+
+import os
+import json
+import time
+import logging
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Constants
+TRACING_ENABLED = os.environ.get("TRACING_ENABLED", "true").lower() == "true"
+TRACE_BUFFER_SIZE = int(os.environ.get("TRACE_BUFFER_SIZE", "200"))
+TRACE_MAX_SPANS = int(os.environ.get("TRACE_MAX_SPANS", "1000"))
+TRACE_EXPORT_PATH = os.environ.get("TRACE_EXPORT_PATH", "")
+TRACE_EXPORT_MAX_BYTES = int(os.environ.get("TRACE_EXPORT_MAX_BYTES", str(50 * 1024 * 1024)))
+TRACE_SERVICE_NAME = os.environ.get("TRACE_SERVICE_NAME", "gcpanel")
+
+# OTLP enum values
+SPAN_KIND_INTERNAL = 1
+STATUS_CODE_UNSET = 0
+STATUS_CODE_ERROR = 2
+
+_current_span: contextvars.ContextVar = contextvars.ContextVar("gcpanel_span", default=None)
+
+
+class Trace:
+    """Spans of one trace, in start order."""
+
+    __slots__ = ("trace_id", "spans", "dropped")
+
+    def __init__(self):
+        self.trace_id = os.urandom(16).hex()
+        self.spans: List["Span"] = []
+        self.dropped = 0
+
+    @property
+    def root(self) -> "Span":
+        return self.spans[0]
+
+    @property
+    def duration_ms(self) -> float:
+        return self.root.duration_ms
+
+
+class Span:
+    """A timed operation with attributes."""
+
+    __slots__ = ("trace", "span_id", "parent", "name", "attributes", "start_ns", "end_ns",
+                 "status", "message")
+
+    def __init__(self, trace: Trace, name: str, parent: Optional["Span"], attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = os.urandom(8).hex()
+        self.parent = parent
+        self.name = name
+        self.attributes = attributes
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.status = STATUS_CODE_UNSET
+        self.message = ""
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def set_attributes(self, **attributes):
+        self.attributes.update(attributes)
+
+    def record_error(self, error: BaseException):
+        self.status = STATUS_CODE_ERROR
+        self.message = f"{type(error).__name__}: {error}"
+
+    @property
+    def depth(self) -> int:
+        depth, parent = 0, self.parent
+        while parent is not None:
+            depth, parent = depth + 1, parent.parent
+        return depth
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+
+class _NoopSpan:
+    """Stands in for a span outside a trace, so call sites need no checks."""
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def set_attributes(self, **attributes):
+        pass
+
+    def record_error(self, error: BaseException):
+        pass
+
+
+NOOP_SPAN = _NoopSpan()
+
+
+class TraceBuffer:
+    """Ring buffer of finished traces, optionally exported to an OTLP JSON lines file."""
+
+    def __init__(self, size: int = TRACE_BUFFER_SIZE, export_path: str = TRACE_EXPORT_PATH):
+        self._traces: deque = deque(maxlen=size)
+        self._lock = threading.Lock()
+        self.export_path = export_path
+
+    def add(self, trace: Trace):
+        with self._lock:
+            self._traces.append(trace)
+            if self.export_path:
+                self._export(trace)
+
+    def _export(self, trace: Trace):
+        try:
+            if os.path.exists(self.export_path) and os.path.getsize(self.export_path) >= TRACE_EXPORT_MAX_BYTES:
+                os.replace(self.export_path, f"{self.export_path}.1")
+            with open(self.export_path, "a", encoding="utf-8") as f:
+                f.write(json.dumps(to_otlp([trace]), separators=(",", ":")) + "\n")
+        except Exception as e:
+            logger.error(f"Error exporting trace: {str(e)}")
+
+    def traces(self) -> List[Trace]:
+        """Buffered traces, newest first."""
+        with self._lock:
+            return list(reversed(self._traces))
+
+    def clear(self):
+        with self._lock:
+            self._traces.clear()
+
+
+_buffer = TraceBuffer()
+
+
+def get_trace_buffer() -> TraceBuffer:
+    """Get the process-wide trace buffer."""
+    return _buffer
+
+
+def current_span():
+    """The innermost open span on this thread (a no-op span outside a trace)."""
+    return _current_span.get() or NOOP_SPAN
+
+
+def start_trace(name: str, **attributes) -> Optional[Span]:
+    """
+    Start a trace on this thread; its root span is open until end_trace().
+
+    Args:
+        name: Root span name
+        **attributes: Root span attributes
+
+    Returns:
+        Span: The root span, or None if tracing is disabled
+    """
+    if not TRACING_ENABLED:
+        return None
+    trace = Trace()
+    root = Span(trace, name, None, attributes)
+    trace.spans.append(root)
+    _current_span.set(root)
+    return root
+
+
+def end_trace(root: Optional[Span]):
+    """
+    End a trace started by start_trace() and keep it in the ring buffer.
+
+    Spans still open (the run was interrupted) are ended with it.
+    """
+    if root is None or root.end_ns is not None:
+        return
+    end_ns = time.time_ns()
+    for open_span in root.trace.spans:
+        if open_span.end_ns is None:
+            open_span.end_ns = end_ns
+    if root.trace.dropped:
+        root.attributes["dropped_spans"] = root.trace.dropped
+    current = _current_span.get()
+    if current is not None and current.trace is root.trace:
+        _current_span.set(None)
+    _buffer.add(root.trace)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Record a block as a span of the current trace.
+
+    Yields the span (or a no-op span outside a trace) so attributes known
+    only inside the block, like row counts, can be added. An exception
+    leaving the block marks the span as an error (Streamlit's st.stop()
+    and st.rerun() raise BaseExceptions, which do not).
+
+    Args:
+        name: Span name (e.g. "BaseModel.get_all")
+        **attributes: Span attributes
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield NOOP_SPAN
+        return
+
+    trace = parent.trace
+    if len(trace.spans) >= TRACE_MAX_SPANS:
+        trace.dropped += 1
+        yield NOOP_SPAN
+        return
+
+    child = Span(trace, name, parent, attributes)
+    trace.spans.append(child)
+    token = _current_span.set(child)
+    try:
+        yield child
+    except Exception as e:
+        child.record_error(e)
+        raise
+    finally:
+        child.end_ns = time.time_ns()
+        _current_span.reset(token)
+
+
+def slowest_traces(limit: int = 20) -> List[Trace]:
+    """Buffered traces with the longest root span, slowest first."""
+    return sorted(_buffer.traces(), key=lambda trace: trace.duration_ms, reverse=True)[:limit]
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": key, "value": _otlp_value(value)} for key, value in attributes.items() if value is not None]
+
+
+def to_otlp(traces: List[Trace]) -> Dict[str, Any]:
+    """
+    Traces as an OTLP/JSON ExportTraceServiceRequest.
+
+    Args:
+        traces: Traces to convert
+
+    Returns:
+        dict: {"resourceSpans": [...]} with hex trace and span ids
+    """
+    spans = []
+    for trace in traces:
+        for item in trace.spans:
+            entry = {
+                "traceId": trace.trace_id,
+                "spanId": item.span_id,
+                "parentSpanId": item.parent.span_id if item.parent is not None else "",
+                "name": item.name,
+                "kind": SPAN_KIND_INTERNAL,
+                "startTimeUnixNano": str(item.start_ns),
+                "endTimeUnixNano": str(item.end_ns if item.end_ns is not None else item.start_ns),
+                "attributes": _otlp_attributes(item.attributes),
+                "status": {"code": item.status},
+            }
+            if item.message:
+                entry["status"]["message"] = item.message
+            spans.append(entry)
+
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": TRACE_SERVICE_NAME})},
+            "scopeSpans": [{"scope": {"name": "gcpanel.tracing"}, "spans": spans}],
+        }]
+    }
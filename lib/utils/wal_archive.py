@@ -0,0 +1,862 @@
+"""
+WAL Archiving and Point-in-Time Recovery for gcPanel.
+
+This module keeps a continuous archive of database changes so that a
+database can be recovered to a point in time, not only to the last full
+backup:
+- PostgreSQL: archive_command / restore_command targets that copy WAL
+  segments to and from WAL_ARCHIVE_DIR, pg_basebackup base backups, and
+  recovery preparation (recovery.signal with recovery_target_time) from
+  the newest base backup before the target
+- SQLite: a background archiver that copies the committed frames of the
+  database's WAL every WAL_ARCHIVE_INTERVAL seconds, takes base images
+  every WAL_BASE_BACKUP_HOURS, and replays frames onto the newest base
+  image before the target
+- Status reports the recovery-point gap (what would be lost if the
+  database were lost now) and the replay needed from the newest base
+  backup (what bounds restore time)
+
+The SQLite archiver keeps a read transaction open at all times, so the WAL
+cannot be restarted over frames it has not copied yet; it moves that read
+transaction forward only while it holds the write lock. Frames are
+archived at poll granularity, so a recovery lands on the last poll at or
+before the target time.
+
+PostgreSQL runs archive_command itself; the server must be able to run
+this module and write to WAL_ARCHIVE_DIR:
+
+    archive_command = 'PYTHONPATH=/app python -m lib.utils.wal_archive archive %p %f /backups/wal'
+"""
+
+import os
+import sys
+import json
+import time
+import shlex
+import shutil
+import struct
+import logging
+import sqlite3
+import datetime
+import threading
+import subprocess
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional, Tuple
+
+from lib.utils import sqlite_backup
+from lib.utils.backup_stream import compress_stream, file_sha256, open_backup, read_chunks
+from lib.utils.metrics import counter, gauge
+
+# Setup logging
+logger = logging.getLogger(__name__)
+
+# Constants
+WAL_ARCHIVE_ENABLED = os.environ.get("WAL_ARCHIVE_ENABLED", "false").lower() == "true"
+WAL_ARCHIVE_DIR = os.environ.get("WAL_ARCHIVE_DIR", os.path.join(os.environ.get("BACKUP_DIR", "backups"), "wal"))
+WAL_ARCHIVE_INTERVAL = float(os.environ.get("WAL_ARCHIVE_INTERVAL", "10"))
+# PostgreSQL switches to a new WAL segment at least this often, so it gets archived
+WAL_ARCHIVE_TIMEOUT = int(os.environ.get("WAL_ARCHIVE_TIMEOUT", "60"))
+WAL_BASE_BACKUP_HOURS = float(os.environ.get("WAL_BASE_BACKUP_HOURS", "24"))
+WAL_RETENTION_DAYS = int(os.environ.get("WAL_RETENTION_DAYS", "7"))
+# The archiver checkpoints the SQLite WAL once it holds this many frames
+WAL_CHECKPOINT_FRAMES = int(os.environ.get("WAL_CHECKPOINT_FRAMES", "1000"))
+
+WAL_MAGIC = (0x377F0682, 0x377F0683)
+# magic, format version, page size, checkpoint sequence, salt-1, salt-2, checksum-1, checksum-2
+WAL_HEADER = struct.Struct(">8I")
+# page number, database size in pages after a commit (0 otherwise), salt-1, salt-2, checksum-1, checksum-2
+FRAME_HEADER = struct.Struct(">6I")
+# Archived segment: magic, page size, then (page number, commit size, page) records
+SEGMENT_MAGIC = b"GCPWAL1"
+SEGMENT_RECORD = struct.Struct(">II")
+
+
+def _wal_checksum(data: bytes, s0: int, s1: int, big_endian: bool) -> Tuple[int, int]:
+    """SQLite's WAL checksum of data (a multiple of 8 bytes), continuing from (s0, s1)."""
+    words = struct.unpack(f"{'>' if big_endian else '<'}{len(data) // 4}I", data)
+    for index in range(0, len(words), 2):
+        s0 = (s0 + words[index] + s1) & 0xFFFFFFFF
+        s1 = (s1 + words[index + 1] + s0) & 0xFFFFFFFF
+    return s0, s1
+
+
+Frame = Tuple[int, int, bytes]
+
+
+def read_committed_frames(wal_path: str,
+                          position: Optional[Dict[str, Any]]) -> Tuple[List[Frame], Optional[Dict[str, Any]], bool]:
+    """
+    Committed frames of a SQLite WAL file after a position.
+
+    Frames are valid while their salts match the WAL header and their
+    checksums chain; only frames up to the last commit frame are returned.
+
+    Args:
+        wal_path: The database's -wal file
+        position: Position returned by the previous call (None to read from the start)
+
+    Returns:
+        tuple: (frames as (page number, commit size, page) tuples, new
+            position, whether the WAL was restarted since a given position)
+    """
+    try:
+        f = open(wal_path, "rb")
+    except FileNotFoundError:
+        return [], position, False
+
+    with f:
+        header = f.read(WAL_HEADER.size)
+        if len(header) < WAL_HEADER.size:
+            return [], position, False
+        magic, _, page_size, _, salt1, salt2, cksum1, cksum2 = WAL_HEADER.unpack(header)
+        if magic not in WAL_MAGIC:
+            return [], position, False
+        big_endian = bool(magic & 1)
+        if _wal_checksum(header[:24], 0, 0, big_endian) != (cksum1, cksum2):
+            return [], position, False
+
+        restarted = position is not None and (position["salt1"], position["salt2"]) != (salt1, salt2)
+        if position is None or restarted:
+            position = {"salt1": salt1, "salt2": salt2, "frames": 0, "checksum": [cksum1, cksum2],
+                        "page_size": page_size}
+
+        frame_size = FRAME_HEADER.size + page_size
+        f.seek(WAL_HEADER.size + position["frames"] * frame_size)
+        s0, s1 = position["checksum"]
+        frames: List[Frame] = []
+        pending: List[Frame] = []
+        new_position = position
+        number = position["frames"]
+        while True:
+            frame = f.read(frame_size)
+            if len(frame) < frame_size:
+                break
+            page_number, commit, frame_salt1, frame_salt2, frame_cksum1, frame_cksum2 = FRAME_HEADER.unpack_from(frame)
+            if (frame_salt1, frame_salt2) != (salt1, salt2):
+                break
+            s0, s1 = _wal_checksum(frame[:8] + frame[FRAME_HEADER.size:], s0, s1, big_endian)
+            if (s0, s1) != (frame_cksum1, frame_cksum2):
+                break
+            number += 1
+            pending.append((page_number, commit, frame[FRAME_HEADER.size:]))
+            if commit:
+                frames.extend(pending)
+                pending = []
+                new_position = {**position, "frames": number, "checksum": [s0, s1]}
+
+    return frames, new_position, restarted
+
+
+def _write_segment(path: str, page_size: int, frames: List[Frame]) -> Dict[str, Any]:
+    def records():
+        yield SEGMENT_MAGIC + struct.pack(">I", page_size)
+        for page_number, commit, page in frames:
+            yield SEGMENT_RECORD.pack(page_number, commit) + page
+
+    return compress_stream(records(), path)
+
+
+def _apply_segment(path: str, image) -> int:
+    """Write a segment's frames into an open database image; returns frames applied."""
+    applied = 0
+    with open_backup(path) as stream:
+        if sqlite_backup.read_exact(stream, len(SEGMENT_MAGIC)) != SEGMENT_MAGIC:
+            raise ValueError(f"Not a WAL archive segment: {path}")
+        page_size = struct.unpack(">I", sqlite_backup.read_exact(stream, 4))[0]
+        while True:
+            record = stream.read(SEGMENT_RECORD.size)
+            if not record:
+                break
+            if len(record) < SEGMENT_RECORD.size:
+                record += sqlite_backup.read_exact(stream, SEGMENT_RECORD.size - len(record))
+            page_number, commit = SEGMENT_RECORD.unpack(record)
+            image.seek((page_number - 1) * page_size)
+            image.write(sqlite_backup.read_exact(stream, page_size))
+            if commit:
+                image.truncate(commit * page_size)
+            applied += 1
+    return applied
+
+
+class SqliteWalArchiver:
+    """Continuous archive of a SQLite database's WAL frames, with base images."""
+
+    def __init__(self, db_path: str, archive_dir: str = WAL_ARCHIVE_DIR):
+        self.db_path = db_path
+        self.wal_path = db_path + "-wal"
+        self.archive_dir = os.path.join(archive_dir, "sqlite")
+        self.segment_dir = os.path.join(self.archive_dir, "segments")
+        self.base_dir = os.path.join(self.archive_dir, "base")
+        self.state_path = os.path.join(self.archive_dir, "state.json")
+        self.last_archived_at: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self._reader: Optional[sqlite3.Connection] = None
+        self._lock_file = None
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._state: Dict[str, Any] = {"next_segment": 1, "position": None}
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def _load_state(self):
+        try:
+            with open(self.state_path, "r") as f:
+                self._state = json.load(f)
+        except FileNotFoundError:
+            pass
+
+    def _save_state(self):
+        partial = self.state_path + ".partial"
+        with open(partial, "w") as f:
+            json.dump(self._state, f)
+        os.replace(partial, self.state_path)
+
+    def _acquire_archive_lock(self) -> bool:
+        """One archiver per archive directory, across processes."""
+        try:
+            import fcntl
+        except ImportError:
+            return True
+        self._lock_file = open(os.path.join(self.archive_dir, "archiver.lock"), "w")
+        try:
+            fcntl.flock(self._lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            return True
+        except OSError:
+            self._lock_file.close()
+            self._lock_file = None
+            return False
+
+    def start(self) -> bool:
+        """
+        Put the database in WAL mode and start archiving on a background thread.
+
+        Returns:
+            bool: False if another process is already archiving this database
+        """
+        os.makedirs(self.segment_dir, exist_ok=True)
+        os.makedirs(self.base_dir, exist_ok=True)
+        if not self._acquire_archive_lock():
+            logger.info(f"WAL archiving of {self.db_path} is running in another process")
+            return False
+
+        self._load_state()
+        self._start_thread()
+        logger.info(f"WAL archiving of {self.db_path} to {self.archive_dir} every {WAL_ARCHIVE_INTERVAL:g}s")
+        return True
+
+    def _start_thread(self):
+        conn = sqlite3.connect(self.db_path)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+        finally:
+            conn.close()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="wal-archiver", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop archiving and release the archiver's read transaction."""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        if self._reader is not None:
+            self._reader.close()
+            self._reader = None
+
+    def resume(self, rebase: bool = False):
+        """
+        Start archiving again after stop().
+
+        Args:
+            rebase: The database was replaced (e.g. restored), so the
+                archive continues from a new base image
+        """
+        if rebase:
+            self._state["position"] = None
+            self._save_state()
+        self._start_thread()
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.archive_once()
+                self.last_error = None
+            except Exception as e:
+                self.last_error = str(e)
+                logger.error(f"Error archiving WAL: {str(e)}")
+            self._stop.wait(WAL_ARCHIVE_INTERVAL)
+
+    def _hold_snapshot(self):
+        """Move the archiver's read transaction to the current end of the WAL."""
+        if self._reader is not None:
+            self._reader.close()
+        self._reader = sqlite3.connect(self.db_path, isolation_level=None, check_same_thread=False)
+        self._reader.execute("BEGIN")
+        self._reader.execute("SELECT COUNT(*) FROM sqlite_master").fetchone()
+
+    def archive_once(self, force_base: bool = False) -> Dict[str, Any]:
+        """
+        Archive the frames committed since the last call.
+
+        Holds the write lock while reading the WAL, so the archive ends
+        exactly at a commit. Takes a base image when none covers the
+        archive (first run, or the WAL was restarted while nobody was
+        archiving) or the newest one is WAL_BASE_BACKUP_HOURS old.
+
+        Returns:
+            dict: frames archived, segment written (if any) and base image taken (if any)
+        """
+        result: Dict[str, Any] = {"frames": 0, "segment": None, "base": None}
+        writer = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        try:
+            writer.execute("BEGIN IMMEDIATE")
+
+            position = self._state.get("position")
+            frames, new_position, restarted = read_committed_frames(self.wal_path, position)
+            # A restart the archiver did not see (its read transaction was not
+            # held) may have dropped frames, so the archive needs a new base
+            unseen_restart = restarted and self._reader is None
+            if unseen_restart or position is None:
+                # Leave a hole in the sequence so older base images stop replaying here
+                self._state["next_segment"] += 1
+            if frames:
+                seq = self._state["next_segment"]
+                path = os.path.join(self.segment_dir, f"{seq:012d}_{int(time.time() * 1000)}.wal.gz")
+                _write_segment(path, new_position["page_size"], frames)
+                self._state["next_segment"] = seq + 1
+                result.update({"frames": len(frames), "segment": path})
+                counter("gcpanel_wal_frames_archived", "SQLite WAL frames archived").inc(len(frames))
+            newest = self.base_backups()[:1]
+            base_due = not newest or time.time() - newest[0]["created_ts"] >= WAL_BASE_BACKUP_HOURS * 3600
+            if force_base or base_due or unseen_restart or position is None:
+                result["base"] = self._take_base()
+                if new_position is None:
+                    # No WAL yet: the base holds everything, and the first WAL header starts a new generation
+                    new_position = {"salt1": None, "salt2": None, "frames": 0, "checksum": [0, 0], "page_size": None}
+
+            self._state["position"] = new_position
+            self._save_state()
+            self.last_archived_at = time.time()
+
+            if new_position is not None and new_position["frames"] >= WAL_CHECKPOINT_FRAMES:
+                # Everything is archived and writers are locked out, so the WAL
+                # can be checkpointed; the next writer then restarts it
+                if self._reader is not None:
+                    self._reader.close()
+                    self._reader = None
+                checkpointer = sqlite3.connect(self.db_path, isolation_level=None)
+                try:
+                    checkpointer.execute("PRAGMA wal_checkpoint(PASSIVE)")
+                finally:
+                    checkpointer.close()
+
+            self._hold_snapshot()
+        finally:
+            if writer.in_transaction:
+                writer.execute("ROLLBACK")
+            writer.close()
+        return result
+
+    def _take_base(self) -> str:
+        """Snapshot the database (write lock held) as the base for the next segments."""
+        seq = self._state["next_segment"]
+        path = os.path.join(self.base_dir, f"base_{seq:012d}.sqlite.gz")
+        snapshot_path = path + ".snapshot"
+        try:
+            taken = sqlite_backup.snapshot(self.db_path, snapshot_path)
+            with open(snapshot_path, "rb") as f:
+                report = compress_stream(read_chunks(f), path)
+        finally:
+            if os.path.exists(snapshot_path):
+                os.remove(snapshot_path)
+
+        metadata = {
+            "created_at": datetime.datetime.now().isoformat(),
+            "created_ts": time.time(),
+            "next_segment": seq,
+            "page_size": taken["page_size"],
+            "page_count": taken["page_count"],
+            "sha256": report["sha256"],
+        }
+        with open(path + ".meta", "w") as f:
+            json.dump(metadata, f, indent=2)
+        logger.info(f"WAL archive base image taken: {path}")
+        return path
+
+    def base_backups(self) -> List[Dict[str, Any]]:
+        """Base images with metadata, newest first."""
+        bases = []
+        if os.path.isdir(self.base_dir):
+            for file in os.listdir(self.base_dir):
+                if file.endswith(".sqlite.gz.meta"):
+                    with open(os.path.join(self.base_dir, file), "r") as f:
+                        metadata = json.load(f)
+                    metadata["path"] = os.path.join(self.base_dir, file[:-len(".meta")])
+                    bases.append(metadata)
+        bases.sort(key=lambda base: base["next_segment"], reverse=True)
+        return bases
+
+    def segments(self) -> List[Tuple[int, float, str]]:
+        """Archived segments as (sequence, archived at, path), oldest first."""
+        segments = []
+        if os.path.isdir(self.segment_dir):
+            for file in os.listdir(self.segment_dir):
+                if file.endswith(".wal.gz"):
+                    seq, archived_ms = file[:-len(".wal.gz")].split("_")
+                    segments.append((int(seq), int(archived_ms) / 1000, os.path.join(self.segment_dir, file)))
+        segments.sort()
+        return segments
+
+    def recover(self, target: datetime.datetime, dest_path: str) -> Dict[str, Any]:
+        """
+        Rebuild the database as of a point in time into a new file.
+
+        Args:
+            target: Point in time to recover to
+            dest_path: Database file to create
+
+        Returns:
+            dict: base image used, segments and frames replayed, and
+                recovered_to (time of the last replayed segment)
+
+        Raises:
+            ValueError: If no base image is older than the target
+        """
+        target_ts = target.timestamp()
+        base = next((base for base in self.base_backups() if base["created_ts"] <= target_ts), None)
+        if base is None:
+            raise ValueError(f"No WAL archive base image before {target.isoformat()}")
+
+        sqlite_backup.materialize([base["path"]], dest_path)
+        recovered_to = base["created_ts"]
+        replayed = 0
+        frames = 0
+        expected = base["next_segment"]
+        with open(dest_path, "r+b") as image:
+            for seq, archived_at, path in self.segments():
+                if seq < expected:
+                    continue
+                if seq > expected:
+                    logger.warning(f"WAL archive is missing segment {expected}; recovering to {recovered_to}")
+                    break
+                if archived_at > target_ts:
+                    break
+                frames += _apply_segment(path, image)
+                replayed += 1
+                recovered_to = archived_at
+                expected += 1
+
+        return {
+            "base": base["path"],
+            "segments": replayed,
+            "frames": frames,
+            "recovered_to": datetime.datetime.fromtimestamp(recovered_to).isoformat(),
+        }
+
+    def status(self) -> Dict[str, Any]:
+        """
+        Recovery point and replay length.
+
+        Returns:
+            dict: running, last_archived_at, gap_seconds (since the last
+                archived commit point; the data at risk), pending_frames
+                (committed frames not archived yet), newest base image time,
+                segments_since_base (replay needed to recover to now),
+                archive_bytes and last_error
+        """
+        if not self.running:
+            # Another process may be archiving; its state is on disk
+            self._load_state()
+        frames, _, _ = read_committed_frames(self.wal_path, self._state.get("position"))
+        last_archived_at = self.last_archived_at
+        if last_archived_at is None and os.path.exists(self.state_path):
+            last_archived_at = os.path.getmtime(self.state_path)
+        if last_archived_at is None:
+            gap_seconds = None
+        else:
+            # Committed but unarchived frames are at risk since the last archive pass
+            gap_seconds = time.time() - last_archived_at if frames else 0.0
+        bases = self.base_backups()
+        segments = self.segments()
+        since_base = [seq for seq, _, _ in segments if bases and seq >= bases[0]["next_segment"]]
+        archive_bytes = sum(
+            os.path.getsize(os.path.join(root, file))
+            for root, _, files in os.walk(self.archive_dir) for file in files
+        ) if os.path.isdir(self.archive_dir) else 0
+        return {
+            "backend": "sqlite",
+            "running": self.running,
+            "last_archived_at": datetime.datetime.fromtimestamp(last_archived_at).isoformat() if last_archived_at else None,
+            "gap_seconds": gap_seconds,
+            "pending_frames": len(frames),
+            "base_backup_at": bases[0]["created_at"] if bases else None,
+            "base_backups": len(bases),
+            "segments_since_base": len(since_base),
+            "archive_bytes": archive_bytes,
+            "last_error": self.last_error,
+        }
+
+    def cleanup(self, retention_days: int = WAL_RETENTION_DAYS) -> int:
+        """
+        Drop base images older than the retention period (keeping the newest)
+        and the segments only they needed.
+
+        Returns:
+            int: Files removed
+        """
+        cutoff = time.time() - retention_days * 86400
+        bases = self.base_backups()
+        kept = [base for index, base in enumerate(bases) if index == 0 or base["created_ts"] >= cutoff]
+        removed = 0
+        for base in bases:
+            if base not in kept:
+                for path in (base["path"], base["path"] + ".meta"):
+                    if os.path.exists(path):
+                        os.remove(path)
+                        removed += 1
+        oldest_needed = min(base["next_segment"] for base in kept) if kept else None
+        if oldest_needed is not None:
+            for seq, _, path in self.segments():
+                if seq < oldest_needed:
+                    os.remove(path)
+                    removed += 1
+        return removed
+
+
+# PostgreSQL
+
+def archive_wal_segment(source: str, name: str, archive_dir: str = WAL_ARCHIVE_DIR) -> int:
+    """
+    archive_command target: copy a WAL segment into the archive.
+
+    A segment already archived with the same content succeeds again (the
+    server retries after crashes); different content is never overwritten.
+
+    Args:
+        source: %p, the segment path relative to the data directory
+        name: %f, the segment file name
+        archive_dir: Archive directory
+
+    Returns:
+        int: Exit status for the server (0 on success)
+    """
+    target_dir = os.path.join(archive_dir, "postgres")
+    target = os.path.join(target_dir, name)
+    try:
+        os.makedirs(target_dir, exist_ok=True)
+        if os.path.exists(target):
+            return 0 if file_sha256(target) == file_sha256(source) else 1
+
+        partial = target + ".partial"
+        with open(source, "rb") as src, open(partial, "wb") as dst:
+            shutil.copyfileobj(src, dst, 1024 * 1024)
+            dst.flush()
+            os.fsync(dst.fileno())
+        os.replace(partial, target)
+        directory = os.open(target_dir, os.O_RDONLY)
+        try:
+            os.fsync(directory)
+        finally:
+            os.close(directory)
+        return 0
+    except Exception as e:
+        logger.error(f"Error archiving WAL segment {name}: {str(e)}")
+        return 1
+
+
+def restore_wal_segment(name: str, dest: str, archive_dir: str = WAL_ARCHIVE_DIR) -> int:
+    """
+    restore_command target: copy an archived WAL segment back for recovery.
+
+    Returns:
+        int: Exit status for the server (non-zero when the segment is not archived)
+    """
+    source = os.path.join(archive_dir, "postgres", name)
+    if not os.path.exists(source):
+        return 1
+    try:
+        shutil.copyfile(source, dest)
+        return 0
+    except Exception as e:
+        logger.error(f"Error restoring WAL segment {name}: {str(e)}")
+        return 1
+
+
+def _module_command(action: str, *args: str) -> str:
+    project_root = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    return " ".join([
+        f"PYTHONPATH={shlex.quote(project_root)}", shlex.quote(sys.executable), "-m", "lib.utils.wal_archive",
+        action, *args, shlex.quote(os.path.abspath(WAL_ARCHIVE_DIR)),
+    ])
+
+
+def postgres_archive_settings() -> Dict[str, str]:
+    """
+    Server settings for continuous archiving into WAL_ARCHIVE_DIR.
+
+    archive_timeout forces a segment switch (and so an archive) at least
+    every WAL_ARCHIVE_TIMEOUT seconds, which bounds the recovery point gap
+    of a quiet database.
+    """
+    return {
+        "archive_mode": "on",
+        "archive_command": _module_command("archive", "%p", "%f"),
+        "archive_timeout": str(WAL_ARCHIVE_TIMEOUT),
+        "wal_compression": "on",
+    }
+
+
+def _psql(sql: str, database: bool = True) -> str:
+    from lib.utils.backup import get_connection_args
+    args, env = get_connection_args(include_database=database)
+    result = subprocess.run(
+        ["psql", *args, "--no-password", "-tAc", sql],
+        check=True, capture_output=True, env={**os.environ, **env}
+    )
+    return result.stdout.decode().strip()
+
+
+def configure_postgres_archiving() -> bool:
+    """
+    Apply postgres_archive_settings() with ALTER SYSTEM and reload.
+
+    archive_mode only takes effect after a server restart.
+
+    Returns:
+        bool: True if the settings were applied
+    """
+    try:
+        for name, value in postgres_archive_settings().items():
+            quoted = value.replace("'", "''")
+            _psql(f"ALTER SYSTEM SET {name} = '{quoted}'")
+        _psql("SELECT pg_reload_conf()")
+        logger.info("PostgreSQL WAL archiving configured (archive_mode needs a server restart)")
+        return True
+    except Exception as e:
+        logger.error(f"Error configuring PostgreSQL WAL archiving: {str(e)}")
+        return False
+
+
+def create_postgres_base_backup(archive_dir: str = WAL_ARCHIVE_DIR) -> Optional[str]:
+    """
+    Take a base backup with pg_basebackup (compressed tar format).
+
+    Returns:
+        str: Base backup directory, or None on failure
+    """
+    from lib.utils.backup import get_connection_args
+    args, env = get_connection_args(include_database=False)
+    started = datetime.datetime.now()
+    path = os.path.join(archive_dir, "postgres_base", "base_" + started.strftime("%Y%m%d_%H%M%S"))
+    try:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        subprocess.run(
+            ["pg_basebackup", *args, "--no-password", "-D", path, "-Ft", "-z", "-X", "fetch", "--checkpoint=fast"],
+            check=True, capture_output=True, env={**os.environ, **env}
+        )
+        with open(os.path.join(path, "gcpanel_base.json"), "w") as f:
+            json.dump({"started_at": started.isoformat(), "finished_at": datetime.datetime.now().isoformat()}, f, indent=2)
+        logger.info(f"PostgreSQL base backup created: {path}")
+        return path
+    except Exception as e:
+        if isinstance(e, subprocess.CalledProcessError) and e.stderr:
+            logger.error(f"Base backup failed: {e.stderr.decode(errors='replace').strip()}")
+        else:
+            logger.error(f"Base backup failed: {str(e)}")
+        shutil.rmtree(path, ignore_errors=True)
+        return None
+
+
+def postgres_base_backups(archive_dir: str = WAL_ARCHIVE_DIR) -> List[Dict[str, Any]]:
+    """PostgreSQL base backups with their times, newest first."""
+    root = os.path.join(archive_dir, "postgres_base")
+    bases = []
+    if os.path.isdir(root):
+        for name in os.listdir(root):
+            label = os.path.join(root, name, "gcpanel_base.json")
+            if os.path.exists(label):
+                with open(label, "r") as f:
+                    bases.append({**json.load(f), "path": os.path.join(root, name)})
+    bases.sort(key=lambda base: base["finished_at"], reverse=True)
+    return bases
+
+
+def prepare_postgres_recovery(target: datetime.datetime, data_dir: str) -> Dict[str, Any]:
+    """
+    Lay out a data directory that recovers to a point in time when started.
+
+    The newest base backup finished before the target is unpacked into
+    data_dir, with recovery.signal and restore_command/recovery_target_time
+    settings; starting a server on it replays archived WAL up to the target
+    and promotes it.
+
+    Args:
+        target: Point in time to recover to
+        data_dir: New (empty) data directory
+
+    Returns:
+        dict: base backup used, data_dir and the command that starts recovery
+
+    Raises:
+        ValueError: If no base backup finished before the target
+    """
+    base = next(
+        (base for base in postgres_base_backups() if datetime.datetime.fromisoformat(base["finished_at"]) <= target),
+        None,
+    )
+    if base is None:
+        raise ValueError(f"No PostgreSQL base backup before {target.isoformat()}")
+
+    os.makedirs(data_dir, exist_ok=False)
+    os.chmod(data_dir, 0o700)
+    subprocess.run(["tar", "-xzf", os.path.join(base["path"], "base.tar.gz"), "-C", data_dir], check=True)
+
+    with open(os.path.join(data_dir, "postgresql.auto.conf"), "a") as f:
+        f.write(f"\nrestore_command = '{_module_command('restore', '%f', '%p')}'\n")
+        f.write(f"recovery_target_time = '{target.astimezone().isoformat()}'\n")
+        f.write("recovery_target_action = 'promote'\n")
+    open(os.path.join(data_dir, "recovery.signal"), "w").close()
+
+    return {"base": base["path"], "data_dir": data_dir, "start_command": f"pg_ctl -D {shlex.quote(data_dir)} start"}
+
+
+def postgres_status() -> Dict[str, Any]:
+    """
+    Archiver state of the PostgreSQL server.
+
+    Returns:
+        dict: last archived segment and time, gap_seconds since then,
+            failures, newest base backup time and archive_bytes
+    """
+    status: Dict[str, Any] = {"backend": "postgresql", "last_error": None}
+    try:
+        row = _psql(
+            "SELECT last_archived_wal, last_archived_time, failed_count, last_failed_wal, "
+            "EXTRACT(EPOCH FROM now() - last_archived_time) FROM pg_stat_archiver"
+        ).split("|")
+        status.update({
+            "last_archived_wal": row[0] or None,
+            "last_archived_at": row[1] or None,
+            "failed_count": int(row[2] or 0),
+            "last_failed_wal": row[3] or None,
+            "gap_seconds": float(row[4]) if row[4] else None,
+        })
+    except Exception as e:
+        status["last_error"] = str(e)
+
+    bases = postgres_base_backups()
+    archive = os.path.join(WAL_ARCHIVE_DIR, "postgres")
+    status["base_backup_at"] = bases[0]["finished_at"] if bases else None
+    status["base_backups"] = len(bases)
+    status["archive_bytes"] = sum(
+        os.path.getsize(os.path.join(archive, file)) for file in os.listdir(archive)
+    ) if os.path.isdir(archive) else 0
+    return status
+
+
+# Process-wide archiver
+
+_archiver: Optional[SqliteWalArchiver] = None
+_archiver_lock = threading.Lock()
+
+
+def _is_postgres() -> bool:
+    return os.environ.get("DATABASE_URL", "").startswith("postgresql")
+
+
+def _sqlite_path() -> str:
+    return os.environ.get("DB_PATH", "data/gcpanel.db")
+
+
+def start_wal_archiver() -> Optional[SqliteWalArchiver]:
+    """
+    Start archiving the SQLite database's WAL once per process, when enabled.
+
+    PostgreSQL archives through archive_command instead (see
+    configure_postgres_archiving()).
+
+    Returns:
+        SqliteWalArchiver: The archiver, or None if disabled or not applicable
+    """
+    global _archiver
+
+    if not WAL_ARCHIVE_ENABLED or _is_postgres():
+        return None
+
+    with _archiver_lock:
+        if _archiver is None:
+            db_path = _sqlite_path()
+            if not os.path.exists(db_path):
+                return None
+            archiver = SqliteWalArchiver(db_path)
+            try:
+                archiver.start()
+            except Exception as e:
+                logger.error(f"Error starting WAL archiver: {str(e)}")
+                return None
+            _archiver = archiver
+    return _archiver
+
+
+def get_wal_archiver() -> SqliteWalArchiver:
+    """The SQLite archiver of this process, or one for reading the archive if none is running."""
+    return _archiver or SqliteWalArchiver(_sqlite_path())
+
+
+@contextmanager
+def archiving_paused():
+    """
+    Stop this process's SQLite archiver around a restore.
+
+    The archiver's read transaction would keep the WAL from being emptied
+    before the database file is replaced; afterwards it continues from a
+    new base image, since the archived history no longer leads to the
+    restored database.
+    """
+    archiver = _archiver
+    if archiver is None or not archiver.running:
+        yield
+        return
+    archiver.stop()
+    try:
+        yield
+    finally:
+        archiver.resume(rebase=True)
+
+
+def get_archive_status() -> Dict[str, Any]:
+    """Recovery point status of the configured database (see SqliteWalArchiver.status and postgres_status)."""
+    if _is_postgres():
+        return postgres_status()
+    return get_wal_archiver().status()
+
+
+def _gap_seconds() -> float:
+    if _archiver is None or _archiver.last_archived_at is None:
+        return float("nan")
+    return time.time() - _archiver.last_archived_at
+
+
+gauge("gcpanel_wal_archive_age_seconds", "Seconds since the SQLite WAL archiver last reached the end of the WAL").set_function(_gap_seconds)
+
+
+def main(argv: List[str]) -> int:
+    """
+    Entry point for the server's archive_command and restore_command.
+
+        python -m lib.utils.wal_archive archive <%p> <%f> [archive dir]
+        python -m lib.utils.wal_archive restore <%f> <%p> [archive dir]
+    """
+    if len(argv) < 3 or argv[0] not in ("archive", "restore"):
+        print(main.__doc__, file=sys.stderr)
+        return 2
+    archive_dir = argv[3] if len(argv) > 3 else WAL_ARCHIVE_DIR
+    if argv[0] == "archive":
+        return archive_wal_segment(argv[1], argv[2], archive_dir)
+    return restore_wal_segment(argv[1], argv[2], archive_dir)
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:]))
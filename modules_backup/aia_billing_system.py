@@ -18,6 +18,11 @@ from openpyxl import Workbook
 from openpyxl.styles import Font, Alignment, Border, Side
 from typing import Dict, List, Any
 
+from lib.utils.cache_engine import cached
+
+# Generated billing documents are kept on disk so restarts and other workers reuse them
+AIA_CACHE_TTL = 3600
+
 def render_aia_billing_system():
     """Highland Tower Development - AIA G702/G703 Billing System"""
     
@@ -399,11 +404,15 @@ def render_pdf_generation():
     # Generate PDF button
     if st.button("📄 Generate Owner Bill PDF", type="primary", key="generate_pdf"):
         with st.spinner("Generating professional AIA G702/G703 PDF..."):
-            pdf_buffer = generate_aia_pdf(include_g702, include_g703, include_summary, letterhead)
+            pdf_bytes = cached_aia_pdf(
+                (include_g702, include_g703, include_summary, letterhead),
+                st.session_state.aia_billing_data,
+                st.session_state.g703_schedule
+            )
             
-            if pdf_buffer:
+            if pdf_bytes:
                 # Create download link
-                b64_pdf = base64.b64encode(pdf_buffer.getvalue()).decode()
+                b64_pdf = base64.b64encode(pdf_bytes).decode()
                 
                 # Current date for filename
                 current_date = datetime.now().strftime("%Y%m%d")
@@ -458,11 +467,15 @@ def render_excel_export():
     # Generate Excel button
     if st.button("📊 Generate Excel Report", type="primary", key="generate_excel"):
         with st.spinner("Generating Excel report with formulas..."):
-            excel_buffer = generate_excel_report(export_g703, export_summary, export_analysis, include_formulas)
+            excel_bytes = cached_aia_excel(
+                (export_g703, export_summary, export_analysis, include_formulas),
+                st.session_state.aia_billing_data,
+                st.session_state.g703_schedule
+            )
             
-            if excel_buffer:
+            if excel_bytes:
                 # Create download link
-                b64_excel = base64.b64encode(excel_buffer.getvalue()).decode()
+                b64_excel = base64.b64encode(excel_bytes).decode()
                 
                 # Current date for filename
                 current_date = datetime.now().strftime("%Y%m%d")
@@ -492,6 +505,18 @@ def render_excel_export():
             else:
                 st.error("Failed to generate Excel report. Please try again.")
 
+# The cache holds bytes: a cached BytesIO would be one stream shared (and seeked) by every session
+
+@cached(ttl=AIA_CACHE_TTL, namespace="aia_billing.pdf", persist=True)
+def cached_aia_pdf(options: tuple, billing_data: Dict[str, Any], g703_schedule: List[Dict[str, Any]]) -> bytes:
+    """Generate the AIA PDF, cached by options and the billing data it is rendered from"""
+    return generate_aia_pdf(*options).getvalue()
+
+@cached(ttl=AIA_CACHE_TTL, namespace="aia_billing.excel", persist=True)
+def cached_aia_excel(options: tuple, billing_data: Dict[str, Any], g703_schedule: List[Dict[str, Any]]) -> bytes:
+    """Generate the billing workbook, cached by options and the billing data it is rendered from"""
+    return generate_excel_report(*options).getvalue()
+
 def generate_aia_pdf(include_g702: bool, include_g703: bool, include_summary: bool, letterhead: bool) -> io.BytesIO:
     """Generate professional AIA G702/G703 PDF with Highland Tower data"""
     
@@ -21,6 +21,11 @@ from openpyxl.chart import BarChart, Reference
 from typing import Dict, List, Any, Optional
 import json
 
+from lib.utils.cache_engine import cached
+
+# Generated artifacts are kept on disk so restarts and other workers reuse them
+REPORT_CACHE_TTL = 3600
+
 def render_report_generation_center():
     """Highland Tower Development - Advanced Report Generation Center"""
     
@@ -259,16 +264,16 @@ def render_generate_reports():
                     }
                     
                     if report_format == "PDF":
-                        report_buffer = generate_comprehensive_pdf_report(report_data)
+                        report_bytes = cached_pdf_report(report_data)
                     elif report_format == "Excel":
-                        report_buffer = generate_comprehensive_excel_report(report_data)
+                        report_bytes = cached_excel_report(report_data)
                     else:
                         st.info(f"{report_format} generation coming soon!")
                         return
                     
-                    if report_buffer:
+                    if report_bytes:
                         # Create download link
-                        b64_report = base64.b64encode(report_buffer.getvalue()).decode()
+                        b64_report = base64.b64encode(report_bytes).decode()
                         current_date = datetime.now().strftime("%Y%m%d")
                         filename = f"Highland_Tower_{report_title.replace(' ', '_')}_{current_date}.{report_format.lower()}"
                         
@@ -316,10 +321,10 @@ def generate_executive_summary_report():
             "custom_notes": "Monthly executive briefing for Highland Properties stakeholders"
         }
         
-        report_buffer = generate_comprehensive_pdf_report(report_data)
+        report_bytes = cached_pdf_report(report_data)
         
-        if report_buffer:
-            b64_report = base64.b64encode(report_buffer.getvalue()).decode()
+        if report_bytes:
+            b64_report = base64.b64encode(report_bytes).decode()
             current_date = datetime.now().strftime("%Y%m%d")
             filename = f"Highland_Tower_Executive_Summary_{current_date}.pdf"
             
@@ -350,10 +355,10 @@ def generate_cost_performance_report():
             "custom_notes": "Detailed cost analysis showing $2.1M under budget performance"
         }
         
-        report_buffer = generate_comprehensive_excel_report(report_data)
+        report_bytes = cached_excel_report(report_data)
         
-        if report_buffer:
-            b64_report = base64.b64encode(report_buffer.getvalue()).decode()
+        if report_bytes:
+            b64_report = base64.b64encode(report_bytes).decode()
             current_date = datetime.now().strftime("%Y%m%d")
             filename = f"Highland_Tower_Cost_Performance_{current_date}.xlsx"
             
@@ -384,10 +389,10 @@ def generate_safety_dashboard_report():
             "custom_notes": "97.2 safety rating with excellent compliance record"
         }
         
-        report_buffer = generate_comprehensive_pdf_report(report_data)
+        report_bytes = cached_pdf_report(report_data)
         
-        if report_buffer:
-            b64_report = base64.b64encode(report_buffer.getvalue()).decode()
+        if report_bytes:
+            b64_report = base64.b64encode(report_bytes).decode()
             current_date = datetime.now().strftime("%Y%m%d")
             filename = f"Highland_Tower_Safety_Dashboard_{current_date}.pdf"
             
@@ -613,8 +618,23 @@ def render_report_analytics():
         perf_df = pd.DataFrame(perf_data)
         st.dataframe(perf_df, use_container_width=True, hide_index=True)
 
-def generate_comprehensive_pdf_report(report_data: Dict[str, Any]) -> io.BytesIO:
-    """Generate comprehensive PDF report with Highland Tower data"""
+# The cache holds bytes: a cached BytesIO would be one stream shared (and seeked) by every session
+
+@cached(ttl=REPORT_CACHE_TTL, namespace="reports.pdf", persist=True)
+def _cached_pdf_report(report_data: Dict[str, Any], generated_on: str) -> bytes:
+    return generate_comprehensive_pdf_report(report_data, generated_on).getvalue()
+
+def cached_pdf_report(report_data: Dict[str, Any]) -> bytes:
+    """Generate the PDF report, cached by the report options and the date printed on it"""
+    return _cached_pdf_report(report_data, datetime.now().strftime('%B %d, %Y'))
+
+@cached(ttl=REPORT_CACHE_TTL, namespace="reports.excel", persist=True)
+def cached_excel_report(report_data: Dict[str, Any]) -> bytes:
+    """Generate the Excel report, cached by the report options"""
+    return generate_comprehensive_excel_report(report_data).getvalue()
+
+def generate_comprehensive_pdf_report(report_data: Dict[str, Any], generated_on: Optional[str] = None) -> io.BytesIO:
+    """Generate comprehensive PDF report with Highland Tower data, dated generated_on (default today)"""
     
     buffer = io.BytesIO()
     doc = SimpleDocTemplate(buffer, pagesize=letter, topMargin=0.75*inch, bottomMargin=0.75*inch)
@@ -647,7 +667,7 @@ def generate_comprehensive_pdf_report(report_data: Dict[str, Any]) -> io.BytesIO
     story.append(Paragraph(report_data['title'], title_style))
     story.append(Paragraph("Highland Tower Development", styles['Normal']))
     story.append(Paragraph("$45.5M Mixed-Use Development", styles['Normal']))
-    story.append(Paragraph(f"Generated: {datetime.now().strftime('%B %d, %Y')}", styles['Normal']))
+    story.append(Paragraph(f"Generated: {generated_on or datetime.now().strftime('%B %d, %Y')}", styles['Normal']))
     story.append(Spacer(1, 30))
     
     # Executive summary
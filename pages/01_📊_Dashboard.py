@@ -14,6 +14,8 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from lib.utils.helpers import check_authentication, initialize_session_state
+from lib.utils.kpi_engine import get_kpi_engine, get_dashboard_metrics
+from lib.utils.page_instrumentation import section
 import plotly.express as px
 import plotly.graph_objects as go
 
@@ -33,45 +35,52 @@ st.markdown("---")
 # Initialize session state
 initialize_session_state()
 
-# Project Overview Metrics
-col1, col2, col3, col4 = st.columns(4)
+# Project Overview Metrics (served from the latest KPI snapshot)
+with section("kpi_load"):
+    kpi_engine = get_kpi_engine()
+    snapshot = kpi_engine.get_snapshot()
+    metrics = get_dashboard_metrics()
 
-with col1:
-    st.metric("Project Progress", "78.5%", "2.3%")
+metric_columns = st.columns(4)
+for column, label in zip(metric_columns, ["Project Progress", "Active RFIs", "Budget Status", "Schedule"]):
+    value, delta = metrics.get(label, ("N/A", None))
+    with column:
+        st.metric(label, value, delta, delta_color="inverse" if label == "Active RFIs" else "normal")
 
-with col2:
-    st.metric("Active RFIs", "12", "-3")
-
-with col3:
-    st.metric("Budget Status", "$35.2M", "Under")
-
-with col4:
-    st.metric("Schedule", "On Track", "1 day ahead")
+st.caption(f"KPIs as of {datetime.fromisoformat(snapshot['taken_at']).strftime('%Y-%m-%d %H:%M')}")
 
 # Charts and visualizations
 st.markdown("---")
 
 col1, col2 = st.columns(2)
 
-with col1:
+with col1, section("charts"):
     st.subheader("Progress Overview")
-    progress_data = pd.DataFrame({
-        'Phase': ['Foundation', 'Structure', 'MEP', 'Finishes'],
-        'Progress': [95, 78, 45, 12]
-    })
-    
-    fig = px.bar(progress_data, x='Phase', y='Progress', 
-                title="Construction Phase Progress")
-    st.plotly_chart(fig, use_container_width=True)
-
-with col2:
+    progress_by_trade = snapshot.get("progress_by_trade", {})
+    if progress_by_trade:
+        progress_data = pd.DataFrame({
+            'Trade': list(progress_by_trade.keys()),
+            'Progress': list(progress_by_trade.values())
+        })
+        
+        fig = px.bar(progress_data, x='Trade', y='Progress', 
+                    title="Schedule Progress by Trade")
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info("No schedule data available")
+
+with col2, section("charts"):
     st.subheader("Budget Tracking")
-    budget_data = pd.DataFrame({
-        'Category': ['Labor', 'Materials', 'Equipment', 'Other'],
-        'Spent': [12500000, 18200000, 3100000, 1400000],
-        'Budget': [15000000, 20000000, 4000000, 2000000]
-    })
-    
-    fig = px.bar(budget_data, x='Category', y=['Spent', 'Budget'],
-                title="Budget vs Actual Spending", barmode='group')
-    st.plotly_chart(fig, use_container_width=True)
\ No newline at end of file
+    budget_by_category = snapshot.get("budget_by_category", {})
+    if budget_by_category:
+        budget_data = pd.DataFrame({
+            'Category': list(budget_by_category.keys()),
+            'Spent': [values['spent'] for values in budget_by_category.values()],
+            'Budget': [values['budget'] for values in budget_by_category.values()]
+        })
+        
+        fig = px.bar(budget_data, x='Category', y=['Spent', 'Budget'],
+                    title="Budget vs Actual Spending", barmode='group')
+        st.plotly_chart(fig, use_container_width=True)
+    else:
+        st.info("No cost data available")
@@ -12,6 +12,7 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from lib.utils.helpers import check_authentication
+from lib.utils.page_instrumentation import section
 
 st.set_page_config(page_title="Daily Reports - gcPanel", page_icon="📋", layout="wide")
 
@@ -44,7 +45,7 @@ if 'daily_reports' not in st.session_state:
 # Main tabs
 tab1, tab2, tab3 = st.tabs(["📊 Reports Database", "📝 Create Report", "📈 Progress Summary"])
 
-with tab1:
+with tab1, section("data_view"):
     st.subheader("📊 Daily Reports Database")
     if st.session_state.daily_reports:
         df = pd.DataFrame(st.session_state.daily_reports)
@@ -52,11 +53,11 @@ with tab1:
     else:
         st.info("No daily reports available")
 
-with tab2:
+with tab2, section("create_form"):
     st.subheader("📝 Create Daily Report")
     st.info("Daily report creation form coming soon")
 
-with tab3:
+with tab3, section("analytics"):
     st.subheader("📈 Progress Summary")
     if st.session_state.daily_reports:
         df = pd.DataFrame(st.session_state.daily_reports)
@@ -10,6 +10,7 @@ import os
 # Add project root to path for imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from lib.utils.helpers import check_authentication
+from lib.utils.page_instrumentation import section
 
 from lib.models.submittal_model import SubmittalModel
 from lib.controllers.crud_controller import CRUDController
@@ -86,13 +87,13 @@ crud_controller = CRUDController(submittal_model, 'submittals', display_config)
 # Main content tabs
 tab1, tab2, tab3 = st.tabs(["📊 Submittals Database", "📝 Create Submittal", "📈 Analytics"])
 
-with tab1:
+with tab1, section("data_view"):
     crud_controller.render_data_view('submittals')
 
-with tab2:
+with tab2, section("create_form"):
     crud_controller.render_create_form(form_config)
 
-with tab3:
+with tab3, section("analytics"):
     st.subheader("📈 Submittal Analytics")
     
     # Metrics
@@ -132,7 +133,7 @@ with tab3:
             st.bar_chart(status_dist)
 
 # Sidebar
-with st.sidebar:
+with st.sidebar, section("sidebar"):
     st.header("Submittal Summary")
     
     submittals = submittal_model.get_all()
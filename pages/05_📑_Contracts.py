@@ -10,6 +10,7 @@ import os
 # Add project root to path for imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from lib.utils.helpers import check_authentication
+from lib.utils.page_instrumentation import section
 
 from lib.models.contract_model import ContractModel
 from lib.controllers.crud_controller import CRUDController
@@ -91,13 +92,13 @@ crud_controller = CRUDController(contract_model, 'contracts', display_config)
 # Main content tabs
 tab1, tab2, tab3 = st.tabs(["📊 Contracts Database", "📝 Create New Contract", "📈 Analytics"])
 
-with tab1:
+with tab1, section("data_view"):
     crud_controller.render_data_view('contracts')
 
-with tab2:
+with tab2, section("create_form"):
     crud_controller.render_create_form(form_config)
 
-with tab3:
+with tab3, section("analytics"):
     st.subheader("📈 Contract Analytics")
     
     # Display key metrics using the model
@@ -134,7 +135,7 @@ with tab3:
         st.bar_chart(phase_values)
 
 # Sidebar with additional contract information
-with st.sidebar:
+with st.sidebar, section("sidebar"):
     st.header("Contract Summary")
     
     contracts = contract_model.get_all()
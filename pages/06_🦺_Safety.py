@@ -11,6 +11,7 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from lib.utils.helpers import check_authentication
+from lib.utils.page_instrumentation import section
 from lib.models.all_models import SafetyModel
 from lib.controllers.crud_controller import CRUDController
 from lib.helpers.ui_helpers import render_highland_header, apply_highland_tower_styling, render_status_badge
@@ -86,13 +87,13 @@ crud_controller = CRUDController(safety_model, 'safety', display_config)
 # Main content tabs
 tab1, tab2, tab3 = st.tabs(["📊 Safety Incidents", "📝 Report Incident", "📈 Safety Metrics"])
 
-with tab1:
+with tab1, section("data_view"):
     crud_controller.render_data_view('safety')
 
-with tab2:
+with tab2, section("create_form"):
     crud_controller.render_create_form(form_config)
 
-with tab3:
+with tab3, section("analytics"):
     st.subheader("📈 Safety Performance Metrics")
     
     # Safety metrics
@@ -132,7 +133,7 @@ with tab3:
             st.caption("Incidents by Type")
 
 # Sidebar
-with st.sidebar:
+with st.sidebar, section("sidebar"):
     st.header("Safety Dashboard")
     
     incidents = safety_model.get_all()
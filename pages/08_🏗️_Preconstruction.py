@@ -11,6 +11,7 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from lib.utils.helpers import check_authentication
+from lib.utils.page_instrumentation import section
 
 from lib.models.all_models import PreconstructionModel
 from lib.controllers.crud_controller import CRUDController
@@ -75,13 +76,13 @@ crud_controller = CRUDController(model, 'preconstruction', display_config)
 # Main content tabs
 tab1, tab2, tab3 = st.tabs(["🏗️ Preconstruction Database", "📝 Create New", "📈 Analytics"])
 
-with tab1:
+with tab1, section("data_view"):
     crud_controller.render_data_view('preconstruction')
 
-with tab2:
+with tab2, section("create_form"):
     crud_controller.render_create_form(form_config)
 
-with tab3:
+with tab3, section("analytics"):
     st.subheader("📈 Preconstruction Analytics")
     
     # Basic metrics
@@ -131,7 +132,7 @@ with tab3:
                 st.caption("Distribution by Type")
 
 # Sidebar
-with st.sidebar:
+with st.sidebar, section("sidebar"):
     st.header("Preconstruction Summary")
     
     items = model.get_all()
@@ -12,6 +12,7 @@ import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from lib.utils.helpers import check_authentication
+from lib.utils.page_instrumentation import section
 
 st.set_page_config(page_title="Cost Management - gcPanel", page_icon="💰", layout="wide")
 
@@ -55,7 +56,7 @@ if 'cost_items' not in st.session_state:
 # Main tabs
 tab1, tab2, tab3 = st.tabs(["📊 Cost Overview", "📝 Add Cost Item", "📈 Budget Analysis"])
 
-with tab1:
+with tab1, section("data_view"):
     st.subheader("📊 Cost Database")
     if st.session_state.cost_items:
         df = pd.DataFrame(st.session_state.cost_items)
@@ -63,11 +64,11 @@ with tab1:
     else:
         st.info("No cost data available")
 
-with tab2:
+with tab2, section("create_form"):
     st.subheader("📝 Add New Cost Item")
     st.info("Cost item creation form coming soon")
 
-with tab3:
+with tab3, section("analytics"):
     st.subheader("📈 Budget Analysis")
     if st.session_state.cost_items:
         df = pd.DataFrame(st.session_state.cost_items)
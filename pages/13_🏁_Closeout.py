@@ -10,6 +10,7 @@ import os
 # Add project root to path for imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from lib.utils.helpers import check_authentication
+from lib.utils.page_instrumentation import section
 
 from lib.models.all_models import CloseoutModel
 from lib.controllers.crud_controller import CRUDController
@@ -74,13 +75,13 @@ crud_controller = CRUDController(model, 'closeout', display_config)
 # Main content tabs
 tab1, tab2, tab3 = st.tabs(["🏁 Project Closeout Database", "📝 Create New", "📈 Analytics"])
 
-with tab1:
+with tab1, section("data_view"):
     crud_controller.render_data_view('closeout')
 
-with tab2:
+with tab2, section("create_form"):
     crud_controller.render_create_form(form_config)
 
-with tab3:
+with tab3, section("analytics"):
     st.subheader("📈 Project Closeout Analytics")
     
     # Basic metrics
@@ -130,7 +131,7 @@ with tab3:
                 st.caption("Distribution by Type")
 
 # Sidebar
-with st.sidebar:
+with st.sidebar, section("sidebar"):
     st.header("Project Closeout Summary")
     
     items = model.get_all()
@@ -12,6 +12,8 @@ import os
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from lib.utils.helpers import check_authentication, initialize_session_state
+from lib.utils.kpi_engine import get_kpi_engine
+from lib.utils.page_instrumentation import section
 
 st.set_page_config(page_title="Analytics - gcPanel", page_icon="📈", layout="wide")
 initialize_session_state()
@@ -23,27 +25,44 @@ st.title("📈 Project Analytics")
 st.markdown("Highland Tower Development - Performance Analytics & Insights")
 st.markdown("---")
 
-# Key Performance Indicators
+# Key Performance Indicators (served from the latest KPI snapshot)
+with section("kpi_load"):
+    kpi_engine = get_kpi_engine()
+    snapshot = kpi_engine.get_snapshot()
+    deltas = kpi_engine.get_deltas()
+
+def format_delta(key, pattern):
+    """Format a KPI delta, or None when there is no baseline yet"""
+    return pattern.format(deltas[key]) if key in deltas else None
+
 col1, col2, col3, col4 = st.columns(4)
 
 with col1:
-    st.metric("Project Progress", "78.5%", "2.3%")
+    progress = snapshot.get("project_progress")
+    st.metric("Project Progress", f"{progress:.1f}%" if progress is not None else "N/A",
+              format_delta("project_progress", "{:+.1f}%"))
 
 with col2:
-    st.metric("Schedule Performance Index", "1.05", "0.02")
+    spi = snapshot.get("spi")
+    st.metric("Schedule Performance Index", f"{spi:.2f}" if spi is not None else "N/A",
+              format_delta("spi", "{:+.2f}"))
 
 with col3:
-    st.metric("Cost Performance Index", "0.98", "-0.01")
+    cpi = snapshot.get("cpi")
+    st.metric("Cost Performance Index", f"{cpi:.2f}" if cpi is not None else "N/A",
+              format_delta("cpi", "{:+.2f}"))
 
 with col4:
-    st.metric("Quality Score", "96%", "1%")
+    quality_score = snapshot.get("quality_score")
+    st.metric("Quality Score", f"{quality_score:.0f}%" if quality_score is not None else "N/A",
+              format_delta("quality_score", "{:+.1f}%"))
 
 st.markdown("---")
 
 # Charts and Analytics
 tab1, tab2, tab3, tab4 = st.tabs(["📊 Project Overview", "💰 Cost Analytics", "📅 Schedule Analytics", "🎯 Performance Metrics"])
 
-with tab1:
+with tab1, section("project_overview"):
     st.subheader("📊 Project Overview Analytics")
     
     col1, col2 = st.columns(2)
@@ -72,7 +91,7 @@ with tab1:
                     title="Resource Allocation Distribution")
         st.plotly_chart(fig, use_container_width=True)
 
-with tab2:
+with tab2, section("cost_analytics"):
     st.subheader("💰 Cost Performance Analytics")
     
     col1, col2 = st.columns(2)
@@ -105,24 +124,28 @@ with tab2:
                     title="Cost Variance by Category", color=colors)
         st.plotly_chart(fig, use_container_width=True)
 
-with tab3:
+with tab3, section("schedule_analytics"):
     st.subheader("📅 Schedule Performance Analytics")
     
     col1, col2 = st.columns(2)
     
     with col1:
-        # Schedule Performance Index Trend
-        spi_data = pd.DataFrame({
-            'Week': list(range(1, 13)),
-            'SPI': [1.02, 1.01, 0.98, 1.05, 1.08, 1.06, 1.04, 1.07, 1.05, 1.03, 1.05, 1.05]
-        })
+        # Schedule Performance Index Trend from persisted KPI snapshots
+        spi_history = [
+            {'Snapshot': datetime.fromisoformat(item['taken_at']), 'SPI': item['spi']}
+            for item in kpi_engine.get_history(days=90) if 'spi' in item
+        ]
         
-        fig = px.line(spi_data, x='Week', y='SPI',
-                     title="Schedule Performance Index Trend",
-                     markers=True)
-        fig.add_hline(y=1.0, line_dash="dash", line_color="red", 
-                     annotation_text="Target SPI = 1.0")
-        st.plotly_chart(fig, use_container_width=True)
+        if spi_history:
+            spi_data = pd.DataFrame(spi_history)
+            fig = px.line(spi_data, x='Snapshot', y='SPI',
+                         title="Schedule Performance Index Trend",
+                         markers=True)
+            fig.add_hline(y=1.0, line_dash="dash", line_color="red", 
+                         annotation_text="Target SPI = 1.0")
+            st.plotly_chart(fig, use_container_width=True)
+        else:
+            st.info("No SPI history recorded yet")
     
     with col2:
         # Critical Path Activities
@@ -137,7 +160,7 @@ with tab3:
                     title="Critical Path Activities Status", color=colors)
         st.plotly_chart(fig, use_container_width=True)
 
-with tab4:
+with tab4, section("performance_metrics"):
     st.subheader("🎯 Performance Metrics Dashboard")
     
     # Performance scorecard
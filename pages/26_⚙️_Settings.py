@@ -9,8 +9,14 @@ import sys
 import os
 
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-from lib.utils.helpers import check_authentication, initialize_session_state
+from lib.utils.helpers import check_authentication, initialize_session_state, is_admin
+from lib.utils.page_instrumentation import section
 from lib.config.project_config import get_project_config
+from lib.utils.monitoring import (
+    render_cache_dashboard, render_page_performance_dashboard, render_profiler_dashboard,
+    render_notification_queue_dashboard, render_recovery_point_dashboard, render_session_memory_dashboard,
+    render_trace_dashboard
+)
 
 st.set_page_config(page_title="Settings - gcPanel", page_icon="⚙️", layout="wide")
 initialize_session_state()
@@ -25,9 +31,9 @@ st.title("⚙️ Settings & Configuration")
 st.markdown("Global Project Configuration - Updates across entire platform")
 st.markdown("---")
 
-tabs = st.tabs(["🏢 Project Settings", "👥 User Management", "🔧 System Configuration", "📊 Analytics Settings", "🌐 Environment Status"])
+tabs = st.tabs(["🏢 Project Settings", "👥 User Management", "🔧 System Configuration", "📊 Analytics Settings", "🌐 Environment Status", "🗄️ Cache Performance", "⏱️ Page Performance"])
 
-with tabs[0]:
+with tabs[0], section("project_settings"):
     st.subheader("🏢 Project Settings")
     st.info("Changes made here will update across all modules and pages in the platform.")
     
@@ -81,7 +87,7 @@ with tabs[0]:
         st.success("✅ Project settings saved! Changes will be reflected across all pages.")
         st.balloons()
 
-with tabs[1]:
+with tabs[1], section("user_management"):
     st.subheader("👥 User Management")
     
     # User creation form
@@ -110,7 +116,7 @@ with tabs[1]:
     df_users = pd.DataFrame(users_data)
     st.dataframe(df_users, use_container_width=True, hide_index=True)
 
-with tabs[2]:
+with tabs[2], section("system_configuration"):
     st.subheader("🔧 System Configuration")
     
     col1, col2 = st.columns(2)
@@ -141,7 +147,7 @@ with tabs[2]:
     if st.button("💾 Save System Configuration", type="primary"):
         st.success("System configuration saved successfully!")
 
-with tabs[3]:
+with tabs[3], section("analytics_settings"):
     st.subheader("📊 Analytics Settings")
     
     col1, col2 = st.columns(2)
@@ -161,7 +167,7 @@ with tabs[3]:
     if st.button("💾 Save Analytics Settings", type="primary"):
         st.success("Analytics settings saved successfully!")
 
-with tabs[4]:
+with tabs[4], section("environment_status"):
     st.subheader("🌐 Environment Status")
     
     st.markdown("**System Status**")
@@ -201,4 +207,42 @@ with tabs[4]:
     ]
     
     for status in module_status:
-        st.write(status)
\ No newline at end of file
+        st.write(status)
+    
+    st.markdown("---")
+    st.subheader("💾 Recovery Point")
+    st.caption("Continuous WAL archiving for point-in-time recovery")
+    render_recovery_point_dashboard()
+    
+    if is_admin():
+        st.markdown("---")
+        st.subheader("📨 Notification Queue")
+        st.caption("Email, SMS and in-app notification delivery")
+        render_notification_queue_dashboard(allow_requeue=True)
+
+with tabs[5], section("cache_performance"):
+    st.subheader("🗄️ Cache Performance")
+    st.caption("Shared cache statistics for this server process")
+    render_cache_dashboard(allow_reset=is_admin())
+    
+    if is_admin():
+        st.markdown("---")
+        st.subheader("🧠 Session Memory")
+        st.caption("Approximate st.session_state footprint of the sessions on this server process")
+        render_session_memory_dashboard()
+
+with tabs[6], section("page_performance"):
+    st.subheader("⏱️ Page Performance")
+    st.caption("Page script run costs for this server process, slowest first")
+    render_page_performance_dashboard(allow_reset=is_admin())
+    
+    st.markdown("---")
+    st.subheader("🧵 Slowest Traces")
+    st.caption("Spans of recent page runs, from page through controller and model to SQL")
+    render_trace_dashboard()
+    
+    if is_admin():
+        st.markdown("---")
+        st.subheader("🔥 Sampling Profiler")
+        st.caption("Samples the page script threads of this server process; safe to run briefly on a live server")
+        render_profiler_dashboard()
@@ -12,6 +12,8 @@ from typing import Dict, Any
 project_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
 sys.path.insert(0, project_root)
 
+from lib.utils.page_instrumentation import section
+
 def create_mvc_page(
     page_title: str,
     page_icon: str, 
@@ -37,8 +39,8 @@ def create_mvc_page(
     
     # Import with error handling
     try:
-        from controllers.crud_controller import CRUDController
-        from helpers.ui_helpers import apply_highland_tower_styling, render_highland_header
+        from lib.controllers.crud_controller import CRUDController
+        from lib.helpers.ui_helpers import apply_highland_tower_styling, render_highland_header
         mvc_available = True
     except ImportError:
         mvc_available = False
@@ -84,19 +86,19 @@ def create_mvc_page(
         "📈 Analytics"
     ])
     
-    with tab1:
+    with tab1, section("data_view"):
         if mvc_available:
             controller.render_data_view(session_key)
         else:
             render_fallback_data_view(session_key, display_config)
     
-    with tab2:
+    with tab2, section("create_form"):
         if mvc_available:
             controller.render_create_form(form_config or {}, session_key)
         else:
             render_fallback_create_form(session_key, display_config, form_config)
     
-    with tab3:
+    with tab3, section("analytics"):
         if mvc_available:
             controller.render_analytics(session_key)
         else:
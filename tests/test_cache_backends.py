@@ -0,0 +1,209 @@
+"""
+Tests for lib.utils.cache_backends.
+
+Every backend runs the same contract tests: the in-process fake always,
+Redis when a server is available (REDIS_TEST_URL, or a redis-server binary
+on PATH, which is started for the test session).
+"""
+
+import os
+import json
+import time
+import uuid
+import socket
+import shutil
+import subprocess
+from datetime import datetime
+
+import pytest
+
+from lib.utils.cache_backends import (
+    InMemoryBackend, InMemoryStore, RedisCacheBackend, deserialize, serialize
+)
+from lib.utils.cache_engine import CacheEngine
+
+
+def _free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@pytest.fixture(scope="session")
+def redis_url():
+    redis = pytest.importorskip("redis")
+
+    url = os.environ.get("REDIS_TEST_URL")
+    if url:
+        yield url
+        return
+
+    binary = shutil.which("redis-server")
+    if binary is None:
+        pytest.skip("no Redis server (set REDIS_TEST_URL or install redis-server)")
+
+    port = _free_port()
+    process = subprocess.Popen(
+        [binary, "--port", str(port), "--save", "", "--appendonly", "no"],
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+    )
+    url = f"redis://127.0.0.1:{port}/0"
+    client = redis.Redis.from_url(url)
+    try:
+        for _ in range(50):
+            try:
+                client.ping()
+                break
+            except redis.ConnectionError:
+                time.sleep(0.1)
+        yield url
+    finally:
+        client.close()
+        process.terminate()
+        process.wait(timeout=5)
+
+
+@pytest.fixture(params=["memory", "redis"])
+def pod_backends(request):
+    """Two backends sharing one store, like two pods talking to the same server."""
+    if request.param == "memory":
+        store = InMemoryStore()
+        backends = [InMemoryBackend(store), InMemoryBackend(store)]
+    else:
+        url = request.getfixturevalue("redis_url")
+        prefix = f"gcpanel:test:{uuid.uuid4().hex}:"
+        backends = [RedisCacheBackend(url, prefix=prefix, channel=prefix + "invalidate") for _ in range(2)]
+    yield backends
+    backends[0].clear()
+    for backend in backends:
+        backend.close()
+
+
+def test_serialization_round_trips_values():
+    for value in ({"rfis": [1, 2.5, "open", None]}, ("a", 1), datetime(2025, 6, 1, 8, 30), b"\x00pdf"):
+        assert deserialize(serialize(value)) == value
+    # Tuples must come back as tuples, so they never take the msgpack path
+    assert type(deserialize(serialize(("a", 1)))) is tuple
+
+
+def test_values_are_shared_between_pods(pod_backends):
+    first, second = pod_backends
+    value = {"project": "Highland Tower", "spi": 0.98, "milestones": [1, 2], "at": datetime(2025, 1, 2)}
+
+    assert first.set("kpis", "latest", value, ttl=60)
+
+    assert second.get("kpis", "latest") == value
+    assert second.get("kpis", "missing", "default") == "default"
+
+
+def test_entries_expire(pod_backends):
+    backend, _ = pod_backends
+    backend.set("kpis", "short", 1, ttl=1)
+
+    time.sleep(1.2)
+
+    assert backend.get("kpis", "short") is None
+
+
+def test_get_many_and_set_many(pod_backends):
+    first, second = pod_backends
+    assert first.set_many("rfis", {"1": "open", "2": "closed", "3": ("a", 1)}, ttl=60) == 3
+
+    assert second.get_many("rfis", ["1", "3", "4"]) == {"1": "open", "3": ("a", 1)}
+    assert second.get_many("rfis", []) == {}
+
+
+def test_get_entries_and_set_entries(pod_backends):
+    first, second = pod_backends
+    assert first.set_entries({("rfis", "all"): ([1, 2], 60), ("costs", "all"): ({"total": 3}, 30)}) == 2
+
+    found = second.get_entries([("rfis", "all"), ("costs", "all"), ("kpis", "latest")])
+    assert found == {("rfis", "all"): [1, 2], ("costs", "all"): {"total": 3}}
+    assert second.get_entries([]) == {}
+
+
+def test_invalidate_and_clear(pod_backends):
+    first, second = pod_backends
+    first.set_many("rfis", {"1": "open", "2": "closed"}, ttl=60)
+    first.set("kpis", "latest", 1, ttl=60)
+
+    assert first.invalidate("rfis") == 2
+    assert second.get_many("rfis", ["1", "2"]) == {}
+    assert second.get("kpis", "latest") == 1
+
+    first.clear()
+    assert second.get("kpis", "latest") is None
+
+
+def test_engines_share_computed_values(pod_backends):
+    first, second = CacheEngine(), CacheEngine()
+    first.set_backend(pod_backends[0])
+    second.set_backend(pod_backends[1])
+    computed = []
+
+    def compute():
+        computed.append(True)
+        return {"active_rfis": 12}
+
+    assert first.get_or_compute("kpis", "latest", compute, ttl=60, scope_id="") == {"active_rfis": 12}
+    assert second.get_or_compute("kpis", "latest", compute, ttl=60, scope_id="") == {"active_rfis": 12}
+
+    assert len(computed) == 1
+    assert second.get_stats()["backend_hits"] == 1
+
+
+def test_prefetch_writes_and_preload_read_in_batches(pod_backends):
+    first, second = CacheEngine(), CacheEngine()
+    first.set_backend(pod_backends[0])
+    second.set_backend(pod_backends[1])
+
+    with first.prefetching():
+        first.get_or_compute("models.rfis", "all", lambda: [1], ttl=60, scope_id="")
+        first.get_or_compute("models.costs", "all", lambda: [2], ttl=60, scope_id="")
+        # Written to the shared tier together when the prefetch ends
+        assert pod_backends[1].get("models.rfis", "all") is None
+
+    assert second.preload([("models.rfis", "all"), ("models.costs", "all"), ("kpis", "latest")], ttl=60) == 2
+    assert second.get_many("models.rfis", ["all", "missing"]) == {"all": [1]}
+    assert second.get_stats()["backend_hits"] == 2
+
+
+def test_invalidation_reaches_other_pods():
+    store = InMemoryStore()
+    first, second = CacheEngine(), CacheEngine()
+    first.set_backend(InMemoryBackend(store))
+    second.set_backend(InMemoryBackend(store))
+
+    first.get_or_compute("kpis", "latest", lambda: 1, ttl=60, scope_id="")
+    second.get_or_compute("kpis", "latest", lambda: 1, ttl=60, scope_id="")
+    first.invalidate(namespace="kpis")
+
+    # The other pod's in-memory copy and the shared entry are both gone
+    assert second.get("kpis", "latest", scope_id="") is None
+    assert second.get_or_compute("kpis", "latest", lambda: 2, ttl=60, scope_id="") == 2
+
+
+def test_redis_invalidation_messages(redis_url):
+    import redis
+
+    prefix = f"gcpanel:test:{uuid.uuid4().hex}:"
+    backend = RedisCacheBackend(redis_url, prefix=prefix, channel=prefix + "invalidate")
+    received = []
+    backend.subscribe_invalidations(received.append)
+    time.sleep(0.2)
+
+    # Messages from this process are ignored; messages from other pods are delivered
+    backend.publish_invalidation("kpis", "latest")
+    client = redis.Redis.from_url(redis_url)
+    client.publish(prefix + "invalidate", json.dumps(
+        {"origin": "other-pod", "namespace": "kpis", "key": None, "scope_id": None}
+    ))
+
+    deadline = time.time() + 3
+    while not received and time.time() < deadline:
+        time.sleep(0.05)
+    client.close()
+    backend.close()
+
+    assert [message["origin"] for message in received] == ["other-pod"]
+    assert received[0]["namespace"] == "kpis"
@@ -0,0 +1,174 @@
+"""
+Tests for lib.utils.smtp_pool against a local SMTP stand-in server.
+"""
+
+import socket
+import threading
+import socketserver
+from email.message import EmailMessage
+
+import pytest
+
+from lib.utils.smtp_pool import SmtpTransport
+
+
+class _SmtpHandler(socketserver.StreamRequestHandler):
+    """Just enough ESMTP for smtplib: EHLO/HELO, MAIL, RCPT, DATA, RSET, NOOP, QUIT."""
+
+    def reply(self, line: str):
+        self.wfile.write(f"{line}\r\n".encode())
+
+    def handle(self):
+        server = self.server
+        with server.lock:
+            server.sessions += 1
+            server.connections.append(self.connection)
+
+        self.reply("220 stand-in ESMTP")
+        sender, recipients = None, []
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip()
+            verb = command[:4].upper()
+
+            if verb in ("EHLO", "HELO"):
+                self.reply("250 stand-in")
+            elif verb == "MAIL":
+                sender, recipients = command[10:].strip("<> "), []
+                self.reply("250 OK")
+            elif verb == "RCPT":
+                address = command[8:].strip("<> ")
+                if "reject" in address:
+                    self.reply("550 No such user")
+                else:
+                    recipients.append(address)
+                    self.reply("250 OK")
+            elif verb == "DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                data = []
+                while True:
+                    data_line = self.rfile.readline()
+                    if data_line in (b".\r\n", b""):
+                        break
+                    data.append(data_line)
+                with server.lock:
+                    server.messages.append({"from": sender, "to": list(recipients), "data": b"".join(data)})
+                self.reply("250 OK queued")
+            elif verb == "RSET":
+                sender, recipients = None, []
+                self.reply("250 OK")
+            elif verb == "NOOP":
+                self.reply("250 OK")
+            elif verb == "QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("502 Command not implemented")
+
+
+class SmtpStandIn(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _SmtpHandler)
+        self.lock = threading.Lock()
+        self.sessions = 0
+        self.connections = []
+        self.messages = []
+
+    @property
+    def port(self) -> int:
+        return self.server_address[1]
+
+    def drop_sessions(self):
+        """Close every open connection, like a server ending idle sessions."""
+        with self.lock:
+            connections, self.connections = self.connections, []
+        for connection in connections:
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            connection.close()
+
+
+@pytest.fixture
+def smtp_server():
+    server = SmtpStandIn()
+    thread = threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def transport(smtp_server):
+    transport = SmtpTransport("127.0.0.1", smtp_server.port, use_tls=False, pool_size=2)
+    yield transport
+    transport.close()
+
+
+def _message(subject: str = "Daily report", to: str = None) -> EmailMessage:
+    message = EmailMessage()
+    message["From"] = "reports@example.com"
+    if to:
+        message["To"] = to
+    message["Subject"] = subject
+    message.set_content("Highland Tower daily report")
+    return message
+
+
+def test_sessions_are_reused(smtp_server, transport):
+    for i in range(10):
+        transport.send(_message(to=f"user{i}@example.com"))
+
+    assert len(smtp_server.messages) == 10
+    assert smtp_server.sessions == 1
+    assert transport.stats()["idle"] == 1
+
+
+def test_send_many_stays_within_pool(smtp_server, transport):
+    results = transport.send_many([(_message(to=f"user{i}@example.com"), None) for i in range(20)])
+
+    assert results == [{}] * 20
+    assert len(smtp_server.messages) == 20
+    assert smtp_server.sessions <= transport.pool_size
+
+
+def test_send_bcc_splits_batches_without_disclosing_recipients(smtp_server, transport):
+    recipients = [f"user{i}@example.com" for i in range(120)]
+    message = _message()
+
+    failures = transport.send_bcc(message, recipients, batch_size=50)
+
+    assert failures == {}
+    # Batches go out concurrently, so they may arrive in any order
+    assert sorted(len(sent["to"]) for sent in smtp_server.messages) == [20, 50, 50]
+    assert sorted(address for sent in smtp_server.messages for address in sent["to"]) == sorted(recipients)
+    for sent in smtp_server.messages:
+        assert b"user" not in sent["data"]
+        assert b"Bcc" not in sent["data"]
+    # The header is added to a copy; the caller's message is unchanged
+    assert "To" not in message
+
+
+def test_send_bcc_reports_refused_recipients(smtp_server, transport):
+    failures = transport.send_bcc(_message(), ["ok@example.com", "reject@example.com"])
+
+    assert list(failures) == ["reject@example.com"]
+    assert failures["reject@example.com"][0] == 550
+    assert smtp_server.messages[0]["to"] == ["ok@example.com"]
+
+
+def test_reconnects_after_server_drops_sessions(smtp_server, transport):
+    transport.send(_message(to="first@example.com"))
+    smtp_server.drop_sessions()
+
+    transport.send(_message(to="second@example.com"))
+
+    assert [sent["to"] for sent in smtp_server.messages] == [["first@example.com"], ["second@example.com"]]
+    assert smtp_server.sessions == 2
@@ -0,0 +1,23 @@
+"""
+Tests for lib.utils.template_engine compiled templates.
+"""
+
+import pytest
+
+from lib.utils.template_engine import FORMAT, PLACEHOLDERS, compile_template
+
+
+@pytest.mark.parametrize("source, context", [
+    ("Use {{braces}} here", {}),
+    ("RFI {number:>5} is {status!r} {{ref}}", {"number": 42, "status": "open"}),
+    ("No fields at all", {}),
+])
+def test_format_templates_match_str_format(source, context):
+    assert compile_template(source, FORMAT).render(context) == source.format(**context)
+
+
+def test_placeholders_leave_unknown_names():
+    template = compile_template("Hello {name}, see {missing}", PLACEHOLDERS)
+
+    assert template.render({"name": "Ada"}) == "Hello Ada, see {missing}"
+    assert compile_template("Plain text", PLACEHOLDERS).render({}) == "Plain text"